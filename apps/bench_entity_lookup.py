@@ -0,0 +1,111 @@
+"""
+文件名稱：bench_entity_lookup.py
+
+功能說明：
+以題庫 xlsx 中 xlsx_entities_clauses.py 已寫入的命名實體 (第 M 欄) 比較實體比對方式的命中率與延遲：
+- legacy：fact 名稱精確比對，查無時再以不限 label 的名稱比對 (修改前的 entities_to_clauses_many)。
+- resolve：KnowledgeGraph.resolve_entities (名稱索引 + 全文索引的別名與模糊比對)。
+- snapshot：GraphSnapshot.resolve_entities (字元 bigram 索引)，不含快照載入與索引建立時間。
+命中率為至少對應到一個節點的實體比例；resolve / snapshot 另列出各比對種類的數量。
+
+使用方式：
+python apps/bench_entity_lookup.py <xlsx> [<xlsx> ...] [-kg_name <KG 名稱>] [-bolt_url <Bolt URL>]
+
+參數說明：
+- xlsx：題庫檔案，kg_name 未指定時取第一個檔名 (不含副檔名)，與 xlsx_entities_clauses.py 相同。
+- bolt_url：KG 的 Bolt URL；未指定時以 DockerManager 取得 kg_name 容器的 Bolt URL。
+- batch：每批比對的題數，預設與 xlsx_entities_clauses.CLAUSE_BATCH_ROWS 相同 (200)。
+"""
+
+import argparse
+from collections import Counter
+import os, sys
+import time
+
+from openpyxl import load_workbook
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+import app_helper   # 註冊 VERBOSE log level
+
+from knowsys.entity_index import best_matches
+from knowsys.graph_snapshot import GraphSnapshot
+from knowsys.knowledge_graph import KnowledgeGraph
+
+COL_ENTITIES = 13   # M：命名實體（逗點分隔）
+FIRST_ROW = 7
+ENTITY_LABELS = ("fact", "concept", "structure", "document")
+
+
+def read_entity_lists(xlsx_paths):
+    entity_lists = []
+    for path in xlsx_paths:
+        wb = load_workbook(path, read_only=True)
+        for row in wb.active.iter_rows(min_row=FIRST_ROW, min_col=COL_ENTITIES, max_col=COL_ENTITIES, values_only=True):
+            entities = str(row[0] or "").replace(",", "，").split("，")
+            entity_lists.append([e.strip() for e in entities if e.strip()])
+        wb.close()
+    return entity_lists
+
+
+def legacy_lookup(kg, names):
+    nodes_by_name = kg.query_nodes_by_names(names, label="fact")
+    missing = [name for name, nodes in nodes_by_name.items() if not nodes]
+    nodes_by_name.update(kg.query_nodes_by_names(missing))
+    return {name: [{'node': node, 'match': 'name'} for node in nodes] for name, nodes in nodes_by_name.items()}
+
+
+def run(label, lookup, batches):
+    elapsed, hits, total, kinds = 0.0, 0, 0, Counter()
+    for names in batches:
+        start = time.perf_counter()
+        matches = lookup(names)
+        elapsed += time.perf_counter() - start
+        for name in names:
+            best = best_matches(matches[name]) if label != 'legacy' else matches[name]
+            total += 1
+            if best:
+                hits += 1
+                kinds[best[0]['match']] += 1
+    print(f"{label:<9} hit rate: {hits / total:6.1%} ({hits}/{total}), "
+          f"latency: {elapsed * 1000 / len(batches):8.1f} ms/batch, {elapsed * 1000 / total:6.3f} ms/entity, "
+          f"matches: {dict(kinds)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Entity lookup benchmark on a question bank")
+    parser.add_argument('xlsx', nargs='+', help='Question bank xlsx files with named entities in column M')
+    parser.add_argument('-kg_name', type=str, help='KG name (default: first xlsx file name)')
+    parser.add_argument('-hostname', type=str, default='localhost', help='Docker host (default: localhost)')
+    parser.add_argument('-datapath', type=str, default=os.getcwd(), help='Data storage path of the KG containers')
+    parser.add_argument('-bolt_url', type=str, help='Bolt URL of the KG, skips container lookup')
+    parser.add_argument('-batch', type=int, default=200, help='Questions per lookup batch')
+    args = parser.parse_args()
+
+    kg_name = args.kg_name or os.path.splitext(os.path.basename(args.xlsx[0]))[0]
+    bolt_url = args.bolt_url
+    if not bolt_url:
+        from knowsys.docker_management import DockerManager
+        _, bolt_url = DockerManager(hostname=args.hostname, base_volume_dir=args.datapath).get_urls(kg_name)
+        if not bolt_url:
+            print(f"KG '{kg_name}' is not running.")
+            sys.exit(1)
+
+    entity_lists = read_entity_lists(args.xlsx)
+    batches = [list(dict.fromkeys(e for entities in entity_lists[start:start + args.batch] for e in entities))
+               for start in range(0, len(entity_lists), args.batch)]
+    batches = [names for names in batches if names]
+    if not batches:
+        print("No named entities found in column M.")
+        return
+    print(f"KG: {kg_name} ({bolt_url}), questions: {len(entity_lists)}, batches: {len(batches)}")
+
+    with KnowledgeGraph(uri=bolt_url) as kg:
+        run('legacy', lambda names: legacy_lookup(kg, names), batches)
+        run('resolve', lambda names: kg.resolve_entities(names, labels=ENTITY_LABELS), batches)
+        snapshot = GraphSnapshot.load(kg)
+    snapshot.resolve_entities([], labels=ENTITY_LABELS)     # 建立 bigram 索引
+    run('snapshot', lambda names: snapshot.resolve_entities(names, labels=ENTITY_LABELS), batches)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+"""
+文件名稱：bench_extraction_modes.py
+
+功能說明：
+以同一份 PDF 的頁面比較 PdfRetriever 的兩種擷取模式 ([service.retrieval] extraction_mode)：
+- chain：facts、concepts、facts 關聯依序呼叫 LLM (未歸類或沒有關聯的 facts 遞迴補問)。
+- structured：一次 JSON schema 限制輸出的請求，只對剩下的缺口補問 (見 retrieval.structured_extraction)。
+直接以 [service.llm] 設定的模型呼叫 LLM (不經 broker 與 LlmService)，逐頁依序執行，
+列出每頁的 LLM 呼叫數、token 用量、延遲與 triplets 數。
+
+使用方式：
+python apps/bench_extraction_modes.py -file_path <PDF 檔案> [-start 0] [-pages 10] [-modes chain structured]
+
+參數說明：
+- file_path：要擷取的 PDF 檔案。
+- start / pages：從第 start 頁開始擷取的頁數。
+- modes：要比較的擷取模式。
+"""
+
+import os, sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+import app_helper
+app_helper.initialize(os.path.splitext(os.path.basename(__file__))[0])
+
+import argparse
+import statistics
+import time
+
+from agentflow.core.parcel import TextParcel
+from retrieval.pdf_retriever import PdfRetriever
+from retrieval.structured_extraction import ExtractionStats
+from services.llm_service import LlmService
+
+
+class DirectPdfRetriever(PdfRetriever):
+    """ 直接呼叫 LLM 的 PdfRetriever，只用於擷取 (不連線 broker)。 """
+    def __init__(self, mode, llm):
+        config = app_helper.get_agent_config()
+        # 比較的是 LLM 擷取本身，不使用 extraction cache
+        config['retrieval'] = {**app_helper.config['service'].get('retrieval', {}), 'extraction_mode': mode,
+                               'extraction_cache': ''}
+        super().__init__(config)
+        self.llm = llm
+
+
+    def _request_llm(self, pcl:TextParcel) -> dict:
+        return LlmService.prompt(self.llm, pcl.content)
+
+
+def run_mode(retriever, pages, meta):
+    stats = ExtractionStats(retriever.extraction_mode)
+    latencies = []
+    for page_content in pages:
+        retriever._page_local.stats = stats
+        start = time.perf_counter()
+        try:
+            triplets = retriever.extract_triplets(page_content, [(meta['title'],)], meta)
+        except Exception as e:
+            print(f"{retriever.extraction_mode}: page failed: {e}")
+            continue
+        latencies.append(time.perf_counter() - start)
+        stats.add_page(len(triplets))
+    return stats.to_dict(), latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Chain vs. structured extraction benchmark")
+    parser.add_argument('-file_path', type=str, required=True, help='PDF file to extract')
+    parser.add_argument('-start', type=int, default=0, help='First page')
+    parser.add_argument('-pages', type=int, default=10, help='Pages to extract')
+    parser.add_argument('-modes', type=str, nargs='+', default=['chain', 'structured'], help='Extraction modes')
+    args = parser.parse_args()
+
+    llm = LlmService._generate_llm_model(app_helper.config['service']['llm'])
+    meta = {'title': os.path.splitext(os.path.basename(args.file_path))[0]}
+    retriever = DirectPdfRetriever('chain', llm)
+    pages = [page for page in retriever.read_pages(args.file_path)[args.start:args.start + args.pages] if page.strip()]
+    print(f"file: {args.file_path}, pages: {len(pages)}")
+
+    print(f"{'mode':<11} {'pages':>5} {'calls/page':>10} {'prompt tok':>10} {'compl tok':>10} "
+          f"{'s/page':>7} {'p95 s':>7} {'triplets/page':>13}")
+    for mode in args.modes:
+        retriever.extraction_mode = mode
+        stats, latencies = run_mode(retriever, pages, meta)
+        if not latencies:
+            continue
+        pages_done = stats['pages']
+        latencies.sort()
+        print(f"{mode:<11} {pages_done:5d} {stats['per_page']['llm_calls']:10.2f} "
+              f"{stats['prompt_tokens'] / pages_done:10.0f} {stats['completion_tokens'] / pages_done:10.0f} "
+              f"{statistics.mean(latencies):7.1f} {latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]:7.1f} "
+              f"{stats['per_page']['triplets']:13.1f}")
+
+
+if __name__ == '__main__':
+    main()
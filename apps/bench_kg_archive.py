@@ -0,0 +1,124 @@
+"""
+文件名稱：bench_kg_archive.py
+
+功能說明：
+比較 KG 快照封存檔 (knowsys.kg_archive) 與 APOC JSON 匯出 (apoc.export.json.all) 的匯出時間與檔案大小，
+並列出封存檔載入成 GraphSnapshot (GraphSnapshot.open) 與轉成 neo4j-admin CSV 的時間。
+指定 -restore 時另外以 DockerManager.restore_KG 將封存檔匯入新的容器，計時並比對節點與關聯數量。
+資料與 bench_kg_write.py 相同，為模擬 PdfRetriever 產生的頁面 triplets。
+
+使用方式：
+python apps/bench_kg_archive.py [-bolt_url <Bolt URL>] [-pages 50] [-triplets 300] [-restore] [-keep]
+
+參數說明：
+- bolt_url：既有 Neo4j 的 Bolt URL；未指定時以 DockerManager 建立本機 Neo4j 容器（bench_kg_archive）作為測試環境。
+- datapath：本機容器的資料存放路徑，預設為 _bench。
+- pages / triplets：寫入的模擬頁數與每頁 triplets 數量。
+- restore：將封存檔還原到新的容器（bench_kg_archive_restore），需要本機 Docker。
+- keep：保留還原的 KG，預設結束後刪除。
+"""
+
+import argparse
+import os, sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+import app_helper   # 註冊 VERBOSE log level
+
+from bench_kg_write import clear_bench_nodes, make_page_triplets
+from knowsys.graph_snapshot import GraphSnapshot
+from knowsys.kg_archive import write_import_csv
+from knowsys.knowledge_graph import KnowledgeGraph
+
+
+BENCH_KG_NAME = 'bench_kg_archive'
+RESTORE_KG_NAME = 'bench_kg_archive_restore'
+BENCH_FILE_ID = 'bench-archive'
+
+
+def export_apoc_json(kg, path):
+    """ 以 apoc.export.json.all 串流匯出整個 KG 並寫入 path (容器內不需開放檔案匯出)。 """
+    with kg.session() as session, open(path, 'w', encoding='utf-8') as f:
+        for record in session.run("CALL apoc.export.json.all(null, {stream: true}) YIELD data RETURN data"):
+            f.write(record["data"])
+
+
+def count_graph(bolt_url):
+    with KnowledgeGraph(uri=bolt_url) as kg:
+        with kg.session() as session:
+            nodes = session.run("MATCH (n) RETURN count(n) AS c").single()["c"]
+            relationships = session.run("MATCH ()-[r]->() RETURN count(r) AS c").single()["c"]
+    return nodes, relationships
+
+
+def report(title, seconds, size=None):
+    print(f"{title:<16} {seconds:8.2f} s" + (f", {size / 2**20:9.2f} MB" if size is not None else ""))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="KG snapshot archive vs. APOC JSON export benchmark")
+    parser.add_argument('-bolt_url', type=str, help='Bolt URL of an existing Neo4j (default: start a local container)')
+    parser.add_argument('-datapath', type=str, default='_bench', help='Volume path for the local Neo4j containers')
+    parser.add_argument('-pages', type=int, default=50, help='Pages written before exporting')
+    parser.add_argument('-triplets', type=int, default=300, help='Triplets per page')
+    parser.add_argument('-restore', action='store_true', help='Restore the archive into a new local container')
+    parser.add_argument('-keep', action='store_true', help='Keep the restored KG')
+    args = parser.parse_args()
+
+    docker_manager = None
+    bolt_url = args.bolt_url
+    if not bolt_url or args.restore:
+        from knowsys.docker_management import DockerManager
+        docker_manager = DockerManager(base_volume_dir=args.datapath)
+    if not bolt_url:
+        _, bolt_url = docker_manager.create_container(BENCH_KG_NAME)
+
+    with tempfile.TemporaryDirectory(prefix='bench_kg_archive_') as work_dir, KnowledgeGraph(uri=bolt_url) as kg:
+        kg.ensure_schema()
+        clear_bench_nodes(kg, BENCH_FILE_ID)
+        kg.add_pages_batched([(BENCH_FILE_ID, page_number, make_page_triplets(page_number, args.triplets))
+                              for page_number in range(args.pages)])
+        archive_path = os.path.join(work_dir, f'{BENCH_KG_NAME}.kgsnap')
+        json_path = os.path.join(work_dir, f'{BENCH_KG_NAME}.json')
+
+        start = time.perf_counter()
+        snapshot = GraphSnapshot.load(kg)
+        loaded = time.perf_counter()
+        snapshot.save(archive_path, source=BENCH_KG_NAME)
+        saved = time.perf_counter()
+        print(f"Neo4j: {bolt_url}, nodes: {snapshot.node_count}, relationships: {snapshot.edge_count}")
+        print(f"archive export phases: load {loaded - start:.2f}s, save {saved - loaded:.2f}s")
+        report('archive export', saved - start, os.path.getsize(archive_path))
+
+        start = time.perf_counter()
+        export_apoc_json(kg, json_path)
+        report('apoc json export', time.perf_counter() - start, os.path.getsize(json_path))
+
+        start = time.perf_counter()
+        opened = GraphSnapshot.open(archive_path)
+        report('archive open', time.perf_counter() - start)
+        assert (opened.node_count, opened.edge_count) == (snapshot.node_count, snapshot.edge_count)
+
+        start = time.perf_counter()
+        stats = write_import_csv(archive_path, os.path.join(work_dir, 'csv'))
+        report('archive -> csv', time.perf_counter() - start, stats['csv_bytes'])
+
+        if args.restore:
+            docker_manager.delete_KG(RESTORE_KG_NAME)
+            try:
+                start = time.perf_counter()
+                _, restored_url = docker_manager.restore_KG(RESTORE_KG_NAME, archive_path, work_dir=work_dir)
+                with KnowledgeGraph(uri=restored_url) as restored:
+                    restored.ensure_schema()
+                report('archive restore', time.perf_counter() - start)
+                print(f"(nodes, relationships): source {count_graph(bolt_url)}, restored {count_graph(restored_url)}")
+            finally:
+                if not args.keep:
+                    docker_manager.delete_KG(RESTORE_KG_NAME)
+
+        clear_bench_nodes(kg, BENCH_FILE_ID)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,132 @@
+"""
+文件名稱：bench_kg_bulk_import.py
+
+功能說明：
+以模擬語料（預設 100 萬個 triplets）比較兩種第一次建立 KG 的總耗時：
+- online：每頁以 KnowledgeGraph.add_triplets_batched 寫入運行中的 Neo4j（與 kg_service 相同）。
+- offline：每頁 spool_page() 累積，BulkImportWriter 輸出 CSV，DockerManager.import_KG 以 neo4j-admin 匯入後啟動容器。
+兩者皆從建立容器開始計時，結束後比對節點與關聯數量。
+
+使用方式：
+python apps/bench_kg_bulk_import.py [-triplets 1000000] [-per_page 300] [-datapath _bench] [-keep]
+
+參數說明：
+- triplets：模擬語料的 triplets 總數。
+- per_page：每頁 triplets 數量。
+- datapath：容器資料與 spool/CSV 的存放路徑，預設為 _bench。
+- keep：保留測試用的 KG（bench_kg_online、bench_kg_offline），預設結束後刪除。
+"""
+
+import argparse
+import os, sys
+import random
+import shutil
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+import app_helper   # 註冊 VERBOSE log level
+
+from knowsys.bulk_import import BulkImportWriter, spool_page
+from knowsys.docker_management import DockerManager
+from knowsys.knowledge_graph import KnowledgeGraph
+
+
+ONLINE_KG_NAME = 'bench_kg_online'
+OFFLINE_KG_NAME = 'bench_kg_offline'
+BENCH_FILE_ID = 'bench-bulk'
+
+
+def make_page_triplets(page_number, triplet_count, concept_pool=2000):
+    """
+    產生一頁模擬 triplets。fact 名稱以頁碼區分：同名 fact 的關聯會連到所有頁面的同名節點，
+    共用名稱會讓關聯數隨頁數平方成長，無法代表實際語料。
+    """
+    document = {'type': 'document', 'name': 'Bench Document', 'meta': {'title': 'Bench Document'}}
+    chapter = {'type': 'structure', 'name': f'Chapter {page_number // 50}'}
+    section = {'type': 'structure', 'name': f'Section {page_number // 5}'}
+    part_of = {'name': 'part_of'}
+    triplets = [(chapter, part_of, document), (section, part_of, chapter)]
+
+    rnd = random.Random(page_number)
+    fact_pool = max(2, triplet_count // 2)
+    while len(triplets) < triplet_count:
+        concept = {'type': 'concept', 'name': f'concept-{rnd.randrange(concept_pool)}'}
+        fact = {'type': 'fact', 'name': f'fact-{page_number}-{rnd.randrange(fact_pool)}'}
+        other = {'type': 'fact', 'name': f'fact-{page_number}-{rnd.randrange(fact_pool)}'}
+        triplets.append((concept, {'name': 'include_in'}, section))
+        triplets.append((fact, {'name': 'is_a'}, concept))
+        triplets.append((fact, {'name': 'related_to'}, other))
+    return triplets[:triplet_count]
+
+
+def count_graph(bolt_url):
+    with KnowledgeGraph(uri=bolt_url) as kg:
+        with kg.session() as session:
+            nodes = session.run("MATCH (n) WHERE n.file_id = $file_id RETURN count(n) AS c", file_id=BENCH_FILE_ID).single()["c"]
+            relationships = session.run("MATCH ()-[r]->() RETURN count(r) AS c").single()["c"]
+    return nodes, relationships
+
+
+def run_online(docker_manager, pages, per_page):
+    start = time.perf_counter()
+    _, bolt_url = docker_manager.create_container(ONLINE_KG_NAME)
+    with KnowledgeGraph(uri=bolt_url) as kg:
+        kg.ensure_schema()
+        for page_number in range(pages):
+            kg.add_triplets_batched(BENCH_FILE_ID, page_number, make_page_triplets(page_number, per_page))
+    return time.perf_counter() - start, bolt_url
+
+
+def run_offline(docker_manager, pages, per_page, work_dir):
+    start = time.perf_counter()
+    bulk_dir = os.path.join(work_dir, 'bench_bulk_spool')
+    shutil.rmtree(bulk_dir, ignore_errors=True)
+    for page_number in range(pages):
+        spool_page(bulk_dir, BENCH_FILE_ID, page_number, make_page_triplets(page_number, per_page))
+    spooled = time.perf_counter()
+
+    writer = BulkImportWriter()
+    writer.add_spool(bulk_dir)
+    csv_dir = os.path.join(bulk_dir, 'csv')
+    writer.write(csv_dir)
+    written = time.perf_counter()
+
+    _, bolt_url = docker_manager.import_KG(OFFLINE_KG_NAME, csv_dir)
+    with KnowledgeGraph(uri=bolt_url) as kg:
+        kg.ensure_schema()
+    end = time.perf_counter()
+    print(f"offline phases: spool {spooled - start:.1f}s, csv {written - spooled:.1f}s, "
+          f"import + start {end - written:.1f}s")
+    shutil.rmtree(bulk_dir, ignore_errors=True)
+    return end - start, bolt_url
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Online MERGE vs. offline neo4j-admin import benchmark")
+    parser.add_argument('-triplets', type=int, default=1_000_000, help='Total triplets of the synthetic corpus')
+    parser.add_argument('-per_page', type=int, default=300, help='Triplets per page')
+    parser.add_argument('-datapath', type=str, default='_bench', help='Volume path for the Neo4j containers')
+    parser.add_argument('-keep', action='store_true', help='Keep the benchmark KGs')
+    args = parser.parse_args()
+
+    pages = max(1, args.triplets // args.per_page)
+    docker_manager = DockerManager(base_volume_dir=args.datapath)
+    for kg_name in (ONLINE_KG_NAME, OFFLINE_KG_NAME):
+        docker_manager.delete_KG(kg_name)
+
+    try:
+        offline_elapsed, offline_url = run_offline(docker_manager, pages, args.per_page, args.datapath)
+        online_elapsed, online_url = run_online(docker_manager, pages, args.per_page)
+
+        print(f"corpus:  {pages} pages x {args.per_page} triplets")
+        print(f"online:  {online_elapsed:9.1f} s, (nodes, relationships) = {count_graph(online_url)}")
+        print(f"offline: {offline_elapsed:9.1f} s, (nodes, relationships) = {count_graph(offline_url)}")
+        print(f"Speedup: {online_elapsed / offline_elapsed:.1f}x")
+    finally:
+        if not args.keep:
+            for kg_name in (ONLINE_KG_NAME, OFFLINE_KG_NAME):
+                docker_manager.delete_KG(kg_name)
+
+
+if __name__ == '__main__':
+    main()
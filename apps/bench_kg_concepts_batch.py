@@ -0,0 +1,109 @@
+"""
+文件名稱：bench_kg_concepts_batch.py
+
+功能說明：
+模擬一次出 500 題的批次工作（同一科目、少數章節反覆出現），比較每題取得 concept 的 KG 耗時：
+- per_question：每題一次 KnowledgeGraph.query_section_concepts（原本 CONCEPTS_QUERY 的作法）。
+- cached：每題經過 ConceptQueryCache（kg_service 的 CONCEPTS_QUERY），相同章節只查詢一次。
+- batch：所有題目一次 query_section_concepts_many（CONCEPTS_BATCH_QUERY）。
+模擬 TOC 以 bench_kg_subsections.build_toc 建立。
+
+使用方式：
+python apps/bench_kg_concepts_batch.py [-bolt_url <Bolt URL>] [-questions 500] [-distinct 20]
+
+參數說明：
+- bolt_url：既有 Neo4j 的 Bolt URL；未指定時以 DockerManager 建立本機 Neo4j 容器 (bench_kg_subsections)。
+- questions：批次題數。
+- distinct：題目中不重複的章節數。
+- depth / branching / concepts：模擬 TOC 的大小（同 bench_kg_subsections.py）。
+"""
+
+import argparse
+import os, sys
+import random
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+import app_helper   # 註冊 VERBOSE log level
+
+from bench_kg_subsections import BENCH_DOCUMENT, BENCH_FILE_ID, BENCH_KG_NAME, build_toc
+from knowsys.concept_cache import ConceptQueryCache, concept_key
+from knowsys.knowledge_graph import KnowledgeGraph
+
+
+def make_criteria(questions, distinct, depth, branching):
+    """ 從 TOC 中隨機挑選 distinct 個章節路徑，再依序分配給每一題。 """
+    rnd = random.Random(0)
+    sections = []
+    for _ in range(distinct):
+        level = rnd.randint(1, depth)
+        path, name = [], 'bench-toc'
+        for _ in range(level):
+            name = f"{name}-{rnd.randrange(branching)}"
+            path.append(name)
+        sections.append([path[-1]])
+    return [(BENCH_DOCUMENT, sections[i % distinct]) for i in range(questions)]
+
+
+def run_cached(kg, criteria):
+    cache = ConceptQueryCache()
+    results = []
+    for document, section in criteria:
+        key = concept_key(BENCH_KG_NAME, document, section)
+        concepts = cache.get(key)
+        if concepts is None:
+            generation = cache.generation(BENCH_KG_NAME)
+            concepts = kg.query_section_concepts(document, section)
+            cache.put(key, concepts, generation)
+        results.append(concepts)
+    return results, cache.stats()
+
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Batched CONCEPTS_QUERY benchmark")
+    parser.add_argument('-bolt_url', type=str, help='Bolt URL of an existing Neo4j (default: start a local container)')
+    parser.add_argument('-datapath', type=str, default='_bench', help='Volume path for the local Neo4j container')
+    parser.add_argument('-questions', type=int, default=500, help='Questions in the batch')
+    parser.add_argument('-distinct', type=int, default=20, help='Distinct sections among the questions')
+    parser.add_argument('-depth', type=int, default=4, help='Depth of the synthetic TOC')
+    parser.add_argument('-branching', type=int, default=4, help='Subsections per section')
+    parser.add_argument('-concepts', type=int, default=5, help='Concepts per section')
+    args = parser.parse_args()
+
+    bolt_url = args.bolt_url
+    if not bolt_url:
+        from knowsys.docker_management import DockerManager
+        _, bolt_url = DockerManager(base_volume_dir=args.datapath).create_container(BENCH_KG_NAME)
+
+    criteria = make_criteria(args.questions, args.distinct, args.depth, args.branching)
+    with KnowledgeGraph(uri=bolt_url) as kg:
+        kg.ensure_schema()
+        structure_count = build_toc(kg, args.depth, args.branching, args.concepts)
+        print(f"Neo4j: {bolt_url}, structures: {structure_count}, "
+              f"questions: {args.questions}, distinct sections: {args.distinct}")
+
+        per_question, per_question_elapsed = timed(
+            lambda: [kg.query_section_concepts(document, section) for document, section in criteria])
+        (cached, cache_stats), cached_elapsed = timed(lambda: run_cached(kg, criteria))
+        batch, batch_elapsed = timed(lambda: kg.query_section_concepts_many(criteria))
+
+        with kg.session() as session:
+            session.run("MATCH (n {file_id: $file_id}) DETACH DELETE n", file_id=BENCH_FILE_ID)
+
+    for results in (cached, batch):
+        assert [{c['element_id'] for c in r} for r in results] == [{c['element_id'] for c in r} for r in per_question]
+
+    for label, elapsed in (('per_question', per_question_elapsed), ('cached', cached_elapsed), ('batch', batch_elapsed)):
+        print(f"{label:12s} total: {elapsed * 1000:9.1f} ms, per question: {elapsed * 1000 / args.questions:7.3f} ms, "
+              f"speedup: {per_question_elapsed / elapsed:6.1f}x")
+    print(f"cache: {cache_stats}")
+
+
+if __name__ == '__main__':
+    main()
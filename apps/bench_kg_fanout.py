@@ -0,0 +1,129 @@
+"""
+文件名稱：bench_kg_fanout.py
+
+功能說明：
+比較 SingleChoiceGenerator.generate_question 中 KG 查詢的總時間 (不含 LLM 與 agent 往返)：
+- sync：修改前的流程，以 KnowledgeGraph 查詢 concept 後，每一輪依序查詢 core concept 的 is_a facts
+  與這些 facts 的鄰居 (素材)，素材足夠時提前結束。
+- fanout：目前的流程，先選出各輪的 core concept，以 FanOutKnowledgeGraph (async driver) 同時查詢
+  各 concept 的 facts，再以一次 query_neighbors_many 取得所有 facts 的鄰居。
+兩種作法每題使用相同的亂數種子。模擬文件以 bench_kg_write.make_page_triplets 產生。
+
+使用方式：
+python apps/bench_kg_fanout.py [-bolt_url <Bolt URL>] [-pages 40] [-questions 50] [-difficulty 50]
+
+參數說明：
+- bolt_url：既有 Neo4j 的 Bolt URL；未指定時以 DockerManager 建立本機 Neo4j 容器 (bench_kg_write)。
+- pages / triplets：模擬文件的頁數與每頁 triplets 數量。
+- questions：每種作法模擬的出題數。
+- difficulty：題目難度 (30 / 50 / 70)，輪數為 difficulty // 3，與 generate_question 相同。
+"""
+
+import argparse
+import os, sys
+import random
+import statistics
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+import app_helper   # 註冊 VERBOSE log level
+
+from bench_kg_write import BENCH_KG_NAME, clear_bench_nodes, make_page_triplets
+from knowsys.async_knowledge_graph import FanOutKnowledgeGraph
+from knowsys.knowledge_graph import KnowledgeGraph
+
+
+BENCH_FILE_ID = 'bench-fanout'
+BENCH_DOCUMENT = 'Bench Document'
+
+
+def text_materials(facts, neighbors):
+    return [f"{fact['name']} {rel} {other['name']}"
+            for fact in facts for rel, _, other in neighbors[fact['element_id']]]
+
+
+def sync_question(kg, section, count, seed):
+    rnd = random.Random(seed)
+    concepts = kg.query_section_concepts(BENCH_DOCUMENT, [section])
+    materials, queries = [], 2
+    for _ in range(count):
+        concept = rnd.choice(concepts)
+        facts = kg.query_nodes_related_by(concept['element_id'], 'is_a', 'fact')
+        facts = rnd.sample(facts, min(5, len(facts)))
+        queries += 1
+        if not facts:
+            continue
+        neighbors = kg.query_neighbors_many([fact['element_id'] for fact in facts], label='fact')
+        queries += 1
+        materials.extend(text_materials(facts, neighbors))
+        if len(materials) >= count:
+            break
+    return materials, queries
+
+
+def fanout_question(kg, fanout, section, count, seed):
+    rnd = random.Random(seed)
+    concepts = kg.query_section_concepts(BENCH_DOCUMENT, [section])
+    core_concepts = [rnd.choice(concepts) for _ in range(count)]
+    fact_lists = fanout.gather([('query_nodes_related_by', concept['element_id'], 'is_a', 'fact')
+                                for concept in core_concepts])
+    fact_lists = [rnd.sample(facts, min(5, len(facts))) for facts in fact_lists]
+    eids = list(dict.fromkeys(fact['element_id'] for facts in fact_lists for fact in facts))
+    neighbors = kg.query_neighbors_many(eids, label='fact')
+    materials = []
+    for facts in fact_lists:
+        if not facts:
+            continue
+        materials.extend(text_materials(facts, neighbors))
+        if len(materials) >= count:
+            break
+    return materials, 2 + len(core_concepts) + 1
+
+
+def run(label, question_fn, sections, questions, count):
+    elapsed, queries = [], 0
+    for i in range(questions):
+        start = time.perf_counter()
+        _, question_queries = question_fn(sections[i % len(sections)], count, i)
+        elapsed.append(time.perf_counter() - start)
+        queries += question_queries
+    elapsed.sort()
+    print(f"{label:<7} mean {statistics.mean(elapsed) * 1000:8.1f} ms, "
+          f"p95 {elapsed[min(len(elapsed) - 1, int(len(elapsed) * 0.95))] * 1000:8.1f} ms, "
+          f"queries/question {queries / questions:5.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="KG fan-out benchmark of generate_question")
+    parser.add_argument('-bolt_url', type=str, help='Bolt URL of an existing Neo4j (default: start a local container)')
+    parser.add_argument('-datapath', type=str, default='_bench', help='Volume path for the local Neo4j container')
+    parser.add_argument('-pages', type=int, default=40, help='Pages of the synthetic document')
+    parser.add_argument('-triplets', type=int, default=300, help='Triplets per page')
+    parser.add_argument('-questions', type=int, default=50, help='Questions per approach')
+    parser.add_argument('-difficulty', type=int, default=50, help='Question difficulty (30, 50, 70)')
+    args = parser.parse_args()
+
+    bolt_url = args.bolt_url
+    if not bolt_url:
+        from knowsys.docker_management import DockerManager
+        _, bolt_url = DockerManager(base_volume_dir=args.datapath).create_container(BENCH_KG_NAME)
+    count = args.difficulty // 3
+    print(f"Neo4j: {bolt_url}, pages: {args.pages}, questions: {args.questions}, rounds/question: {count}")
+
+    with KnowledgeGraph(uri=bolt_url) as kg, FanOutKnowledgeGraph(uri=bolt_url, shared=False) as fanout:
+        kg.ensure_schema()
+        clear_bench_nodes(kg, BENCH_FILE_ID)
+        kg.add_pages_batched([(BENCH_FILE_ID, page_number, make_page_triplets(page_number, args.triplets))
+                              for page_number in range(args.pages)])
+        sections = [f'Section {i}' for i in range(max(1, args.pages // 5))]
+
+        run('sync', lambda section, count, seed: sync_question(kg, section, count, seed),
+            sections, args.questions, count)
+        run('fanout', lambda section, count, seed: fanout_question(kg, fanout, section, count, seed),
+            sections, args.questions, count)
+
+        clear_bench_nodes(kg, BENCH_FILE_ID)
+
+
+if __name__ == '__main__':
+    main()
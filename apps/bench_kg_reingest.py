@@ -0,0 +1,88 @@
+"""
+文件名稱：bench_kg_reingest.py
+
+功能說明：
+模擬同一份文件被匯入兩次 (修正 PDF 後重跑或中斷後重跑)，比較 fact 節點數與 is_a 查詢延遲：
+1. legacy：以原本的 CREATE 寫入 fact，匯入兩次後每頁的 fact 各有兩份。
+2. collapsed：以 KnowledgeGraph.collapse_duplicate_facts 補上 fact_key 並合併重複的 fact。
+3. reingested：再以 fact_key MERGE 的批次寫入匯入一次，fact 節點數不變。
+模擬頁面以 bench_kg_write.make_page_triplets 產生。
+
+使用方式：
+python apps/bench_kg_reingest.py [-bolt_url <Bolt URL>] [-pages 20] [-triplets 300]
+
+參數說明：
+- bolt_url：既有 Neo4j 的 Bolt URL；未指定時以 DockerManager 建立本機 Neo4j 容器 (bench_kg_write)。
+- pages / triplets：文件頁數與每頁 triplets 數量。
+"""
+
+import argparse
+import os, sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+import app_helper   # 註冊 VERBOSE log level
+
+from bench_kg_write import BENCH_KG_NAME, clear_bench_nodes, make_page_triplets
+from kg_utility import measure_facts
+from knowsys.knowledge_graph import KnowledgeGraph
+
+
+BENCH_FILE_ID = 'bench-reingest'
+
+# 修改前 _add_fact / 批次寫入的 fact 語句
+LEGACY_FACT_WRITE = """
+    UNWIND $rows AS row
+    CREATE (n:fact {name: row.name, file_id: row.file_id, page_number: row.page_number, aliases: row.aliases})
+    """
+
+
+def legacy_ingest(kg, pages):
+    """ 以 CREATE 寫入 fact (每次匯入視為新的 process，去重 store 是空的)，其他節點與關聯照常寫入。 """
+    for page_number, triplets in enumerate(pages):
+        nodes, relationships = KnowledgeGraph._plan_batched_writes(BENCH_FILE_ID, page_number, triplets, idempotent=True)
+        facts = nodes.pop(('fact', 'fact'), {})
+        with kg.session() as session:
+            session.run(LEGACY_FACT_WRITE, rows=list(facts.values())).consume()
+            session.execute_write(KnowledgeGraph._write_batched_tx, nodes=nodes, relationships=relationships)
+
+
+def report(label, kg):
+    facts, latency = measure_facts(kg, [BENCH_FILE_ID])
+    print(f"{label:<11} fact nodes: {facts:7d}, is_a query: {latency * 1000:8.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fact re-ingestion benchmark")
+    parser.add_argument('-bolt_url', type=str, help='Bolt URL of an existing Neo4j (default: start a local container)')
+    parser.add_argument('-datapath', type=str, default='_bench', help='Volume path for the local Neo4j container')
+    parser.add_argument('-pages', type=int, default=20, help='Pages of the document')
+    parser.add_argument('-triplets', type=int, default=300, help='Triplets per page')
+    args = parser.parse_args()
+
+    bolt_url = args.bolt_url
+    if not bolt_url:
+        from knowsys.docker_management import DockerManager
+        _, bolt_url = DockerManager(base_volume_dir=args.datapath).create_container(BENCH_KG_NAME)
+    print(f"Neo4j: {bolt_url}, pages: {args.pages}, triplets/page: {args.triplets}")
+
+    pages = [make_page_triplets(page_number, args.triplets) for page_number in range(args.pages)]
+    with KnowledgeGraph(uri=bolt_url) as kg:
+        kg.ensure_schema()
+        clear_bench_nodes(kg, BENCH_FILE_ID)
+
+        legacy_ingest(kg, pages)
+        legacy_ingest(kg, pages)
+        report('legacy x2', kg)
+
+        print(kg.collapse_duplicate_facts([BENCH_FILE_ID]))
+        report('collapsed', kg)
+
+        kg.add_pages_batched([(BENCH_FILE_ID, page_number, triplets) for page_number, triplets in enumerate(pages)],
+                             idempotent=True)
+        report('reingested', kg)
+
+        clear_bench_nodes(kg, BENCH_FILE_ID)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+"""
+文件名稱：bench_kg_snapshot.py
+
+功能說明：
+比較 KnowledgeGraph（Bolt 查詢）與 GraphSnapshot（記憶體快照）的鄰居查詢延遲，
+並列出快照載入時間、增量更新 (refresh) 時間與每百萬條關聯的記憶體用量。
+資料與 bench_kg_write.py 相同，為模擬 PdfRetriever 產生的頁面 triplets。
+
+使用方式：
+python apps/bench_kg_snapshot.py [-bolt_url <Bolt URL>] [-pages 50] [-triplets 300] [-lookups 500]
+
+參數說明：
+- bolt_url：既有 Neo4j 的 Bolt URL；未指定時以 DockerManager 建立本機 Neo4j 容器（bench_kg_snapshot）作為測試環境。
+- datapath：未指定 bolt_url 時的容器資料存放路徑，預設為 _bench。
+- pages / triplets：寫入的模擬頁數與每頁 triplets 數量。
+- lookups：每種查詢方式的鄰居查詢次數。
+"""
+
+import argparse
+import os, sys
+import random
+import statistics
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+import app_helper   # 註冊 VERBOSE log level
+
+from bench_kg_write import clear_bench_nodes, make_page_triplets
+from knowsys.graph_snapshot import GraphSnapshot
+from knowsys.knowledge_graph import KnowledgeGraph
+
+
+BENCH_KG_NAME = 'bench_kg_snapshot'
+BENCH_FILE_ID = 'bench-snapshot'
+
+
+def time_lookups(query_fn, element_ids):
+    elapsed = []
+    for element_id in element_ids:
+        start = time.perf_counter()
+        query_fn(element_id, 'is_a', 'fact')
+        elapsed.append(time.perf_counter() - start)
+    return elapsed
+
+
+def report(title, elapsed):
+    print(f"{title:<10} lookups: {len(elapsed):5d}, "
+          f"median: {statistics.median(elapsed) * 1e6:10.1f} us, "
+          f"p99: {sorted(elapsed)[int(len(elapsed) * 0.99)] * 1e6:10.1f} us")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="KG snapshot read benchmark")
+    parser.add_argument('-bolt_url', type=str, help='Bolt URL of an existing Neo4j (default: start a local container)')
+    parser.add_argument('-datapath', type=str, default='_bench', help='Volume path for the local Neo4j container')
+    parser.add_argument('-pages', type=int, default=50, help='Pages written before loading the snapshot')
+    parser.add_argument('-triplets', type=int, default=300, help='Triplets per page')
+    parser.add_argument('-lookups', type=int, default=500, help='Neighborhood lookups per approach')
+    args = parser.parse_args()
+
+    bolt_url = args.bolt_url
+    if not bolt_url:
+        from knowsys.docker_management import DockerManager
+        _, bolt_url = DockerManager(base_volume_dir=args.datapath).create_container(BENCH_KG_NAME)
+
+    with KnowledgeGraph(uri=bolt_url) as kg:
+        kg.ensure_schema()
+        for page_number in range(args.pages):
+            kg.add_triplets_batched(BENCH_FILE_ID, page_number, make_page_triplets(page_number, args.triplets))
+
+        start = time.perf_counter()
+        snapshot = GraphSnapshot.load(kg)
+        print(f"Neo4j: {bolt_url}, snapshot load: {time.perf_counter() - start:.2f}s, "
+              f"nodes: {snapshot.node_count}, relationships: {snapshot.edge_count}")
+
+        concepts = [c['element_id'] for i in range(40) for c in snapshot.query_nodes_by_name(f'concept-{i}', 'concept')]
+        element_ids = [random.choice(concepts) for _ in range(args.lookups)]
+
+        for element_id in element_ids[:20]:
+            expected = sorted(n['element_id'] for n in kg.query_nodes_related_by(element_id, 'is_a', 'fact'))
+            assert expected == sorted(n['element_id'] for n in snapshot.query_nodes_related_by(element_id, 'is_a', 'fact'))
+
+        report('bolt', time_lookups(kg.query_nodes_related_by, element_ids))
+        report('snapshot', time_lookups(snapshot.query_nodes_related_by, element_ids))
+
+        triplets = make_page_triplets(args.pages, args.triplets)
+        kg.add_triplets_batched(BENCH_FILE_ID, args.pages, triplets)
+        start = time.perf_counter()
+        added = snapshot.refresh(kg, triplets)
+        print(f"refresh:   {(time.perf_counter() - start) * 1000:.1f} ms for one page, {added} relationships added")
+
+        clear_bench_nodes(kg, BENCH_FILE_ID)
+
+    memory = snapshot.memory_report()
+    print(f"memory:    {memory['total_bytes'] / 2**20:.1f} MB, {memory['mb_per_million_edges']} MB per million relationships")
+    for part, size in memory['bytes'].items():
+        print(f"    {part:<18} {size / 2**20:9.2f} MB")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,149 @@
+"""
+文件名稱：bench_kg_subsections.py
+
+功能說明：
+在 KG 中建立一個深層的模擬目錄 (TOC)，比較 CONCEPTS_QUERY 的兩種作法：
+- legacy：query_subsections 逐節點遞迴查詢，再逐 section 呼叫 query_nodes_related_by。
+- subtree：KnowledgeGraph.query_section_concepts（變長路徑，一次取回子樹後一次查詢 concept）。
+
+使用方式：
+python apps/bench_kg_subsections.py [-bolt_url <Bolt URL>] [-depth 5] [-branching 4] [-repeat 10]
+
+參數說明：
+- bolt_url：既有 Neo4j 的 Bolt URL；未指定時以 DockerManager 建立本機 Neo4j 容器 (bench_kg_subsections)。
+- depth / branching：模擬 TOC 的深度與每層分支數（結構節點數約為 branching^depth）。
+- concepts：每個結構節點的 concept 數量。
+- repeat：每種作法重複查詢次數。
+"""
+
+import argparse
+import os, sys
+import statistics
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+import app_helper   # 註冊 VERBOSE log level
+
+from knowsys.knowledge_graph import KnowledgeGraph
+
+
+BENCH_KG_NAME = 'bench_kg_subsections'
+BENCH_FILE_ID = 'bench-toc'
+BENCH_DOCUMENT = 'bench-toc-document'
+
+
+def build_toc(kg, depth, branching, concepts_per_section):
+    """以 part_of / include_in triplets 建立模擬 TOC，回傳結構節點數。"""
+    document = {'type': 'document', 'name': BENCH_DOCUMENT, 'meta': {}}
+    part_of, include_in = {'name': 'part_of'}, {'name': 'include_in'}
+    triplets = []
+    level = [(document, 'bench-toc')]
+    structure_count = 0
+    for _ in range(depth):
+        next_level = []
+        for parent, prefix in level:
+            for b in range(branching):
+                name = f"{prefix}-{b}"
+                section = {'type': 'structure', 'name': name}
+                triplets.append((section, part_of, parent))
+                for c in range(concepts_per_section):
+                    triplets.append(({'type': 'concept', 'name': f"{name}-c{c}"}, include_in, section))
+                next_level.append((section, name))
+        structure_count += len(next_level)
+        level = next_level
+
+    for i in range(0, len(triplets), 5000):
+        kg.add_triplets_batched(BENCH_FILE_ID, 0, triplets[i:i + 5000])
+    return structure_count
+
+
+def legacy_section_concepts(kg, document, section_path):
+    """重現原本的作法：每個 structure 一次查詢遞迴展開，再逐 section 查詢 concept。"""
+    queries = 0
+
+    def fetch_all_subsections(session, parent_path):
+        nonlocal queries
+        query = """
+        MATCH (sec:structure {name: $last_section})
+        OPTIONAL MATCH (sub:structure)-[:part_of]->(sec)
+        RETURN collect(sub) AS subsections
+        """
+        queries += 1
+        record = session.run(query, last_section=parent_path[-1]["name"]).single()
+        subsections = [s for s in record["subsections"] if s is not None] if record else []
+        all_paths = [parent_path]
+        for sub in subsections:
+            all_paths.extend(fetch_all_subsections(session, parent_path + [sub]))
+        return all_paths
+
+    with kg.session() as session:
+        roots = []
+        for section in section_path:
+            queries += 1
+            record = session.run("MATCH (sec:structure {name: $section}) RETURN sec", section=section).single()
+            if record and record["sec"]:
+                roots.append(record["sec"])
+        paths = []
+        for root in roots:
+            paths.extend(fetch_all_subsections(session, [root]))
+    sections = [kg.serialize_node(p[-1]) for p in paths]
+
+    queries += 1
+    document_node = kg.query_nodes_by_name(document, 'document')[0]
+    queries += 1
+    concepts = {c['element_id']: c for c in kg.query_nodes_related_by(document_node['element_id'], 'include_in', 'concept')}
+    for section in sections:
+        queries += 1
+        for c in kg.query_nodes_related_by(section['element_id'], 'include_in', 'concept'):
+            concepts[c['element_id']] = c
+    return list(concepts.values()), queries
+
+
+def measure(fn, repeat):
+    elapsed = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        elapsed.append(time.perf_counter() - start)
+    return result, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Subsection traversal benchmark")
+    parser.add_argument('-bolt_url', type=str, help='Bolt URL of an existing Neo4j (default: start a local container)')
+    parser.add_argument('-datapath', type=str, default='_bench', help='Volume path for the local Neo4j container')
+    parser.add_argument('-depth', type=int, default=5, help='Depth of the synthetic TOC')
+    parser.add_argument('-branching', type=int, default=4, help='Subsections per section')
+    parser.add_argument('-concepts', type=int, default=3, help='Concepts per section')
+    parser.add_argument('-repeat', type=int, default=10, help='Repetitions per approach')
+    args = parser.parse_args()
+
+    bolt_url = args.bolt_url
+    if not bolt_url:
+        from knowsys.docker_management import DockerManager
+        _, bolt_url = DockerManager(base_volume_dir=args.datapath).create_container(BENCH_KG_NAME)
+
+    with KnowledgeGraph(uri=bolt_url) as kg:
+        kg.ensure_schema()
+        structure_count = build_toc(kg, args.depth, args.branching, args.concepts)
+        print(f"Neo4j: {bolt_url}, structures: {structure_count}, depth: {args.depth}, branching: {args.branching}")
+
+        section_path = ['bench-toc-0']
+        (legacy, queries), legacy_elapsed = measure(
+            lambda: legacy_section_concepts(kg, BENCH_DOCUMENT, section_path), args.repeat)
+        subtree, subtree_elapsed = measure(
+            lambda: kg.query_section_concepts(BENCH_DOCUMENT, section_path), args.repeat)
+
+        with kg.session() as session:
+            session.run("MATCH (n {file_id: $file_id}) DETACH DELETE n", file_id=BENCH_FILE_ID)
+
+    assert {c['element_id'] for c in legacy} == {c['element_id'] for c in subtree}
+    print(f"legacy   concepts: {len(legacy):6d}, queries: {queries:6d}, "
+          f"median: {statistics.median(legacy_elapsed) * 1000:9.1f} ms")
+    print(f"subtree  concepts: {len(subtree):6d}, queries: {2:6d}, "
+          f"median: {statistics.median(subtree_elapsed) * 1000:9.1f} ms")
+    print(f"Speedup: {statistics.median(legacy_elapsed) / statistics.median(subtree_elapsed):.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+"""
+文件名稱：bench_kg_write.py
+
+功能說明：
+比較 KnowledgeGraph.add_triplets（逐筆 session.run）與 add_triplets_batched（UNWIND 分組批次寫入）
+兩種寫入路徑的每頁寫入時間。資料為模擬 PdfRetriever 產生的頁面 triplets
+（document/structure/concept/fact 節點與 part_of、include_in、is_a 及 fact 間關係）。
+
+使用方式：
+python apps/bench_kg_write.py [-bolt_url <Bolt URL>] [-pages 20] [-triplets 300]
+
+參數說明：
+- bolt_url：既有 Neo4j 的 Bolt URL；未指定時以 DockerManager 建立本機 Neo4j 容器（bench_kg_write）作為測試環境。
+- datapath：未指定 bolt_url 時的容器資料存放路徑，預設為 _bench。
+- pages：每種寫入路徑測試的頁數。
+- triplets：每頁 triplets 數量。
+"""
+
+import argparse
+import os, sys
+import random
+import statistics
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+import app_helper   # 註冊 VERBOSE log level
+
+from knowsys.knowledge_graph import KnowledgeGraph
+
+
+BENCH_KG_NAME = 'bench_kg_write'
+
+
+def make_page_triplets(page_number, triplet_count, concept_pool=40, fact_pool=400):
+    """產生一頁與 PdfRetriever.extract_triplets 結構相同的模擬 triplets。"""
+    document = {'type': 'document', 'name': 'Bench Document', 'meta': {'title': 'Bench Document'}}
+    chapter = {'type': 'structure', 'name': f'Chapter {page_number // 20}'}
+    section = {'type': 'structure', 'name': f'Section {page_number // 5}'}
+    part_of = {'name': 'part_of'}
+    triplets = [(chapter, part_of, document), (section, part_of, chapter)]
+
+    rnd = random.Random(page_number)
+    while len(triplets) < triplet_count:
+        concept = {'type': 'concept', 'name': f'concept-{rnd.randrange(concept_pool)}'}
+        fact = {'type': 'fact', 'name': f'fact-{rnd.randrange(fact_pool)}'}
+        other = {'type': 'fact', 'name': f'fact-{rnd.randrange(fact_pool)}'}
+        triplets.append((concept, {'name': 'include_in'}, section))
+        triplets.append((fact, {'name': 'is_a'}, concept))
+        triplets.append((fact, {'name': 'related_to'}, other))
+    return triplets[:triplet_count]
+
+
+def clear_bench_nodes(kg, file_id):
+    with kg.session() as session:
+        session.run("MATCH (n {file_id: $file_id}) DETACH DELETE n", file_id=file_id)
+
+
+def run_path(kg, add_fn, file_id, pages, triplet_count):
+    elapsed = []
+    for page_number in range(pages):
+        triplets = make_page_triplets(page_number, triplet_count)
+        start = time.perf_counter()
+        add_fn(file_id, page_number, triplets)
+        elapsed.append(time.perf_counter() - start)
+    clear_bench_nodes(kg, file_id)
+    return elapsed
+
+
+def report(title, elapsed):
+    print(f"{title:<12} pages: {len(elapsed):4d}, "
+          f"mean: {statistics.mean(elapsed) * 1000:9.1f} ms/page, "
+          f"median: {statistics.median(elapsed) * 1000:9.1f} ms/page, "
+          f"max: {max(elapsed) * 1000:9.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="KG write path benchmark")
+    parser.add_argument('-bolt_url', type=str, help='Bolt URL of an existing Neo4j (default: start a local container)')
+    parser.add_argument('-datapath', type=str, default='_bench', help='Volume path for the local Neo4j container')
+    parser.add_argument('-pages', type=int, default=20, help='Pages per write path')
+    parser.add_argument('-triplets', type=int, default=300, help='Triplets per page')
+    args = parser.parse_args()
+
+    bolt_url = args.bolt_url
+    if not bolt_url:
+        from knowsys.docker_management import DockerManager
+        _, bolt_url = DockerManager(base_volume_dir=args.datapath).create_container(BENCH_KG_NAME)
+    print(f"Neo4j: {bolt_url}, pages: {args.pages}, triplets/page: {args.triplets}")
+
+    with KnowledgeGraph(uri=bolt_url) as kg:
+        per_triplet = run_path(kg, kg.add_triplets, 'bench-per-triplet', args.pages, args.triplets)
+        batched = run_path(kg, kg.add_triplets_batched, 'bench-batched', args.pages, args.triplets)
+
+    report('per_triplet', per_triplet)
+    report('batched', batched)
+    print(f"Speedup: {statistics.mean(per_triplet) / statistics.mean(batched):.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+"""
+文件名稱：bench_page_pipeline.py
+
+功能說明：
+以模擬的 LLM 呼叫測量 PagePipeline (PdfRetriever 的並行頁面處理) 在不同 concurrency 下的每分鐘頁數。
+每頁依序進行 3~6 次 LLM 呼叫 (與 PdfRetriever.extract_triplets 相同)，每次呼叫的延遲為對數常態分佈，
+少數頁面的延遲放大 (模擬過長的頁面或重試)；LLM 後端可同時處理的請求數以 -llm_slots 限制。
+concurrency 為 1 時即為原本逐頁處理的流程。
+
+使用方式：
+python apps/bench_page_pipeline.py [-pages 60] [-concurrency 1 2 4 8 16] [-latency 0.2] [-llm_slots 16]
+
+參數說明：
+- pages：模擬的頁數。
+- concurrency：要比較的同時處理頁數。
+- latency：每次 LLM 呼叫的平均延遲（秒）。
+- slow_ratio：延遲放大 5 倍的頁面比例，預設 0.05。
+- llm_slots：LLM 後端同時處理的請求上限。
+- unordered：完成即發佈，不依頁碼順序。
+"""
+
+import argparse
+import os, sys
+import random
+import threading
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+import app_helper   # 註冊 VERBOSE log level
+
+from retrieval.page_pipeline import PagePipeline
+
+
+class SimulatedLlm:
+    def __init__(self, latency, slots):
+        self.latency = latency
+        self.slots = threading.Semaphore(slots)
+
+
+    def call(self, rnd, factor=1.0):
+        with self.slots:
+            time.sleep(rnd.lognormvariate(0, 0.5) * self.latency * factor)
+
+
+def make_process_page(llm, slow_ratio):
+    def process_page(page_number, page_content):
+        rnd = random.Random(page_number)
+        factor = 5.0 if rnd.random() < slow_ratio else 1.0
+        for _ in range(rnd.randint(3, 6)):
+            llm.call(rnd, factor)
+        return [page_content]
+    return process_page
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Page pipeline throughput benchmark")
+    parser.add_argument('-pages', type=int, default=60, help='Simulated pages')
+    parser.add_argument('-concurrency', type=int, nargs='+', default=[1, 2, 4, 8, 16], help='Pages in flight to compare')
+    parser.add_argument('-latency', type=float, default=0.2, help='Mean seconds of one LLM call')
+    parser.add_argument('-slow_ratio', type=float, default=0.05, help='Ratio of pages whose LLM calls are 5x slower')
+    parser.add_argument('-llm_slots', type=int, default=16, help='Concurrent requests the LLM backend serves')
+    parser.add_argument('-unordered', action='store_true', help='Publish pages as soon as they are done')
+    args = parser.parse_args()
+
+    pages = [f'page {page_number}' for page_number in range(args.pages)]
+    print(f"pages: {args.pages}, LLM latency: {args.latency}s, LLM slots: {args.llm_slots}, "
+          f"{'unordered' if args.unordered else 'ordered'} publish")
+
+    baseline = None
+    for concurrency in args.concurrency:
+        published = []
+        pipeline = PagePipeline(make_process_page(SimulatedLlm(args.latency, args.llm_slots), args.slow_ratio),
+                                lambda page_number, triplets: published.append(page_number),
+                                concurrency=concurrency, ordered=not args.unordered)
+        stats = pipeline.run(pages)
+        assert args.unordered or published == list(range(args.pages))
+        baseline = baseline or stats['pages_per_minute']
+        print(f"concurrency {concurrency:3d}: {stats['pages_per_minute']:8.1f} pages/min "
+              f"({stats['pages_per_minute'] / baseline:5.1f}x), {stats['seconds']:7.1f}s")
+
+
+if __name__ == '__main__':
+    main()
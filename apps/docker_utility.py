@@ -9,14 +9,30 @@
 1. 使用命令列指令 `create` 建立 Docker 容器。
 2. 指定容器名稱、主機名稱與資料儲存路徑。
 3. 自動回傳容器啟動後的 HTTP 與 Bolt 連線網址。
+4. 建立後自動套用 KG schema（索引與唯一性限制，見 knowsys.kg_schema）。
+5. 使用命令列指令 `import` 將 document_ingest.py -bulk_dir 累積的 triplets 轉成 CSV，
+   以 neo4j-admin 離線匯入新的 KG 後再啟動容器（見 knowsys.bulk_import）。
+6. 使用命令列指令 `start` 並行啟動多個 KG（預設為 datapath 下所有 KG），回報各 KG 就緒所需時間。
+7. 使用命令列指令 `memory` 列出各 KG 依大小計算的記憶體設定、容器實際套用的設定與 page cache 命中率
+   （見 knowsys.memory_profile）。
+8. 使用命令列指令 `export` 將運行中的 KG 匯出為快照封存檔；`restore` 將封存檔匯入新的 KG 後啟動容器
+   （見 knowsys.kg_archive）。
 
 使用方式：
 python docker_utility.py create <container_name> [-hostname <主機名稱>] [-datapath <資料儲存路徑>]
+python docker_utility.py import <container_name> -bulk_dir <triplets 累積資料夾> [-hostname <主機名稱>] [-datapath <資料儲存路徑>]
+python docker_utility.py start [container_name ...] [-parallelism 4] [-hostname <主機名稱>] [-datapath <資料儲存路徑>]
+python docker_utility.py memory [-hostname <主機名稱>] [-datapath <資料儲存路徑>]
+python docker_utility.py export <container_name> -snapshot <封存檔> [-hostname <主機名稱>] [-datapath <資料儲存路徑>]
+python docker_utility.py restore <container_name> -snapshot <封存檔> [-hostname <主機名稱>] [-datapath <資料儲存路徑>]
 
 參數說明：
 - container_name：要建立的 Docker 容器名稱（必填）。
 - -hostname：Docker 主機名稱，預設為 localhost。
 - -datapath：資料存放路徑，預設為目前資料夾。
+- -bulk_dir：document_ingest.py ingest -bulk_dir 指定的資料夾，CSV 會輸出到其下的 csv 子資料夾。
+- -parallelism：start 時同時啟動的容器數，預設為 4。
+- -snapshot：export 輸出 / restore 讀取的快照封存檔 (.kgsnap)，不可放在 datapath 下的 KG 資料夾內。
 
 範例：
 python apps\docker_utility.py create my_neo4j -hostname localhost -datapath _neo4j_volumes
@@ -28,8 +44,11 @@ python docker_utility.py create my_neo4j -hostname 127.0.0.1 -datapath /data/neo
 
 import argparse
 import os, sys
+import time
 
+from knowsys.bulk_import import BulkImportWriter
 from knowsys.docker_management import DockerManager
+from knowsys.knowledge_graph import KnowledgeGraph
 
 
 def create_container(container_name, hostname, datapath):
@@ -37,9 +56,77 @@ def create_container(container_name, hostname, datapath):
     
     docker_manager = DockerManager(hostname=hostname, base_volume_dir=datapath)
     http_url, bolt_url = docker_manager.create_container(container_name)
+    if bolt_url:
+        with KnowledgeGraph(uri=bolt_url) as kg:
+            kg.ensure_schema()
     print(f"Neo4j is up and running at \n{http_url} (HTTP) \nand \n{bolt_url} (Bolt)")
 
 
+def import_container(container_name, hostname, datapath, bulk_dir):
+    print(f"Importing '{bulk_dir}' into a new Docker container named '{container_name}' on host '{hostname}'")
+
+    writer = BulkImportWriter()
+    writer.add_spool(bulk_dir)
+    csv_dir = os.path.join(bulk_dir, 'csv')
+    print(f"CSV: {writer.write(csv_dir)}")
+
+    docker_manager = DockerManager(hostname=hostname, base_volume_dir=datapath)
+    http_url, bolt_url = docker_manager.import_KG(container_name, csv_dir)
+    if bolt_url:
+        with KnowledgeGraph(uri=bolt_url) as kg:
+            kg.ensure_schema()
+    print(f"Neo4j is up and running at \n{http_url} (HTTP) \nand \n{bolt_url} (Bolt)")
+
+
+def export_container(container_name, hostname, datapath, snapshot):
+    docker_manager = DockerManager(hostname=hostname, base_volume_dir=datapath)
+    stats = docker_manager.export_KG(container_name, snapshot)
+    print(f"{stats['nodes']} nodes, {stats['edges']} relationships, "
+          f"{stats['bytes'] / 2**20:.1f} MB in {stats['seconds']:.1f}s")
+
+
+def restore_container(container_name, hostname, datapath, snapshot):
+    print(f"Restoring '{snapshot}' into a new Docker container named '{container_name}' on host '{hostname}'")
+
+    docker_manager = DockerManager(hostname=hostname, base_volume_dir=datapath)
+    http_url, bolt_url = docker_manager.restore_KG(container_name, snapshot)
+    if bolt_url:
+        with KnowledgeGraph(uri=bolt_url) as kg:
+            kg.ensure_schema()
+    print(f"Neo4j is up and running at \n{http_url} (HTTP) \nand \n{bolt_url} (Bolt)")
+
+
+def start_containers(container_names, hostname, datapath, parallelism):
+    docker_manager = DockerManager(hostname=hostname, base_volume_dir=datapath)
+    container_names = container_names or docker_manager.list_KGs()
+    print(f"Starting {len(container_names)} KGs with parallelism {parallelism} ...")
+
+    start_time = time.monotonic()
+    results = docker_manager.ensure_running(container_names, parallelism)
+    for container_name, result in results.items():
+        if result['bolt_url'] and not result['error']:
+            with KnowledgeGraph(uri=result['bolt_url']) as kg:
+                kg.ensure_schema()
+        status = result['error'] or result['bolt_url']
+        print(f"{container_name:30s} {result['seconds']:7.1f}s  {status}")
+    print(f"Total: {time.monotonic() - start_time:.1f}s")
+
+
+def memory_report(hostname, datapath):
+    docker_manager = DockerManager(hostname=hostname, base_volume_dir=datapath)
+
+    def profile_str(profile):
+        return f"{profile.heap_mb}/{profile.pagecache_mb}/{profile.transaction_mb}" if profile else '-'
+
+    print(f"{'KG':24s} {'store MB':>9s} {'nodes':>10s} {'rels':>10s} {'profile':>16s} {'applied':>16s} {'hit ratio':>9s}")
+    for row in docker_manager.memory_report():
+        hit_ratio = f"{row['page_cache_hit_ratio']:.2%}" if row['page_cache_hit_ratio'] is not None else '-'
+        print(f"{row['kg_name']:24s} {row['store_mb']:9.1f} {str(row['nodes'] or '-'):>10s} "
+              f"{str(row['relationships'] or '-'):>10s} {profile_str(row['profile']):>16s} "
+              f"{profile_str(row['applied']):>16s} {hit_ratio:>9s}")
+    print("profile / applied: heap / page cache / transaction MB")
+
+
 def main():
     parser = argparse.ArgumentParser(description="Docker Utility Tool")
     # Sub-command setup
@@ -51,10 +138,52 @@ def main():
     create_parser.add_argument('-hostname', type=str, default='localhost', help='Hostname for the Docker container (default: localhost)')
     create_parser.add_argument('-datapath', type=str, default=os.getcwd(), help='Data storage path for the container (default: current folder)')
 
+    # Offline import sub-command
+    import_parser = subparsers.add_parser('import', help='Create a new KG container from triplets spooled by document_ingest -bulk_dir')
+    import_parser.add_argument('container_name', type=str, help='Name of the Docker container to create')
+    import_parser.add_argument('-bulk_dir', type=str, required=True, help='Folder with the spooled triplets')
+    import_parser.add_argument('-hostname', type=str, default='localhost', help='Hostname for the Docker container (default: localhost)')
+    import_parser.add_argument('-datapath', type=str, default=os.getcwd(), help='Data storage path for the container (default: current folder)')
+
+    # Parallel startup sub-command
+    start_parser = subparsers.add_parser('start', help='Start KG containers concurrently and report the time to ready')
+    start_parser.add_argument('container_names', type=str, nargs='*', help='KGs to start (default: all KGs under datapath)')
+    start_parser.add_argument('-parallelism', type=int, default=4, help='Containers started at once (default: 4)')
+    start_parser.add_argument('-hostname', type=str, default='localhost', help='Hostname for the Docker container (default: localhost)')
+    start_parser.add_argument('-datapath', type=str, default=os.getcwd(), help='Data storage path for the container (default: current folder)')
+
+    # Memory profile report sub-command
+    memory_parser = subparsers.add_parser('memory', help='Show the memory profile and page cache hit ratio of each KG')
+    memory_parser.add_argument('-hostname', type=str, default='localhost', help='Hostname for the Docker container (default: localhost)')
+    memory_parser.add_argument('-datapath', type=str, default=os.getcwd(), help='Data storage path for the container (default: current folder)')
+
+    # Snapshot export / restore sub-commands
+    export_parser = subparsers.add_parser('export', help='Export a running KG into a snapshot archive')
+    export_parser.add_argument('container_name', type=str, help='Name of the KG container to export')
+    export_parser.add_argument('-snapshot', type=str, required=True, help='Snapshot archive to write (.kgsnap)')
+    export_parser.add_argument('-hostname', type=str, default='localhost', help='Hostname for the Docker container (default: localhost)')
+    export_parser.add_argument('-datapath', type=str, default=os.getcwd(), help='Data storage path for the container (default: current folder)')
+
+    restore_parser = subparsers.add_parser('restore', help='Create a new KG container from a snapshot archive')
+    restore_parser.add_argument('container_name', type=str, help='Name of the Docker container to create')
+    restore_parser.add_argument('-snapshot', type=str, required=True, help='Snapshot archive written by export')
+    restore_parser.add_argument('-hostname', type=str, default='localhost', help='Hostname for the Docker container (default: localhost)')
+    restore_parser.add_argument('-datapath', type=str, default=os.getcwd(), help='Data storage path for the container (default: current folder)')
+
     args = parser.parse_args()
 
     if args.command == 'create':
         create_container(args.container_name, args.hostname, args.datapath)
+    elif args.command == 'import':
+        import_container(args.container_name, args.hostname, args.datapath, args.bulk_dir)
+    elif args.command == 'start':
+        start_containers(args.container_names, args.hostname, args.datapath, args.parallelism)
+    elif args.command == 'memory':
+        memory_report(args.hostname, args.datapath)
+    elif args.command == 'export':
+        export_container(args.container_name, args.hostname, args.datapath, args.snapshot)
+    elif args.command == 'restore':
+        restore_container(args.container_name, args.hostname, args.datapath, args.snapshot)
     else:
         print("Unknown command. Use -h for help.")
         sys.exit(1)
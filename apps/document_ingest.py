@@ -10,14 +10,22 @@
 2. 使用 AgentFlow 框架的 Agent 機制執行導入任務。
 3. 將文件內容包裝為 BinaryParcel，並透過發佈機制送出給 PdfRetriever 處理。
 4. 可透過 Ctrl+C 中斷任務執行。
+5. 第一次建立 KG 時可指定 -bulk_dir，triplets 改為累積到該資料夾（可多次導入累積多份文件），
+   再以 docker_utility.py import 離線匯入。
+6. 修訂過的文件可加上 -incremental，只重新擷取與前一版 (同 subject_name 與 document_key) 相比新增或改變的頁面，
+   並撤下來自已改變或移除頁面的節點與關聯。
 
 使用方法：
-python document_ingest.py ingest -subject_name <主題名稱> -file_path <文件路徑> [-toc <TOC檔案路徑>]
+python document_ingest.py ingest -subject_name <主題名稱> -file_path <文件路徑> [-toc <TOC檔案路徑>] [-bulk_dir <累積資料夾>]
+                          [-incremental] [-document_key <文件識別>]
 
 參數說明：
 - subject_name：導入知識的主題名稱，會作為知識圖譜分類。
 - file_path：PDF 文件檔案路徑。
 - toc：選填，用 pprint 格式編寫的章節目錄 TOC 檔案路徑。
+- bulk_dir：選填，PdfRetriever 主機上的資料夾；指定時不寫入 KG，改為累積 triplets 供離線匯入。
+- incremental：選填，與前一版比對頁面，只處理改變的頁面 (不可與 bulk_dir 同時使用)。
+- document_key：選填，識別同一份文件不同版本的名稱，預設為檔名。
 """
 
 import os, sys
@@ -46,6 +54,9 @@ class ExecutionAgent(Agent):
         self.mission = config['mission']
         self.subject_name = config['subject_name']
         self.file_path = config['file_path']
+        self.bulk_dir = config.get('bulk_dir')
+        self.incremental = config.get('incremental', False)
+        self.document_key = config.get('document_key')
         self.toc = toc  
         
         
@@ -67,6 +78,12 @@ class ExecutionAgent(Agent):
         }
         if self.toc:
             pcl_content['toc'] = self.toc
+        if self.bulk_dir:
+            pcl_content['bulk_dir'] = os.path.abspath(self.bulk_dir)
+        if self.incremental:
+            pcl_content['incremental'] = True
+        if self.document_key:
+            pcl_content['document_key'] = self.document_key
         pcl = BinaryParcel(pcl_content)
         self.publish(PdfRetriever.TOPIC_FILE_UPLOAD, pcl)
 
@@ -101,11 +118,14 @@ def load_toc(toc_file):
             sys.exit(1)
 
 
-def ingest_document(subject_name, file_path, toc_file=None):
+def ingest_document(subject_name, file_path, toc_file=None, bulk_dir=None, incremental=False, document_key=None):
     """
     :param subject_name: The subject or category of the knowledge graph.
     :param file_path: The path to the document to be imported.
     :param toc_file: The path to the TOC file in pprint format.
+    :param bulk_dir: Spool triplets into this folder for an offline import instead of writing to the KG.
+    :param incremental: Only re-extract the pages that changed since the previous version of the document.
+    :param document_key: Identifies the versions of the same document, defaults to the filename.
     """
     if not os.path.exists(file_path):
         print(f"Error: The file at '{file_path}' does not exist.")
@@ -120,6 +140,9 @@ def ingest_document(subject_name, file_path, toc_file=None):
     config['mission'] = 'ingest_document'
     config['subject_name'] = subject_name
     config['file_path'] = file_path
+    config['bulk_dir'] = bulk_dir
+    config['incremental'] = incremental
+    config['document_key'] = document_key
     agent = ExecutionAgent(config, toc)
     agent.start_thread()
 
@@ -144,11 +167,14 @@ def main():
     ingest_parser.add_argument('-subject_name', type=str, required=True, help='Subject or category for the KG')
     ingest_parser.add_argument('-file_path', type=str, required=True, help='Path to the document file to be imported')
     ingest_parser.add_argument('-toc', type=str, help='Path to the Table of Contents file in pprint format')
+    ingest_parser.add_argument('-bulk_dir', type=str, help='Spool triplets here for an offline import (see docker_utility.py import)')
+    ingest_parser.add_argument('-incremental', action='store_true', help='Only re-extract pages changed since the previous version')
+    ingest_parser.add_argument('-document_key', type=str, help='Name identifying the versions of a document (default: filename)')
 
     args = parser.parse_args()
 
     if args.command == 'ingest':
-        ingest_document(args.subject_name, args.file_path, args.toc)
+        ingest_document(args.subject_name, args.file_path, args.toc, args.bulk_dir, args.incremental, args.document_key)
     else:
         print("Unknown command. Use -h for help.")
         sys.exit(1)
@@ -0,0 +1,157 @@
+"""
+文件名稱：kg_utility.py
+
+功能說明：
+本程式提供知識圖譜 (Neo4j) 的維護命令列工具。KG 可由容器名稱（透過 DockerManager 取得 Bolt URL）
+或直接以 -bolt_url 指定。
+
+主要功能：
+1. schema：建立或升級 KG 的索引與唯一性限制。
+2. index-report：列出各熱門 Cypher 查詢實際使用的索引與全掃描。
+3. collapse-facts：為既有 fact 補上 fact_key，並合併同一頁重複的 fact (可用 -dry_run 先查看數量)。
+4. slowlog：彙總 [service.kg.profiling] 寫入的慢查詢記錄 (含輪替檔)，依總延遲等欄位列出最慢的語句與其執行計畫。
+
+使用方式：
+python apps/kg_utility.py schema <kg_name> [-hostname <主機名稱>] [-datapath <資料儲存路徑>] [-bolt_url <Bolt URL>]
+python apps/kg_utility.py index-report <kg_name> [-bolt_url <Bolt URL>]
+python apps/kg_utility.py collapse-facts <kg_name> [-file_id <file_id> ...] [-dry_run] [-bolt_url <Bolt URL>]
+python apps/kg_utility.py slowlog <slow log> [<slow log> ...] [-top 20] [-sort total_ms|max_ms|p95_ms|count|max_db_hits] [-plan]
+"""
+
+import argparse
+import os, sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+import app_helper   # 註冊 VERBOSE log level
+
+from knowsys.knowledge_graph import KnowledgeGraph
+from knowsys.query_profiler import read_slow_log, summarize_slow_log
+
+
+def resolve_bolt_url(args):
+    if args.bolt_url:
+        return args.bolt_url
+    from knowsys.docker_management import DockerManager
+    docker_manager = DockerManager(hostname=args.hostname, base_volume_dir=args.datapath)
+    _, bolt_url = docker_manager.get_urls(args.kg_name)
+    if not bolt_url:
+        print(f"KG '{args.kg_name}' is not running.")
+        sys.exit(1)
+    return bolt_url
+
+
+def apply_schema(args):
+    with KnowledgeGraph(uri=resolve_bolt_url(args)) as kg:
+        from_version, to_version = kg.ensure_schema()
+    print(f"KG '{args.kg_name}' schema version: {from_version} -> {to_version}")
+
+
+def index_report(args):
+    with KnowledgeGraph(uri=resolve_bolt_url(args)) as kg:
+        report = kg.index_usage_report()
+    for name, usage in report.items():
+        print(f"{name}:")
+        for index in usage['indexes']:
+            print(f"    index: {index}")
+        for scan in usage['scans']:
+            print(f"    SCAN:  {scan}")
+        if not usage['indexes'] and not usage['scans']:
+            print("    (no index or scan operator)")
+
+
+# 代表性的讀取查詢：某份文件中各 concept 的 is_a fact
+_FACTS_OF_CONCEPTS_QUERY = """
+    MATCH (f:fact)-[:is_a]->(c:concept)
+    WHERE $file_ids IS NULL OR f.file_id IN $file_ids
+    RETURN c.name AS concept, count(f) AS facts
+    """
+
+
+def measure_facts(kg, file_ids):
+    with kg.session() as session:
+        facts = session.run(
+            "MATCH (n:fact) WHERE $file_ids IS NULL OR n.file_id IN $file_ids RETURN count(n) AS facts",
+            file_ids=file_ids).single()["facts"]
+        start = time.perf_counter()
+        session.run(_FACTS_OF_CONCEPTS_QUERY, file_ids=file_ids).consume()
+        elapsed = time.perf_counter() - start
+    return facts, elapsed
+
+
+def collapse_facts(args):
+    file_ids = args.file_id or None
+    with KnowledgeGraph(uri=resolve_bolt_url(args)) as kg:
+        facts_before, latency_before = measure_facts(kg, file_ids)
+        start = time.perf_counter()
+        report = kg.collapse_duplicate_facts(file_ids, dry_run=args.dry_run)
+        elapsed = time.perf_counter() - start
+        facts_after, latency_after = measure_facts(kg, file_ids)
+
+    print(f"KG '{args.kg_name}' {'(dry run) ' if args.dry_run else ''}collapsed in {elapsed:.1f}s: {report}")
+    print(f"fact nodes:          {facts_before:8d} -> {facts_after:8d}")
+    print(f"is_a query latency:  {latency_before * 1000:8.1f} -> {latency_after * 1000:8.1f} ms")
+
+
+def slowlog(args):
+    entries = [entry for path in args.path for entry in read_slow_log(path)]
+    if not entries:
+        print("No slow queries recorded.")
+        return
+    summaries = summarize_slow_log(entries, top=args.top, sort=args.sort)
+    print(f"{len(entries)} slow queries, {len(summaries)} top statements by {args.sort}:")
+    print(f"{'id':<12} {'count':>6} {'total ms':>10} {'mean ms':>9} {'p95 ms':>9} {'max ms':>9} {'rows':>8} {'db hits':>10}")
+    for summary in summaries:
+        db_hits = summary['max_db_hits'] if summary['max_db_hits'] is not None else '-'
+        print(f"{summary['fingerprint_id']:<12} {summary['count']:>6} {summary['total_ms']:>10.1f} "
+              f"{summary['mean_ms']:>9.1f} {summary['p95_ms']:>9.1f} {summary['max_ms']:>9.1f} "
+              f"{summary['mean_rows']:>8} {db_hits:>10}")
+        print(f"    {summary['fingerprint'][:200]}")
+        if args.plan and summary['plan']:
+            for operator in summary['plan']:
+                print(f"    {'  ' * operator['depth']}{operator['operator']} rows={operator['rows']} "
+                      f"db_hits={operator['db_hits']} {operator['details']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Knowledge Graph Utility Tool")
+    subparsers = parser.add_subparsers(dest='command')
+
+    def add_kg_arguments(sub_parser):
+        sub_parser.add_argument('kg_name', type=str, help='Name of the KG (container name)')
+        sub_parser.add_argument('-hostname', type=str, default='localhost', help='Docker host (default: localhost)')
+        sub_parser.add_argument('-datapath', type=str, default=os.getcwd(), help='Data storage path of the KG containers (default: current folder)')
+        sub_parser.add_argument('-bolt_url', type=str, help='Bolt URL of the KG, skips container lookup')
+
+    add_kg_arguments(subparsers.add_parser('schema', help='Create or migrate indexes and constraints of a KG'))
+    add_kg_arguments(subparsers.add_parser('index-report', help='Show which indexes the hot Cypher queries use'))
+    collapse_parser = subparsers.add_parser('collapse-facts', help='Set fact keys and merge duplicate fact nodes')
+    add_kg_arguments(collapse_parser)
+    collapse_parser.add_argument('-file_id', type=str, nargs='*', help='Only these file IDs (default: all)')
+    collapse_parser.add_argument('-dry_run', action='store_true', help='Only count duplicates')
+
+    slowlog_parser = subparsers.add_parser('slowlog', help='Summarize the slow query log')
+    slowlog_parser.add_argument('path', type=str, nargs='+', help='Slow query JSONL files (rotated backups are included)')
+    slowlog_parser.add_argument('-top', type=int, default=20, help='Number of statements to show (default: 20)')
+    slowlog_parser.add_argument('-sort', type=str, default='total_ms',
+                                choices=['total_ms', 'max_ms', 'p95_ms', 'mean_ms', 'count', 'max_db_hits'],
+                                help='Order of the statements (default: total_ms)')
+    slowlog_parser.add_argument('-plan', action='store_true', help='Show the profiled plan of each statement')
+
+    args = parser.parse_args()
+
+    if args.command == 'schema':
+        apply_schema(args)
+    elif args.command == 'index-report':
+        index_report(args)
+    elif args.command == 'collapse-facts':
+        collapse_facts(args)
+    elif args.command == 'slowlog':
+        slowlog(args)
+    else:
+        print("Unknown command. Use -h for help.")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,6 +1,7 @@
 from neo4j import GraphDatabase
 from knowsys.knowledge_graph import KnowledgeGraph
 from knowsys import docker_management
+from knowsys.query_profiler import QueryProfiler
 import random
 
 class FactRetriever:
@@ -9,7 +10,7 @@ class FactRetriever:
 
     def __init__(self, uri) -> None:
         manager = docker_management.DockerManager()
-        self.driver = GraphDatabase.driver(uri)
+        self.driver = QueryProfiler.instrument(GraphDatabase.driver(uri))
     
     
     def query(self, query_statement):
@@ -29,6 +29,7 @@ from agentflow.core.parcel import TextParcel
 
 from services.kg_service import Topic as KgTopic
 from services.llm_service import Topic as LlmTopic
+from knowsys.entity_index import preferred_matches
 from knowsys.knowledge_graph import KnowledgeGraph
 
 
@@ -42,6 +43,9 @@ COL_ENTITIES = 13   # M：命名實體（逗點分隔）
 COL_CLAUSES = 14    # N：子句（分號分隔，主謂賓直接相連）
 FIRST_ROW = 7
 CELL_TOTAL = "A1"
+CLAUSE_BATCH_ROWS = 200     # 每批一起查 KG 子句的題數
+# 實體比對的節點 label，依優先順序 (名稱相同時 fact 優先)；structure / document 只做名稱比對
+ENTITY_LABELS = ("fact", "concept", "structure", "document")
 
 NER_PROMPT_TEMPLATE = """請從以下試題文字中，抽出「命名實體」（專有名詞、重要概念、術語），不要選項代號或題幹中的 (A)(B)(C)(D)。
 只回傳一個 JSON 物件，格式為：{"named_entities": ["實體1", "實體2", ...]}，不要其他說明。
@@ -81,30 +85,46 @@ def extract_entities_from_llm_response(response_text):
     return []
 
 
+def entities_to_clauses_many(kg, entity_lists):
+    """
+    entities_to_clauses 的批次版本：多題的命名實體一起以 resolve_entities 比對節點
+    (名稱、別名與模糊比對)，比對及關聯查詢各只需一次，回傳每題的子句 list。
+    kg 可為 KnowledgeGraph 或 GraphSnapshot。
+    """
+    entity_lists = [[e.strip() for e in (entities or []) if (e or "").strip()] for entities in entity_lists]
+    names = list(dict.fromkeys(e for entities in entity_lists for e in entities))
+
+    # limit=None：同名的 fact 可能出現在許多頁，不可截斷
+    matches = kg.resolve_entities(names, labels=ENTITY_LABELS, limit=None)
+    nodes_by_name = {name: [entry["node"] for entry in preferred_matches(matches[name], ENTITY_LABELS)]
+                     for name in names}
+    eids = list(dict.fromkeys(node["element_id"] for nodes in nodes_by_name.values()
+                              for node in nodes if node.get("element_id")))
+    relationships = kg.query_all_relationships_many(eids)
+
+    clause_lists = []
+    for entities in entity_lists:
+        clauses = []
+        seen = set()
+        for entity in entities:
+            for node in nodes_by_name[entity]:
+                eid = node.get("element_id")
+                if not eid:
+                    continue
+                for subj, rel, obj in relationships[eid]:
+                    key = (subj, rel, obj)
+                    if key in seen:
+                        continue
+                    seen.add(key)
+                    # 主+謂+賓直接相連，不用 —> 等符號
+                    clauses.append(f"{subj} {rel} {obj}")
+        clause_lists.append(clauses)
+    return clause_lists
+
+
 def entities_to_clauses(kg, entity_list):
     """依命名實體列表查 KG：fact 節點 → 連出連入關聯 → 主謂賓子句（直接相連無符號），去重後以 list 回傳。"""
-    clauses = []
-    seen = set()
-    for entity in (entity_list or []):
-        entity = (entity or "").strip()
-        if not entity:
-            continue
-        nodes = kg.query_nodes_by_name(entity, label="fact")
-        if not nodes:
-            nodes = kg.query_nodes_by_name(entity)
-        for node in nodes:
-            eid = node.get("element_id")
-            if not eid:
-                continue
-            for subj, rel, obj in kg.query_all_relationships(eid):
-                key = (subj, rel, obj)
-                if key in seen:
-                    continue
-                seen.add(key)
-                # 主+謂+賓直接相連，不用 —> 等符號
-                clause = f"{subj} {rel} {obj}"
-                clauses.append(clause)
-    return clauses
+    return entities_to_clauses_many(kg, [entity_list])[0]
 
 
 class XlsxEntitiesClausesAgent(Agent):
@@ -175,6 +195,8 @@ class XlsxEntitiesClausesAgent(Agent):
             wb.close()
             return False
 
+        # 先逐題 LLM NER 寫入 M 欄，再每 CLAUSE_BATCH_ROWS 題一起查 KG 子句寫入 N 欄
+        row_entities = []
         for i in range(total):
             row = FIRST_ROW + i
             stem = ws.cell(row=row, column=COL_STEM).value or ""
@@ -188,12 +210,15 @@ class XlsxEntitiesClausesAgent(Agent):
             entities = self.call_llm_ner(question_text)
             entities_str = "，".join(entities) if entities else ""
             ws.cell(row=row, column=COL_ENTITIES, value=entities_str)
+            row_entities.append(entities)
 
-            clauses = []
-            with KnowledgeGraph(uri=self.bolt_url) as kg:
-                clauses = entities_to_clauses(kg, entities)
-            clauses_str = "；".join(clauses) if clauses else ""
-            ws.cell(row=row, column=COL_CLAUSES, value=clauses_str)
+        # 整個檔案共用同一個 KnowledgeGraph（driver 由 DriverRegistry 共用）
+        with KnowledgeGraph(uri=self.bolt_url) as kg:
+            for start in range(0, total, CLAUSE_BATCH_ROWS):
+                clause_lists = entities_to_clauses_many(kg, row_entities[start:start + CLAUSE_BATCH_ROWS])
+                for offset, clauses in enumerate(clause_lists):
+                    clauses_str = "；".join(clauses) if clauses else ""
+                    ws.cell(row=FIRST_ROW + start + offset, column=COL_CLAUSES, value=clauses_str)
 
         wb.save(file_path)
         wb.close()
@@ -25,4 +25,9 @@ class NodeRanker(ABC):
     def rank_facts(self, concept) -> List[Any]:
         """根據排名選擇多個重要事實"""
         return []
+
+
+    def rank_facts_many(self, concepts) -> List[List[Any]]:
+        """依序對每個概念呼叫 rank_facts；子類別可覆寫以同時查詢"""
+        return [self.rank_facts(concept) for concept in concepts]
     
\ No newline at end of file
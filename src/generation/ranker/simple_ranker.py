@@ -3,6 +3,7 @@ from typing import List, Any
 
 from agentflow.core.parcel import TextParcel
 from generation.ranker.node_ranker import NodeRanker
+from knowsys.async_knowledge_graph import FanOutKnowledgeGraph
 from knowsys.knowledge_graph import KnowledgeGraph
 from services.kg_service import Topic
 
@@ -30,3 +31,14 @@ class SimpleRanker(NodeRanker):
             facts = kg.query_nodes_related_by(concept['element_id'], 'is_a', 'fact')
         
         return random.sample(facts, min(5, len(facts))) if facts else []
+
+
+    def rank_facts_many(self, concepts) -> List[List[Any]]:
+        """ 各概念的 is_a 事實同時查詢 (見 async_knowledge_graph)，只取得一次 Bolt URL。 """
+        pcl = TextParcel({'kg_name': self.subject})
+        bolt_url = self.agent.publish_sync(Topic.ACCESS_POINT.value, pcl).content['bolt_url']
+        with FanOutKnowledgeGraph(uri=bolt_url) as kg:
+            fact_lists = kg.gather([('query_nodes_related_by', concept['element_id'], 'is_a', 'fact')
+                                    for concept in concepts])
+
+        return [random.sample(facts, min(5, len(facts))) if facts else [] for facts in fact_lists]
@@ -1,6 +1,7 @@
 from typing import List, Any
 from generation.ranker.node_ranker import NodeRanker
 from neo4j import GraphDatabase
+from knowsys.query_profiler import QueryProfiler
 import networkx as nx
 from collections import defaultdict
 import math
@@ -17,7 +18,7 @@ class ConceptScorer:
         self.pagerank_scores = None
 
     def connect(self):
-        self.driver = GraphDatabase.driver(self.uri, auth=(self.username, self.password))
+        self.driver = QueryProfiler.instrument(GraphDatabase.driver(self.uri, auth=(self.username, self.password)))
 
     def disconnect(self):
         if self.driver:
@@ -24,7 +24,9 @@ from evaluation.scq_evaluator import ScqEvaluator
 from generation.ranker.node_ranker import NodeRanker
 from generation.ranker.simple_ranker import SimpleRanker
 from generation.ranker.wm_ranker import WasteManagementRanker
+from knowsys.async_knowledge_graph import FanOutKnowledgeGraph
 from knowsys.knowledge_graph import KnowledgeGraph
+from knowsys.query_profiler import QueryProfiler
 
 
 
@@ -42,6 +44,7 @@ class SingleChoiceGenerator(Agent):
     #     70: 16
     # }
     weights = [1, 1, 1.5, 1, 1, 1, 1.2] # 定義各參數的權重  
+    fanout_rounds = 2   # generate_question 每次同時查詢的輪數
 
     def __init__(self, config:dict):
         logger.info(f"config: {config}")
@@ -50,9 +53,21 @@ class SingleChoiceGenerator(Agent):
 
     def on_activate(self):
         logger.verbose(f"on_activate")
+        kg_cfg = app_helper.config.get('service', {}).get('kg', {})
+        if kg_cfg.get('profiling') is not None:
+            # 慢查詢記錄不放在 KG service 的 datapath (Docker volume)，預設為 generation 的資料目錄
+            QueryProfiler.configure_from(kg_cfg['profiling'], app_helper.get_generation_data_directory(),
+                                         process_name='scq')
         self.subscribe(SingleChoiceGenerator.TOPIC_CREATE, topic_handler=self.handle_create)
 
 
+    def on_terminated(self):
+        # ranker 的 FanOutKnowledgeGraph 共用 process 內的 async client，結束時關閉其連線池
+        FanOutKnowledgeGraph.close_all()
+        if QueryProfiler.default():
+            QueryProfiler.default().close()
+
+
     def handle_create(self, topic, pcl:TextParcel):
         # question_criteria = {
         #     'question_id': 'Q101',              # 使用者自訂題目 ID
@@ -160,17 +175,24 @@ class SingleChoiceGenerator(Agent):
         # ranker = SimpleRanker(self, subject, document, section)
         # ranker = WeightedRanker(self, qc['subject'], qc['document'], qc['section'])
         count = question_criteria.get('difficulty', 30) // 3
+        # 每次取 fanout_rounds 輪：各輪 concept 的 facts 同時查詢，facts 的鄰居再以一次查詢取得；
+        # 素材足夠即停止，不查詢之後各輪 (同逐輪查詢的提早結束)
         text_materials = []
-        for _ in range(count):
-            core_concept = ranker.rank_concepts(concepts)
-            facts = ranker.rank_facts(core_concept)
-            logger.verbose(f"facts: {', '.join([n['name'] for n in facts])}")
-            if not facts:
-                continue
-
-            text_materials.extend(self._generate_text_materials(subject, facts))
-            if len(text_materials) >= count:
-                break
+        rounds = 0
+        while rounds < count and len(text_materials) < count:
+            batch = min(SingleChoiceGenerator.fanout_rounds, count - rounds)
+            rounds += batch
+            core_concepts = [ranker.rank_concepts(concepts) for _ in range(batch)]
+            fact_lists = ranker.rank_facts_many(core_concepts)
+            materials = self._generate_text_materials_many(subject, fact_lists)
+            for facts, texts in zip(fact_lists, materials):
+                logger.verbose(f"facts: {', '.join([n['name'] for n in facts])}")
+                if not facts:
+                    continue
+
+                text_materials.extend(texts)
+                if len(text_materials) >= count:
+                    break
             
         logger.debug(f"text_materials: {text_materials}")
         if not text_materials:
@@ -459,43 +481,37 @@ Text materials:
 
 
     def _generate_text_materials(self, subject, fact_nodes):
-        def generate_text_from_paths(records):
-            """
-            從每個 record 取得路徑 (path)，
-            提取 (start_node)-[rel]->(end_node) 組成文字描述。
-            """
-            text_segments = set()
-            for record in records:
-                path = record["p"] 
-                for rel in path.relationships:
-                    start_node = rel.start_node
-                    end_node = rel.end_node
-                    
-                    s_name = start_node.get("name", "(unknown)") 
-                    e_name = end_node.get("name", "(unknown)") 
-                    rel = rel.type
-                    text_segments.add(f"{s_name} {rel} {e_name}")
-
-            texts = list(text_segments)
-            logger.verbose(f"text_segments: {texts}")
-            return texts
-
-
-        query = """
-            MATCH p = (start:fact)-[*1..1]-(other:fact)
-            WHERE elementId(start) = $start_element_id
-            RETURN p
-        """
-        pcl = TextParcel({'kg_name': subject})
-        bolt_url = self.publish_sync(KgTopic.ACCESS_POINT.value, pcl).content['bolt_url']
-        text_materials = []
-        with KnowledgeGraph(uri=bolt_url) as kg:
-            with kg.session() as session:
-                for fact in fact_nodes:
-                    results = session.run(query, start_element_id=fact['element_id'])
-                    text_materials.extend(generate_text_from_paths(results))
+        return self._generate_text_materials_many(subject, [fact_nodes])[0]
+
 
-        return text_materials
+    def _generate_text_materials_many(self, subject, fact_groups):
+        """
+        以一次查詢取得各組所有 fact 的一跳 fact 鄰居，
+        每個關聯組成 "(start_node) rel (end_node)" 文字描述，依組回傳。
+        """
+        eids = list(dict.fromkeys(fact['element_id'] for facts in fact_groups for fact in facts))
+        neighbors = {}
+        if eids:
+            pcl = TextParcel({'kg_name': subject})
+            bolt_url = self.publish_sync(KgTopic.ACCESS_POINT.value, pcl).content['bolt_url']
+            with KnowledgeGraph(uri=bolt_url) as kg:
+                neighbors = kg.query_neighbors_many(eids, label='fact')
+
+        materials = []
+        for fact_nodes in fact_groups:
+            text_materials = []
+            for fact in fact_nodes:
+                name = fact.get("name", "(unknown)")
+                text_segments = set()
+                for rel, outgoing, other in neighbors[fact['element_id']]:
+                    other_name = other.get("name", "(unknown)")
+                    text_segments.add(f"{name} {rel} {other_name}" if outgoing else f"{other_name} {rel} {name}")
+                texts = list(text_segments)
+                logger.verbose(f"text_segments: {texts}")
+                text_materials.extend(texts)
+            materials.append(text_materials)
+
+        return materials
         # return [
         #     "104 年全國各縣市焚化底渣產量約占焚化量之 15%",
         #     "104 年度一般廢棄物底渣再利用量占該年度底渣總量之89.3%",
@@ -0,0 +1,317 @@
+"""
+以 neo4j async driver 實作的 KG 讀取。
+
+出一道題需要 concept 查詢、數次 rank_facts 與 fact 的素材查詢，過去全部經由同步的 KnowledgeGraph 依序執行，
+KG 時間是各查詢往返時間的總和。AsyncKnowledgeGraph 提供與 KnowledgeGraph 相同的讀取方法
+(語句與結果整理共用 KnowledgeGraph 的常數與 helper)，每個查詢使用各自的 session，
+互不相依的查詢可以 gather() 同時送出，例如一道題各 concept 的 facts、一份文件各 section 的子樹。
+
+既有的同步 agent 照常使用 KnowledgeGraph；需要同時送出多個查詢時使用 FanOutKnowledgeGraph：
+在 process 共用的背景 event loop 上執行 AsyncKnowledgeGraph，以同步方法呼叫 (agentflow 的 handler 不在 event loop 中)。
+寫入 (add_triplets 等) 仍只由 KnowledgeGraph 提供。
+async driver 不經過 DriverRegistry，語句的延遲由 _records 直接記錄到共用的 QueryProfiler。
+"""
+import asyncio
+import inspect
+import os
+import threading
+import time
+
+from neo4j import AsyncGraphDatabase
+from neo4j.exceptions import ClientError
+
+from knowsys import entity_index
+from knowsys.knowledge_graph import KnowledgeGraph
+from knowsys.query_profiler import QueryProfiler
+
+import logging
+logger:logging.Logger = logging.getLogger(os.getenv('LOGGER_NAME'))
+
+
+serialize_node = KnowledgeGraph.serialize_node
+
+
+
+class AsyncKnowledgeGraph:
+    def __init__(self, uri="bolt://localhost:7687", auth=None, max_concurrency=8, **driver_params):
+        """
+        :param max_concurrency: 同時執行的查詢 (session) 上限，超過者等待
+        :param driver_params: 傳給 AsyncGraphDatabase.driver 的其他參數，例如 max_connection_pool_size
+        """
+        self.uri = uri
+        self.driver = AsyncGraphDatabase.driver(uri, auth=auth, **driver_params)
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+
+
+    async def __aenter__(self):
+        return self
+
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+
+    async def close(self):
+        if self.driver is not None:
+            await self.driver.close()
+            self.driver = None
+
+
+    async def _records(self, query, **params):
+        """ 以獨立的 session 執行一個查詢並讀取所有 records；已 configure QueryProfiler 時記錄延遲。 """
+        async with self._semaphore:
+            profiler = QueryProfiler.default()
+            start = time.perf_counter()
+            records, error = [], None
+            try:
+                async with self.driver.session() as session:
+                    result = await session.run(query, **params)
+                    records = [record async for record in result]
+                    return records
+            except Exception as e:
+                error = e
+                raise
+            finally:
+                if profiler:
+                    # 不傳 driver：PROFILE 重跑由同步的背景 thread 執行，無法使用 async driver
+                    profiler.record(query, params, time.perf_counter() - start, len(records), error)
+
+
+    @staticmethod
+    async def gather(aws):
+        """ 同時執行多個查詢 (coroutine)，依序回傳結果；任一查詢失敗時拋出其例外。 """
+        return list(await asyncio.gather(*aws))
+
+
+    async def query_nodes_by_name(self, node_name, label=None):
+        records = await self._records(KnowledgeGraph._nodes_by_name_query(label), node_name=node_name)
+        return [serialize_node(record["n"]) for record in records]
+
+
+    async def query_nodes_related_by(self, node_eid, relation=None, label=None):
+        records = await self._records(KnowledgeGraph._nodes_related_by_query(relation, label), node_eid=node_eid)
+        return [serialize_node(record["m"]) for record in records]
+
+
+    async def query_nodes_relate_to(self, node_eid, relation=None, label=None):
+        records = await self._records(KnowledgeGraph._nodes_relate_to_query(relation, label), node_eid=node_eid)
+        return [serialize_node(record["m"]) for record in records]
+
+
+    async def query_all_relationships(self, element_id):
+        """ 連出與連入兩個查詢同時執行，回傳的順序與 KnowledgeGraph 相同 (連出在前)。 """
+        outgoing, incoming = await self.gather([
+            self._records(KnowledgeGraph._OUTGOING_RELATIONSHIPS_QUERY, eid=element_id),
+            self._records(KnowledgeGraph._INCOMING_RELATIONSHIPS_QUERY, eid=element_id),
+        ])
+        return [(record["subj"], record["rel"], record["obj"]) for record in outgoing + incoming]
+
+
+    async def query_nodes_by_names(self, node_names, label=None):
+        nodes = {name: [] for name in node_names}
+        if not nodes:
+            return nodes
+        for record in await self._records(KnowledgeGraph._nodes_by_names_query(label), names=list(nodes)):
+            nodes[record["name"]].append(serialize_node(record["n"]))
+        return nodes
+
+
+    async def resolve_entities(self, surface_forms, labels=('fact', 'concept'), limit=5, min_score=0.5):
+        """ 見 KnowledgeGraph.resolve_entities；全文查詢依賴名稱查詢的結果，兩者依序執行。 """
+        surfaces = list(dict.fromkeys(surface_forms))
+        candidates = {surface: [] for surface in surfaces}
+        if not surfaces:
+            return candidates
+
+        for record in await self._records(KnowledgeGraph._exact_names_query(labels), names=surfaces):
+            candidates[record["name"]].append(serialize_node(record["n"]))
+        params, _ = KnowledgeGraph._fulltext_lookups(surfaces, candidates, labels, limit)
+        if params:
+            try:
+                for record in await self._records(KnowledgeGraph._FULLTEXT_LOOKUP_QUERY, **params):
+                    candidates[record["surface"]].append(serialize_node(record["node"]))
+            except ClientError as e:
+                logger.warning(f"Fulltext entity lookup failed, exact names only: {e.message}")
+
+        return {surface: entity_index.rank_matches(surface, nodes, labels, limit, min_score)
+                for surface, nodes in candidates.items()}
+
+
+    async def query_all_relationships_many(self, element_ids):
+        outgoing = {eid: [] for eid in element_ids}
+        incoming = {eid: [] for eid in element_ids}
+        if not outgoing:
+            return outgoing
+        out_records, in_records = await self.gather([
+            self._records(KnowledgeGraph._OUTGOING_RELATIONSHIPS_MANY_QUERY, eids=list(outgoing)),
+            self._records(KnowledgeGraph._INCOMING_RELATIONSHIPS_MANY_QUERY, eids=list(outgoing)),
+        ])
+        for triples, records in ((outgoing, out_records), (incoming, in_records)):
+            for record in records:
+                triples[record["eid"]].append((record["subj"], record["rel"], record["obj"]))
+        return {eid: outgoing[eid] + incoming[eid] for eid in outgoing}
+
+
+    async def query_neighbors_many(self, element_ids, relation=None, label=None):
+        neighbors = {eid: [] for eid in element_ids}
+        if not neighbors:
+            return neighbors
+        for record in await self._records(KnowledgeGraph._neighbors_many_query(relation, label), eids=list(neighbors)):
+            neighbors[record["eid"]].append((record["rel"], record["outgoing"], serialize_node(record["m"])))
+        return neighbors
+
+
+    async def query_subsections(self, document, section_path=None):
+        """ 見 KnowledgeGraph.query_subsections。 """
+        if section_path:
+            sections = [section_path] if isinstance(section_path, str) else list(section_path)
+            records = await self._records(KnowledgeGraph._SECTION_SUBTREES_QUERY, sections=sections)
+            if records:
+                return [serialize_node(sub) for sub in KnowledgeGraph._preorder_subtrees(records)]
+            logger.warning(f"No structure found for section_path={section_path}, "
+                           f"fallback to query_subsections(document, None).")
+
+        records = await self._records(KnowledgeGraph._DOCUMENT_SUBTREES_QUERY, document=document)
+        return [serialize_node(sub) for sub in KnowledgeGraph._preorder_subtrees(records)]
+
+
+    async def query_section_concepts(self, document, section_path=None):
+        sections = await self.query_subsections(document, section_path)
+        records = await self._records(KnowledgeGraph._SECTION_CONCEPTS_QUERY,
+                                      document=document, section_eids=[s['element_id'] for s in sections])
+        return [serialize_node(record["c"]) for record in records]
+
+
+    async def query_section_concepts_many(self, criteria):
+        """ 見 KnowledgeGraph.query_section_concepts_many；各 criterion 的子樹同時查詢，兩個 concept 查詢也同時執行。 """
+        keys = list(dict.fromkeys(KnowledgeGraph._criterion_key(document, section_path)
+                                  for document, section_path in criteria))
+        if not keys:
+            return []
+        sections = await self.gather([self.query_subsections(document, section_path) for document, section_path in keys])
+        subtrees = {key: [s['element_id'] for s in nodes] for key, nodes in zip(keys, sections)}
+
+        documents = sorted({document for document, _ in subtrees})
+        section_eids = sorted({eid for eids in subtrees.values() for eid in eids})
+        document_concepts = {document: {} for document in documents}
+        section_concepts = {eid: {} for eid in section_eids}
+        document_records, section_records = await self.gather([
+            self._records(KnowledgeGraph._DOCUMENTS_CONCEPTS_QUERY, documents=documents),
+            self._records(KnowledgeGraph._SECTIONS_CONCEPTS_QUERY, section_eids=section_eids),
+        ])
+        for record in document_records:
+            node = serialize_node(record["c"])
+            document_concepts[record["document"]][node['element_id']] = node
+        for record in section_records:
+            node = serialize_node(record["c"])
+            section_concepts[record["eid"]][node['element_id']] = node
+        return KnowledgeGraph._merge_section_concepts(criteria, subtrees, document_concepts, section_concepts)
+
+
+
+class _EventLoopThread:
+    """ 在 daemon thread 上執行的 event loop，同一 process 共用一個。 """
+    _default:'_EventLoopThread' = None
+    _lock = threading.Lock()
+
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, name='kg-async-loop', daemon=True)
+        self.thread.start()
+
+
+    @staticmethod
+    def default() -> '_EventLoopThread':
+        with _EventLoopThread._lock:
+            if _EventLoopThread._default is None:
+                _EventLoopThread._default = _EventLoopThread()
+            return _EventLoopThread._default
+
+
+    def run(self, coro, timeout=None):
+        """ 在背景 loop 上執行 coroutine 並等待結果；不可在該 loop 的 thread 內呼叫。 """
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result(timeout)
+
+
+
+async def _create_client(uri, auth, params):
+    # async driver 須在使用它的 event loop 上建立
+    return AsyncKnowledgeGraph(uri, auth, **params)
+
+
+
+class FanOutKnowledgeGraph:
+    """
+    AsyncKnowledgeGraph 的同步介面：讀取方法與 KnowledgeGraph 相同 (阻塞直到結果回傳)，
+    gather() 將多個查詢同時送出。
+    """
+    _shared:dict[tuple, AsyncKnowledgeGraph] = {}
+    _shared_lock = threading.Lock()
+
+
+    def __init__(self, uri="bolt://localhost:7687", auth=None, shared=True, timeout=None, **params):
+        """
+        :param shared: True 時使用 process 內同一 URI 共用的 async client (連線池跨呼叫重複使用)，close() 不關閉它；
+            False 時自行建立並於 close() 關閉。
+        :param timeout: 每次呼叫等待結果的秒數上限；None 表示一直等待
+        :param params: 傳給 AsyncKnowledgeGraph 的參數 (只在建立新的 client 時使用)
+        """
+        self._loop = _EventLoopThread.default()
+        self.shared = shared
+        self.timeout = timeout
+        if shared:
+            key = (uri, auth)
+            with FanOutKnowledgeGraph._shared_lock:
+                if key not in FanOutKnowledgeGraph._shared:
+                    FanOutKnowledgeGraph._shared[key] = self._loop.run(_create_client(uri, auth, params))
+                self.client = FanOutKnowledgeGraph._shared[key]
+        else:
+            self.client = self._loop.run(_create_client(uri, auth, params))
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+    def __getattr__(self, name):
+        if name == 'client':
+            raise AttributeError(name)
+        method = getattr(self.client, name)
+        if not inspect.iscoroutinefunction(method):
+            return method
+
+        def call(*args, **kwargs):
+            return self._loop.run(method(*args, **kwargs), self.timeout)
+        return call
+
+
+    def gather(self, calls):
+        """
+        同時執行多個查詢，依序回傳結果。
+
+        :param calls: list of (方法名稱, 位置參數...)，例如 [('query_nodes_related_by', eid, 'is_a', 'fact'), ...]
+        """
+        aws = [getattr(self.client, name)(*args) for name, *args in calls]
+        return self._loop.run(AsyncKnowledgeGraph.gather(aws), self.timeout)
+
+
+    def close(self):
+        if not self.shared and self.client is not None:
+            self._loop.run(self.client.close())
+        self.client = None
+
+
+    @staticmethod
+    def close_all():
+        """ 關閉所有共用的 async client。 """
+        with FanOutKnowledgeGraph._shared_lock:
+            clients = list(FanOutKnowledgeGraph._shared.values())
+            FanOutKnowledgeGraph._shared.clear()
+        loop = _EventLoopThread.default()
+        for client in clients:
+            loop.run(client.close())
@@ -0,0 +1,176 @@
+"""
+第一次建立 KG 時的離線批次匯入。
+
+線上模式中 PdfRetriever 每頁發佈 TRIPLETS_ADD，由 kg_service 以交易逐頁 MERGE；
+對全新的資料庫而言這是最慢的載入方式。離線模式改為：
+1. spool_page()：每頁的 triplets 先附加到 <bulk_dir>/triplets.jsonl (可累積多份文件)。
+2. BulkImportWriter：依 add_triplets 的語意去重節點與關聯，輸出 neo4j-admin 的 header + data CSV。
+3. DockerManager.import_KG()：容器啟動前以 neo4j-admin database import full 一次匯入。
+"""
+import csv
+import json
+import os
+import threading
+
+from knowsys.fact_identity import fact_key
+from knowsys.knowledge_graph import KnowledgeGraph
+from knowsys.page_provenance import page_source
+
+import logging
+logger:logging.Logger = logging.getLogger(os.getenv('LOGGER_NAME'))
+
+
+SPOOL_FILENAME = 'triplets.jsonl'
+NODE_HEADER = 'nodes_header.csv'
+NODE_DATA = 'nodes.csv'
+RELATIONSHIP_HEADER = 'relationships_header.csv'
+RELATIONSHIP_DATA = 'relationships.csv'
+ARRAY_DELIMITER = '\x1f'        # aliases 內可能出現 ';' (neo4j-admin 預設分隔字元)
+
+# 未命名的 :ID 只供匯入時連結關聯，不會在節點上留下 id 屬性
+_NODE_COLUMNS = [':ID', ':LABEL', 'name', 'file_id', 'page_number:int', 'aliases:string[]', 'metadata', 'fact_key']
+_RELATIONSHIP_COLUMNS = [':START_ID', ':END_ID', ':TYPE', 'sources:string[]']
+
+_spool_lock = threading.Lock()
+
+
+def spool_page(bulk_dir, file_id, page_number, triplets):
+    """ 將一頁的 triplets 附加到 bulk_dir 的 spool 檔，格式與 TRIPLETS_ADD 的內容相同。 """
+    os.makedirs(bulk_dir, exist_ok=True)
+    line = json.dumps({'file_id': file_id, 'page_number': page_number, 'triplets': triplets}, ensure_ascii=False)
+    with _spool_lock:
+        with open(os.path.join(bulk_dir, SPOOL_FILENAME), 'a', encoding='utf-8') as f:
+            f.write(line + '\n')
+
+
+def neo4j_admin_import_args(import_dir='/import', database='neo4j'):
+    """ 回傳匯入 BulkImportWriter 輸出檔案的 neo4j-admin 命令；import_dir 為容器內的掛載路徑。 """
+    return [
+        'neo4j-admin', 'database', 'import', 'full',
+        f"--nodes={import_dir}/{NODE_HEADER},{import_dir}/{NODE_DATA}",
+        f"--relationships={import_dir}/{RELATIONSHIP_HEADER},{import_dir}/{RELATIONSHIP_DATA}",
+        f"--array-delimiter={ARRAY_DELIMITER}",
+        '--multiline-fields=true',
+        '--overwrite-destination=true',
+        database,
+    ]
+
+
+
+class BulkImportWriter:
+    """
+    累積整份文件 (或多份文件) 去重後的節點與關聯，語意與 KnowledgeGraph.add_triplets_batched 相同：
+    - fact 節點每 (label, fact_key) 建立一次，屬性取第一次出現。
+    - 其他節點以 (label, name) MERGE，屬性以最後一次 SET 為準。
+    - 關聯連結寫入當下所有同 label、同名的節點，並以 (start, type, end) 去重，sources 為產生關聯的頁面。
+    """
+    def __init__(self):
+        self._properties:list[dict] = []         # node id -> 屬性 (含 label)
+        self._nodes_by_key:dict = {}            # (label, name) -> [node id]
+        self._facts:dict = {}                   # (label, fact_key) -> node id
+        self._types:dict = {}                   # relation type -> type id
+        self._relationships:dict = {}           # (start id, type id, end id) -> [page source]
+        self.pages = 0
+        self.triplets = 0
+
+
+    def _plan_node(self, node, is_object, file_id, page_number):
+        kind = KnowledgeGraph._node_write_kind(node, is_object)
+        label = node.get('type', 'Entity')
+        name = node["name"]
+        if kind == 'fact':
+            key = (label, fact_key(file_id, page_number, name))
+            if key not in self._facts:
+                self._facts[key] = self._new_node(label, name, {
+                    'file_id': file_id,
+                    'page_number': page_number,
+                    'aliases': node.get("aliases", []),
+                    'fact_key': key[1],
+                })
+            return
+
+        ids = self._nodes_by_key.get((label, name))
+        node_id = ids[0] if ids else self._new_node(label, name, {})
+        properties = self._properties[node_id]
+        properties['file_id'] = file_id
+        if kind == 'document':
+            properties['metadata'] = json.dumps(node.get("meta", None))
+        elif kind == 'concept':
+            properties['aliases'] = node.get("aliases", [])
+
+
+    def _new_node(self, label, name, properties):
+        node_id = len(self._properties)
+        self._properties.append({'label': label, 'name': name, **properties})
+        self._nodes_by_key.setdefault((label, name), []).append(node_id)
+        return node_id
+
+
+    def add_triplets(self, file_id, page_number, triplets):
+        """ 加入一頁的 triplets；與批次寫入相同，先建立整頁的節點，再建立關聯。 """
+        for subject, _, obj in triplets:
+            self._plan_node(subject, False, file_id, page_number)
+            self._plan_node(obj, True, file_id, page_number)
+
+        source = page_source(file_id, page_number)
+        for subject, predicate, obj in triplets:
+            type_id = self._types.setdefault(predicate["name"], len(self._types))
+            subject_ids = self._nodes_by_key.get((subject.get('type', 'Entity'), subject["name"]), [])
+            object_ids = self._nodes_by_key.get((obj.get('type', 'Entity'), obj["name"]), [])
+            for start in subject_ids:
+                for end in object_ids:
+                    sources = self._relationships.setdefault((start, type_id, end), [])
+                    if source not in sources:
+                        sources.append(source)
+
+        self.pages += 1
+        self.triplets += len(triplets)
+
+
+    def add_spool(self, bulk_dir):
+        """ 依序加入 spool_page() 寫入的所有頁面。 """
+        with open(os.path.join(bulk_dir, SPOOL_FILENAME), encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    page = json.loads(line)
+                    self.add_triplets(page['file_id'], page['page_number'], page['triplets'])
+
+
+    def write(self, output_dir):
+        """ 輸出 neo4j-admin 匯入用的 header 與 data CSV，回傳統計資料。 """
+        os.makedirs(output_dir, exist_ok=True)
+
+        def write_csv(filename, rows):
+            with open(os.path.join(output_dir, filename), 'w', encoding='utf-8', newline='') as f:
+                writer = csv.writer(f, lineterminator='\n')
+                writer.writerows(rows)
+
+        # 空的 aliases 輸出為空欄位，匯入後該屬性不存在 (線上寫入則為空 list)
+        write_csv(NODE_HEADER, [_NODE_COLUMNS])
+        write_csv(NODE_DATA, (
+            [node_id, p['label'], p['name'], p.get('file_id'), p.get('page_number'),
+             ARRAY_DELIMITER.join(p['aliases']) if p.get('aliases') else None, p.get('metadata'), p.get('fact_key')]
+            for node_id, p in enumerate(self._properties)))
+
+        types = {type_id: name for name, type_id in self._types.items()}
+        write_csv(RELATIONSHIP_HEADER, [_RELATIONSHIP_COLUMNS])
+        write_csv(RELATIONSHIP_DATA, (
+            [start, end, types[type_id], ARRAY_DELIMITER.join(sources)]
+            for (start, type_id, end), sources in self._relationships.items()))
+
+        stats = self.stats()
+        stats['csv_bytes'] = sum(os.path.getsize(os.path.join(output_dir, filename)) for filename in (
+            NODE_HEADER, NODE_DATA, RELATIONSHIP_HEADER, RELATIONSHIP_DATA))
+        logger.info(f"Bulk import CSV written to {output_dir}: {stats}")
+        return stats
+
+
+    def stats(self) -> dict:
+        return {
+            'pages': self.pages,
+            'triplets': self.triplets,
+            'nodes': len(self._properties),
+            'facts': len(self._facts),
+            'relationships': len(self._relationships),
+            'relationship_types': len(self._types),
+        }
@@ -0,0 +1,88 @@
+"""
+CONCEPTS_QUERY 結果的快取。
+
+批次出題時同一科目的 (document, section) 會被重複查詢數百次。ConceptQueryCache 以
+(kg_name, document, section path) 為 key 保存結果 (LRU)，KG 寫入 triplets 後以 invalidate(kg_name)
+清除該 KG 的所有結果。每個 KG 有一個 generation 計數：查詢開始前取得 generation，
+寫回時若期間發生 invalidate 則不寫入，避免與寫入同時進行的查詢把舊結果放回快取。
+"""
+from collections import OrderedDict
+import os
+import threading
+
+import logging
+logger:logging.Logger = logging.getLogger(os.getenv('LOGGER_NAME'))
+
+
+def concept_key(kg_name, document, section_path):
+    """ section_path 可為 None、單一名稱或名稱 list。 """
+    if section_path is None:
+        section_path = ()
+    elif isinstance(section_path, str):
+        section_path = (section_path,)
+    return (kg_name, document, tuple(section_path))
+
+
+
+class ConceptQueryCache:
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._generations:dict[str, int] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.stale_puts = 0
+
+
+    def generation(self, kg_name):
+        with self._lock:
+            return self._generations.get(kg_name, 0)
+
+
+    def get(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            self.misses += 1
+            return None
+
+
+    def put(self, key, concepts, generation):
+        """ generation 為查詢開始前 generation() 的值；期間 KG 被寫入時不保存。 """
+        with self._lock:
+            if self._generations.get(key[0], 0) != generation:
+                self.stale_puts += 1
+                return
+            self._entries[key] = concepts
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+    def invalidate(self, kg_name):
+        with self._lock:
+            self._generations[kg_name] = self._generations.get(kg_name, 0) + 1
+            keys = [key for key in self._entries if key[0] == kg_name]
+            for key in keys:
+                del self._entries[key]
+            self.invalidations += 1
+        if keys:
+            logger.verbose(f"KG '{kg_name}' concept cache invalidated, {len(keys)} entries removed")
+
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries = len(self._entries)
+        lookups = self.hits + self.misses
+        return {
+            'entries': entries,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': round(self.hits / lookups, 4) if lookups else None,
+            'invalidations': self.invalidations,
+            'stale_puts': self.stale_puts,
+        }
@@ -0,0 +1,276 @@
+"""
+fact 節點去重用的 key store。
+
+KnowledgeGraph 以 (file_id, page_number, label, name) 判斷同一頁的 fact 是否已建立過。
+- LruDedupeStore: 有容量上限的記憶體 LRU。
+- SqliteDedupeStore: 本機 SQLite 檔案，重啟後仍保留，且多個 process 可共用。
+- TieredDedupeStore: LRU 快取在前、持久化 store 在後。
+"""
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+import hashlib
+import os
+import sqlite3
+import sys
+import threading
+
+import logging
+logger:logging.Logger = logging.getLogger(os.getenv('LOGGER_NAME'))
+
+
+def dedupe_key(file_id, page_number, label, name):
+    """ 回傳固定長度的去重 key (sha1 hex)。 """
+    raw = f"{file_id}\x1f{page_number}\x1f{label}\x1f{name}"
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+
+
+class DedupeStore(ABC):
+    """抽象基類，定義去重 store 的介面"""
+
+    @abstractmethod
+    def contains(self, key) -> bool:
+        """回傳 key 是否已存在，不加入 key"""
+        pass
+
+
+    @abstractmethod
+    def add_many(self, keys):
+        """加入 keys (寫入 commit 後才記錄，見 KnowledgeGraph._record_written_facts)"""
+        pass
+
+
+    @abstractmethod
+    def discard(self, keys):
+        """移除 key (頁面退役後，重新寫入的 fact 不應被視為已存在)"""
+        pass
+
+
+    @abstractmethod
+    def stats(self) -> dict:
+        """回傳使用統計，包含記憶體用量 (bytes)"""
+        pass
+
+
+    def generation(self) -> int:
+        """回傳 discard 的累計次數；多個 process 共用的 store 以此讓快取得知其他 process 移除了 key"""
+        return 0
+
+
+    def close(self):
+        pass
+
+
+
+class LruDedupeStore(DedupeStore):
+    def __init__(self, capacity=100_000):
+        self.capacity = capacity
+        self._keys = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+
+    def __contains__(self, key):
+        with self._lock:
+            if key in self._keys:
+                self._keys.move_to_end(key)
+                return True
+            return False
+
+
+    def add(self, key):
+        with self._lock:
+            self._keys[key] = None
+            self._keys.move_to_end(key)
+            while len(self._keys) > self.capacity:
+                self._keys.popitem(last=False)
+                self.evictions += 1
+
+
+    def contains(self, key) -> bool:
+        with self._lock:
+            if key in self._keys:
+                self._keys.move_to_end(key)
+                self.hits += 1
+                return True
+            self.misses += 1
+            return False
+
+
+    def add_many(self, keys):
+        for key in keys:
+            self.add(key)
+
+
+    def discard(self, keys):
+        with self._lock:
+            for key in keys:
+                self._keys.pop(key, None)
+
+
+    def clear(self):
+        with self._lock:
+            self._keys.clear()
+
+
+    def memory_usage(self):
+        """ 估計 LRU 佔用的記憶體 (bytes)：OrderedDict 本身加上 key 字串。 """
+        with self._lock:
+            key_bytes = sum(sys.getsizeof(k) for k in self._keys)
+            return sys.getsizeof(self._keys) + key_bytes
+
+
+    def stats(self) -> dict:
+        return {
+            'entries': len(self._keys),
+            'capacity': self.capacity,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'memory_bytes': self.memory_usage(),
+        }
+
+
+
+class SqliteDedupeStore(DedupeStore):
+    """
+    以 SQLite 檔案保存 key。INSERT OR IGNORE 為原子操作，
+    因此多個 kg_service process 共用同一個檔案時仍可正確去重。
+    discard 在同一個 transaction 內遞增 dedupe_meta 的 generation，供其他 process 的快取檢查。
+    """
+    def __init__(self, path, timeout=30):
+        self.path = path
+        self.timeout = timeout
+        self._local = threading.local()
+        self._connections:list = []             # 所有 thread 開啟的連線，close() 時一併關閉
+        self._connections_lock = threading.Lock()
+        self.inserts = 0
+        self.duplicates = 0
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        conn = self._connection()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("CREATE TABLE IF NOT EXISTS dedupe (key TEXT PRIMARY KEY) WITHOUT ROWID")
+        conn.execute("CREATE TABLE IF NOT EXISTS dedupe_meta (id INTEGER PRIMARY KEY CHECK (id = 0), generation INTEGER NOT NULL)")
+        conn.execute("INSERT OR IGNORE INTO dedupe_meta (id, generation) VALUES (0, 0)")
+        conn.commit()
+
+
+    def _connection(self):
+        # sqlite3 連線不可跨 thread 共用，每個 thread 各自開啟
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=self.timeout, check_same_thread=False)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            with self._connections_lock:
+                self._connections.append(conn)
+        return conn
+
+
+    def contains(self, key) -> bool:
+        row = self._connection().execute("SELECT 1 FROM dedupe WHERE key = ?", (key,)).fetchone()
+        if row is not None:
+            self.duplicates += 1
+        return row is not None
+
+
+    def add_many(self, keys):
+        conn = self._connection()
+        with conn:
+            cursor = conn.executemany("INSERT OR IGNORE INTO dedupe (key) VALUES (?)", ((key,) for key in keys))
+        self.inserts += max(cursor.rowcount, 0)
+
+
+    def discard(self, keys):
+        conn = self._connection()
+        with conn:
+            conn.executemany("DELETE FROM dedupe WHERE key = ?", ((key,) for key in keys))
+            conn.execute("UPDATE dedupe_meta SET generation = generation + 1 WHERE id = 0")
+
+
+    def generation(self) -> int:
+        return self._connection().execute("SELECT generation FROM dedupe_meta WHERE id = 0").fetchone()[0]
+
+
+    def stats(self) -> dict:
+        conn = self._connection()
+        entries = conn.execute("SELECT count(*) FROM dedupe").fetchone()[0]
+        return {
+            'entries': entries,
+            'inserts': self.inserts,
+            'duplicates': self.duplicates,
+            'disk_bytes': os.path.getsize(self.path) if os.path.exists(self.path) else 0,
+            'memory_bytes': 0,
+        }
+
+
+    def close(self):
+        # 連線由各 thread 開啟，check_same_thread=False 才能在此一併關閉
+        with self._connections_lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
+            conn.close()
+        self._local = threading.local()
+
+
+
+class TieredDedupeStore(DedupeStore):
+    """
+    LRU 只快取「已存在」的 key，未命中時才查詢持久化 store，記憶體用量受 capacity 限制。
+    key 只會因 discard 消失：查詢前先比對持久化 store 的 generation，
+    其他 process 共用同一個 store 並 discard 過 key 時清空 LRU，不以過期的快取回答。
+    """
+    def __init__(self, backing:DedupeStore, capacity=100_000):
+        self.backing = backing
+        self.cache = LruDedupeStore(capacity)
+        self._generation = backing.generation()
+        self.invalidations = 0
+
+
+    def _check_generation(self):
+        generation = self.backing.generation()
+        if generation != self._generation:
+            self.cache.clear()
+            self._generation = generation
+            self.invalidations += 1
+
+
+    def contains(self, key) -> bool:
+        self._check_generation()
+        if key in self.cache:
+            self.cache.hits += 1
+            return True
+        self.cache.misses += 1
+        existed = self.backing.contains(key)
+        if existed:
+            self.cache.add(key)
+        return existed
+
+
+    def add_many(self, keys):
+        keys = list(keys)
+        self.backing.add_many(keys)
+        self.cache.add_many(keys)
+
+
+    def discard(self, keys):
+        keys = list(keys)
+        self.cache.discard(keys)
+        self.backing.discard(keys)
+
+
+    def stats(self) -> dict:
+        cache_stats = self.cache.stats()
+        return {
+            'cache': cache_stats,
+            'backing': self.backing.stats(),
+            'invalidations': self.invalidations,
+            'memory_bytes': cache_stats['memory_bytes'],
+        }
+
+
+    def close(self):
+        self.backing.close()
@@ -1,10 +1,17 @@
+from concurrent.futures import ThreadPoolExecutor
 import docker
 import os
 import socket
 import shutil
 import sys
+import tempfile
+import threading
 import time
-import requests
+from neo4j import GraphDatabase
+
+from knowsys.memory_profile import MIN_PROFILE, MemoryProfile, MemoryProfileStore, size_profile, store_size_bytes
+from knowsys.port_allocator import PortAllocator
+from knowsys.port_registry import PortRegistry
 
 # Docker 預設 socket 路徑（可被 DOCKER_HOST 覆寫）
 _DEFAULT_DOCKER_SOCK = "/var/run/docker.sock"
@@ -14,6 +21,8 @@ _MACOS_DOCKER_SOCK = os.path.expanduser("~/.docker/run/docker.sock")
 _DOCKER_SOCKET_CANDIDATES = [_MACOS_DOCKER_SOCK, _DEFAULT_DOCKER_SOCK]
 # Windows Docker Desktop 使用 named pipe
 _WINDOWS_DOCKER_NPIPE = "npipe:////./pipe/docker_engine"
+# 啟動容器後等待 Bolt 就緒的秒數上限
+READY_TIMEOUT = 180
 
 
 def _docker_socket_path():
@@ -63,20 +72,36 @@ class DockerManager:
     :param ports: 映射的端口，格式為 {'container_port/protocol': host_port}
     :param volumes: 映射的資料儲存位置，格式為 {host_path: {'bind': container_path, 'mode': 'rw'}}
     :param detach: 是否在後台運行容器 (預設為 True)
+    :param port_cache_ttl: 運行中容器連接埠快取的有效秒數 (未連上 Docker events 時)
+    :param watch_events: 是否訂閱 Docker events 即時更新連接埠快取
+    :param client: 指定 docker client，預設為 docker.from_env()
+    :param memory_profiles: 是否依 KG 大小設定容器的 heap / page cache (見 knowsys.memory_profile)
+    :param memory_budget_gb: 所有運行中 KG 容器 heap + page cache 的上限，None 表示不限制
     :return: Docker 回傳DokerManager instance
     """
-    def __init__(self, hostname='localhost', base_volume_dir=None):
+    def __init__(self, hostname='localhost', base_volume_dir=None, port_cache_ttl=30, watch_events=False, client=None,
+                 memory_profiles=True, memory_budget_gb=None):
         # self.base_volume_dir = base_volume_dir if base_volume_dir else os.path.join(os.getcwd(), "src/knowsys/data")
         self.base_volume_dir = base_volume_dir if base_volume_dir else os.path.join(os.getcwd(), "src/knowsys/volumes")
         os.makedirs(self.base_volume_dir, exist_ok=True)
         print(f"base_volume_dir: {self.base_volume_dir}")
         self.hostname = hostname
-        _ensure_docker_host()
-        _check_docker_available()
-        self.client = docker.from_env()
+        if client is None:
+            _ensure_docker_host()
+            _check_docker_available()
+            client = docker.from_env()
+        self.client = client
+        self.port_registry = PortRegistry(self.client, port_cache_ttl, watch_events)
         self.image = "neo4j:community"
         # self.image = "neo4j:5.26.3-community-ubi9"
         self.detach = True
+        # 每個 KG 的端口預約表 (檔案)，同時建立多個容器時不會選到相同端口
+        self.port_allocator = PortAllocator(os.path.join(self.base_volume_dir, '_ports.json'))
+        self.memory_profiles = memory_profiles
+        self.memory_budget_mb = int(memory_budget_gb * 1024) if memory_budget_gb else None
+        self.profile_store = MemoryProfileStore(os.path.join(self.base_volume_dir, '_memory_profiles.json'))
+        # 從計算記憶體預算到容器啟動 (計入 running_profiles) 之間持有，並行啟動的 KG 不會重複使用同一份剩餘預算
+        self._budget_lock = threading.RLock()
 
 
     # 檢查端口是否已被占用
@@ -93,28 +118,50 @@ class DockerManager:
         return port
 
 
-    def wait_for_KG(self, http_port, timeout=500):
-        """檢查 Neo4j 是否在 7474 端口上啟動，最多等待 timeout 秒"""
+    def used_host_ports(self):
+        """ 以一次容器列表 (含已停止的容器) 取得所有容器綁定的 host 端口。 """
+        ports = set()
+        for container in self.client.containers.list(all=True):
+            bindings = container.attrs.get('HostConfig', {}).get('PortBindings') or {}
+            for host_bindings in bindings.values():
+                for binding in host_bindings or []:
+                    if binding.get('HostPort'):
+                        ports.add(int(binding['HostPort']))
+        return ports
 
-        url = f"http://{self.hostname}:{http_port}"
-        start_time = time.time()
 
-        while time.time() - start_time < timeout:
+    def wait_for_bolt(self, bolt_port, timeout=READY_TIMEOUT, initial_delay=0.05, max_delay=2.0):
+        """
+        以 Bolt 連線並執行 RETURN 1 確認 Neo4j 已可查詢；失敗時以指數退避重試 (initial_delay 起，最多 max_delay 秒)。
+
+        :return: 就緒所花的秒數，逾時回傳 None
+        """
+        uri = f"bolt://{self.hostname}:{bolt_port}"
+        start_time = time.monotonic()
+        delay = initial_delay
+        while True:
             try:
-                # 嘗試連線到 Neo4j HTTP 端口
-                response = requests.get(url)
-                if response.status_code == 200:
-                    #print(f"Neo4j is up and running at {url}")
-                    print("")
-                    return True
-            except requests.ConnectionError:
-                # 如果連線失敗則等候一段時間後重試
+                with GraphDatabase.driver(uri, connection_timeout=max(delay, 1.0)) as driver:
+                    with driver.session() as session:
+                        session.run("RETURN 1").consume()
+                return time.monotonic() - start_time
+            except Exception:
+                # 端口尚未開啟、Bolt 尚未就緒或資料庫仍在啟動
                 pass
-            time.sleep(1)
-            print(f"\rNeo4j 仍在啟動中，已經過{int(time.time() - start_time):d}秒...",end="")
-
-        print("\nTimed out waiting for Neo4j to start.")
-        return False
+            remaining = timeout - (time.monotonic() - start_time)
+            if remaining <= 0:
+                print(f"Timed out waiting for Neo4j at {uri}.")
+                return None
+            time.sleep(min(delay, remaining))
+            delay = min(delay * 2, max_delay)
+
+
+    def _wait_ready(self, kgName, bolt_port):
+        """ 等待剛啟動的容器可查詢，逾時拋出 TimeoutError；啟用 memory_profiles 時記錄圖譜大小。 """
+        if self.wait_for_bolt(int(bolt_port), timeout=READY_TIMEOUT) is None:
+            raise TimeoutError(f"KG '{kgName}' not ready after {READY_TIMEOUT}s")
+        if self.memory_profiles:
+            self._record_graph_size(kgName, bolt_port)
     
     
     def get_ports(self, kgName):
@@ -124,11 +171,7 @@ class DockerManager:
         :param kgName: 容器名稱
         :return: tuple, 包含 HTTP 和 BOLT 端口 (http_port, bolt_port)
         """
-        running_kgs = self.list_running_KGs()
-        for container_name, http_port, bolt_port in running_kgs:
-            if container_name == kgName:
-                return http_port, bolt_port
-        return None, None  # KG 未運行
+        return self.port_registry.get(kgName)   # KG 未運行時為 (None, None)
 
 
     def get_urls(self, kgName):
@@ -144,52 +187,175 @@ class DockerManager:
         return None, None  # KG 未運行
     
     
+    def _kg_path(self, kgName):
+        kg_path = os.path.join(self.base_volume_dir, kgName)
+        return os.path.abspath(os.path.normpath(kg_path)).replace('\\', '/')
+
+
+    def memory_profile(self, kgName):
+        """ 依 store 大小與最近記錄的節點 / 關聯數計算 KG 的記憶體設定。 """
+        record = self.profile_store.get(kgName)
+        return size_profile(store_size_bytes(self._kg_path(kgName)),
+                            record.get('nodes', 0), record.get('relationships', 0))
+
+
+    def running_profiles(self):
+        """ 回傳運行中容器實際套用的記憶體設定 {容器名稱: MemoryProfile}。 """
+        profiles = {}
+        for container in self.client.containers.list():
+            profile = MemoryProfile.from_environment(container.attrs['Config'].get('Env') or [])
+            if profile:
+                profiles[container.name] = profile
+        return profiles
+
+
+    def _budgeted_profile(self, kgName):
+        """
+        套用主機記憶體上限：扣除其他運行中 KG 的用量後縮小 profile，連最小設定都放不下時拋出 RuntimeError。
+        呼叫端須持有 _budget_lock 直到容器啟動。
+        """
+        profile = self.memory_profile(kgName)
+        if self.memory_budget_mb is None:
+            return profile
+        used = sum(p.total_mb for name, p in self.running_profiles().items() if name != kgName)
+        remaining = self.memory_budget_mb - used
+        if remaining < MIN_PROFILE.total_mb:
+            raise RuntimeError(f"Memory budget exhausted: {used} MB of {self.memory_budget_mb} MB used by running KGs, "
+                               f"cannot start KG '{kgName}'.")
+        return profile.scaled_to(remaining)
+
+
+    def _record_graph_size(self, kgName, bolt_port):
+        """ 記錄節點 / 關聯數與 store 大小，供下次啟動時計算記憶體設定。 """
+        try:
+            with GraphDatabase.driver(f"bolt://{self.hostname}:{bolt_port}") as driver:
+                with driver.session() as session:
+                    nodes = session.run("MATCH (n) RETURN count(n) AS c").single()["c"]
+                    relationships = session.run("MATCH ()-[r]->() RETURN count(r) AS c").single()["c"]
+            self.profile_store.update(kgName, nodes=nodes, relationships=relationships,
+                                      store_bytes=store_size_bytes(self._kg_path(kgName)))
+        except Exception as e:
+            print(f"Failed to record graph size of KG '{kgName}': {e}")
+
+
+    def page_cache_hit_ratio(self, bolt_port):
+        """ 由 JMX 讀取 page cache 命中率；無法取得時回傳 None。 """
+        try:
+            with GraphDatabase.driver(f"bolt://{self.hostname}:{bolt_port}") as driver:
+                with driver.session() as session:
+                    records = list(session.run(
+                        "CALL dbms.queryJmx('org.neo4j:*') YIELD name, attributes "
+                        "WHERE name CONTAINS 'Page cache' RETURN attributes"))
+        except Exception:
+            return None
+        for record in records:
+            attributes = {key: value.get('value') for key, value in record['attributes'].items()}
+            if attributes.get('HitRatio') is not None:
+                return round(float(attributes['HitRatio']), 4)
+            hits, faults = attributes.get('Hits'), attributes.get('Faults')
+            if hits is not None and faults is not None:
+                return round(hits / (hits + faults), 4) if hits + faults else None
+        return None
+
+
+    def memory_report(self):
+        """
+        回傳每個 KG 的 store 大小、節點 / 關聯數、計算出的記憶體設定、運行中容器實際套用的設定與 page cache 命中率。
+        """
+        running = {name: bolt_port for name, _, bolt_port in self.list_running_KGs()}
+        applied = self.running_profiles()
+        report = []
+        for kgName in self.list_KGs():
+            record = self.profile_store.get(kgName)
+            report.append({
+                'kg_name': kgName,
+                'store_mb': round(store_size_bytes(self._kg_path(kgName)) / 1024 ** 2, 1),
+                'nodes': record.get('nodes'),
+                'relationships': record.get('relationships'),
+                'profile': self.memory_profile(kgName),
+                'applied': applied.get(kgName),
+                'page_cache_hit_ratio': self.page_cache_hit_ratio(running[kgName]) if kgName in running else None,
+            })
+        return report
+
+
+    def _container_environment(self, profile):
+        environment = {
+            'NEO4J_AUTH': 'none',
+            'NEO4JLABS_PLUGINS': '["apoc", "graph-data-science"]',
+            'dbms.security.procedures.unrestricted': 'apoc.*,gds.*',
+            'dbms.security.procedures.allowlist': 'apoc.*,gds.*',
+            'apoc.export.file.enabled': 'true'
+        }
+        if profile:
+            environment.update(profile.to_environment())
+        return environment
+
+
     def create_container(self, kgName):
         """
         若 kgName 的容器已存在則不建立；若未啟動先啟動，
-        最後回傳 (http_url, bolt_url)。若無法取得連接埠則回傳 (None, None)。
+        等待 Bolt 就緒後回傳 (http_url, bolt_url)。若無法取得連接埠則回傳 (None, None)，
+        READY_TIMEOUT 秒內未就緒則拋出 TimeoutError。
+        啟用 memory_profiles 時，已停止容器的記憶體設定與目前計算結果不同則重建容器 (端口與資料不變)。
         """
         # 先嘗試取得既有容器
         try:
             container = self.client.containers.get(kgName)
+        except docker.errors.NotFound:
+            container = None
+
+        with self._budget_lock:
+            if container is not None and container.status != 'running' and self.memory_profiles:
+                profile = self._budgeted_profile(kgName)
+                if MemoryProfile.from_environment(container.attrs['Config'].get('Env') or []) != profile:
+                    print(f"Recreating container '{kgName}' with memory profile {profile}")
+                    container.remove()
+                    container = None
 
             # 若未啟動則啟動
-            if container.status != 'running':
+            if container is not None and container.status != 'running':
                 container.start()
                 # 重新抓一次屬性以取得最新連接埠映射
                 container.reload()
+                self.port_registry.invalidate(kgName)
 
-            # 讀取既有的連接埠映射
-            ports = container.attrs['NetworkSettings']['Ports'] or {}
-            http_port = ports.get('7474/tcp', [{}])[0].get('HostPort')
-            bolt_port = ports.get('7687/tcp', [{}])[0].get('HostPort')
+        if container is None:
+            return self._run_container(kgName)
 
-            # 若映射缺失，嘗試用既有工具找
-            if not http_port or not bolt_port:
-                http_port, bolt_port = self.get_ports(kgName)
+        # 讀取既有的連接埠映射
+        ports = container.attrs['NetworkSettings']['Ports'] or {}
+        http_port = ports.get('7474/tcp', [{}])[0].get('HostPort')
+        bolt_port = ports.get('7687/tcp', [{}])[0].get('HostPort')
 
-            if http_port and bolt_port:
-                # 確認服務已就緒
-                self.wait_for_KG(int(http_port), timeout=180)
-                return (f"http://{self.hostname}:{http_port}",
-                        f"bolt://{self.hostname}:{bolt_port}")
-            else:
-                print(f"Existing container '{kgName}' has no port bindings.")
-                return None, None
+        # 若映射缺失，嘗試用既有工具找
+        if not http_port or not bolt_port:
+            http_port, bolt_port = self.get_ports(kgName)
 
-        except docker.errors.NotFound:
-            # 不存在則建立新容器
-            print(f"Creating new container for {kgName}...")
+        if http_port and bolt_port:
+            # 確認服務已就緒
+            self._wait_ready(kgName, bolt_port)
+            return (f"http://{self.hostname}:{http_port}",
+                    f"bolt://{self.hostname}:{bolt_port}")
+        else:
+            print(f"Existing container '{kgName}' has no port bindings.")
+            return None, None
 
-            http_port = self.get_free_port(7474)
-            bolt_port = self.get_free_port(7687)
 
-            # 準備資料夾
-            kg_path = os.path.join(self.base_volume_dir, kgName)
-            kg_path = os.path.abspath(os.path.normpath(kg_path)).replace('\\', '/')
-            os.makedirs(kg_path, exist_ok=True)
+    def _run_container(self, kgName):
+        """ 建立並啟動新容器，回傳 (http_url, bolt_url)；未就緒時拋出 TimeoutError (容器保留)。 """
+        print(f"Creating new container for {kgName}...")
 
-            try:
+        # 準備資料夾
+        kg_path = self._kg_path(kgName)
+        os.makedirs(kg_path, exist_ok=True)
+
+        try:
+            with self._budget_lock:
+                profile = self._budgeted_profile(kgName) if self.memory_profiles else None
+                # 沿用 KG 的預約端口；新 KG 在預約表中分配，只對候選端口確認是否被其他程式占用
+                http_port, bolt_port = self.port_allocator.reserve(
+                    kgName, self.used_host_ports(), probe=self.is_port_in_use)
                 container = self.client.containers.run(
                     image=self.image,
                     name=kgName,
@@ -197,27 +363,132 @@ class DockerManager:
                         '7474/tcp': http_port,
                         '7687/tcp': bolt_port
                     },
-                    environment={
-                        'NEO4J_AUTH': 'none',
-                        'NEO4JLABS_PLUGINS': '["apoc", "graph-data-science"]',
-                        'dbms.security.procedures.unrestricted': 'apoc.*,gds.*',
-                        'dbms.security.procedures.allowlist': 'apoc.*,gds.*',
-                        'apoc.export.file.enabled': 'true'
-                    },
+                    environment=self._container_environment(profile),
                     volumes={kg_path: {'bind': '/data', 'mode': 'rw'}},
                     detach=self.detach
                 )
+            self.port_registry.invalidate(kgName)
+
+            self._wait_ready(kgName, bolt_port)
+            print(f"Container {container.name} created and running. "
+                f"HTTP at: http://{self.hostname}:{http_port}, "
+                f"BOLT at: bolt://{self.hostname}:{bolt_port}"
+                + (f", memory: {profile}" if profile else ""))
+            return (f"http://{self.hostname}:{http_port}",
+                    f"bolt://{self.hostname}:{bolt_port}")
+
+        except docker.errors.APIError as e:
+            print(f"Error creating container: {e}")
+            return None, None
+
+
+    def import_KG(self, kgName, import_dir):
+        """
+        以 neo4j-admin 離線匯入 BulkImportWriter 輸出的 CSV，完成後啟動容器。
+        只適用於第一次建立的 KG：容器已存在時拋出 ValueError。
+
+        :param kgName: KG (容器) 名稱
+        :param import_dir: 含 header 與 data CSV 的資料夾
+        :return: tuple: (http_url, bolt_url)
+        """
+        from knowsys.bulk_import import neo4j_admin_import_args
+
+        try:
+            self.client.containers.get(kgName)
+            raise ValueError(f"KG '{kgName}' already exists, offline import only supports new KGs.")
+        except docker.errors.NotFound:
+            pass
+
+        kg_path = self._kg_path(kgName)
+        os.makedirs(kg_path, exist_ok=True)
+        import_path = os.path.abspath(os.path.normpath(import_dir)).replace('\\', '/')
 
-                self.wait_for_KG(http_port, timeout=180)
-                print(f"Container {container.name} created and running. "
-                    f"HTTP at: http://{self.hostname}:{http_port}, "
-                    f"BOLT at: bolt://{self.hostname}:{bolt_port}")
-                return (f"http://{self.hostname}:{http_port}",
-                        f"bolt://{self.hostname}:{bolt_port}")
+        print(f"Importing '{import_path}' into KG '{kgName}' ...")
+        start_time = time.time()
+        try:
+            output = self.client.containers.run(
+                image=self.image,
+                command=neo4j_admin_import_args('/import'),
+                environment={'NEO4J_AUTH': 'none'},
+                volumes={
+                    kg_path: {'bind': '/data', 'mode': 'rw'},
+                    import_path: {'bind': '/import', 'mode': 'ro'},
+                },
+                remove=True,
+                detach=False
+            )
+        except docker.errors.ContainerError as e:
+            print(f"Error importing KG '{kgName}': {e.stderr.decode('utf-8', errors='replace') if e.stderr else e}")
+            raise
+        print(output.decode('utf-8', errors='replace'))
+        print(f"KG '{kgName}' imported in {time.time() - start_time:.1f}s.")
+
+        return self.create_container(kgName)
+
+
+    def export_KG(self, kgName, path):
+        """
+        將運行中的 KG 匯出為快照封存檔 (見 knowsys.kg_archive)。
+
+        :param kgName: KG (容器) 名稱
+        :param path: 封存檔路徑；不可放在 base_volume_dir 的 KG 資料夾內
+        :return: dict: 統計資料 (nodes, edges, bytes, seconds)
+        """
+        from knowsys.graph_snapshot import GraphSnapshot
+        from knowsys.knowledge_graph import KnowledgeGraph
+
+        _, bolt_url = self.open_KG(kgName)
+        start_time = time.time()
+        with KnowledgeGraph(uri=bolt_url) as kg:
+            stats = GraphSnapshot.load(kg).save(path, source=kgName)
+        stats['seconds'] = round(time.time() - start_time, 2)
+        print(f"KG '{kgName}' exported to '{path}': {stats}")
+        return stats
 
-            except docker.errors.APIError as e:
-                print(f"Error creating container: {e}")
-                return None, None
+
+    def restore_KG(self, kgName, path, work_dir=None):
+        """
+        將快照封存檔轉成 CSV 後以 neo4j-admin 匯入新的 KG，完成後啟動容器。
+        與 import_KG 相同只適用於新的 KG；節點的 element id 會改變，KG schema 須在啟動後以 ensure_schema() 建立。
+
+        :param kgName: KG (容器) 名稱
+        :param path: export_KG 輸出的封存檔
+        :param work_dir: 暫存 CSV 的資料夾，預設為系統暫存資料夾 (須可掛載到容器)
+        :return: tuple: (http_url, bolt_url)
+        """
+        from knowsys.kg_archive import write_import_csv
+
+        with tempfile.TemporaryDirectory(prefix='kg_restore_', dir=work_dir) as csv_dir:
+            print(f"Snapshot '{path}' converted to CSV: {write_import_csv(path, csv_dir)}")
+            return self.import_KG(kgName, csv_dir)
+
+
+    def ensure_running(self, kgNames, parallelism=4):
+        """
+        同時啟動 (或建立) 多個 KG 容器，最多 parallelism 個並行。
+
+        :param kgNames: KG 名稱 list
+        :return: dict, {kgName: {'http_url', 'bolt_url', 'seconds', 'error'}}，seconds 為該 KG 從開始啟動到就緒的秒數
+        """
+        def start(kgName):
+            start_time = time.monotonic()
+            try:
+                # create_container 已等待 Bolt 就緒，不再重複探測
+                http_url, bolt_url = self.create_container(kgName)
+                error = None if bolt_url else 'no port bindings'
+            except TimeoutError:
+                http_url, bolt_url, error = None, None, f'not ready after {READY_TIMEOUT}s'
+            except Exception as e:
+                http_url, bolt_url, error = None, None, str(e)
+            return {
+                'http_url': http_url,
+                'bolt_url': bolt_url,
+                'seconds': round(time.monotonic() - start_time, 2),
+                'error': error,
+            }
+
+        with ThreadPoolExecutor(max_workers=max(1, parallelism), thread_name_prefix='kg-start') as executor:
+            return dict(zip(kgNames, executor.map(start, kgNames)))
 
 
     def open_KG(self, kgName):
@@ -229,22 +500,31 @@ class DockerManager:
         :return: tuple:
             (http_url, bolt_url)
         """
-        print(f"Opening KG '{kgName}' ...")
-
-        # 取得所有正在運行的 KG
-        running_kgs = self.list_running_KGs()
-
-        # 檢查 KG 是否已在運行
-        for container_name, http_port, bolt_port in running_kgs:
-            if container_name == kgName:
-                print(f"KG '{kgName}', HTTP at: http://{self.hostname}:{http_port}, BOLT at: bolt://{self.hostname}:{bolt_port}")
-                return f"http://{self.hostname}:{http_port}", f"bolt://{self.hostname}:{bolt_port}"
+        # 檢查 KG 是否已在運行 (連接埠快取，不呼叫 Docker API)
+        http_port, bolt_port = self.get_ports(kgName)
+        if http_port:
+            return f"http://{self.hostname}:{http_port}", f"bolt://{self.hostname}:{bolt_port}"
 
         raise ValueError(f"KG '{kgName}' is not running. Please create it first.")
         # 若 KG 尚未運行，則創建它
         # print(f"KG '{kgName}' is not running. Creating a new container...")
         # return self.create_container(kgName)
 
+
+    def stop_container(self, kgName):
+        """
+        停止KG容器但不刪除，之後可由 create_container 重新啟動 (連接埠映射不變)。
+
+        :param kgName: 容器或KG名稱
+        """
+        try:
+            self.client.containers.get(kgName).stop()
+            self.port_registry.invalidate(kgName)
+            print(f"Container {kgName} stopped.")
+        except docker.errors.NotFound:
+            print(f"無運作中{kgName}的Container")
+
+
         
     def stop_KG(self, kgName):
         """
@@ -262,6 +542,7 @@ class DockerManager:
                     volume_names.append(mount['Name'])
             container.stop()
             container.remove()
+            self.port_registry.invalidate(kgName)
             for volumn in volume_names:
                 self.client.volumes.get(volumn).remove()
             print(f"Container {kgName} stopped.")
@@ -312,28 +593,17 @@ class DockerManager:
 
         :return: list of tuples, 每個元素包含 (容器名稱, HTTP端口, BOLT端口)
         """
-        running_kgs = []
-        containers = self.client.containers.list()  # 只列出運行中的容器
-
-        for container in containers:
-            ports = container.attrs['NetworkSettings']['Ports']
-            
-            # 確保 7474/tcp 存在於映射端口中
-            if '7474/tcp' in ports and ports['7474/tcp']:
-                http_port = ports['7474/tcp'][0].get('HostPort', 'N/A')
-                bolt_port = ports.get('7687/tcp', [{}])[0].get('HostPort', 'N/A')
-                running_kgs.append((container.name, http_port, bolt_port))
-
-        return running_kgs
+        return self.port_registry.running()
     
     
-    def stop_all(self):
+    def stop_all(self, parallelism=4):
         """
-        停止所有正在運行的KG container.
+        停止所有正在運行的KG container，最多 parallelism 個並行.
         """
-        for kgName in self.list_containers()[1]:
-            if kgName in self.list_KGs():
-                self.stop_KG(kgName)
+        kgs = set(self.list_KGs())
+        kgNames = [kgName for kgName in self.list_containers()[1] if kgName in kgs]
+        with ThreadPoolExecutor(max_workers=max(1, parallelism), thread_name_prefix='kg-stop') as executor:
+            list(executor.map(self.stop_KG, kgNames))
         print("All KG containers have been stopped.")
 
 
@@ -343,6 +613,8 @@ class DockerManager:
         """
         try:
             self.stop_KG(kgName)
+            self.port_allocator.release(kgName)
+            self.profile_store.remove(kgName)
             volume_dir = os.path.join(self.base_volume_dir, kgName)
             # directory = os.path.normpath(os.path.join(self.base_volume_dir,path))
             shutil.rmtree(volume_dir)
@@ -357,3 +629,8 @@ class DockerManager:
         self.stop_all()
         for kgName in self.list_KGs():
             self.delete_KG(kgName)
+
+
+    def close(self):
+        """ 停止 Docker events 訂閱。 """
+        self.port_registry.close()
@@ -0,0 +1,209 @@
+"""
+Process 內共用的 Neo4j driver 登錄表。
+
+同一個 bolt URI 只建立一個 driver (含 connection pool)，KnowledgeGraph 由此借用與歸還，
+避免每次查詢都重新建立 driver 與 Bolt handshake。閒置過久的 driver 會被關閉，
+借出前也會定期以 verify_connectivity() 做健康檢查。
+"""
+import os
+import threading
+import time
+
+from neo4j import GraphDatabase
+
+import logging
+logger:logging.Logger = logging.getLogger(os.getenv('LOGGER_NAME'))
+
+
+
+class _DriverEntry:
+    def __init__(self, driver):
+        self.driver = driver
+        self.borrowers = 0
+        self.peak_borrowers = 0
+        self.borrows = 0
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+        self.last_checked = self.created_at
+
+
+
+class DriverRegistry:
+    _default = None
+    _default_lock = threading.Lock()
+
+
+    def __init__(self, max_connection_pool_size=50, idle_timeout=300, health_check_interval=30,
+                 connection_acquisition_timeout=60):
+        """
+        :param max_connection_pool_size: 每個 driver 的連線池上限
+        :param idle_timeout: 無人借用超過此秒數的 driver 會被關閉
+        :param health_check_interval: 借出前距上次檢查超過此秒數則做健康檢查
+        :param connection_acquisition_timeout: 從連線池取得連線的逾時秒數
+        """
+        self.max_connection_pool_size = max_connection_pool_size
+        self.idle_timeout = idle_timeout
+        self.health_check_interval = health_check_interval
+        self.connection_acquisition_timeout = connection_acquisition_timeout
+
+        self._entries:dict[tuple, _DriverEntry] = {}
+        self._retired:list[_DriverEntry] = []     # 健康檢查失敗但仍有借用者的 driver
+        self._lock = threading.Lock()
+        self.created = 0
+        self.evicted = 0
+        self.health_failures = 0
+
+
+    @staticmethod
+    def default():
+        with DriverRegistry._default_lock:
+            if DriverRegistry._default is None:
+                DriverRegistry._default = DriverRegistry()
+            return DriverRegistry._default
+
+
+    @staticmethod
+    def configure(**params):
+        """ 以新參數替換預設 registry，舊 registry 中的 driver 全部關閉。 """
+        with DriverRegistry._default_lock:
+            previous, DriverRegistry._default = DriverRegistry._default, DriverRegistry(**params)
+        if previous:
+            previous.close_all()
+        return DriverRegistry._default
+
+
+    def _create_driver(self, uri, auth):
+        self.created += 1
+        return GraphDatabase.driver(
+            uri, auth=auth,
+            max_connection_pool_size=self.max_connection_pool_size,
+            connection_acquisition_timeout=self.connection_acquisition_timeout)
+
+
+    def _is_healthy(self, driver):
+        try:
+            driver.verify_connectivity()
+            return True
+        except Exception as e:
+            logger.warning(f"Neo4j driver health check failed: {e}")
+            return False
+
+
+    def acquire(self, uri, auth=None):
+        """
+        借用 uri 對應的共用 driver，用完須呼叫 release()。
+        健康檢查 (verify_connectivity 的網路 I/O) 在鎖外進行，不阻擋其他 URI 的借用與歸還。
+        """
+        key = (uri, auth)
+        now = time.monotonic()
+        self.evict_idle()
+
+        with self._lock:
+            checked = self._entries.get(key)
+            if checked and now - checked.last_checked > self.health_check_interval:
+                checked.last_checked = now      # 檢查期間其他借用者不重複檢查
+            else:
+                checked = None
+
+        to_close = None
+        healthy = checked is None or self._is_healthy(checked.driver)
+        with self._lock:
+            if not healthy:
+                self.health_failures += 1
+                # 檢查期間 entry 可能已被移除或替換，只移除檢查過的 entry
+                if self._entries.get(key) is checked:
+                    del self._entries[key]
+                    if checked.borrowers == 0:
+                        to_close = checked.driver
+                    else:
+                        self._retired.append(checked)
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = self._entries[key] = _DriverEntry(self._create_driver(uri, auth))
+                logger.debug(f"Created shared Neo4j driver for {uri}")
+
+            entry.borrowers += 1
+            entry.borrows += 1
+            entry.peak_borrowers = max(entry.peak_borrowers, entry.borrowers)
+            entry.last_used = now
+            driver = entry.driver
+
+        if to_close:
+            to_close.close()
+        return driver
+
+
+    def release(self, driver):
+        with self._lock:
+            for entry in self._entries.values():
+                if entry.driver is driver:
+                    entry.borrowers = max(0, entry.borrowers - 1)
+                    entry.last_used = time.monotonic()
+                    return
+            # 已因健康檢查失敗被移出 registry 的 driver，由最後一個借用者關閉
+            for entry in self._retired:
+                if entry.driver is driver:
+                    entry.borrowers -= 1
+                    if entry.borrowers <= 0:
+                        self._retired.remove(entry)
+                        driver.close()
+                    return
+
+
+    def evict_idle(self):
+        """ 關閉無人借用且閒置超過 idle_timeout 的 driver，回傳關閉數量。 """
+        now = time.monotonic()
+        with self._lock:
+            idle_keys = [key for key, entry in self._entries.items()
+                         if entry.borrowers == 0 and now - entry.last_used > self.idle_timeout]
+            idle_entries = [self._entries.pop(key) for key in idle_keys]
+            self.evicted += len(idle_entries)
+        for entry in idle_entries:
+            entry.driver.close()
+        return len(idle_entries)
+
+
+    def close_all(self):
+        with self._lock:
+            entries = list(self._entries.values())
+            self._entries.clear()
+        for entry in entries:
+            entry.driver.close()
+
+
+    @staticmethod
+    def _pool_usage(driver):
+        """ 讀取 driver 連線池的連線數與使用中連線數；driver 內部結構不符時回傳 (None, None)。 """
+        try:
+            pool = driver._pool
+            addresses = list(pool.connections.keys())
+            total = sum(len(pool.connections[address]) for address in addresses)
+            in_use = sum(pool.in_use_connection_count(address) for address in addresses)
+            return total, in_use
+        except Exception:
+            return None, None
+
+
+    def stats(self) -> dict:
+        """ 回傳每個 URI 的借用與連線池使用狀況。 """
+        now = time.monotonic()
+        drivers = {}
+        with self._lock:
+            for (uri, _), entry in self._entries.items():
+                connections, in_use = DriverRegistry._pool_usage(entry.driver)
+                drivers[uri] = {
+                    'borrowers': entry.borrowers,
+                    'peak_borrowers': entry.peak_borrowers,
+                    'borrows': entry.borrows,
+                    'connections': connections,
+                    'connections_in_use': in_use,
+                    'pool_utilization': in_use / self.max_connection_pool_size if in_use is not None else None,
+                    'idle_seconds': round(now - entry.last_used, 1) if entry.borrowers == 0 else 0,
+                }
+        return {
+            'drivers': drivers,
+            'created': self.created,
+            'evicted': self.evicted,
+            'health_failures': self.health_failures,
+            'max_connection_pool_size': self.max_connection_pool_size,
+        }
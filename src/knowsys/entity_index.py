@@ -0,0 +1,163 @@
+"""
+實體名稱 (surface form) 到 KG 節點的模糊比對。
+
+LLM 抽出的實體常與 KG 節點名稱只差全形 / 大小寫 / 空白，或是寫成 add_triplets 存在 aliases 中的別名，
+只以 name 精確比對會查不到。KnowledgeGraph.resolve_entities 以名稱索引 + 全文索引 (node_aliases)、
+GraphSnapshot.resolve_entities 以本模組的字元 n-gram 索引取得候選節點，兩者都以 rank_matches 排序：
+名稱相同 > 別名相同 > 模糊比對 (字元 bigram 的 Dice 相似度)。
+"""
+import math
+import os
+import re
+import sys
+
+from knowsys.fact_identity import normalize_fact_name
+
+import logging
+logger:logging.Logger = logging.getLogger(os.getenv('LOGGER_NAME'))
+
+
+MATCH_NAME = 'name'
+MATCH_ALIAS = 'alias'
+MATCH_FUZZY = 'fuzzy'
+_MATCH_PRIORITY = {MATCH_NAME: 0, MATCH_ALIAS: 1, MATCH_FUZZY: 2}
+
+_LUCENE_SPECIAL = re.compile(r'([+\-&|!(){}\[\]^"~*?:\\/])')
+
+
+def lucene_escape(text):
+    """ 跳脫 Lucene 查詢語法的特殊字元。 """
+    return _LUCENE_SPECIAL.sub(r'\\\1', text)
+
+
+def fulltext_query(surface):
+    """
+    全文索引的查詢字串：整段片語加權，再加上各詞 (長度 4 以上的英數詞允許 1 個字元的差異)。
+    中文由分析器切成單字，片語比對即為連續字元比對。
+    """
+    text = normalize_fact_name(surface)
+    terms = []
+    for token in text.split(' '):
+        if not token:
+            continue
+        escaped = lucene_escape(token)
+        terms.append(f"{escaped}~1" if len(token) >= 4 and token.isascii() and token.isalnum() else escaped)
+    phrase = f'"{lucene_escape(text)}"^3'
+    if not terms:
+        return phrase
+    return f"{phrase} OR ({' AND '.join(terms)})"
+
+
+def ngrams(text, n=2):
+    """ 正規化後的字元 n-gram 集合 (不含空白)；短於 n 的字串以整個字串為一個 gram。 """
+    text = normalize_fact_name(text).replace(' ', '')
+    if len(text) < n:
+        return {text} if text else set()
+    return {text[i:i + n] for i in range(len(text) - n + 1)}
+
+
+def similarity(a, b):
+    """ 字元 bigram 的 Dice 係數，0 ~ 1。 """
+    grams_a, grams_b = ngrams(a), ngrams(b)
+    if not grams_a or not grams_b:
+        return 0.0
+    return 2 * len(grams_a & grams_b) / (len(grams_a) + len(grams_b))
+
+
+def classify_match(surface, name, aliases):
+    """ 回傳 (match, score)：name / alias 為正規化後完全相同，否則為與名稱及別名中最相似者的 fuzzy 分數。 """
+    normalized = normalize_fact_name(surface)
+    if name is not None and normalize_fact_name(name) == normalized:
+        return MATCH_NAME, 1.0
+    aliases = aliases or []
+    if any(normalize_fact_name(alias) == normalized for alias in aliases):
+        return MATCH_ALIAS, 1.0
+    return MATCH_FUZZY, max([similarity(surface, text) for text in [name or ''] + list(aliases)])
+
+
+def rank_matches(surface, nodes, labels, limit=5, min_score=0.5):
+    """
+    :param nodes: 候選的 serialized node (含 name、aliases、labels)，可重複
+    :param labels: 依優先順序排列的 label，同一種比對結果時排在前面的 label 優先
+    :return: list of {'node', 'match', 'score'}，最多 limit 筆 (None 不限)；fuzzy 分數低於 min_score 者不列入
+    """
+    label_order = {label: i for i, label in enumerate(labels)}
+    matches = {}
+    for node in nodes:
+        if node['element_id'] in matches:
+            continue
+        match, score = classify_match(surface, node.get('name'), node.get('aliases'))
+        if match == MATCH_FUZZY and score < min_score:
+            continue
+        matches[node['element_id']] = {'node': node, 'match': match, 'score': round(score, 4)}
+
+    def order(entry):
+        label_rank = min((label_order.get(label, len(label_order)) for label in entry['node']['labels']),
+                         default=len(label_order))
+        return _MATCH_PRIORITY[entry['match']], -entry['score'], label_rank, entry['node'].get('name') or ''
+    return sorted(matches.values(), key=order)[:limit]
+
+
+def best_matches(matches):
+    """ 取排名最前的一組：有名稱或別名相同的節點時取全部相同者，否則只取最相似的一個 fuzzy 結果。 """
+    if not matches:
+        return []
+    if matches[0]['match'] == MATCH_FUZZY:
+        return matches[:1]
+    return [entry for entry in matches if entry['match'] == matches[0]['match']]
+
+
+def preferred_matches(matches, labels):
+    """
+    best_matches 中只保留與第一筆相同 label 的節點 (labels 依優先順序)：同名的 fact 與 concept 都存在時只取 fact，
+    與名稱查詢先查 fact、查無時才查其他 label 相同。
+    """
+    def top_label(entry):
+        return min(entry['node']['labels'], key=lambda label: labels.index(label) if label in labels else len(labels),
+                   default=None)
+    best = best_matches(matches)
+    return [entry for entry in best if top_label(entry) == top_label(best[0])] if best else []
+
+
+
+class NgramEntityIndex:
+    """ 名稱與別名的字元 bigram 倒排索引：gram -> {key}，供 GraphSnapshot 取得模糊比對候選。 """
+    def __init__(self):
+        self._postings:dict[str, set] = {}
+        self._exact:dict[str, set] = {}       # 正規化後的名稱 / 別名 -> {key}
+
+
+    def add(self, key, surfaces):
+        for surface in surfaces:
+            if not isinstance(surface, str) or not surface:
+                continue
+            self._exact.setdefault(normalize_fact_name(surface), set()).add(key)
+            for gram in ngrams(surface):
+                self._postings.setdefault(gram, set()).add(key)
+
+
+    def candidates(self, surface, min_score=0.5, max_candidates=200):
+        """
+        回傳可能相符的 key：名稱 / 別名完全相同者，加上共用 bigram 數足以達到 min_score 者
+        (依共用數排序，最多 max_candidates 個)。
+        """
+        exact = self._exact.get(normalize_fact_name(surface), set())
+        grams = ngrams(surface)
+        counts = {}
+        for gram in grams:
+            for key in self._postings.get(gram, ()):
+                counts[key] = counts.get(key, 0) + 1
+        # Dice >= min_score 時共用 gram 數至少為 min_score * |A| / 2
+        threshold = max(1, math.ceil(min_score * len(grams) / 2))
+        shared = sorted((key for key, count in counts.items() if count >= threshold and key not in exact),
+                        key=lambda key: -counts[key])
+        return list(exact) + shared[:max_candidates]
+
+
+    def __len__(self):
+        return len(self._postings)
+
+
+    def memory_usage(self):
+        return sum(sys.getsizeof(index) + sum(sys.getsizeof(keys) for keys in index.values())
+                   for index in (self._postings, self._exact))
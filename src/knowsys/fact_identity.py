@@ -0,0 +1,158 @@
+"""
+fact 節點的識別 key。
+
+fact 原本以 CREATE 寫入，只靠 process 內的去重 store 避免重複；重新匯入修正過的 PDF 或中斷後重跑時，
+同一頁的 fact 會再建立一份，之後的 is_a 與鄰居查詢都要多讀這些重複節點。
+fact_key = sha1(file_id, page_number, 正規化名稱)，存於有唯一性限制的 fact.fact_key，寫入改為 MERGE。
+
+既有 KG 的 fact 沒有 fact_key，collapse_duplicate_facts() 一次性補上 key，並將重複的 fact 合併：
+保留一個節點，其他節點的關聯移到保留的節點後刪除 (不需要 APOC)。
+"""
+import hashlib
+import os
+import re
+import unicodedata
+
+import logging
+logger:logging.Logger = logging.getLogger(os.getenv('LOGGER_NAME'))
+
+
+_WHITESPACE = re.compile(r'\s+')
+
+
+def normalize_fact_name(name):
+    """ NFKC (全形轉半形)、忽略大小寫、合併連續空白。 """
+    return _WHITESPACE.sub(' ', unicodedata.normalize('NFKC', str(name))).strip().casefold()
+
+
+def fact_key(file_id, page_number, name):
+    """ 回傳 fact 的識別 key (sha1 hex)。 """
+    raw = f"{file_id}\x1f{page_number}\x1f{normalize_fact_name(name)}"
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+
+def plan_fact_collapse(facts):
+    """
+    :param facts: 同一 file_id 的 fact，dict 含 eid、file_id、page_number、name、aliases、fact_key
+    :return: list of {'keep', 'duplicates', 'fact_key', 'aliases'}，只包含需要合併或補上 / 修正 key 的節點。
+        保留的節點優先選已有正確 fact_key 者 (避免違反唯一性限制)，其次為第一個；aliases 取聯集。
+    """
+    groups = {}
+    for fact in facts:
+        groups.setdefault(fact_key(fact['file_id'], fact['page_number'], fact['name']), []).append(fact)
+
+    plan = []
+    for key, members in groups.items():
+        keep = next((fact for fact in members if fact.get('fact_key') == key), members[0])
+        duplicates = [fact['eid'] for fact in members if fact is not keep]
+        if not duplicates and keep.get('fact_key') == key:
+            continue
+        aliases = []
+        for fact in [keep] + [fact for fact in members if fact is not keep]:
+            aliases.extend(alias for alias in fact.get('aliases') or [] if alias not in aliases)
+        plan.append({'keep': keep['eid'], 'duplicates': duplicates, 'fact_key': key, 'aliases': aliases})
+    return plan
+
+
+_FACTS_OF_FILE_QUERY = """
+    MATCH (n:fact)
+    WHERE n.file_id = $file_id OR ($file_id IS NULL AND n.file_id IS NULL)
+    RETURN elementId(n) AS eid, n.file_id AS file_id, n.page_number AS page_number,
+        n.name AS name, n.aliases AS aliases, n.fact_key AS fact_key
+    """
+
+_DUPLICATE_TYPES_QUERY = """
+    UNWIND $eids AS eid
+    MATCH (d)-[r]-()
+    WHERE elementId(d) = eid
+    RETURN DISTINCT type(r) AS type
+    """
+
+# 將重複節點的關聯 (排除同組節點之間的關聯) 以 MERGE 移到保留的節點；{type} 於執行時代入。
+# r.sources (產生關聯的頁面，見 page_provenance) 併入保留的關聯，頁面退役時才能正確移除；
+# 任一方為沒有 sources 的舊關聯時，合併後也不設 sources，維持「不因退役而移除」。
+_MOVE_RELATIONSHIPS = {
+    'outgoing': """
+        UNWIND $groups AS g
+        MATCH (keep) WHERE elementId(keep) = g.keep
+        UNWIND g.duplicates AS eid
+        MATCH (d)-[r:`{type}`]->(o)
+        WHERE elementId(d) = eid AND NOT elementId(o) IN g.members
+        MERGE (keep)-[m:`{type}`]->(o)
+        ON CREATE SET m.sources = r.sources
+        ON MATCH SET m.sources = CASE WHEN m.sources IS NULL OR r.sources IS NULL THEN null
+            ELSE m.sources + [source IN r.sources WHERE NOT source IN m.sources] END
+        """,
+    'incoming': """
+        UNWIND $groups AS g
+        MATCH (keep) WHERE elementId(keep) = g.keep
+        UNWIND g.duplicates AS eid
+        MATCH (d)<-[r:`{type}`]-(o)
+        WHERE elementId(d) = eid AND NOT elementId(o) IN g.members
+        MERGE (keep)<-[m:`{type}`]-(o)
+        ON CREATE SET m.sources = r.sources
+        ON MATCH SET m.sources = CASE WHEN m.sources IS NULL OR r.sources IS NULL THEN null
+            ELSE m.sources + [source IN r.sources WHERE NOT source IN m.sources] END
+        """,
+}
+
+_DELETE_DUPLICATES = """
+    UNWIND $eids AS eid
+    MATCH (d) WHERE elementId(d) = eid
+    DETACH DELETE d
+    """
+
+_SET_FACT_KEYS = """
+    UNWIND $groups AS g
+    MATCH (n) WHERE elementId(n) = g.keep
+    SET n.fact_key = g.fact_key,
+        n.aliases = g.aliases
+    """
+
+
+def _collapse_tx(tx, plan):
+    """ 供 session.execute_write() 呼叫；先移動關聯、刪除重複節點，最後才設定 key。 """
+    groups = [dict(group, members=[group['keep']] + group['duplicates']) for group in plan if group['duplicates']]
+    duplicates = [eid for group in groups for eid in group['duplicates']]
+    relationships_created = 0
+    if duplicates:
+        types = [record["type"] for record in tx.run(_DUPLICATE_TYPES_QUERY, eids=duplicates)]
+        for rel_type in types:
+            for query in _MOVE_RELATIONSHIPS.values():
+                summary = tx.run(query.format(type=rel_type), groups=groups).consume()
+                relationships_created += summary.counters.relationships_created
+        tx.run(_DELETE_DUPLICATES, eids=duplicates).consume()
+    tx.run(_SET_FACT_KEYS, groups=plan).consume()
+    return relationships_created
+
+
+def collapse_duplicate_facts(session, file_ids=None, dry_run=False, batch_size=1000):
+    """
+    為沒有 fact_key 的 fact 補上 key，並合併 fact_key 相同的 fact。每個 file_id 分開處理，
+    每 batch_size 組合併為一個 write transaction。
+
+    :param file_ids: 只處理這些 file_id；None 表示全部
+    :param dry_run: True 時只計算，不寫入
+    :return: dict，包含 files、facts_before、facts_after、duplicates、keys_set 與 relationships_moved
+    """
+    if file_ids is None:
+        file_ids = [record["file_id"] for record in session.run("MATCH (n:fact) RETURN DISTINCT n.file_id AS file_id")]
+
+    report = {'files': 0, 'facts_before': 0, 'facts_after': 0, 'duplicates': 0, 'keys_set': 0,
+              'relationships_moved': 0, 'dry_run': dry_run}
+    for file_id in file_ids:
+        facts = [dict(record) for record in session.run(_FACTS_OF_FILE_QUERY, file_id=file_id)]
+        plan = plan_fact_collapse(facts)
+        duplicates = sum(len(group['duplicates']) for group in plan)
+        report['files'] += 1
+        report['facts_before'] += len(facts)
+        report['facts_after'] += len(facts) - duplicates
+        report['duplicates'] += duplicates
+        report['keys_set'] += len(plan)
+        if dry_run:
+            continue
+        for start in range(0, len(plan), batch_size):
+            report['relationships_moved'] += session.execute_write(_collapse_tx, plan[start:start + batch_size])
+        if plan:
+            logger.info(f"File '{file_id}': {len(facts)} facts, {duplicates} duplicates collapsed, {len(plan)} keys set")
+    return report
@@ -0,0 +1,803 @@
+"""
+KG 的唯讀記憶體快照。
+
+出題流程只讀取 KG (section 底下的 concept、concept 的 is_a fact、fact 的一跳鄰居)，
+GraphSnapshot 將整個 KG 一次載入成精簡的陣列結構，提供與 KnowledgeGraph 相同的讀取 API：
+- 節點屬性以欄位陣列 (numpy) 保存，名稱、file_id、label 組合與其他屬性皆 intern。
+- element_id 拆成共用前綴與整數 id，以排序陣列二分搜尋查找。
+- 關聯以 CSR (offsets / targets / types) 保存連出與連入兩個方向。
+  關聯屬性 (例如 r.sources) 不供查詢，只為封存與還原保留：以 JSON 字串 intern，連出方向每條關聯一個 id。
+- refresh() 依 TRIPLETS_ADD 的 triplets 只讀回該頁寫入的節點與關聯，新增部分先放在 overlay，
+  累積超過一定比例後再合併 (compact) 回 CSR。
+- save() / open() 以 kg_archive 的二進位封存檔保存與載入快照，不需重新讀取 Neo4j。
+
+快照只反映新增，刪除節點或關聯後須以 load() 重新載入。
+"""
+import json
+import os
+import sys
+import threading
+import time
+
+import numpy as np
+
+from knowsys import entity_index, kg_schema
+
+import logging
+logger:logging.Logger = logging.getLogger(os.getenv('LOGGER_NAME'))
+
+
+_NO_VALUE = -1
+_NO_PAGE = np.iinfo(np.int32).min
+
+
+def _id_dtype(count):
+    """ count 個 intern id (0 .. count - 1) 所需的 dtype：平常用 int16，超出範圍時改用 int32。 """
+    return np.int16 if count <= np.iinfo(np.int16).max + 1 else np.int32
+
+
+
+class _StringPool:
+    """ 字串 intern 表：相同字串只保存一次，以 int id 參照。 """
+    def __init__(self):
+        self.strings:list = []
+        self.index:dict = {}
+
+
+    def intern(self, value):
+        string_id = self.index.get(value)
+        if string_id is None:
+            string_id = self.index[value] = len(self.strings)
+            self.strings.append(value)
+        return string_id
+
+
+    def lookup(self, value):
+        return self.index.get(value, _NO_VALUE)
+
+
+    def memory_usage(self):
+        return (sys.getsizeof(self.strings) + sys.getsizeof(self.index)
+                + sum(sys.getsizeof(s) for s in self.strings))
+
+
+
+class _KeyIndex:
+    """
+    int key -> 節點 index 的查找表。compact 時建立排序陣列 (二分搜尋)，
+    之後新增的節點先記在 dict，下次 compact 再併入。
+    """
+    def __init__(self, keys:np.ndarray):
+        self.order = np.argsort(keys, kind='stable').astype(np.int32)
+        self.sorted = keys[self.order]
+        self.recent:dict = {}
+
+
+    def add(self, key, idx):
+        self.recent.setdefault(int(key), []).append(idx)
+
+
+    def lookup(self, key):
+        lo = np.searchsorted(self.sorted, key, side='left')
+        hi = np.searchsorted(self.sorted, key, side='right')
+        found = self.order[lo:hi].tolist()
+        recent = self.recent.get(key)
+        return found + recent if recent else found
+
+
+    def memory_usage(self):
+        return (self.order.nbytes + self.sorted.nbytes + sys.getsizeof(self.recent)
+                + sum(sys.getsizeof(v) for v in self.recent.values()))
+
+
+
+def _split_element_id(element_id):
+    """ Neo4j element id 形如 '4:<database id>:<id>'，拆成 (前綴, 整數 id)。 """
+    prefix, sep, local_id = element_id.rpartition(':')
+    if not local_id.isdigit():
+        raise ValueError(f"Unsupported element id: {element_id}")
+    return prefix + sep, int(local_id)
+
+
+
+class GraphSnapshot:
+    # 節點欄位與 dtype；容量不足時以倍數成長，prefix 與 labels 的 id 超出 int16 時改為 int32 (見 _store_id)
+    _NODE_COLUMNS = {
+        'prefix': np.int16,
+        'local_id': np.int64,
+        'labels': np.int16,
+        'name': np.int32,
+        'file_id': np.int32,
+        'page_number': np.int32,
+        'extra': np.int32,
+    }
+
+
+    def __init__(self, compact_ratio=0.2, compact_min_edges=10_000):
+        """
+        :param compact_ratio: overlay 關聯數超過 CSR 關聯數的此比例時合併
+        :param compact_min_edges: overlay 關聯數至少達此數量才合併
+        """
+        self.compact_ratio = compact_ratio
+        self.compact_min_edges = compact_min_edges
+        self._lock = threading.RLock()
+        self.loaded_at = None
+        self.refreshes = 0
+        self.compactions = 0
+        self.reset([], [])
+
+
+    @staticmethod
+    def load(kg, **params):
+        """ 從 KnowledgeGraph 讀取全部節點與關聯，建立快照。 """
+        start = time.perf_counter()
+        snapshot = GraphSnapshot(**params)
+        with kg.session() as session:
+            nodes = session.run(
+                "MATCH (n) RETURN elementId(n) AS eid, labels(n) AS labels, properties(n) AS props")
+            nodes = [(record["eid"], record["labels"], record["props"]) for record in nodes]
+            relationships = session.run(
+                "MATCH (s)-[r]->(o) RETURN elementId(s) AS s, type(r) AS rel, elementId(o) AS o, properties(r) AS props")
+            relationships = [(record["s"], record["rel"], record["o"], record["props"]) for record in relationships]
+        snapshot.reset(nodes, relationships)
+        logger.info(f"Graph snapshot loaded in {time.perf_counter() - start:.2f}s: "
+                    f"{snapshot.node_count} nodes, {snapshot.edge_count} relationships")
+        return snapshot
+
+
+    def reset(self, nodes, relationships):
+        """
+        以完整的節點與關聯重建快照。
+        :param nodes: iterable of (element_id, labels, properties)
+        :param relationships: iterable of (subject element_id, type, object element_id[, properties])
+        """
+        with self._lock:
+            self._prefixes = _StringPool()
+            self._labelsets = _StringPool()       # tuple(labels)
+            self._names = _StringPool()
+            self._file_ids = _StringPool()
+            self._types = _StringPool()
+            self._extras = _StringPool()          # 其他屬性以 JSON 字串 intern
+            self._rel_extras = _StringPool()      # 關聯屬性以 JSON 字串 intern
+            self._extra_values:list = []
+            self._labelset_members:list = []
+
+            self._node_count = 0
+            self._columns = {column: np.empty(0, dtype) for column, dtype in GraphSnapshot._NODE_COLUMNS.items()}
+            loading = {}     # 載入期間暫用的 element_id -> index
+            for element_id, labels, props in nodes:
+                if kg_schema.SCHEMA_LABEL in labels:
+                    continue
+                loading[element_id] = self._append_node(element_id, labels, props)
+
+            self._id_index = _KeyIndex(self._column('local_id'))
+            self._name_index = _KeyIndex(self._column('name'))
+            self._entity_index = None     # resolve_entities 第一次使用時建立
+
+            src, types, dst, extras = [], [], [], []
+            for subject_eid, rel, object_eid, *props in relationships:
+                s, o = loading.get(subject_eid), loading.get(object_eid)
+                if s is None or o is None:
+                    continue
+                src.append(s)
+                types.append(self._types.intern(rel))
+                dst.append(o)
+                extras.append(self._rel_extra(props[0] if props else None))
+            self._build_csr(np.array(src, np.int32), np.array(types, _id_dtype(len(self._types.strings))),
+                            np.array(dst, np.int32), np.array(extras, np.int32))
+            self.loaded_at = time.time()
+
+
+    def _column(self, column):
+        return self._columns[column][:self._node_count]
+
+
+    def _append_node(self, element_id, labels, props):
+        if self._node_count == len(self._columns['local_id']):
+            capacity = max(1024, self._node_count * 2)
+            for column, values in self._columns.items():
+                grown = np.empty(capacity, values.dtype)
+                grown[:self._node_count] = values[:self._node_count]
+                self._columns[column] = grown
+
+        idx = self._node_count
+        self._node_count += 1
+        prefix, local_id = _split_element_id(element_id)
+        self._store_id('prefix', idx, self._prefixes.intern(prefix))
+        self._columns['local_id'][idx] = local_id
+        self._set_properties(idx, labels, props)
+        return idx
+
+
+    def _store_id(self, column, idx, value):
+        values = self._columns[column]
+        if value > np.iinfo(values.dtype).max:
+            logger.info(f"Graph snapshot column '{column}' widened to int32 ({value + 1} distinct values)")
+            values = self._columns[column] = values.astype(np.int32)
+        values[idx] = value
+
+
+    def _set_properties(self, idx, labels, props):
+        labelset = tuple(labels)
+        if labelset not in self._labelsets.index:
+            self._labelset_members.append(frozenset(labelset))
+        self._store_id('labels', idx, self._labelsets.intern(labelset))
+
+        props = dict(props)
+        name = props.pop('name', None)
+        self._columns['name'][idx] = self._names.intern(name) if isinstance(name, str) else _NO_VALUE
+        if name is not None and not isinstance(name, str):
+            props['name'] = name
+        file_id = props.pop('file_id', None)
+        self._columns['file_id'][idx] = self._file_ids.intern(file_id) if isinstance(file_id, str) else _NO_VALUE
+        if file_id is not None and not isinstance(file_id, str):
+            props['file_id'] = file_id
+        page_number = props.pop('page_number', None)
+        if isinstance(page_number, int) and not isinstance(page_number, bool) and page_number != _NO_PAGE:
+            self._columns['page_number'][idx] = page_number
+        else:
+            self._columns['page_number'][idx] = _NO_PAGE
+            if page_number is not None:
+                props['page_number'] = page_number
+
+        if props:
+            key = json.dumps(props, sort_keys=True, ensure_ascii=False, default=str)
+            if key not in self._extras.index:
+                self._extra_values.append(props)
+            self._columns['extra'][idx] = self._extras.intern(key)
+        else:
+            self._columns['extra'][idx] = _NO_VALUE
+
+
+    def _rel_extra(self, props):
+        if not props:
+            return _NO_VALUE
+        return self._rel_extras.intern(json.dumps(props, sort_keys=True, ensure_ascii=False, default=str))
+
+
+    @staticmethod
+    def _csr(count, src, types, dst):
+        order = np.argsort(src, kind='stable')
+        offsets = np.zeros(count + 1, np.int64)
+        np.cumsum(np.bincount(src, minlength=count), out=offsets[1:])
+        return offsets, dst[order].astype(np.int32), types[order]
+
+
+    def _build_csr(self, src, types, dst, extras):
+        count = self._node_count
+        # 先依 src 排序，連出方向的關聯屬性與 CSR 對齊
+        order = np.argsort(src, kind='stable')
+        src, types, dst = src[order], types[order], dst[order]
+        self._out = GraphSnapshot._csr(count, src, types, dst)
+        self._out_extras = extras[order].astype(np.int32)
+        self._in = GraphSnapshot._csr(count, dst, types, src)
+        self._csr_edges = len(src)
+        self._overlay_out:dict = {}       # node index -> [(type id, node index)]
+        self._overlay_in:dict = {}
+        self._overlay_extras:dict = {}    # (src, type id, dst) -> 關聯屬性 id
+        self._overlay_edges = 0
+
+
+    def _csr_position(self, s, type_id, o):
+        """ 回傳關聯在連出 CSR 的位置，不在 CSR 中回傳 None。 """
+        offsets, targets, types = self._out
+        if s + 1 >= len(offsets):
+            return None
+        lo, hi = int(offsets[s]), int(offsets[s + 1])
+        hits = np.flatnonzero((targets[lo:hi] == o) & (types[lo:hi] == type_id))
+        return lo + int(hits[0]) if len(hits) else None
+
+
+    def _node_index(self, element_id):
+        try:
+            prefix, local_id = _split_element_id(element_id)
+        except ValueError:
+            return None
+        prefix_id = self._prefixes.lookup(prefix)
+        for idx in self._id_index.lookup(local_id):
+            if self._columns['prefix'][idx] == prefix_id:
+                return idx
+        return None
+
+
+    @staticmethod
+    def _adjacent(csr, overlay, idx):
+        """ 回傳 idx 的 (type ids, node indices)，包含 CSR 與 overlay。 """
+        offsets, targets, types = csr
+        if idx + 1 < len(offsets):
+            lo, hi = offsets[idx], offsets[idx + 1]
+            adj_types, adj_nodes = types[lo:hi].tolist(), targets[lo:hi].tolist()
+        else:
+            adj_types, adj_nodes = [], []
+        for type_id, other in overlay.get(idx, ()):
+            adj_types.append(type_id)
+            adj_nodes.append(other)
+        return adj_types, adj_nodes
+
+
+    def _neighbors(self, csr, overlay, node_eid, relation, label):
+        idx = self._node_index(node_eid)
+        if idx is None:
+            return []
+        relation_id = self._types.lookup(relation) if relation else None
+        if relation_id == _NO_VALUE:
+            return []
+        adj_types, adj_nodes = GraphSnapshot._adjacent(csr, overlay, idx)
+        return [(type_id, other) for type_id, other in zip(adj_types, adj_nodes)
+                if (relation_id is None or type_id == relation_id) and self._has_label(other, label)]
+
+
+    def _has_label(self, idx, label):
+        return label is None or label in self._labelset_members[self._columns['labels'][idx]]
+
+
+    def _serialize(self, idx):
+        columns = self._columns
+        serialized = {
+            "element_id": f"{self._prefixes.strings[columns['prefix'][idx]]}{columns['local_id'][idx]}",
+            "labels": list(self._labelsets.strings[columns['labels'][idx]]),
+        }
+        if (name := columns['name'][idx]) != _NO_VALUE:
+            serialized['name'] = self._names.strings[name]
+        if (file_id := columns['file_id'][idx]) != _NO_VALUE:
+            serialized['file_id'] = self._file_ids.strings[file_id]
+        if (page_number := columns['page_number'][idx]) != _NO_PAGE:
+            serialized['page_number'] = int(page_number)
+        if (extra := columns['extra'][idx]) != _NO_VALUE:
+            for key, value in self._extra_values[extra].items():
+                serialized[key] = list(value) if isinstance(value, list) else value
+        return serialized
+
+
+    def _name_of(self, idx):
+        name = self._columns['name'][idx]
+        return self._names.strings[name] if name != _NO_VALUE else None
+
+
+    @property
+    def node_count(self):
+        return self._node_count
+
+
+    @property
+    def edge_count(self):
+        return self._csr_edges + self._overlay_edges
+
+
+    # ---- 與 KnowledgeGraph 相同的讀取 API ----
+
+    def query_nodes_by_name(self, node_name, label=None):
+        """ Returns a list of serialized nodes matching the given name and optional label. """
+        with self._lock:
+            name_id = self._names.lookup(node_name)
+            if name_id == _NO_VALUE:
+                return []
+            return [self._serialize(idx) for idx in sorted(self._name_index.lookup(name_id))
+                    if self._has_label(idx, label)]
+
+
+    def query_nodes_related_by(self, node_eid, relation=None, label=None):
+        """ Returns a list of serialized nodes related to the given node by the given relation. """
+        with self._lock:
+            return [self._serialize(idx) for _, idx in self._neighbors(self._in, self._overlay_in, node_eid, relation, label)]
+
+
+    def query_nodes_relate_to(self, node_eid, relation=None, label=None):
+        """ Returns a list of serialized nodes that the given node relates to via the specified relation. """
+        with self._lock:
+            return [self._serialize(idx) for _, idx in self._neighbors(self._out, self._overlay_out, node_eid, relation, label)]
+
+
+    def query_all_relationships(self, element_id):
+        """
+        取得指定節點的所有連出與連入關聯。
+        :return: list of (subject_name, relation_type, object_name)，主謂賓三元組
+        """
+        with self._lock:
+            idx = self._node_index(element_id)
+            if idx is None:
+                return []
+            name = self._name_of(idx)
+            types = self._types.strings
+            out_types, out_nodes = GraphSnapshot._adjacent(self._out, self._overlay_out, idx)
+            in_types, in_nodes = GraphSnapshot._adjacent(self._in, self._overlay_in, idx)
+            return ([(name, types[t], self._name_of(o)) for t, o in zip(out_types, out_nodes)]
+                    + [(self._name_of(s), types[t], name) for t, s in zip(in_types, in_nodes)])
+
+
+    def query_nodes_by_names(self, node_names, label=None):
+        """ 與 KnowledgeGraph.query_nodes_by_names 相同：{name: [serialized node, ...]}。 """
+        with self._lock:
+            return {name: self.query_nodes_by_name(name, label) for name in node_names}
+
+
+    def query_all_relationships_many(self, element_ids):
+        """ 與 KnowledgeGraph.query_all_relationships_many 相同：{element_id: [(subject, relation, object), ...]}。 """
+        with self._lock:
+            return {eid: self.query_all_relationships(eid) for eid in element_ids}
+
+
+    def query_neighbors_many(self, element_ids, relation=None, label=None):
+        """ 與 KnowledgeGraph.query_neighbors_many 相同：{element_id: [(relation, is_outgoing, serialized neighbor), ...]}。 """
+        with self._lock:
+            types = self._types.strings
+            neighbors = {}
+            for eid in element_ids:
+                outgoing = self._neighbors(self._out, self._overlay_out, eid, relation, label)
+                incoming = self._neighbors(self._in, self._overlay_in, eid, relation, label)
+                neighbors[eid] = ([(types[t], True, self._serialize(idx)) for t, idx in outgoing]
+                                  + [(types[t], False, self._serialize(idx)) for t, idx in incoming])
+            return neighbors
+
+
+    def _surfaces(self, idx):
+        """ 節點的名稱與別名。 """
+        surfaces = [self._name_of(idx)]
+        if (extra := self._columns['extra'][idx]) != _NO_VALUE:
+            aliases = self._extra_values[extra].get('aliases')
+            if isinstance(aliases, (list, tuple)):
+                surfaces.extend(aliases)
+        return surfaces
+
+
+    def resolve_entities(self, surface_forms, labels=('fact', 'concept'), limit=5, min_score=0.5):
+        """ 與 KnowledgeGraph.resolve_entities 相同，候選節點取自名稱與別名的字元 bigram 索引。 """
+        with self._lock:
+            if self._entity_index is None:
+                start = time.perf_counter()
+                self._entity_index = entity_index.NgramEntityIndex()
+                for idx in range(self._node_count):
+                    self._entity_index.add(idx, self._surfaces(idx))
+                logger.info(f"Snapshot entity index built in {time.perf_counter() - start:.2f}s: "
+                            f"{len(self._entity_index)} grams")
+
+            results = {}
+            for surface in dict.fromkeys(surface_forms):
+                nodes = [self._serialize(idx) for idx in self._entity_index.candidates(surface, min_score)
+                         if any(self._has_label(idx, label) for label in labels)]
+                results[surface] = entity_index.rank_matches(surface, nodes, labels, limit, min_score)
+            return results
+
+
+    def _subtree_paths(self, root, part_of):
+        """
+        回傳 root (含) 以 part_of 連入的所有 structure 路徑: [(path names, node index)]，
+        前序排列，同層依關聯載入的順序 (同 KnowledgeGraph._preorder_subtrees)。
+        """
+        paths = []
+
+        def walk(idx, path, names):
+            paths.append((names, idx))
+            adj_types, adj_nodes = GraphSnapshot._adjacent(self._in, self._overlay_in, idx)
+            for type_id, child in zip(adj_types, adj_nodes):
+                if type_id == part_of and child not in path and self._has_label(child, 'structure'):
+                    walk(child, path | {child}, names + (self._name_of(child) or '',))
+
+        walk(root, {root}, (self._name_of(root) or '',))
+        return paths
+
+
+    def _section_indices(self, document, section_path=None):
+        part_of = self._types.lookup('part_of')
+        if part_of == _NO_VALUE:
+            return []
+
+        if section_path:
+            sections = [section_path] if isinstance(section_path, str) else list(section_path)
+            indices = []
+            for section in sections:
+                name_id = self._names.lookup(section)
+                roots = [idx for idx in sorted(self._name_index.lookup(name_id))
+                         if self._has_label(idx, 'structure')] if name_id != _NO_VALUE else []
+                if roots:
+                    indices.extend(idx for _, idx in self._subtree_paths(roots[0], part_of))
+            if indices:
+                return indices
+            logger.warning(f"No structure found for section_path={section_path}, "
+                           f"fallback to query_subsections(document, None).")
+
+        paths = []
+        name_id = self._names.lookup(document)
+        documents = self._name_index.lookup(name_id) if name_id != _NO_VALUE else []
+        for doc in documents:
+            if not self._has_label(doc, 'document'):
+                continue
+            adj_types, adj_nodes = GraphSnapshot._adjacent(self._in, self._overlay_in, doc)
+            for type_id, top in zip(adj_types, adj_nodes):
+                if type_id == part_of and self._has_label(top, 'structure'):
+                    paths.extend(self._subtree_paths(top, part_of))
+        return [idx for _, idx in paths]
+
+
+    def query_subsections(self, document, section_path=None):
+        """ 與 KnowledgeGraph.query_subsections 相同：section_path 子樹 (前序)，找不到時改為 document 底下的 structure。 """
+        with self._lock:
+            return [self._serialize(idx) for idx in self._section_indices(document, section_path)]
+
+
+    def query_section_concepts(self, document, section_path=None):
+        """ 與 KnowledgeGraph.query_section_concepts 相同：document 與子樹 section 的 concept (不重複)。 """
+        with self._lock:
+            include_in = self._types.lookup('include_in')
+            if include_in == _NO_VALUE:
+                return []
+            name_id = self._names.lookup(document)
+            parents = [idx for idx in (self._name_index.lookup(name_id) if name_id != _NO_VALUE else [])
+                       if self._has_label(idx, 'document')]
+            parents.extend(self._section_indices(document, section_path))
+
+            concepts = {}
+            for parent in parents:
+                adj_types, adj_nodes = GraphSnapshot._adjacent(self._in, self._overlay_in, parent)
+                for type_id, child in zip(adj_types, adj_nodes):
+                    if type_id == include_in and child not in concepts and self._has_label(child, 'concept'):
+                        concepts[child] = None
+            return [self._serialize(idx) for idx in concepts]
+
+
+    def query_section_concepts_many(self, criteria):
+        """ 與 KnowledgeGraph.query_section_concepts_many 相同；criteria 為 list of (document, section_path)。 """
+        results, concepts = {}, []
+        for document, section_path in criteria:
+            key = (document, tuple(section_path) if isinstance(section_path, list) else section_path)
+            if key not in results:
+                results[key] = self.query_section_concepts(document, section_path)
+            concepts.append(results[key])
+        return concepts
+
+
+    # ---- 增量更新 ----
+
+    @staticmethod
+    def _group_triplets(triplets):
+        """ 依 (subject label, predicate, object label) 分組，與 add_triplets 的 MATCH 條件一致。 """
+        groups = {}
+        for subject, predicate, obj in triplets:
+            key = (subject.get('type', 'Entity'), predicate["name"], obj.get('type', 'Entity'))
+            row = {'subject_name': subject["name"], 'object_name': obj["name"]}
+            rows = groups.setdefault(key, [])
+            if row not in rows:
+                rows.append(row)
+        return groups
+
+
+    _DELTA_QUERY = """
+        UNWIND $rows AS row
+        MATCH (s:`{subject_label}` {{name: row.subject_name}})-[r:`{predicate}`]->(o:`{object_label}` {{name: row.object_name}})
+        RETURN elementId(s) AS s_eid, labels(s) AS s_labels, properties(s) AS s_props,
+               elementId(o) AS o_eid, labels(o) AS o_labels, properties(o) AS o_props, properties(r) AS r_props
+        """
+
+
+    def refresh(self, kg, triplets):
+        """
+        在 triplets 寫入 KG 之後呼叫：只讀回這些 triplets 對應的節點與關聯並併入快照。
+        :return: 新增的關聯數
+        """
+        nodes, relationships = {}, []
+        with kg.session() as session:
+            for (subject_label, predicate, object_label), rows in GraphSnapshot._group_triplets(triplets).items():
+                query = GraphSnapshot._DELTA_QUERY.format(
+                    subject_label=subject_label, predicate=predicate, object_label=object_label)
+                for record in session.run(query, rows=rows):
+                    nodes[record["s_eid"]] = (record["s_eid"], record["s_labels"], record["s_props"])
+                    nodes[record["o_eid"]] = (record["o_eid"], record["o_labels"], record["o_props"])
+                    relationships.append((record["s_eid"], predicate, record["o_eid"], record["r_props"]))
+        return self.apply_delta(nodes.values(), relationships)
+
+
+    def apply_delta(self, nodes, relationships):
+        """
+        併入新增或更新的節點與關聯；已存在的關聯只更新屬性 (有提供時)。
+        :param relationships: iterable of (subject element_id, type, object element_id[, properties])
+        :return: 新增的關聯數
+        """
+        with self._lock:
+            for element_id, labels, props in nodes:
+                idx = self._node_index(element_id)
+                if idx is None:
+                    idx = self._append_node(element_id, labels, props)
+                    self._id_index.add(self._columns['local_id'][idx], idx)
+                    if (name := self._columns['name'][idx]) != _NO_VALUE:
+                        self._name_index.add(name, idx)
+                else:
+                    # MERGE 以 name 比對，既有節點的 name 不會改變，name 索引不需更新
+                    self._set_properties(idx, labels, props)
+                if self._entity_index is not None:
+                    self._entity_index.add(idx, self._surfaces(idx))
+
+            added = 0
+            for subject_eid, rel, object_eid, *props in relationships:
+                s, o = self._node_index(subject_eid), self._node_index(object_eid)
+                if s is None or o is None:
+                    continue
+                type_id = self._types.intern(rel)
+                key = (s, type_id, o)
+                if key in self._overlay_extras:
+                    if props:
+                        self._overlay_extras[key] = self._rel_extra(props[0])
+                    continue
+                position = self._csr_position(s, type_id, o)
+                if position is not None:
+                    if props:
+                        self._out_extras[position] = self._rel_extra(props[0])
+                    continue
+                self._overlay_out.setdefault(s, []).append((type_id, o))
+                self._overlay_in.setdefault(o, []).append((type_id, s))
+                self._overlay_extras[key] = self._rel_extra(props[0] if props else None)
+                self._overlay_edges += 1
+                added += 1
+
+            self.refreshes += 1
+            if self._overlay_edges >= max(self.compact_min_edges, self.compact_ratio * self._csr_edges):
+                self.compact()
+            return added
+
+
+    def _edges(self):
+        """ 回傳 CSR 與 overlay 的所有關聯 (src, types, dst, 關聯屬性 id)。 """
+        offsets, targets, types = self._out
+        sources = np.repeat(np.arange(len(offsets) - 1, dtype=np.int32), np.diff(offsets))
+        overlay = [(s, t, o) for s, edges in self._overlay_out.items() for t, o in edges]
+        overlay_sources = np.array([s for s, _, _ in overlay], np.int32)
+        overlay_types = np.array([t for _, t, _ in overlay], _id_dtype(len(self._types.strings)))
+        overlay_targets = np.array([o for _, _, o in overlay], np.int32)
+        overlay_extras = np.array([self._overlay_extras[edge] for edge in overlay], np.int32)
+        return (np.concatenate([sources, overlay_sources]),
+                np.concatenate([types, overlay_types]),
+                np.concatenate([targets, overlay_targets]),
+                np.concatenate([self._out_extras, overlay_extras]))
+
+
+    def compact(self):
+        """ 將 overlay 關聯與新增節點併入 CSR 與排序索引。 """
+        with self._lock:
+            self._id_index = _KeyIndex(self._column('local_id'))
+            self._name_index = _KeyIndex(self._column('name'))
+            self._build_csr(*self._edges())
+            self.compactions += 1
+
+
+    # ---- 封存檔 (見 kg_archive) ----
+
+    _POOLS = ('prefixes', 'labelsets', 'names', 'file_ids', 'types', 'extras', 'rel_extras')
+
+
+    def save(self, path, source=None):
+        """
+        將快照 (含 overlay) 寫成封存檔：節點依 label 組合排序，關聯依 (類型, src) 排序。
+        :param source: 記錄在 header 的來源說明，例如 KG 名稱
+        :return: 統計資料
+        """
+        from knowsys import kg_archive
+
+        start = time.perf_counter()
+        with self._lock:
+            count = self._node_count
+            labels = self._column('labels')
+            order = np.argsort(labels, kind='stable')
+            position = np.empty(count, np.int32)
+            position[order] = np.arange(count, dtype=np.int32)
+
+            src, types, dst, extras = self._edges()
+            src, dst = position[src], position[dst]
+            edge_order = np.lexsort((dst, src, types))
+            src, types, dst, extras = src[edge_order], types[edge_order], dst[edge_order], extras[edge_order]
+
+            arrays = {}
+            for pool in GraphSnapshot._POOLS:
+                strings = getattr(self, f"_{pool}").strings
+                if pool == 'labelsets':
+                    strings = [json.dumps(list(labelset), ensure_ascii=False) for labelset in strings]
+                arrays[f"{pool}.offsets"], arrays[f"{pool}.data"] = kg_archive.encode_strings(strings)
+            for column in GraphSnapshot._NODE_COLUMNS:
+                arrays[f"nodes.{column}"] = self._column(column)[order]
+            arrays['edges.src'], arrays['edges.dst'], arrays['edges.extra'] = src, dst, extras
+
+            def ranges(values, names):
+                ids, starts, counts = np.unique(values, return_index=True, return_counts=True)
+                return [{'name': names[i], 'start': int(s), 'count': int(c)} for i, s, c in zip(ids, starts, counts)]
+
+            header = {
+                'created_at': time.time(),
+                'source': source,
+                'nodes': count,
+                'edges': len(src),
+                'labelsets': ranges(labels[order], [list(labelset) for labelset in self._labelsets.strings]),
+                'types': ranges(types, self._types.strings),
+            }
+            size = kg_archive.write_archive(path, header, arrays)
+
+        stats = {'nodes': count, 'edges': len(src), 'bytes': size, 'seconds': round(time.perf_counter() - start, 2)}
+        logger.info(f"Graph snapshot saved to {path}: {stats}")
+        return stats
+
+
+    @staticmethod
+    def open(path, **params):
+        """
+        從封存檔建立快照，不需連線 Neo4j。節點欄位直接 memory-map (copy-on-write)，之後的 apply_delta 不會改寫檔案。
+        element id 與匯出時的 KG 相同；封存檔還原到新的 Neo4j 後 element id 會改變，須改用 load()。
+        """
+        from knowsys import kg_archive
+
+        start = time.perf_counter()
+        snapshot = GraphSnapshot(**params)
+        archive = kg_archive.SnapshotArchive(path, mode='c')
+        with snapshot._lock:
+            for pool in GraphSnapshot._POOLS:
+                # 格式 1 的封存檔沒有關聯屬性
+                strings = archive.strings(pool) if f"{pool}.offsets" in archive.header['sections'] else []
+                if pool == 'labelsets':
+                    strings = [tuple(json.loads(labels)) for labels in strings]
+                string_pool = _StringPool()
+                string_pool.strings = strings
+                string_pool.index = {value: string_id for string_id, value in enumerate(strings)}
+                setattr(snapshot, f"_{pool}", string_pool)
+            snapshot._labelset_members = [frozenset(labelset) for labelset in snapshot._labelsets.strings]
+            snapshot._extra_values = [json.loads(extra) for extra in snapshot._extras.strings]
+
+            snapshot._node_count = archive.header['nodes']
+            snapshot._columns = {column: archive.array(f"nodes.{column}") for column in GraphSnapshot._NODE_COLUMNS}
+            snapshot._id_index = _KeyIndex(snapshot._column('local_id'))
+            snapshot._name_index = _KeyIndex(snapshot._column('name'))
+            snapshot._entity_index = None
+
+            edge_types = archive.header['types']
+            types = np.repeat(np.array([snapshot._types.lookup(edge_type['name']) for edge_type in edge_types],
+                                       _id_dtype(len(snapshot._types.strings))),
+                              [edge_type['count'] for edge_type in edge_types])
+            src = archive.array('edges.src')
+            extras = (archive.array('edges.extra') if 'edges.extra' in archive.header['sections']
+                      else np.full(len(src), _NO_VALUE, np.int32))
+            snapshot._build_csr(src, types, archive.array('edges.dst'), extras)
+            snapshot.loaded_at = archive.header['created_at']
+        logger.info(f"Graph snapshot opened from {path} in {time.perf_counter() - start:.2f}s: "
+                    f"{snapshot.node_count} nodes, {snapshot.edge_count} relationships")
+        return snapshot
+
+
+    # ---- 統計 ----
+
+    def memory_report(self) -> dict:
+        """ 估計快照各部分的記憶體用量 (bytes)，以及每百萬條關聯的 MB 數。 """
+        with self._lock:
+            def overlay_bytes(overlay):
+                return sys.getsizeof(overlay) + sum(
+                    sys.getsizeof(edges) + sum(sys.getsizeof(edge) for edge in edges) for edges in overlay.values())
+
+            breakdown = {
+                'node_columns': sum(values.nbytes for values in self._columns.values()),
+                'csr': sum(array.nbytes for array in self._out + self._in) + self._out_extras.nbytes,
+                'indexes': self._id_index.memory_usage() + self._name_index.memory_usage()
+                    + (self._entity_index.memory_usage() if self._entity_index is not None else 0),
+                'strings': sum(pool.memory_usage() for pool in (
+                    self._prefixes, self._labelsets, self._names, self._file_ids, self._types, self._extras,
+                    self._rel_extras)),
+                'extra_properties': sys.getsizeof(self._extra_values) + sum(
+                    sys.getsizeof(values) for values in self._extra_values),
+                'overlay': overlay_bytes(self._overlay_out) + overlay_bytes(self._overlay_in)
+                    + sys.getsizeof(self._overlay_extras),
+            }
+            total = sum(breakdown.values())
+            edges = self.edge_count
+            return {
+                'nodes': self._node_count,
+                'edges': edges,
+                'overlay_edges': self._overlay_edges,
+                'bytes': breakdown,
+                'total_bytes': total,
+                'mb_per_million_edges': round(total / edges * 1_000_000 / 2**20, 1) if edges else None,
+            }
+
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'nodes': self._node_count,
+                'edges': self.edge_count,
+                'overlay_edges': self._overlay_edges,
+                'refreshes': self.refreshes,
+                'compactions': self.compactions,
+                'loaded_at': self.loaded_at,
+            }
@@ -0,0 +1,273 @@
+"""
+KG 快照的二進位封存檔 (.kgsnap)。
+
+複製或重建一個科目的 KG 過去只能重跑 PDF 擷取 (數小時的 LLM 呼叫)，或整份複製 Neo4j 的資料 volume。
+封存檔保存 GraphSnapshot 的內容：
+- 字串表：前綴、label 組合、名稱、file_id、關聯類型、其他屬性與關聯屬性 (JSON) 各自 intern 一次，以 offsets + UTF-8 bytes 保存。
+- 節點欄位陣列依 label 組合排序，header 記錄每個 label 組合的範圍。
+- 關聯以 src / dst / extra (關聯屬性，例如頁面退役用的 r.sources) 陣列保存，依 (類型, src) 排序，header 記錄每個類型的範圍。
+  格式 1 沒有關聯屬性，讀取時視為沒有屬性。
+陣列以 64 bytes 對齊，讀取時直接 memory-map，GraphSnapshot.open() 不需經過 Neo4j 即可提供唯讀查詢；
+write_import_csv() 將封存檔轉成 neo4j-admin 的 CSV，由 DockerManager.restore_KG() 匯入新的容器。
+
+檔案格式：
+    [0, 64)          prelude：magic (8 bytes)、格式版本 (uint32)、保留 (uint32)、header offset、header 長度 (uint64)
+    [64, ...)        各陣列，起點對齊 64 bytes
+    [header offset)  header (UTF-8 JSON)：sections {名稱: {offset, dtype, shape}} 與其他 metadata
+"""
+import csv
+import json
+import os
+import struct
+import time
+
+import numpy as np
+
+from knowsys.bulk_import import (ARRAY_DELIMITER, NODE_DATA, NODE_HEADER, RELATIONSHIP_DATA,
+                                 RELATIONSHIP_HEADER)
+from knowsys.graph_snapshot import _NO_PAGE, _NO_VALUE
+
+import logging
+logger:logging.Logger = logging.getLogger(os.getenv('LOGGER_NAME'))
+
+
+MAGIC = b'KAQGSNAP'
+FORMAT_VERSION = 2
+ARCHIVE_SUFFIX = '.kgsnap'
+ALIGNMENT = 64
+_PRELUDE = struct.Struct('<8sIIQQ')
+
+
+
+def encode_strings(strings):
+    """ 將字串 list 編碼為 (offsets int64[n + 1], UTF-8 bytes uint8[])。 """
+    encoded = [s.encode('utf-8') for s in strings]
+    offsets = np.zeros(len(encoded) + 1, np.int64)
+    np.cumsum([len(b) for b in encoded], out=offsets[1:])
+    return offsets, np.frombuffer(b''.join(encoded), np.uint8)
+
+
+def _aligned(position):
+    return (position + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+def write_archive(path, header:dict, arrays:dict):
+    """
+    寫入封存檔；先寫到暫存檔再取代，寫入中斷不會留下不完整的檔案。
+    :param header: 可 JSON 序列化的 metadata，sections 由本函式加入
+    :param arrays: {section 名稱: numpy array}
+    :return: 檔案大小 (bytes)
+    """
+    sections = {}
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(b'\0' * _PRELUDE.size)
+        for name, array in arrays.items():
+            array = np.ascontiguousarray(array)
+            offset = _aligned(f.tell())
+            f.write(b'\0' * (offset - f.tell()))
+            f.write(array.tobytes())
+            sections[name] = {'offset': offset, 'dtype': array.dtype.str, 'shape': list(array.shape)}
+
+        header_bytes = json.dumps({**header, 'sections': sections}, ensure_ascii=False).encode('utf-8')
+        header_offset = _aligned(f.tell())
+        f.write(b'\0' * (header_offset - f.tell()))
+        f.write(header_bytes)
+        f.seek(0)
+        f.write(_PRELUDE.pack(MAGIC, FORMAT_VERSION, 0, header_offset, len(header_bytes)))
+    os.replace(tmp_path, path)
+    return os.path.getsize(path)
+
+
+
+class SnapshotArchive:
+    """ 以 memory-map 讀取封存檔；array() 回傳檔案內容的 view，不複製資料。 """
+    def __init__(self, path, mode='r'):
+        """
+        :param mode: np.memmap 的模式；'c' (copy-on-write) 時陣列可寫入，修改不會寫回檔案
+        """
+        self.path = path
+        with open(path, 'rb') as f:
+            prelude = f.read(_PRELUDE.size)
+            if len(prelude) < _PRELUDE.size:
+                raise ValueError(f"{path} is not a KG snapshot archive (file too short).")
+            magic, version, _, header_offset, header_length = _PRELUDE.unpack(prelude)
+            if magic != MAGIC:
+                raise ValueError(f"{path} is not a KG snapshot archive.")
+            if version > FORMAT_VERSION:
+                raise ValueError(f"{path} has archive format {version}, only up to {FORMAT_VERSION} is supported.")
+            f.seek(header_offset)
+            header_bytes = f.read(header_length)
+        if len(header_bytes) < header_length:
+            raise ValueError(f"{path} is truncated.")
+
+        self.version = version
+        self.header:dict = json.loads(header_bytes.decode('utf-8'))
+        self._buffer = np.memmap(path, dtype=np.uint8, mode=mode)
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+    def close(self):
+        self._buffer = None
+
+
+    def array(self, name) -> np.ndarray:
+        section = self.header['sections'][name]
+        dtype = np.dtype(section['dtype'])
+        count = int(np.prod(section['shape'], dtype=np.int64))
+        start = section['offset']
+        end = start + count * dtype.itemsize
+        if end > len(self._buffer):
+            raise ValueError(f"{self.path} is truncated: section '{name}' ends at {end}.")
+        return self._buffer[start:end].view(dtype).reshape(section['shape'])
+
+
+    def strings(self, pool) -> list:
+        """ 解碼 encode_strings() 保存的字串表 (pool.offsets / pool.data)。 """
+        offsets = self.array(f"{pool}.offsets").tolist()
+        data = self.array(f"{pool}.data").tobytes()
+        return [data[offsets[i]:offsets[i + 1]].decode('utf-8') for i in range(len(offsets) - 1)]
+
+
+
+# ---- 還原到 Neo4j ----
+
+def _value_type(value):
+    """ neo4j-admin 的屬性型別；空 list 回傳 None (與任何陣列型別相容)。 """
+    if isinstance(value, bool):
+        return 'boolean'
+    if isinstance(value, int):
+        return 'long'
+    if isinstance(value, float):
+        return 'double'
+    if isinstance(value, str):
+        return 'string'
+    if isinstance(value, (list, tuple)):
+        element_type = None
+        for element in value:
+            element_type = _merge_types(element_type, _value_type(element))
+        if element_type is None:
+            return None
+        return element_type + '[]' if element_type in ('boolean', 'long', 'double', 'string') else 'json'
+    return 'json'
+
+
+def _merge_types(a, b):
+    if a is None or a == b:
+        return b
+    if b is None:
+        return a
+    if {a, b} == {'long', 'double'}:
+        return 'double'
+    if {a, b} == {'long[]', 'double[]'}:
+        return 'double[]'
+    return 'json'       # 型別不一致時以 JSON 字串保存
+
+
+def _csv_value(value, value_type):
+    if value is None:
+        return None
+    if value_type == 'json':
+        return value if isinstance(value, str) else json.dumps(value, ensure_ascii=False)
+    if value_type.endswith('[]'):
+        # 空的 list 輸出為空欄位，匯入後該屬性不存在 (與 bulk_import 相同)
+        return ARRAY_DELIMITER.join(_csv_value(v, value_type[:-2]) for v in value) if value else None
+    if value_type == 'boolean':
+        return 'true' if value else 'false'
+    return value
+
+
+def _archive_nodes(archive):
+    """ 逐一產生 (labels, properties)，順序即節點 index。 """
+    labelsets = [json.loads(labels) for labels in archive.strings('labelsets')]
+    names = archive.strings('names')
+    file_ids = archive.strings('file_ids')
+    extras = [json.loads(extra) for extra in archive.strings('extras')]
+    columns = {column: archive.array(f"nodes.{column}").tolist()
+               for column in ('labels', 'name', 'file_id', 'page_number', 'extra')}
+    for labels, name, file_id, page_number, extra in zip(
+            columns['labels'], columns['name'], columns['file_id'], columns['page_number'], columns['extra']):
+        properties = {}
+        if name != _NO_VALUE:
+            properties['name'] = names[name]
+        if file_id != _NO_VALUE:
+            properties['file_id'] = file_ids[file_id]
+        if page_number != _NO_PAGE:
+            properties['page_number'] = page_number
+        if extra != _NO_VALUE:
+            properties.update(extras[extra])
+        yield labelsets[labels], properties
+
+
+def _archive_relationship_properties(archive):
+    """ 回傳每條關聯的屬性 dict (依封存檔順序)。 """
+    src = archive.array('edges.src')
+    if 'edges.extra' not in archive.header['sections']:
+        return [{}] * len(src)
+    rel_extras = [json.loads(extra) for extra in archive.strings('rel_extras')]
+    return [rel_extras[extra] if extra != _NO_VALUE else {} for extra in archive.array('edges.extra').tolist()]
+
+
+def _property_columns(rows):
+    """ 依屬性值決定欄位：回傳 (排序後的 keys, {key: 型別}, header 欄位)。 """
+    property_types = {}
+    for properties in rows:
+        for key, value in properties.items():
+            property_types[key] = _merge_types(property_types.get(key), _value_type(value))
+    # 只出現空 list 的屬性不會輸出任何值
+    property_types = {key: value_type or 'string[]' for key, value_type in property_types.items()}
+    keys = sorted(property_types)
+    columns = [key if property_types[key] in ('string', 'json') else f"{key}:{property_types[key]}" for key in keys]
+    return keys, property_types, columns
+
+
+def write_import_csv(path, output_dir):
+    """
+    將封存檔轉成 neo4j-admin 的 header 與 data CSV (檔名與 bulk_import 相同，可用 DockerManager.import_KG 匯入)。
+    屬性欄位與型別依封存檔內的值決定。匯入後節點的 element id 會改變，schema 須另外以 ensure_schema() 建立。
+    :return: 統計資料
+    """
+    start = time.perf_counter()
+    os.makedirs(output_dir, exist_ok=True)
+    with SnapshotArchive(path) as archive:
+        keys, property_types, columns = _property_columns(properties for _, properties in _archive_nodes(archive))
+        # 未命名的 :ID 只用於連結關聯，匯入後節點不會多出 id 屬性 (與 bulk_import 相同)
+        header = [':ID', ':LABEL'] + columns
+
+        with open(os.path.join(output_dir, NODE_HEADER), 'w', encoding='utf-8', newline='') as f:
+            csv.writer(f, lineterminator='\n').writerow(header)
+        with open(os.path.join(output_dir, NODE_DATA), 'w', encoding='utf-8', newline='') as f:
+            writer = csv.writer(f, lineterminator='\n')
+            for node_id, (labels, properties) in enumerate(_archive_nodes(archive)):
+                writer.writerow([node_id, ';'.join(labels)] + [
+                    _csv_value(properties.get(key), property_types[key]) for key in keys])
+
+        rel_properties = _archive_relationship_properties(archive)
+        rel_keys, rel_types, rel_columns = _property_columns(rel_properties)
+        with open(os.path.join(output_dir, RELATIONSHIP_HEADER), 'w', encoding='utf-8', newline='') as f:
+            csv.writer(f, lineterminator='\n').writerow([':START_ID', ':END_ID', ':TYPE'] + rel_columns)
+        src, dst = archive.array('edges.src'), archive.array('edges.dst')
+        with open(os.path.join(output_dir, RELATIONSHIP_DATA), 'w', encoding='utf-8', newline='') as f:
+            writer = csv.writer(f, lineterminator='\n')
+            for edge_type in archive.header['types']:
+                lo, hi = edge_type['start'], edge_type['start'] + edge_type['count']
+                writer.writerows([s, o, edge_type['name']] + [
+                    _csv_value(properties.get(key), rel_types[key]) for key in rel_keys]
+                    for s, o, properties in zip(src[lo:hi].tolist(), dst[lo:hi].tolist(), rel_properties[lo:hi]))
+
+        stats = {
+            'nodes': archive.header['nodes'],
+            'relationships': archive.header['edges'],
+            'csv_bytes': sum(os.path.getsize(os.path.join(output_dir, filename)) for filename in (
+                NODE_HEADER, NODE_DATA, RELATIONSHIP_HEADER, RELATIONSHIP_DATA)),
+            'seconds': round(time.perf_counter() - start, 2),
+        }
+    logger.info(f"Snapshot archive {path} converted to import CSV in {output_dir}: {stats}")
+    return stats
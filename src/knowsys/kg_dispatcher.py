@@ -0,0 +1,199 @@
+"""
+KG 請求的分派。
+
+agentflow 對每則訊息各開一個 thread 執行 handler，請求數量沒有上限，不同 KG 之間也沒有隔離：
+科目 A 大量寫入 triplets 時，科目 B 的 CONCEPTS_QUERY 與寫入競爭同一批 driver 連線與 CPU，互動出題因此停頓。
+KGDispatcher 將請求依 (kg_name, lane) 分派到各自的 worker：
+- read / write 兩條 lane 分開，某個 KG 的寫入不會占用任何 KG 的讀取 worker；
+- write lane 預設只有一個 worker，同一 KG 的寫入依序執行，避免並行 MERGE 互相等待鎖；
+- 每條 lane 的佇列有上限，佇列滿時提交端等待 (backpressure)，超過 queue_timeout 則拋出 TimeoutError；
+- stats() 回傳各 lane 的佇列深度、等待時間與服務時間。
+"""
+from collections import deque
+from concurrent.futures import Future
+import os
+import queue
+import threading
+import time
+
+import logging
+logger:logging.Logger = logging.getLogger(os.getenv('LOGGER_NAME'))
+
+
+READ = 'read'
+WRITE = 'write'
+LATENCY_WINDOW = 1024       # 計算百分位數的最近樣本數
+
+
+
+class _LatencyStats:
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.recent = deque(maxlen=LATENCY_WINDOW)
+
+
+    def add(self, seconds):
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        self.recent.append(seconds)
+
+
+    def report(self) -> dict:
+        recent = sorted(self.recent)
+
+        def percentile(p):
+            return round(recent[min(len(recent) - 1, int(len(recent) * p))] * 1000, 2) if recent else None
+        return {
+            'mean_ms': round(self.total / self.count * 1000, 2) if self.count else None,
+            'p50_ms': percentile(0.5),
+            'p95_ms': percentile(0.95),
+            'max_ms': round(self.max * 1000, 2),
+        }
+
+
+
+class _Lane:
+    def __init__(self, name, workers, queue_size):
+        self.name = name
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.workers = [threading.Thread(target=self._run, name=f'kg-{name}-{i}', daemon=True) for i in range(workers)]
+        self.lock = threading.Lock()
+        self.active = 0
+        self.max_depth = 0
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.wait = _LatencyStats()
+        self.service = _LatencyStats()
+        for worker in self.workers:
+            worker.start()
+
+
+    def submit(self, fn, args, kwargs, timeout) -> Future:
+        future = Future()
+        try:
+            self.queue.put((future, fn, args, kwargs, time.perf_counter()), timeout=timeout)
+        except queue.Full:
+            with self.lock:
+                self.rejected += 1
+            raise TimeoutError(f"Lane '{self.name}' is full ({self.queue.maxsize} queued requests)") from None
+        with self.lock:
+            self.submitted += 1
+            self.max_depth = max(self.max_depth, self.queue.qsize())
+        return future
+
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            future, fn, args, kwargs, queued_at = item
+            if not future.set_running_or_notify_cancel():
+                continue
+            start = time.perf_counter()
+            with self.lock:
+                self.active += 1
+                self.wait.add(start - queued_at)
+            try:
+                result = fn(*args, **kwargs)
+                error = None
+            except BaseException as e:
+                error = e
+            elapsed = time.perf_counter() - start
+            with self.lock:
+                self.active -= 1
+                self.service.add(elapsed)
+                if error is None:
+                    self.completed += 1
+                else:
+                    self.failed += 1
+            if error is None:
+                future.set_result(result)
+            else:
+                future.set_exception(error)
+
+
+    def close(self):
+        for _ in self.workers:
+            self.queue.put(None)
+        for worker in self.workers:
+            worker.join()
+
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                'workers': len(self.workers),
+                'active': self.active,
+                'queue_depth': self.queue.qsize(),
+                'max_queue_depth': self.max_depth,
+                'submitted': self.submitted,
+                'completed': self.completed,
+                'failed': self.failed,
+                'rejected': self.rejected,
+                'wait': self.wait.report(),
+                'service': self.service.report(),
+            }
+
+
+
+class KGDispatcher:
+    def __init__(self, read_workers=4, write_workers=1, queue_size=64, queue_timeout=30):
+        """
+        :param read_workers: 每個 KG 的讀取 worker 數
+        :param write_workers: 每個 KG 的寫入 worker 數
+        :param queue_size: 每條 lane 的佇列上限
+        :param queue_timeout: 佇列滿時提交端等待的秒數，逾時拋出 TimeoutError；None 表示一直等待
+        """
+        self.workers = {READ: read_workers, WRITE: write_workers}
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self._lanes:dict[tuple[str, str], _Lane] = {}
+        self._lock = threading.Lock()
+        self._closed = False
+
+
+    def _lane(self, kg_name, lane) -> _Lane:
+        if lane not in self.workers:
+            raise ValueError(f"Unknown lane '{lane}', expected one of {list(self.workers)}")
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("KGDispatcher is closed")
+            key = (kg_name, lane)
+            if key not in self._lanes:
+                self._lanes[key] = _Lane(f'{kg_name}-{lane}', self.workers[lane], self.queue_size)
+            return self._lanes[key]
+
+
+    def submit(self, kg_name, lane, fn, *args, **kwargs) -> Future:
+        """ 將 fn(*args, **kwargs) 排入 kg_name 的 lane，回傳 Future。 """
+        return self._lane(kg_name, lane).submit(fn, args, kwargs, self.queue_timeout)
+
+
+    def call(self, kg_name, lane, fn, *args, **kwargs):
+        """ submit() 並等待結果；fn 的例外會在呼叫端重新拋出。 """
+        return self.submit(kg_name, lane, fn, *args, **kwargs).result()
+
+
+    def close(self):
+        """ 處理完已排入的請求後停止所有 worker。 """
+        with self._lock:
+            self._closed = True
+            lanes = list(self._lanes.values())
+        for lane in lanes:
+            lane.close()
+
+
+    def stats(self) -> dict:
+        """ {kg_name: {'read': {...}, 'write': {...}}} """
+        with self._lock:
+            lanes = dict(self._lanes)
+        report = {}
+        for (kg_name, lane), entry in sorted(lanes.items()):
+            report.setdefault(kg_name, {})[lane] = entry.stats()
+        return report
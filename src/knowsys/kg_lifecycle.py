@@ -0,0 +1,358 @@
+"""
+KG 容器的生命週期管理。
+
+每個科目一個 neo4j JVM 容器；全部常駐會耗盡記憶體，而 DockerManager.open_KG 遇到未運行的 KG 直接拋出例外。
+KGLifecycleManager 在需要時才啟動容器，並以 LRU + 閒置 TTL 限制同時運行的容器數量 (或估計記憶體)：
+- 已運行：直接回傳 URL (hit)。
+- 未運行：停止最久未使用的容器騰出空間，再啟動 (miss / cold start)；啟動期間其他請求排隊等待。
+- 閒置超過 idle_ttl 的容器由 reap_idle() 停止 (只停止不刪除，資料保留在 volume)。
+- 處理中的請求以 borrow() 借用 KG，借用中的容器不會被淘汰或閒置停止。
+
+Docker 操作透過 ContainerBackend 介面，測試時可替換成假的 backend。
+"""
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from contextlib import contextmanager
+import os
+import threading
+import time
+
+import logging
+logger:logging.Logger = logging.getLogger(os.getenv('LOGGER_NAME'))
+
+
+GB = 1024 ** 3
+
+
+
+class ContainerBackend(ABC):
+    """抽象基類，定義 KG 容器的操作"""
+
+    @abstractmethod
+    def start(self, name) -> tuple[str, str]:
+        """啟動 (或建立) 容器並等待就緒，回傳 (http_url, bolt_url)"""
+        pass
+
+
+    @abstractmethod
+    def stop(self, name):
+        """停止容器，保留容器與資料"""
+        pass
+
+
+    @abstractmethod
+    def running(self) -> dict[str, tuple[str, str]]:
+        """回傳運行中的容器 {name: (http_url, bolt_url)}"""
+        pass
+
+
+    def memory_bytes(self, name) -> int:
+        """估計一個運行中容器的記憶體用量"""
+        return 0
+
+
+
+class DockerContainerBackend(ContainerBackend):
+    def __init__(self, docker_manager, container_memory_gb=1.5):
+        """
+        :param container_memory_gb: 未啟用 memory_profiles 時，每個 neo4j 容器的估計記憶體 (heap + page cache)
+        """
+        self.docker_manager = docker_manager
+        self.container_memory = int(container_memory_gb * GB)
+
+
+    def start(self, name):
+        return self.docker_manager.create_container(name)
+
+
+    def stop(self, name):
+        self.docker_manager.stop_container(name)
+
+
+    def running(self):
+        hostname = self.docker_manager.hostname
+        return {name: (f"http://{hostname}:{http_port}", f"bolt://{hostname}:{bolt_port}")
+                for name, http_port, bolt_port in self.docker_manager.list_running_KGs()}
+
+
+    def memory_bytes(self, name):
+        # 依 KG 大小設定記憶體時，以該 KG 的 heap + page cache 估計
+        if self.docker_manager.memory_profiles:
+            return self.docker_manager.memory_profile(name).total_mb * 1024 ** 2
+        return self.container_memory
+
+
+
+class _KGEntry:
+    def __init__(self):
+        self.urls = None
+        self.ready = threading.Event()
+        self.error = None
+        self.last_used = time.monotonic()
+        self.memory = 0
+
+
+
+class KGLifecycleManager:
+    def __init__(self, backend:ContainerBackend, max_running=4, max_memory_gb=None, idle_ttl=600,
+                 managed=None, on_started=None):
+        """
+        :param max_running: 同時運行的容器數上限
+        :param max_memory_gb: 同時運行容器的估計記憶體上限，None 表示不限制
+        :param idle_ttl: 閒置超過此秒數的容器由 reap_idle() 停止，None 表示不停止
+        :param managed: 可停止的 KG 名稱；None 表示全部。其他容器 (非 KG) 不計入也不會被停止
+        :param on_started: on_started(name, urls)，容器啟動後、等待中的請求取得 URL 前呼叫 (例如 schema 升級)
+        """
+        self.backend = backend
+        self.max_running = max_running
+        self.max_memory = int(max_memory_gb * GB) if max_memory_gb else None
+        self.idle_ttl = idle_ttl
+        self.managed = set(managed) if managed is not None else None
+        self.on_started = on_started
+
+        self._entries:OrderedDict[str, _KGEntry] = OrderedDict()     # LRU 順序，最近使用的在最後
+        self._borrowers:dict[str, int] = {}     # 各 KG 處理中的請求數 (見 borrow)
+        self._stopping:dict[str, threading.Event] = {}     # 停止中的 KG，停止完成時 set；重新啟動前須等待
+        self._lock = threading.Lock()
+        self._reaper = None
+        self._closed = threading.Event()
+
+        self.hits = 0
+        self.misses = 0
+        self.queued = 0
+        self.failures = 0
+        self.evictions = 0
+        self.idle_stops = 0
+        self.cold_starts = 0
+        self.cold_start_total = 0.0
+        self.cold_start_max = 0.0
+        self.cold_start_last = 0.0
+
+        self.adopt()
+
+
+    def _is_managed(self, name):
+        return self.managed is None or name in self.managed
+
+
+    def adopt(self):
+        """ 將已在運行的 KG 容器納入管理 (視為最久未使用)。 """
+        running = self.backend.running()
+        with self._lock:
+            for name, urls in running.items():
+                if self._is_managed(name) and name not in self._entries:
+                    entry = _KGEntry()
+                    entry.urls = urls
+                    entry.memory = self.backend.memory_bytes(name)
+                    entry.ready.set()
+                    self._entries[name] = entry
+                    self._entries.move_to_end(name, last=False)
+        return list(running)
+
+
+    def add_managed(self, name):
+        if self.managed is not None:
+            self.managed.add(name)
+
+
+    def track(self, name, http_url, bolt_url):
+        """ 登記由其他途徑 (例如 create_container) 啟動的容器。 """
+        with self._lock:
+            entry = self._entries.get(name) or _KGEntry()
+            entry.urls = (http_url, bolt_url)
+            entry.memory = self.backend.memory_bytes(name)
+            entry.last_used = time.monotonic()
+            entry.ready.set()
+            self._entries[name] = entry
+            self._entries.move_to_end(name)
+            victims = self._select_victims(exclude=name)
+        self._stop(victims, 'evicted')
+
+
+    @contextmanager
+    def borrow(self, name):
+        """ 請求處理期間借用 KG：借用中的容器不會被 LRU 淘汰或閒置停止，結束時歸還。 """
+        with self._lock:
+            self._borrowers[name] = self._borrowers.get(name, 0) + 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                count = self._borrowers.pop(name) - 1
+                if count > 0:
+                    self._borrowers[name] = count
+                entry = self._entries.get(name)
+                if entry is not None:
+                    entry.last_used = time.monotonic()
+
+
+    def _is_idle(self, name, entry):
+        return entry.ready.is_set() and not self._borrowers.get(name)
+
+
+    def _select_victims(self, exclude):
+        """ 依 LRU 選出需要停止的閒置容器，使運行數與記憶體不超過上限；需持有 _lock。 """
+        ready = [(name, entry) for name, entry in self._entries.items() if self._is_idle(name, entry) and name != exclude]
+        count = len(self._entries)
+        memory = sum(entry.memory for entry in self._entries.values())
+        victims = []
+        for name, entry in ready:
+            over_count = count > self.max_running
+            over_memory = self.max_memory is not None and memory > self.max_memory
+            if not over_count and not over_memory:
+                break
+            victims.append(name)
+            self._mark_stopping(name)
+            count -= 1
+            memory -= entry.memory
+        if count > self.max_running:
+            logger.warning(f"{count} KG containers running or starting, above the limit {self.max_running}")
+        return victims
+
+
+    def _mark_stopping(self, name):
+        """ 將 KG 移出運行清單並標記為停止中；需持有 _lock，之後須以 _stop() 停止。 """
+        del self._entries[name]
+        self._stopping[name] = threading.Event()
+
+
+    def _stop(self, names, reason):
+        for name in names:
+            try:
+                self.backend.stop(name)
+                logger.info(f"KG '{name}' stopped ({reason})")
+            except Exception as e:
+                logger.warning(f"Failed to stop KG '{name}': {e}")
+            finally:
+                with self._lock:
+                    stopped = self._stopping.pop(name, None)
+                if stopped is not None:
+                    stopped.set()
+            if reason == 'evicted':
+                self.evictions += 1
+            else:
+                self.idle_stops += 1
+
+
+    def open_KG(self, name, timeout=600):
+        """
+        回傳 (http_url, bolt_url)，容器未運行時先啟動；
+        同一個 KG 啟動中時，其他請求等待啟動完成。KG 正在停止 (淘汰或閒置) 時，等停止完成後才重新啟動。
+        """
+        if not self._is_managed(name):
+            raise ValueError(f"KG '{name}' does not exist. Please create it first.")
+        with self._lock:
+            entry = self._entries.get(name)
+            if entry is not None:
+                entry.last_used = time.monotonic()
+                self._entries.move_to_end(name)
+                if entry.ready.is_set():
+                    self.hits += 1
+                    return entry.urls
+                self.queued += 1
+                starting = False
+            else:
+                self.misses += 1
+                entry = self._entries[name] = _KGEntry()
+                entry.memory = self.backend.memory_bytes(name)
+                stopping = self._stopping.get(name)
+                victims = self._select_victims(exclude=name)
+                starting = True
+
+        if not starting:
+            if not entry.ready.wait(timeout):
+                raise TimeoutError(f"KG '{name}' did not start within {timeout}s")
+            if entry.error:
+                raise entry.error
+            return entry.urls
+
+        self._stop(victims, 'evicted')
+        start = time.perf_counter()
+        try:
+            if stopping is not None and not stopping.wait(timeout):
+                raise TimeoutError(f"KG '{name}' did not stop within {timeout}s")
+            urls = self.backend.start(name)
+            if not urls or not urls[1]:
+                raise RuntimeError(f"KG '{name}' has no port bindings")
+            if self.on_started:
+                self.on_started(name, urls)
+        except Exception as e:
+            self.failures += 1
+            entry.error = e
+            with self._lock:
+                self._entries.pop(name, None)
+            entry.ready.set()
+            raise
+        latency = time.perf_counter() - start
+
+        entry.urls = urls
+        entry.ready.set()
+        self.cold_starts += 1
+        self.cold_start_total += latency
+        self.cold_start_max = max(self.cold_start_max, latency)
+        self.cold_start_last = latency
+        logger.info(f"KG '{name}' started in {latency:.1f}s")
+        return urls
+
+
+    def reap_idle(self):
+        """ 停止閒置超過 idle_ttl 的容器，回傳停止的 KG 名稱。 """
+        if self.idle_ttl is None:
+            return []
+        deadline = time.monotonic() - self.idle_ttl
+        with self._lock:
+            idle = [name for name, entry in self._entries.items()
+                    if self._is_idle(name, entry) and entry.last_used < deadline]
+            for name in idle:
+                self._mark_stopping(name)
+        self._stop(idle, 'idle')
+        return idle
+
+
+    def start_reaper(self, interval=None):
+        """ 以背景 thread 定期呼叫 reap_idle()。 """
+        if self.idle_ttl is None or self._reaper:
+            return
+        interval = interval or max(1.0, self.idle_ttl / 4)
+
+        def run():
+            while not self._closed.wait(interval):
+                try:
+                    self.reap_idle()
+                except Exception as e:
+                    logger.warning(f"Failed to stop idle KGs: {e}")
+
+        self._reaper = threading.Thread(target=run, name='kg-lifecycle-reaper', daemon=True)
+        self._reaper.start()
+
+
+    def close(self):
+        self._closed.set()
+        if self._reaper:
+            self._reaper.join()
+
+
+    def stats(self) -> dict:
+        with self._lock:
+            running = [name for name, entry in self._entries.items() if entry.ready.is_set()]
+            starting = [name for name, entry in self._entries.items() if not entry.ready.is_set()]
+            memory = sum(entry.memory for entry in self._entries.values())
+            borrowed = dict(self._borrowers)
+            stopping = list(self._stopping)
+        return {
+            'running': running,
+            'borrowed': borrowed,
+            'starting': starting,
+            'stopping': stopping,
+            'memory_gb': round(memory / GB, 2),
+            'hits': self.hits,
+            'misses': self.misses,
+            'queued': self.queued,
+            'failures': self.failures,
+            'evictions': self.evictions,
+            'idle_stops': self.idle_stops,
+            'cold_starts': self.cold_starts,
+            'cold_start_last': round(self.cold_start_last, 2),
+            'cold_start_mean': round(self.cold_start_total / self.cold_starts, 2) if self.cold_starts else None,
+            'cold_start_max': round(self.cold_start_max, 2),
+        }
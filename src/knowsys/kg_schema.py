@@ -0,0 +1,108 @@
+"""
+KG schema 管理：為 concept/fact/structure/document 建立索引與唯一性限制，並以版本號記錄於 KG 中，
+讓既有 KG 在服務啟動時可自動升級。
+"""
+import os
+
+from neo4j.exceptions import ClientError, DatabaseError
+
+import logging
+logger:logging.Logger = logging.getLogger(os.getenv('LOGGER_NAME'))
+
+
+SCHEMA_VERSION = 2
+SCHEMA_LABEL = '_KaqgSchema'
+FULLTEXT_ALIAS_INDEX = 'node_aliases'
+
+
+# 每個版本的 migration：(statement, fallback)。
+# 唯一性限制在既有資料已有重複名稱時會失敗，此時改建一般 range index。
+SCHEMA_MIGRATIONS = {
+    1: [
+        ("CREATE CONSTRAINT concept_name_unique IF NOT EXISTS FOR (n:concept) REQUIRE n.name IS UNIQUE",
+         "CREATE INDEX concept_name IF NOT EXISTS FOR (n:concept) ON (n.name)"),
+        ("CREATE CONSTRAINT structure_name_unique IF NOT EXISTS FOR (n:structure) REQUIRE n.name IS UNIQUE",
+         "CREATE INDEX structure_name IF NOT EXISTS FOR (n:structure) ON (n.name)"),
+        ("CREATE CONSTRAINT document_name_unique IF NOT EXISTS FOR (n:document) REQUIRE n.name IS UNIQUE",
+         "CREATE INDEX document_name IF NOT EXISTS FOR (n:document) ON (n.name)"),
+        ("CREATE INDEX fact_name IF NOT EXISTS FOR (n:fact) ON (n.name)", None),
+        ("CREATE INDEX fact_file_id IF NOT EXISTS FOR (n:fact) ON (n.file_id)", None),
+        ("CREATE INDEX fact_page_number IF NOT EXISTS FOR (n:fact) ON (n.file_id, n.page_number)", None),
+        ("CREATE INDEX concept_file_id IF NOT EXISTS FOR (n:concept) ON (n.file_id)", None),
+        ("CREATE INDEX structure_file_id IF NOT EXISTS FOR (n:structure) ON (n.file_id)", None),
+        ("CREATE INDEX document_file_id IF NOT EXISTS FOR (n:document) ON (n.file_id)", None),
+        (f"CREATE FULLTEXT INDEX {FULLTEXT_ALIAS_INDEX} IF NOT EXISTS FOR (n:concept|fact) ON EACH [n.name, n.aliases]", None),
+    ],
+    # fact 以 fact_key MERGE (見 fact_identity)；既有 fact 的 key 由 kg_utility.py collapse-facts 補上
+    2: [
+        ("CREATE CONSTRAINT fact_key_unique IF NOT EXISTS FOR (n:fact) REQUIRE n.fact_key IS UNIQUE",
+         "CREATE INDEX fact_key IF NOT EXISTS FOR (n:fact) ON (n.fact_key)"),
+    ],
+}
+
+
+# 使用索引的 plan operator 前綴；其餘掃描型 operator 另外標示。
+_INDEX_OPERATORS = ('NodeIndex', 'NodeUniqueIndex', 'DirectedRelationshipIndex', 'UndirectedRelationshipIndex')
+_SCAN_OPERATORS = ('AllNodesScan', 'NodeByLabelScan', 'DirectedAllRelationshipsScan', 'UndirectedAllRelationshipsScan')
+
+
+def get_schema_version(session):
+    record = session.run(
+        f"MATCH (s:`{SCHEMA_LABEL}`) RETURN max(s.version) AS version"
+    ).single()
+    return (record and record["version"]) or 0
+
+
+def ensure_schema(session, target_version=SCHEMA_VERSION):
+    """
+    將 KG 升級至 target_version，已是最新版本則不做任何事。
+
+    :return: tuple (原版本, 升級後版本)
+    """
+    current = get_schema_version(session)
+    for version in range(current + 1, target_version + 1):
+        for statement, fallback in SCHEMA_MIGRATIONS.get(version, []):
+            try:
+                session.run(statement).consume()
+            except (ClientError, DatabaseError) as e:
+                # 既有資料違反唯一性時 Neo4j 回傳 Neo.DatabaseError.Schema.ConstraintCreationFailed
+                if not fallback:
+                    raise
+                logger.warning(f"Schema statement failed, fallback to index: {e.message}")
+                session.run(fallback).consume()
+        session.run(
+            f"MERGE (s:`{SCHEMA_LABEL}` {{name: 'kaqg'}}) SET s.version = $version",
+            version=version
+        ).consume()
+        logger.info(f"KG schema migrated to version {version}.")
+
+    return current, max(current, target_version)
+
+
+def _walk_plan(plan):
+    yield plan
+    for child in plan.get('children', []):
+        yield from _walk_plan(child)
+
+
+def index_usage_report(session, queries):
+    """
+    以 EXPLAIN 取得各熱門查詢的執行計畫，回傳每個查詢使用的索引及全掃描 operator。
+    熱門查詢取自實際執行的語句 (見 KnowledgeGraph._hot_queries)，語句修改後報告仍然有效。
+
+    :param queries: dict {query name: (query, 代表性參數)}
+    :return: dict {query name: {'indexes': [details, ...], 'scans': [operator, ...]}}
+    """
+    report = {}
+    for name, (query, params) in queries.items():
+        plan = session.run(f"EXPLAIN {query}", **params).consume().plan or {}
+        indexes, scans = [], []
+        for operator in _walk_plan(plan):
+            operator_type = operator.get('operatorType', '').split('@')[0]
+            details = operator.get('args', {}).get('Details', operator_type)
+            if operator_type.startswith(_INDEX_OPERATORS):
+                indexes.append(details)
+            elif operator_type.startswith(_SCAN_OPERATORS):
+                scans.append(f"{operator_type}: {details}")
+        report[name] = {'indexes': indexes, 'scans': scans}
+    return report
@@ -2,19 +2,36 @@ import json
 import os
 from venv import logger
 from neo4j import GraphDatabase
-import threading
+from neo4j.exceptions import ClientError
+
+from knowsys import entity_index, kg_schema
+from knowsys import fact_identity, page_provenance
+from knowsys.dedupe_store import DedupeStore, LruDedupeStore, dedupe_key
+from knowsys.driver_registry import DriverRegistry
+from knowsys.query_profiler import QueryProfiler
 
 import logging
 logger:logging.Logger = logging.getLogger(os.getenv('LOGGER_NAME'))
 
 
 class KnowledgeGraph:
-    _facts = {}
-    _facts_lock = threading.Lock()
+    # 同一頁 fact 的去重 store，預設為有容量上限的記憶體 LRU，可由 set_dedupe_store() 替換成持久化 store。
+    _dedupe_store:DedupeStore = LruDedupeStore()
     
     
-    def __init__(self, uri="bolt://localhost:7687", auth=None):
-        self.driver = GraphDatabase.driver(uri, auth=auth)
+    def __init__(self, uri="bolt://localhost:7687", auth=None, shared=True):
+        """
+        :param shared: True 時向 DriverRegistry 借用 process 內共用的 driver，close() 時歸還；
+            False 時自行建立並關閉 driver。
+        已 QueryProfiler.configure() 時，所有語句的延遲與筆數都會被統計 (見 query_profiler)。
+        """
+        self.shared = shared
+        if shared:
+            self._registry = DriverRegistry.default()
+            driver = self._registry.acquire(uri, auth)
+        else:
+            driver = GraphDatabase.driver(uri, auth=auth)
+        self.driver = QueryProfiler.instrument(driver)
 
 
     def __enter__(self):
@@ -36,52 +53,61 @@ class KnowledgeGraph:
         return serialized
 
 
-    def __is_node_exist(node_type, node_name, file_id, page_number):
-        if file_id not in KnowledgeGraph._facts:
-            with KnowledgeGraph._facts_lock:
-                KnowledgeGraph._facts[file_id] = []
+    @staticmethod
+    def set_dedupe_store(store:DedupeStore):
+        """ 替換 fact 去重 store，回傳原本的 store。 """
+        previous, KnowledgeGraph._dedupe_store = KnowledgeGraph._dedupe_store, store
+        return previous
 
-        file_facts = KnowledgeGraph._facts.get(file_id, [])
-        if (fflen := len(file_facts)) <= page_number:
-            new_size = max(page_number+1, max(10, fflen*2))
-            with KnowledgeGraph._facts_lock:
-                for _ in range(new_size - fflen):
-                    file_facts.append(set())
-            print(f"Extended list to {new_size} items, real size: {len(file_facts)}.")
 
-        key = f"{node_type}-{node_name}"
-        is_existing = key in file_facts[page_number]
+    def __fact_dedupe_key(node_type, node_name, file_id, page_number):
+        # 以正規化名稱為 key (同 fact_key)，頁面退役時可依 KG 中的名稱移除 (見 retire_pages)
+        return dedupe_key(file_id, page_number, node_type, fact_identity.normalize_fact_name(node_name))
+
+
+    def __is_node_exist(node_type, node_name, file_id, page_number):
+        # 只檢查不記錄：key 在寫入 commit 後才記錄，寫入失敗的 fact 重新匯入時仍會寫入
+        key = KnowledgeGraph.__fact_dedupe_key(node_type, node_name, file_id, page_number)
+        is_existing = KnowledgeGraph._dedupe_store.contains(key)
 
         if is_existing:
-            print(f"Node '{key}' already exists in page {page_number}.")
-        else:
-            with KnowledgeGraph._facts_lock:
-                file_facts[page_number].add(key)
+            logger.verbose(f"Node '{node_type}-{node_name}' already exists in page {page_number}.")
 
         return is_existing
 
 
+    def _record_written_facts(nodes):
+        """ 批次寫入 commit 後，記錄計畫中 fact 節點的去重 key。 """
+        KnowledgeGraph._dedupe_store.add_many(
+            KnowledgeGraph.__fact_dedupe_key(label, row['name'], row['file_id'], row['page_number'])
+            for (kind, label), rows in nodes.items() if kind == 'fact'
+            for row in rows.values())
+
+
     def _add_fact(session, subject_type, subject, file_id, page_number):
         if KnowledgeGraph.__is_node_exist(subject_type, subject["name"], file_id, page_number):
             return  # 已存在，跳過建立
         
         session.run(
             f"""
-            CREATE (s:`{subject_type}` {{
-                name: $subject_name,
-                file_id: $file_id,
-                page_number: $page_number,
-                aliases: $subject_aliases
-            }})
+            MERGE (s:`{subject_type}` {{fact_key: $fact_key}})
+            ON CREATE SET s.name = $subject_name,
+                s.file_id = $file_id,
+                s.page_number = $page_number,
+                s.aliases = $subject_aliases
             """,
+            fact_key=fact_identity.fact_key(file_id, page_number, subject["name"]),
             subject_name=subject["name"],
             file_id=file_id,
             page_number=page_number,
             subject_aliases=subject.get("aliases", [])
-        )
+        ).consume()
+        KnowledgeGraph._dedupe_store.add_many([
+            KnowledgeGraph.__fact_dedupe_key(subject_type, subject["name"], file_id, page_number)])
 
 
     def add_triplets(self, file_id, page_number, triplets):
+        source = page_provenance.page_source(file_id, page_number)
         with self.driver.session() as session:
             for triplet in triplets:
                 subject = triplet[0]
@@ -153,14 +179,205 @@ class KnowledgeGraph:
                     MATCH (s:`{subject_type}` {{name: $subject_name}}),
                         (o:`{object_type}` {{name: $object_name}})
                     MERGE (s)-[r:`{predicate["name"]}`]->(o)
+                    SET r.sources = CASE WHEN $source IN coalesce(r.sources, []) THEN r.sources
+                        ELSE coalesce(r.sources, []) + $source END
                     """,
                     subject_name=subject["name"],
-                    object_name=obj["name"]
+                    object_name=obj["name"],
+                    source=source
                 )
-            
-            
+
+
+    # Cypher 寫入語句，依節點種類區分；{label} 於分組時代入。
+    _BATCH_NODE_WRITES = {
+        # fact 以 fact_key (見 fact_identity) MERGE，重新匯入同一份文件不會產生重複節點
+        'fact': """
+            UNWIND $rows AS row
+            MERGE (n:`{label}` {{fact_key: row.fact_key}})
+            ON CREATE SET n.name = row.name,
+                n.file_id = row.file_id,
+                n.page_number = row.page_number,
+                n.aliases = row.aliases
+            """,
+        'structure': """
+            UNWIND $rows AS row
+            MERGE (n:`{label}` {{name: row.name}})
+            SET n.file_id = row.file_id
+            """,
+        'document': """
+            UNWIND $rows AS row
+            MERGE (n:`{label}` {{name: row.name}})
+            SET n.file_id = row.file_id,
+                n.metadata = row.metadata
+            """,
+        'concept': """
+            UNWIND $rows AS row
+            MERGE (n:`{label}` {{name: row.name}})
+            SET n.file_id = row.file_id,
+                n.aliases = row.aliases
+            """,
+    }
+
+    # r.sources 記錄產生關聯的頁面 (見 page_provenance)
+    _BATCH_RELATIONSHIP_WRITE = """
+        UNWIND $rows AS row
+        MATCH (s:`{subject_label}` {{name: row.subject_name}}),
+            (o:`{object_label}` {{name: row.object_name}})
+        MERGE (s)-[r:`{predicate}`]->(o)
+        SET r.sources = coalesce(r.sources, []) + [source IN row.sources WHERE NOT source IN coalesce(r.sources, [])]
+        """
+
+
+    def _node_write_kind(node, is_object):
+        """ 回傳節點在 add_triplets 中對應的寫入方式: fact, structure, document 或 concept. """
+        node_type = node.get('type', 'Entity')
+        if node_type in ('fact', 'structure'):
+            return node_type
+        if node_type == 'document' and is_object:
+            return 'document'
+        return 'concept'
+
+
+    def _plan_batched_writes(file_id, page_number, triplets, nodes=None, relationships=None, idempotent=False):
+        """
+        將一頁的 triplets 分組成批次寫入計畫，語意與 add_triplets 相同：
+        - nodes: {(kind, label): {key: row}}，fact 以 fact_key 為 key，
+          其他節點以 name 為 key，同名節點以最後一次出現的屬性為準
+        - relationships: {(subject_label, predicate, object_label): {(subject_name, object_name): row}}，
+          row['sources'] 為產生該關聯的頁面 (page_provenance.page_source)
+
+        fact 節點以 __is_node_exist 去重，已寫入過的 fact 不再寫入；規劃時只檢查不記錄，
+        寫入 commit 後由 _record_written_facts 記錄，交易失敗時重新匯入仍會寫入這些 fact
+        (尚未記錄前同一頁被規劃兩次時，由 fact_key 的 MERGE 確保不重複)。
+        idempotent 時不檢查去重，由 MERGE 確保不重複。
+        傳入 nodes / relationships 時將多頁累積到同一個計畫。
+        """
+        nodes = {} if nodes is None else nodes
+        relationships = {} if relationships is None else relationships
+
+        def plan_node(node, is_object):
+            kind = KnowledgeGraph._node_write_kind(node, is_object)
+            label = node.get('type', 'Entity')
+            key = node["name"]
+            if kind == 'fact':
+                is_existing = KnowledgeGraph.__is_node_exist(label, node["name"], file_id, page_number)
+                if is_existing and not idempotent:
+                    return label
+                key = fact_identity.fact_key(file_id, page_number, node["name"])
+                if key in nodes.get((kind, label), {}):
+                    return label    # 名稱正規化後相同，保留第一次出現的屬性 (同 ON CREATE SET)
+                row = {'name': node["name"], 'aliases': node.get("aliases", []), 'page_number': page_number,
+                       'fact_key': key}
+            elif kind == 'document':
+                row = {'name': node["name"], 'metadata': json.dumps(node.get("meta", None))}
+            elif kind == 'concept':
+                row = {'name': node["name"], 'aliases': node.get("aliases", [])}
+            else:
+                row = {'name': node["name"]}
+            row['file_id'] = file_id
+            rows = nodes.setdefault((kind, label), {})
+            rows.pop(key, None)     # 保留最後一次出現的屬性與順序
+            rows[key] = row
+            return label
+
+        source = page_provenance.page_source(file_id, page_number)
+        for subject, predicate, obj in triplets:
+            subject_label = plan_node(subject, False)
+            object_label = plan_node(obj, True)
+            rows = relationships.setdefault((subject_label, predicate["name"], object_label), {})
+            row = rows.setdefault((subject["name"], obj["name"]),
+                                  {'subject_name': subject["name"], 'object_name': obj["name"], 'sources': []})
+            if source not in row['sources']:
+                row['sources'].append(source)
+
+        return nodes, relationships
+
+
+    def _write_batched_tx(tx, nodes, relationships):
+        """ 供 session.execute_write() 呼叫，每個分組只送出一個 UNWIND 語句。 """
+        for (kind, label), rows in nodes.items():
+            tx.run(
+                KnowledgeGraph._BATCH_NODE_WRITES[kind].format(label=label),
+                rows=list(rows.values())
+            )
+        for (subject_label, predicate, object_label), rows in relationships.items():
+            tx.run(
+                KnowledgeGraph._BATCH_RELATIONSHIP_WRITE.format(
+                    subject_label=subject_label,
+                    predicate=predicate,
+                    object_label=object_label),
+                rows=list(rows.values())
+            )
+
+
+    def add_triplets_batched(self, file_id, page_number, triplets):
+        """
+        與 add_triplets 相同的寫入結果，但將 triplets 依 (subject label, predicate, object label)
+        分組，以 UNWIND $rows 批次寫入，並在同一個 write transaction 中完成。
+
+        :return: 實際送出的 Cypher 語句數
+        """
+        return self.add_pages_batched([(file_id, page_number, triplets)])['statements']
+
+
+    def add_pages_batched(self, pages, idempotent=False):
+        """
+        將多頁 triplets 合併成一個批次寫入計畫，在同一個 write transaction 中完成。
+        各頁重複的節點與關聯只寫入一次；關聯在所有節點寫入後才建立，
+        因此指向 fact 名稱的關聯會連到這批中所有同名的 fact，如同這些頁面是同一頁。
+
+        :param pages: list of (file_id, page_number, triplets)
+        :param idempotent: 重送先前可能已部分記錄的頁面時設為 True (見 _plan_batched_writes)
+        :return: dict，包含 pages、triplets、node_rows、relationship_rows 與 statements
+        """
+        nodes, relationships = {}, {}
+        triplet_count = 0
+        for file_id, page_number, triplets in pages:
+            KnowledgeGraph._plan_batched_writes(file_id, page_number, triplets, nodes, relationships, idempotent)
+            triplet_count += len(triplets)
+
+        if nodes or relationships:
+            with self.driver.session() as session:
+                session.execute_write(
+                    KnowledgeGraph._write_batched_tx,
+                    nodes=nodes,
+                    relationships=relationships
+                )
+            KnowledgeGraph._record_written_facts(nodes)
+        return {
+            'pages': len(pages),
+            'triplets': triplet_count,
+            'node_rows': sum(len(rows) for rows in nodes.values()),
+            'relationship_rows': sum(len(rows) for rows in relationships.values()),
+            'statements': len(nodes) + len(relationships),
+        }
+
+
+    def retire_pages(self, file_id, page_numbers):
+        """
+        撤下 file_id 中 page_numbers 各頁的 facts，以及只來自這些頁面的關聯與因此孤立的節點
+        (見 page_provenance)，並移除這些 facts 的去重 key，讓重新擷取的頁面可再次寫入。
+
+        :return: dict，包含 pages、facts、relationships 與 nodes (刪除數)
+        """
+        with self.driver.session() as session:
+            result = session.execute_write(page_provenance.retire_pages_tx, file_id, list(page_numbers))
+        retired_facts = result.pop('retired_facts')
+        KnowledgeGraph._dedupe_store.discard(
+            dedupe_key(file_id, page_number, 'fact', fact_identity.normalize_fact_name(name))
+            for name, page_number in retired_facts)
+        return result
+
+
     def close(self):
-        self.driver.close()
+        if self.driver is None:
+            return
+        driver = QueryProfiler.unwrap(self.driver)
+        if self.shared:
+            self._registry.release(driver)
+        else:
+            driver.close()
+        self.driver = None
         
 
     def _query_concepts_tx(tx, parent_names):
@@ -256,44 +473,67 @@ class KnowledgeGraph:
             return concepts
 
 
-    def query_nodes_by_name(self, node_name, label=None):
-        """ Returns a list of serialized nodes matching the given name and optional label. """
-        query = "MATCH (n" + (":" + label if label else "") + " {name: $node_name}) RETURN n"
-        
-        with self.driver.session() as session:
-            result = session.run(query, node_name=node_name)
-            return [self.serialize_node(record["n"]) for record in result]
-        
+    # 以下查詢語句與 AsyncKnowledgeGraph 共用 (見 async_knowledge_graph)
+    @staticmethod
+    def _nodes_by_name_query(label=None):
+        return "MATCH (n" + (":" + label if label else "") + " {name: $node_name}) RETURN n"
 
-    def query_nodes_related_by(self, node_eid, relation=None, label=None):
-        """ Returns a list of serialized nodes related to the given node by the given relation. """
+
+    @staticmethod
+    def _nodes_related_by_query(relation=None, label=None):
         label_clause = f":{label}" if label else ""
         relation_clause = f":{relation}" if relation else ""
-        
-        query = f"""
+        return f"""
         MATCH (m{label_clause})-[{relation_clause}]->(n)
         WHERE elementId(n) = $node_eid
         RETURN m
         """
 
-        with self.driver.session() as session:
-            result = session.run(query, node_eid=node_eid)
-            return [self.serialize_node(record["m"]) for record in result]
-        
-        
-    def query_nodes_relate_to(self, node_eid, relation=None, label=None):
-        """ Returns a list of serialized nodes that the given node relates to via the specified relation. """
+
+    @staticmethod
+    def _nodes_relate_to_query(relation=None, label=None):
         label_clause = f":{label}" if label else ""
         relation_clause = f":{relation}" if relation else ""
-
-        query = f"""
+        return f"""
         MATCH (n)-[{relation_clause}]->(m{label_clause})
         WHERE elementId(n) = $node_eid
         RETURN m
         """
 
+
+    # 連出: (n)-[r]->(m)
+    _OUTGOING_RELATIONSHIPS_QUERY = """
+        MATCH (n)-[r]->(m)
+        WHERE elementId(n) = $eid
+        RETURN n.name AS subj, type(r) AS rel, m.name AS obj
+        """
+
+    # 連入: (m)-[r]->(n)
+    _INCOMING_RELATIONSHIPS_QUERY = """
+        MATCH (m)-[r]->(n)
+        WHERE elementId(n) = $eid
+        RETURN m.name AS subj, type(r) AS rel, n.name AS obj
+        """
+
+
+    def query_nodes_by_name(self, node_name, label=None):
+        """ Returns a list of serialized nodes matching the given name and optional label. """
         with self.driver.session() as session:
-            result = session.run(query, node_eid=node_eid)
+            result = session.run(KnowledgeGraph._nodes_by_name_query(label), node_name=node_name)
+            return [self.serialize_node(record["n"]) for record in result]
+        
+
+    def query_nodes_related_by(self, node_eid, relation=None, label=None):
+        """ Returns a list of serialized nodes related to the given node by the given relation. """
+        with self.driver.session() as session:
+            result = session.run(KnowledgeGraph._nodes_related_by_query(relation, label), node_eid=node_eid)
+            return [self.serialize_node(record["m"]) for record in result]
+        
+        
+    def query_nodes_relate_to(self, node_eid, relation=None, label=None):
+        """ Returns a list of serialized nodes that the given node relates to via the specified relation. """
+        with self.driver.session() as session:
+            result = session.run(KnowledgeGraph._nodes_relate_to_query(relation, label), node_eid=node_eid)
             return [self.serialize_node(record["m"]) for record in result]
 
 
@@ -304,110 +544,367 @@ class KnowledgeGraph:
         :return: list of (subject_name, relation_type, object_name)，主謂賓三元組
         """
         with self.driver.session() as session:
-            # 連出: (n)-[r]->(m)
-            out_q = """
-            MATCH (n)-[r]->(m)
-            WHERE elementId(n) = $eid
-            RETURN n.name AS subj, type(r) AS rel, m.name AS obj
-            """
-            # 連入: (m)-[r]->(n)
-            in_q = """
-            MATCH (m)-[r]->(n)
-            WHERE elementId(n) = $eid
-            RETURN m.name AS subj, type(r) AS rel, n.name AS obj
-            """
             triples = []
-            for record in session.run(out_q, eid=element_id):
+            for record in session.run(KnowledgeGraph._OUTGOING_RELATIONSHIPS_QUERY, eid=element_id):
                 triples.append((record["subj"], record["rel"], record["obj"]))
-            for record in session.run(in_q, eid=element_id):
+            for record in session.run(KnowledgeGraph._INCOMING_RELATIONSHIPS_QUERY, eid=element_id):
                 triples.append((record["subj"], record["rel"], record["obj"]))
             return triples
 
 
+    def query_nodes_by_names(self, node_names, label=None):
+        """
+        query_nodes_by_name 的批次版本，一次查詢所有名稱。
+        :return: {name: [serialized node, ...]}，包含每個輸入名稱 (查無節點時為空 list)
+        """
+        nodes = {name: [] for name in node_names}
+        if not nodes:
+            return nodes
+
+        with self.driver.session() as session:
+            for record in session.run(KnowledgeGraph._nodes_by_names_query(label), names=list(nodes)):
+                nodes[record["name"]].append(self.serialize_node(record["n"]))
+        return nodes
+
+
+    @staticmethod
+    def _nodes_by_names_query(label=None):
+        return "UNWIND $names AS name MATCH (n" + (":" + label if label else "") + " {name: name}) RETURN name, n"
+
+
+    # 全文索引 (kg_schema.FULLTEXT_ALIAS_INDEX) 涵蓋的 label
+    _FULLTEXT_LABELS = ('concept', 'fact')
+
+    _FULLTEXT_LOOKUP_QUERY = """
+        UNWIND $queries AS q
+        CALL {
+            WITH q
+            CALL db.index.fulltext.queryNodes($index, q.lucene) YIELD node, score
+            WHERE any(label IN labels(node) WHERE label IN $labels)
+            RETURN node, score
+            ORDER BY score DESC
+            LIMIT $candidates
+        }
+        RETURN q.surface AS surface, node
+        """
+
+
+    @staticmethod
+    def _exact_names_query(labels):
+        """ 各 label 的名稱索引查詢以 UNION 合併為一個語句。 """
+        exact = " UNION ".join(f"WITH name MATCH (n:`{label}` {{name: name}}) RETURN n" for label in labels)
+        return f"UNWIND $names AS name CALL {{ {exact} }} RETURN name, n"
+
+
+    @staticmethod
+    def _fulltext_lookups(surfaces, candidates, labels, limit):
+        """ 名稱查無節點的實體才做全文查詢；回傳 (全文查詢參數, 全文索引涵蓋的 labels)，不需查詢時為 (None, None)。 """
+        fulltext_labels = [label for label in labels if label in KnowledgeGraph._FULLTEXT_LABELS]
+        pending = [surface for surface in surfaces if not candidates[surface] and surface.strip()]
+        if not pending or not fulltext_labels:
+            return None, None
+        return {
+            'queries': [{'surface': surface, 'lucene': entity_index.fulltext_query(surface)} for surface in pending],
+            'index': kg_schema.FULLTEXT_ALIAS_INDEX,
+            'labels': fulltext_labels,
+            'candidates': (limit or 5) * 4,
+        }, fulltext_labels
+
+
+    def resolve_entities(self, surface_forms, labels=('fact', 'concept'), limit=5, min_score=0.5):
+        """
+        將一批實體名稱對應到節點：名稱相同 (name 索引)、別名相同或模糊比對 (全文索引 node_aliases)，
+        依 entity_index.rank_matches 排序。名稱查詢與全文查詢各一次；名稱已相同的實體不做全文查詢。
+
+        :param labels: 依優先順序排列；全文查詢只涵蓋 concept 與 fact
+        :param limit: 每個名稱回傳的節點數上限；None 不限 (名稱相同的節點不會被截斷)
+        :return: {surface: [{'node', 'match', 'score'}, ...]}，包含每個輸入名稱 (查無節點時為空 list)
+        """
+        surfaces = list(dict.fromkeys(surface_forms))
+        candidates = {surface: [] for surface in surfaces}
+        if not surfaces:
+            return candidates
+
+        with self.driver.session() as session:
+            for record in session.run(KnowledgeGraph._exact_names_query(labels), names=surfaces):
+                candidates[record["name"]].append(self.serialize_node(record["n"]))
+
+            params, _ = KnowledgeGraph._fulltext_lookups(surfaces, candidates, labels, limit)
+            if params:
+                try:
+                    result = session.run(KnowledgeGraph._FULLTEXT_LOOKUP_QUERY, **params)
+                    for record in result:
+                        candidates[record["surface"]].append(self.serialize_node(record["node"]))
+                except ClientError as e:
+                    # schema 尚未升級 (沒有全文索引) 時只做名稱比對
+                    logger.warning(f"Fulltext entity lookup failed, exact names only: {e.message}")
+
+        return {surface: entity_index.rank_matches(surface, nodes, labels, limit, min_score)
+                for surface, nodes in candidates.items()}
+
+
+    _OUTGOING_RELATIONSHIPS_MANY_QUERY = """
+        UNWIND $eids AS eid
+        MATCH (n)-[r]->(m)
+        WHERE elementId(n) = eid
+        RETURN eid, n.name AS subj, type(r) AS rel, m.name AS obj
+        """
+
+    _INCOMING_RELATIONSHIPS_MANY_QUERY = """
+        UNWIND $eids AS eid
+        MATCH (m)-[r]->(n)
+        WHERE elementId(n) = eid
+        RETURN eid, m.name AS subj, type(r) AS rel, n.name AS obj
+        """
+
+
+    def query_all_relationships_many(self, element_ids):
+        """
+        query_all_relationships 的批次版本，連出與連入各一次查詢。
+        :return: {element_id: [(subject_name, relation_type, object_name), ...]}，連出在前、連入在後
+        """
+        outgoing = {eid: [] for eid in element_ids}
+        incoming = {eid: [] for eid in element_ids}
+        if not outgoing:
+            return outgoing
+
+        with self.driver.session() as session:
+            for record in session.run(KnowledgeGraph._OUTGOING_RELATIONSHIPS_MANY_QUERY, eids=list(outgoing)):
+                outgoing[record["eid"]].append((record["subj"], record["rel"], record["obj"]))
+            for record in session.run(KnowledgeGraph._INCOMING_RELATIONSHIPS_MANY_QUERY, eids=list(outgoing)):
+                incoming[record["eid"]].append((record["subj"], record["rel"], record["obj"]))
+        return {eid: outgoing[eid] + incoming[eid] for eid in outgoing}
+
+
+    @staticmethod
+    def _neighbors_many_query(relation=None, label=None):
+        label_clause = f":{label}" if label else ""
+        relation_clause = f":{relation}" if relation else ""
+        return f"""
+        UNWIND $eids AS eid
+        MATCH (n)-[r{relation_clause}]-(m{label_clause})
+        WHERE elementId(n) = eid
+        RETURN eid, type(r) AS rel, startNode(r) = n AS outgoing, m
+        """
+
+
+    def query_neighbors_many(self, element_ids, relation=None, label=None):
+        """
+        一次查詢多個節點的一跳鄰居 (不分方向)。
+        :return: {element_id: [(relation_type, is_outgoing, serialized neighbor), ...]}
+        """
+        neighbors = {eid: [] for eid in element_ids}
+        if not neighbors:
+            return neighbors
+
+        with self.driver.session() as session:
+            for record in session.run(KnowledgeGraph._neighbors_many_query(relation, label), eids=list(neighbors)):
+                neighbors[record["eid"]].append((record["rel"], record["outgoing"], self.serialize_node(record["m"])))
+        return neighbors
+
+
+    # section_path 中每個名稱取第一個 structure 作為子樹根節點 (與逐一 .single() 查詢相同)，
+    # 再以變長路徑一次取回整個子樹；依路徑名稱排序即為前序 (parent 在 children 之前)。
+    _SECTION_SUBTREES_QUERY = """
+        UNWIND range(0, size($sections) - 1) AS i
+        CALL {
+            WITH i
+            MATCH (root:structure {name: $sections[i]})
+            RETURN root
+            LIMIT 1
+        }
+        MATCH p = (sub:structure)-[:part_of*0..]->(root)
+        RETURN i AS tree, sub, [n IN reverse(nodes(p)) | elementId(n)] AS path
+        """
+
+    _DOCUMENT_SUBTREES_QUERY = """
+        MATCH (:document {name: $document})<-[:part_of]-(top:structure)
+        MATCH p = (sub:structure)-[:part_of*0..]->(top)
+        RETURN 0 AS tree, sub, [n IN reverse(nodes(p)) | elementId(n)] AS path
+        """
+
+
+    def _preorder_subtrees(records):
+        """
+        將子樹查詢的 records 排成前序 (父節點在子節點之前)。同層節點依查詢回傳的先後，
+        即 Neo4j 走訪 part_of 關聯的順序，與逐層 collect(sub) 展開的舊實作相同；
+        不依名稱排序，避免 "Chapter 10" 排在 "Chapter 2" 之前。
+        records 的 tree 為子樹序號 (section_path 中的位置)，path 為由子樹根到 sub 的 element id。
+        """
+        nodes, children = {}, {}
+        for record in records:
+            path = (record["tree"],) + tuple(record["path"])
+            if path not in nodes:
+                nodes[path] = record["sub"]
+                children.setdefault(path[:-1], []).append(path)
+
+        ordered = []
+        def walk(parent):
+            for path in children.get(parent, []):
+                ordered.append(nodes[path])
+                walk(path)
+        for tree in sorted({path[0] for path in nodes}):
+            walk((tree,))
+        return ordered
+
+
     def query_subsections(self, document, section_path=None):
-        def _query_subsections(self, document, section_path=None):
-            logger.verbose(f"Querying subsections for document: {document}, section_path: {section_path}")
-
-            def fetch_all_subsections(session, parent_path):
-                last_node = parent_path[-1]
-                if last_node is None:
-                    return [parent_path]
-
-                query = """
-                MATCH (sec:structure {name: $last_section})
-                OPTIONAL MATCH (sub:structure)-[:part_of]->(sec)
-                RETURN collect(sub) AS subsections
-                """
-                last_section = last_node["name"]
-                record = session.run(query, last_section=last_section).single()
-                if not record:
-                    return [parent_path]
-
-                subsections = [s for s in record["subsections"] if s is not None]
-
-                all_paths = [parent_path]
-                for sub in subsections:
-                    all_paths.extend(fetch_all_subsections(session, parent_path + [sub]))
-                return all_paths
+        """
+        回傳 section_path 各節點 (含自身) 的所有下層 structure；section_path 為空或找不到任何
+        structure 時，改為回傳 document 底下的所有 structure。每種情況只需一次查詢。
+        結果為前序，同層依 Neo4j 走訪關聯的順序 (見 _preorder_subtrees)。
+        """
+        logger.verbose(f"Querying subsections for document: {document}, section_path: {section_path}")
 
-            with self.driver.session() as session:
+        with self.driver.session() as session:
+            if section_path:
+                sections = [section_path] if isinstance(section_path, str) else list(section_path)
+                result = session.run(KnowledgeGraph._SECTION_SUBTREES_QUERY, sections=sections)
+                sections = [self.serialize_node(sub) for sub in KnowledgeGraph._preorder_subtrees(result)]
+                if sections:
+                    return sections
+
+                logger.warning(
+                    f"No structure found for section_path={section_path}, "
+                    f"fallback to query_subsections(document, None)."
+                )
 
-                # --- 有 section_path 的情況 ---
-                if section_path:
-                    initial_nodes = []
-                    for section in section_path:
-                        record = session.run(
-                            "MATCH (sec:structure {name: $section}) RETURN sec",
-                            section=section
-                        ).single()
-
-                        if record and record["sec"]:
-                            initial_nodes.append(record["sec"])
-
-                    if initial_nodes:
-                        # 找到 structure，正常展開
-                        all_paths = []
-                        for n in initial_nodes:
-                            all_paths.extend(fetch_all_subsections(session, [n]))
-                        return all_paths
-
-                    # ⭐ section_path 有值但找不到 structure → 你要的行為：
-                    # ⭐⭐ 再呼叫一次，等同沒有 section_path ⭐⭐
-                    logger.warning(
-                        f"No structure found for section_path={section_path}, "
-                        f"recursively fallback to query_subsections(document, None)."
-                    )
-                    return self.query_subsections(document, None)
+            result = session.run(KnowledgeGraph._DOCUMENT_SUBTREES_QUERY, document=document)
+            sections = [self.serialize_node(sub) for sub in KnowledgeGraph._preorder_subtrees(result)]
+            if not sections:
+                logger.verbose(f"Document '{document}' has no structure nodes.")
+            return sections
+
+
+    _SECTION_CONCEPTS_QUERY = """
+        CALL {
+            MATCH (c:concept)-[:include_in]->(:document {name: $document})
+            RETURN c
+            UNION
+            UNWIND $section_eids AS eid
+            MATCH (c:concept)-[:include_in]->(s)
+            WHERE elementId(s) = eid
+            RETURN c
+        }
+        RETURN DISTINCT c
+        """
 
+    _DOCUMENTS_CONCEPTS_QUERY = """
+        UNWIND $documents AS document
+        MATCH (c:concept)-[:include_in]->(:document {name: document})
+        RETURN document, c
+        """
 
+    _SECTIONS_CONCEPTS_QUERY = """
+        UNWIND $section_eids AS eid
+        MATCH (c:concept)-[:include_in]->(s)
+        WHERE elementId(s) = eid
+        RETURN eid, c
+        """
 
-                # --- section_path = None 的情況 ---
-                record = session.run(
-                    """
-                    MATCH (doc:document {name: $document})
-                    OPTIONAL MATCH (sec:structure)-[:part_of]->(doc)
-                    RETURN collect(sec) AS sections
-                    """,
-                    document=document
-                ).single()
-
-                sections = []
-                if record:
-                    sections = [s for s in record["sections"] if s is not None]
-
-                if not sections:
-                    # 文件底下也沒有任何 structure，直接回傳空
-                    logger.verbose(f"Document '{document}' has no structure nodes.")
-                    return []
-
-                all_paths = []
-                for sec in sections:
-                    all_paths.extend(fetch_all_subsections(session, [sec]))
-                return all_paths
-
-        # serialize 最終節點
-        sectionss = _query_subsections(self, document, section_path)
-        return [self.serialize_node(sections[-1]) for sections in sectionss]
+
+    def query_section_concepts(self, document, section_path=None):
+        """
+        回傳以 include_in 連結到 document 或 query_subsections() 所得任一 structure 的 concept (不重複)，
+        共兩次查詢。
+        """
+        sections = self.query_subsections(document, section_path)
+        with self.driver.session() as session:
+            result = session.run(KnowledgeGraph._SECTION_CONCEPTS_QUERY,
+                                 document=document, section_eids=[s['element_id'] for s in sections])
+            return [self.serialize_node(record["c"]) for record in result]
+
+
+    def query_section_concepts_many(self, criteria):
+        """
+        query_section_concepts 的批次版本，criteria 為 list of (document, section_path)，回傳依序對應的 concept list。
+        相同的 criterion 只計算一次；document 與 section 的 concept 各以一次查詢取得，
+        多個 criterion 共用的 section 只讀取一次。查詢數為不重複 criterion 數 + 2。
+        """
+        subtrees = {}       # criterion -> section element ids
+        for document, section_path in criteria:
+            key = KnowledgeGraph._criterion_key(document, section_path)
+            if key not in subtrees:
+                subtrees[key] = [s['element_id'] for s in self.query_subsections(document, section_path)]
+        if not subtrees:
+            return []
+
+        documents = sorted({document for document, _ in subtrees})
+        section_eids = sorted({eid for eids in subtrees.values() for eid in eids})
+        document_concepts = {document: {} for document in documents}
+        section_concepts = {eid: {} for eid in section_eids}
+        with self.driver.session() as session:
+            result = session.run(KnowledgeGraph._DOCUMENTS_CONCEPTS_QUERY, documents=documents)
+            for record in result:
+                node = self.serialize_node(record["c"])
+                document_concepts[record["document"]][node['element_id']] = node
+            result = session.run(KnowledgeGraph._SECTIONS_CONCEPTS_QUERY, section_eids=section_eids)
+            for record in result:
+                node = self.serialize_node(record["c"])
+                section_concepts[record["eid"]][node['element_id']] = node
+
+        return KnowledgeGraph._merge_section_concepts(criteria, subtrees, document_concepts, section_concepts)
+
+
+    @staticmethod
+    def _criterion_key(document, section_path):
+        if isinstance(section_path, list):
+            section_path = tuple(section_path)
+        return document, section_path
+
+
+    @staticmethod
+    def _merge_section_concepts(criteria, subtrees, document_concepts, section_concepts):
+        """ 依 criteria 的順序回傳各 criterion 的 document 與子樹 section 的 concept 聯集。 """
+        results = {}
+        for key, eids in subtrees.items():
+            concepts = dict(document_concepts[key[0]])
+            for eid in eids:
+                concepts.update(section_concepts[eid])
+            results[key] = list(concepts.values())
+        return [results[KnowledgeGraph._criterion_key(document, section_path)] for document, section_path in criteria]
+
+
+    def collapse_duplicate_facts(self, file_ids=None, dry_run=False):
+        """ 為既有 fact 補上 fact_key 並合併重複的 fact (見 fact_identity.collapse_duplicate_facts)。 """
+        with self.driver.session() as session:
+            return fact_identity.collapse_duplicate_facts(session, file_ids, dry_run)
+
+
+    def ensure_schema(self):
+        """ 建立或升級 KG 的索引與限制 (見 kg_schema)，回傳 (原版本, 升級後版本)。 """
+        with self.driver.session() as session:
+            return kg_schema.ensure_schema(session)
+
+
+    def _hot_queries():
+        """ 熱門查詢及其代表性參數，與實際執行的語句相同 (批次寫入、fact_key MERGE、子樹查詢)。 """
+        relationship_write = KnowledgeGraph._BATCH_RELATIONSHIP_WRITE.format
+        return {
+            'add_pages_batched: merge fact': (
+                KnowledgeGraph._BATCH_NODE_WRITES['fact'].format(label='fact'), {'rows': []}),
+            'add_pages_batched: merge concept': (
+                KnowledgeGraph._BATCH_NODE_WRITES['concept'].format(label='concept'), {'rows': []}),
+            'add_pages_batched: merge structure': (
+                KnowledgeGraph._BATCH_NODE_WRITES['structure'].format(label='structure'), {'rows': []}),
+            'add_pages_batched: merge is_a': (
+                relationship_write(subject_label='fact', predicate='is_a', object_label='concept'), {'rows': []}),
+            'add_pages_batched: merge fact relation': (
+                relationship_write(subject_label='fact', predicate='related_to', object_label='fact'), {'rows': []}),
+            'query_nodes_by_name(label)': (KnowledgeGraph._nodes_by_name_query('fact'), {'node_name': ''}),
+            'query_nodes_by_name': (KnowledgeGraph._nodes_by_name_query(), {'node_name': ''}),
+            'query_nodes_by_names(label)': (KnowledgeGraph._nodes_by_names_query('fact'), {'names': []}),
+            'query_subsections: section': (KnowledgeGraph._SECTION_SUBTREES_QUERY, {'sections': ['']}),
+            'query_subsections: document': (KnowledgeGraph._DOCUMENT_SUBTREES_QUERY, {'document': ''}),
+            'retire_pages: facts of pages': (
+                page_provenance._RETIRED_FACTS_QUERY, {'file_id': '', 'page_numbers': [0]}),
+        }
+
+
+    def index_usage_report(self):
+        """ 回傳各熱門 Cypher 查詢實際使用的索引 (見 kg_schema.index_usage_report)。 """
+        with self.driver.session() as session:
+            return kg_schema.index_usage_report(session, KnowledgeGraph._hot_queries())
 
 
     def session(self):
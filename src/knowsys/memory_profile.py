@@ -0,0 +1,164 @@
+"""
+依 KG 大小決定 Neo4j 容器的記憶體設定。
+
+每個 KG 容器原本都使用 Neo4j 預設的 heap 與 page cache：小 KG 浪費主機記憶體，大 KG 的 page cache 不足。
+size_profile() 依磁碟上的 store 大小與節點 / 關聯數計算 heap、page cache 與交易記憶體上限，
+以 NEO4J_* 環境變數在建立 (或重建) 容器時套用。節點 / 關聯數在容器就緒後記錄到 MemoryProfileStore，
+供下次啟動時使用。
+"""
+from dataclasses import dataclass
+import json
+import math
+import os
+import threading
+
+import logging
+logger:logging.Logger = logging.getLogger(os.getenv('LOGGER_NAME'))
+
+
+MB = 1024 ** 2
+
+MIN_HEAP_MB = 256
+MAX_HEAP_MB = 8192
+MIN_PAGECACHE_MB = 64
+MAX_PAGECACHE_MB = 32768
+MIN_TRANSACTION_MB = 128
+PAGECACHE_HEADROOM = 1.2        # store 成長的預留空間
+HEAP_BYTES_PER_ENTITY = 200     # 每個節點 / 關聯估計的 heap 用量 (查詢 working set 與快取)
+ROUND_MB = 64
+
+_ENV_HEAP_INITIAL = 'NEO4J_server_memory_heap_initial__size'
+_ENV_HEAP_MAX = 'NEO4J_server_memory_heap_max__size'
+_ENV_PAGECACHE = 'NEO4J_server_memory_pagecache_size'
+_ENV_TRANSACTION = 'NEO4J_db_memory_transaction_total_max'
+
+
+def _round_up(mb):
+    return int(math.ceil(mb / ROUND_MB) * ROUND_MB)
+
+
+def _clamp(value, low, high):
+    return max(low, min(high, value))
+
+
+
+@dataclass
+class MemoryProfile:
+    heap_mb: int
+    pagecache_mb: int
+    transaction_mb: int
+
+
+    @property
+    def total_mb(self):
+        """ 容器的主要記憶體用量 (heap + page cache)，交易記憶體包含在 heap 內。 """
+        return self.heap_mb + self.pagecache_mb
+
+
+    def to_environment(self) -> dict:
+        return {
+            _ENV_HEAP_INITIAL: f'{self.heap_mb}m',
+            _ENV_HEAP_MAX: f'{self.heap_mb}m',
+            _ENV_PAGECACHE: f'{self.pagecache_mb}m',
+            _ENV_TRANSACTION: f'{self.transaction_mb}m',
+        }
+
+
+    @staticmethod
+    def from_environment(env):
+        """
+        由容器的環境變數 (dict 或 docker attrs['Config']['Env'] 的 'KEY=VALUE' list) 讀回 profile；
+        未設定時回傳 None。
+        """
+        if isinstance(env, list):
+            env = dict(item.split('=', 1) for item in env if '=' in item)
+        if _ENV_HEAP_MAX not in env or _ENV_PAGECACHE not in env:
+            return None
+
+        def mb(value):
+            return int(value.rstrip('mM'))
+        return MemoryProfile(mb(env[_ENV_HEAP_MAX]), mb(env[_ENV_PAGECACHE]),
+                             mb(env.get(_ENV_TRANSACTION, f'{MIN_TRANSACTION_MB}m')))
+
+
+    def scaled_to(self, total_mb):
+        """ 縮小至 total_mb 以內：先縮 page cache，再縮 heap，皆不低於下限。 """
+        if self.total_mb <= total_mb:
+            return self
+        pagecache_mb = max(MIN_PAGECACHE_MB, total_mb - self.heap_mb)
+        heap_mb = max(MIN_HEAP_MB, total_mb - pagecache_mb)
+        return MemoryProfile(heap_mb, pagecache_mb, min(self.transaction_mb, max(MIN_TRANSACTION_MB, heap_mb // 2)))
+
+
+
+MIN_PROFILE = MemoryProfile(MIN_HEAP_MB, MIN_PAGECACHE_MB, MIN_TRANSACTION_MB)
+
+
+def store_size_bytes(kg_path):
+    """ KG volume 中資料庫檔案的大小 (databases/ 與 transactions/)。 """
+    total = 0
+    for subdir in ('databases', 'transactions'):
+        for root, _, files in os.walk(os.path.join(kg_path, subdir)):
+            for filename in files:
+                try:
+                    total += os.path.getsize(os.path.join(root, filename))
+                except OSError:
+                    pass    # 檔案在列出後被刪除
+    return total
+
+
+def size_profile(store_bytes, nodes=0, relationships=0) -> MemoryProfile:
+    """
+    - page cache：store 大小加上成長預留，讓整個 store 可以留在記憶體中。
+    - heap：基本用量加上依節點 / 關聯數估計的 working set。
+    - 交易記憶體：heap 的一半，避免單一大交易耗盡 heap。
+    """
+    pagecache_mb = _clamp(_round_up(store_bytes * PAGECACHE_HEADROOM / MB), MIN_PAGECACHE_MB, MAX_PAGECACHE_MB)
+    heap_mb = _clamp(_round_up(MIN_HEAP_MB + (nodes + relationships) * HEAP_BYTES_PER_ENTITY / MB),
+                     MIN_HEAP_MB, MAX_HEAP_MB)
+    return MemoryProfile(heap_mb, pagecache_mb, max(MIN_TRANSACTION_MB, heap_mb // 2))
+
+
+
+class MemoryProfileStore:
+    """ 以 JSON 檔記錄各 KG 最近一次的節點 / 關聯數與 store 大小。 """
+    def __init__(self, path):
+        """
+        :param path: 檔案路徑 (放在 datapath 下時須為檔案，DockerManager.list_KGs 會將目錄視為 KG)
+        """
+        self.path = path
+        self._lock = threading.Lock()
+
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return {}
+        with open(self.path, encoding='utf-8') as f:
+            return json.load(f)
+
+
+    def get(self, kg_name) -> dict:
+        with self._lock:
+            return self._load().get(kg_name, {})
+
+
+    def _save(self, records):
+        # 先寫暫存檔再取代，寫入中斷不會留下不完整的 JSON
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(records, f, ensure_ascii=False, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.path)
+
+
+    def update(self, kg_name, **fields):
+        with self._lock:
+            records = self._load()
+            records.setdefault(kg_name, {}).update(fields)
+            self._save(records)
+
+
+    def remove(self, kg_name):
+        with self._lock:
+            records = self._load()
+            if records.pop(kg_name, None) is not None:
+                self._save(records)
@@ -0,0 +1,101 @@
+"""
+關聯的來源頁面與頁面退役。
+
+修訂過的 PDF 以增量模式重新匯入時 (見 retrieval.page_fingerprints)，內容改變或被移除的頁面要從 KG 中撤下。
+fact 節點以 (file_id, page_number) 區分，可直接刪除；concept、structure 與 document 節點及其關聯由多頁共用，
+無法從節點判斷來自哪一頁。因此寫入關聯時在 r.sources 記錄產生它的頁面 (page_source)，退役時：
+1. 從退役 facts、其 concepts、同名 facts 以及該文件的 structure / document 的關聯中移除這些頁面，
+   沒有其他來源的關聯才刪除。
+2. 刪除退役頁面的 facts (連同其關聯)。
+3. 刪除失去所有關聯的 concept 與 structure 節點。
+只讀取與退役頁面相關的節點，成本與修改的頁數成正比。
+此功能加入前寫入的關聯沒有 sources，不會因退役而移除，只隨退役的 fact 一起刪除。
+"""
+import os
+
+import logging
+logger:logging.Logger = logging.getLogger(os.getenv('LOGGER_NAME'))
+
+
+def page_source(file_id, page_number):
+    """ 關聯 r.sources 中代表一頁的字串。 """
+    return f"{file_id}/{page_number}"
+
+
+_RETIRED_FACTS_QUERY = """
+    MATCH (n:fact)
+    WHERE n.file_id = $file_id AND n.page_number IN $page_numbers
+    OPTIONAL MATCH (n)-[:is_a]->(c:concept)
+    RETURN n.name AS name, n.page_number AS page_number, collect(DISTINCT c.name) AS concepts
+    """
+
+# 移除關聯中退役頁面的來源，沒有來源的關聯刪除；{label} 與 {condition} 於執行時代入
+_STRIP_SOURCES = """
+    MATCH (n:`{label}`)-[r]-()
+    WHERE {condition} AND any(source IN coalesce(r.sources, []) WHERE source IN $sources)
+    WITH DISTINCT r
+    SET r.sources = [source IN r.sources WHERE NOT source IN $sources]
+    WITH r
+    WHERE size(r.sources) = 0
+    DELETE r
+    RETURN count(*) AS deleted
+    """
+
+_STRIP_CONDITIONS = {
+    'fact': "n.name IN $names",
+    'concept': "n.name IN $names",
+    'structure': "n.file_id = $file_id",
+    'document': "n.file_id = $file_id",
+}
+
+_DELETE_FACTS = """
+    MATCH (n:fact)
+    WHERE n.file_id = $file_id AND n.page_number IN $page_numbers
+    DETACH DELETE n
+    RETURN count(*) AS deleted
+    """
+
+_DELETE_ORPHANS = """
+    MATCH (n:`{label}`)
+    WHERE {condition} AND NOT (n)--()
+    DELETE n
+    RETURN count(*) AS deleted
+    """
+
+
+def retire_pages_tx(tx, file_id, page_numbers):
+    """
+    供 session.execute_write() 呼叫，撤下 file_id 中 page_numbers 各頁的節點與關聯。
+    :return: dict，包含 facts、relationships、nodes (刪除數) 與 retired_facts [(name, page_number)]
+    """
+    page_numbers = list(page_numbers)
+    sources = [page_source(file_id, page_number) for page_number in page_numbers]
+    records = list(tx.run(_RETIRED_FACTS_QUERY, file_id=file_id, page_numbers=page_numbers))
+    retired_facts = [(record["name"], record["page_number"]) for record in records]
+    names = {
+        'fact': list(dict.fromkeys(name for name, _ in retired_facts)),
+        'concept': list(dict.fromkeys(concept for record in records for concept in record["concepts"])),
+    }
+
+    relationships = 0
+    for label, condition in _STRIP_CONDITIONS.items():
+        record = tx.run(_STRIP_SOURCES.format(label=label, condition=condition),
+                        names=names.get(label, []), file_id=file_id, sources=sources).single()
+        relationships += record["deleted"] if record else 0
+
+    record = tx.run(_DELETE_FACTS, file_id=file_id, page_numbers=page_numbers).single()
+    facts = record["deleted"] if record else 0
+
+    nodes = 0
+    for label in ('concept', 'structure'):
+        record = tx.run(_DELETE_ORPHANS.format(label=label, condition=_STRIP_CONDITIONS[label]),
+                        names=names.get(label, []), file_id=file_id).single()
+        nodes += record["deleted"] if record else 0
+
+    return {
+        'pages': len(page_numbers),
+        'facts': facts,
+        'relationships': relationships,
+        'nodes': nodes,
+        'retired_facts': retired_facts,
+    }
@@ -0,0 +1,115 @@
+"""
+KG 容器的連接埠分配。
+
+DockerManager.get_free_port 從基準端口逐一以 connect_ex 探測，KG 越多越慢；
+且端口在 Docker 綁定前仍是空閒的，同時建立兩個容器可能選到相同端口。
+PortAllocator 改為：
+- 以持久化的預約表 (JSON 檔) 記錄每個 KG 的 (http_port, bolt_port)，重建容器時沿用相同端口；
+- 已占用端口由一次容器列表取得 (含已停止的容器)，不再逐一探測；
+- 預約在 lock 內完成並立即寫入檔案，並行的 create_container 不會拿到相同端口。
+"""
+from contextlib import contextmanager
+import json
+import os
+import threading
+
+try:
+    import fcntl
+except ImportError:     # Windows：只保證同一 process 內的互斥
+    fcntl = None
+
+import logging
+logger:logging.Logger = logging.getLogger(os.getenv('LOGGER_NAME'))
+
+
+
+class PortAllocator:
+    # 同一個預約表檔案共用一個 lock，同一 process 內的多個 DockerManager 也互斥
+    _locks:dict[str, threading.Lock] = {}
+    _locks_lock = threading.Lock()
+
+
+    def __init__(self, path, http_base=7474, bolt_base=7687):
+        """
+        :param path: 預約表檔案路徑 (放在 datapath 下時須為檔案，DockerManager.list_KGs 會將目錄視為 KG)
+        """
+        self.path = path
+        self.http_base = http_base
+        self.bolt_base = bolt_base
+        with PortAllocator._locks_lock:
+            self._lock = PortAllocator._locks.setdefault(os.path.abspath(path), threading.Lock())
+
+
+    @contextmanager
+    def _locked(self):
+        """ process 內以 threading.Lock、process 間以 lock 檔 (flock) 互斥。 """
+        with self._lock:
+            if fcntl is None:
+                yield
+                return
+            with open(self.path + '.lock', 'a') as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+    def _load(self) -> dict[str, list[int]]:
+        if not os.path.exists(self.path):
+            return {}
+        with open(self.path, encoding='utf-8') as f:
+            return json.load(f)
+
+
+    def _save(self, reservations):
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(reservations, f, ensure_ascii=False, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.path)
+
+
+    def reservations(self) -> dict[str, tuple[int, int]]:
+        with self._locked():
+            return {kg_name: tuple(ports) for kg_name, ports in self._load().items()}
+
+
+    @staticmethod
+    def _next_free(start, taken, probe):
+        port = start
+        while port in taken or (probe and probe(port)):
+            port += 1
+        return port
+
+
+    def reserve(self, kg_name, used_ports=(), probe=None):
+        """
+        回傳 kg_name 的 (http_port, bolt_port)，尚未預約時分配並寫入預約表。
+
+        :param used_ports: 目前已被容器占用的 host 端口 (來自一次容器列表)
+        :param probe: probe(port) -> bool，對候選端口做最後確認 (例如非 Docker 程式占用)，只探測候選端口
+        """
+        with self._locked():
+            reservations = self._load()
+            if kg_name in reservations:
+                return tuple(reservations[kg_name])
+
+            taken = set(used_ports)
+            for ports in reservations.values():
+                taken.update(ports)
+            http_port = PortAllocator._next_free(self.http_base, taken, probe)
+            taken.add(http_port)
+            bolt_port = PortAllocator._next_free(self.bolt_base, taken, probe)
+
+            reservations[kg_name] = [http_port, bolt_port]
+            self._save(reservations)
+            logger.info(f"KG '{kg_name}' reserved ports: HTTP {http_port}, BOLT {bolt_port}")
+            return http_port, bolt_port
+
+
+    def release(self, kg_name):
+        """ 刪除 KG 時釋放其預約。 """
+        with self._locked():
+            reservations = self._load()
+            if reservations.pop(kg_name, None) is not None:
+                self._save(reservations)
@@ -0,0 +1,220 @@
+"""
+運行中 KG 容器的連接埠快取。
+
+DockerManager.open_KG 原本每次都以 Docker API 列出所有容器並讀取其屬性，每個問題都會多一次 Docker daemon 呼叫。
+PortRegistry 啟動時列出一次，之後：
+- 訂閱 Docker events (start / stop / die / destroy) 即時更新；
+- events 連線中斷時，改以 TTL 判斷是否需要重新列出 (TTL fallback)；
+- 查詢不到的 KG 最多每 miss_refresh_interval 秒重新列出一次，涵蓋剛建立、events 尚未送達的容器。
+"""
+from collections import deque
+import os
+import threading
+import time
+
+import logging
+logger:logging.Logger = logging.getLogger(os.getenv('LOGGER_NAME'))
+
+
+CONTAINER_EVENTS = ['start', 'stop', 'die', 'destroy']
+
+
+
+class ApiCallCounter:
+    """ 統計 Docker API 呼叫次數，及最近一分鐘內的呼叫數。 """
+    def __init__(self, window=60.0):
+        self.window = window
+        self.total = 0
+        self._calls = deque()
+        self._lock = threading.Lock()
+
+
+    def record(self):
+        now = time.monotonic()
+        with self._lock:
+            self.total += 1
+            self._calls.append(now)
+            self._prune(now)
+
+
+    def _prune(self, now):
+        while self._calls and self._calls[0] < now - self.window:
+            self._calls.popleft()
+
+
+    def per_minute(self):
+        with self._lock:
+            self._prune(time.monotonic())
+            return len(self._calls) * 60.0 / self.window
+
+
+
+class PortRegistry:
+    def __init__(self, client, ttl=30.0, watch_events=False, miss_refresh_interval=1.0):
+        """
+        :param client: docker.DockerClient (或相同介面的物件)
+        :param ttl: 未連上 events 時，快取的有效秒數
+        :param watch_events: 是否以背景 thread 訂閱 Docker events
+        """
+        self.client = client
+        self.ttl = ttl
+        self.miss_refresh_interval = miss_refresh_interval
+        self.api_calls = ApiCallCounter()
+        self.watching = False
+
+        self._ports:dict[str, tuple[str, str]] = {}     # container name -> (http_port, bolt_port)
+        self._loaded_at = None
+        self._lock = threading.Lock()
+        self._closed = threading.Event()
+        self._events = None
+        self._thread = None
+
+        self.hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self.events = 0
+
+        if watch_events:
+            self._thread = threading.Thread(target=self._watch, name='docker-port-registry', daemon=True)
+            self._thread.start()
+
+
+    def _call(self, fn, *args, **kwargs):
+        self.api_calls.record()
+        return fn(*args, **kwargs)
+
+
+    @staticmethod
+    def _container_ports(container):
+        """ 回傳映射 7474/tcp 的容器的 (http_port, bolt_port)，否則回傳 None。 """
+        ports = container.attrs['NetworkSettings']['Ports']
+        if ports and '7474/tcp' in ports and ports['7474/tcp']:
+            http_port = ports['7474/tcp'][0].get('HostPort', 'N/A')
+            bolt_port = (ports.get('7687/tcp') or [{}])[0].get('HostPort', 'N/A')
+            return http_port, bolt_port
+        return None
+
+
+    def refresh(self):
+        """ 重新列出運行中的容器。 """
+        containers = self._call(self.client.containers.list)     # 只列出運行中的容器
+        ports = {}
+        for container in containers:
+            container_ports = PortRegistry._container_ports(container)
+            if container_ports:
+                ports[container.name] = container_ports
+        with self._lock:
+            self._ports = ports
+            self._loaded_at = time.monotonic()
+            self.refreshes += 1
+
+
+    def _is_stale(self, max_age):
+        return self._loaded_at is None or time.monotonic() - self._loaded_at > max_age
+
+
+    def _ensure_fresh(self):
+        if self._is_stale(float('inf') if self.watching else self.ttl):
+            self.refresh()
+
+
+    def get(self, name):
+        """ 回傳 (http_port, bolt_port)；容器未運行時回傳 (None, None)。 """
+        self._ensure_fresh()
+        with self._lock:
+            ports = self._ports.get(name)
+        if ports is None and self._is_stale(self.miss_refresh_interval):
+            self.refresh()
+            with self._lock:
+                ports = self._ports.get(name)
+
+        if ports is None:
+            self.misses += 1
+            return None, None
+        self.hits += 1
+        return ports
+
+
+    def running(self):
+        """ 回傳 list of (容器名稱, HTTP端口, BOLT端口)。 """
+        self._ensure_fresh()
+        with self._lock:
+            return [(name, http_port, bolt_port) for name, (http_port, bolt_port) in self._ports.items()]
+
+
+    def invalidate(self, name=None):
+        """ 移除一個容器的快取 (name=None 時全部)，下次查詢時重新列出。 """
+        with self._lock:
+            if name is None:
+                self._loaded_at = None
+            else:
+                self._ports.pop(name, None)
+                self._loaded_at = None
+
+
+    def _apply_event(self, event):
+        action = event.get('Action') or event.get('status')
+        actor = event.get('Actor', {})
+        name = actor.get('Attributes', {}).get('name')
+        self.events += 1
+        if action == 'start':
+            container = self._call(self.client.containers.get, actor.get('ID') or event.get('id'))
+            ports = PortRegistry._container_ports(container)
+            with self._lock:
+                if ports:
+                    self._ports[container.name] = ports
+                else:
+                    self._ports.pop(container.name, None)
+        elif name:
+            with self._lock:
+                self._ports.pop(name, None)
+
+
+    def _watch(self):
+        backoff = 1
+        while not self._closed.is_set():
+            try:
+                self._events = self._call(self.client.events, decode=True,
+                                          filters={'type': 'container', 'event': CONTAINER_EVENTS})
+                # 訂閱後才列出，連線前發生的變動不會遺漏
+                self.refresh()
+                self.watching = True
+                backoff = 1
+                logger.info("Docker events watcher connected")
+                for event in self._events:
+                    self._apply_event(event)
+            except Exception as e:
+                if self._closed.is_set():
+                    break
+                logger.warning(f"Docker events watcher disconnected, falling back to TTL {self.ttl}s: {e}")
+            self.watching = False
+            self._closed.wait(backoff)
+            backoff = min(backoff * 2, 60)
+
+
+    def close(self):
+        self._closed.set()
+        if self._events is not None:
+            try:
+                self._events.close()
+            except Exception:
+                pass
+        if self._thread:
+            self._thread.join(timeout=5)
+
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries = len(self._ports)
+            age = None if self._loaded_at is None else round(time.monotonic() - self._loaded_at, 1)
+        return {
+            'entries': entries,
+            'age': age,
+            'watching': self.watching,
+            'hits': self.hits,
+            'misses': self.misses,
+            'refreshes': self.refreshes,
+            'events': self.events,
+            'api_calls': self.api_calls.total,
+            'api_calls_per_minute': self.api_calls.per_minute(),
+        }
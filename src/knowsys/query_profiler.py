@@ -0,0 +1,595 @@
+"""
+Cypher 語句的延遲統計與慢查詢記錄。
+
+knowledge_graph、weighted_ranker、scq_generator 與 apps/retrieve_facts 中有大量內嵌的 Cypher，
+過去無從得知哪一個查詢慢。QueryProfiler 包裝 neo4j driver 的 session / transaction / execute_query：
+- 以正規化後的語句 (fingerprint：字串與數字常數換成 ?，合併空白) 分組，記錄次數、錯誤、延遲直方圖與回傳筆數；
+- 超過 slow_ms 的語句寫入本機的 JSONL 慢查詢記錄 (依大小輪替)；
+- 唯讀語句另以 PROFILE 在背景重跑一次取得執行計畫與 db hits (同一 fingerprint 每 profile_interval 秒最多一次)，
+  寫入語句不重跑，避免重複寫入。db hits 只有 PROFILE 才取得得到，因此只統計被 profile 過的語句。
+
+延遲為 run() 到結果讀完 (或 consume / session 結束) 的時間，包含 client 端讀取 records 的時間。
+"""
+from collections import defaultdict
+import hashlib
+import json
+import logging.handlers
+import os
+import queue
+import re
+import threading
+import time
+
+import logging
+logger:logging.Logger = logging.getLogger(os.getenv('LOGGER_NAME'))
+
+
+# 延遲直方圖的上界 (ms)，最後一格為超過 10 秒
+LATENCY_BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000)
+
+_COMMENTS = re.compile(r'//[^\n]*|/\*.*?\*/', re.DOTALL)
+_STRINGS = re.compile(r"'(?:[^'\\]|\\.)*'|\"(?:[^\"\\]|\\.)*\"")
+_NUMBERS = re.compile(r'(?<![\w$`])-?\d+(?:\.\d+)?(?![\w`])')
+_LISTS = re.compile(r'\[\s*\?(?:\s*,\s*\?)*\s*\]')
+_WHITESPACE = re.compile(r'\s+')
+_WRITE_CLAUSES = re.compile(r'\b(CREATE|MERGE|DELETE|SET|REMOVE|DROP|FOREACH|LOAD\s+CSV)\b', re.IGNORECASE)
+_EXPLAINED = re.compile(r'^\s*(EXPLAIN|PROFILE)\b', re.IGNORECASE)
+_PARAM_TEXT_LIMIT = 200
+
+
+def fingerprint(query):
+    """ 去除註解、以 ? 取代字串與數字常數 (常數 list 合併為 [?])、合併空白。 """
+    text = _COMMENTS.sub(' ', query)
+    text = _STRINGS.sub('?', text)
+    text = _NUMBERS.sub('?', text)
+    text = _LISTS.sub('[?]', text)
+    return _WHITESPACE.sub(' ', text).strip()
+
+
+def fingerprint_id(text):
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()[:12]
+
+
+def is_read_only(query):
+    """ 不含寫入子句的語句才可安全地以 PROFILE 重跑。 """
+    return not _WRITE_CLAUSES.search(_STRINGS.sub('?', query)) and not _EXPLAINED.match(query)
+
+
+def summarize_params(params):
+    """ 慢查詢記錄中的參數摘要：list / dict 只記錄長度，過長的字串截斷。 """
+    summary = {}
+    for key, value in (params or {}).items():
+        if isinstance(value, (list, tuple, set)):
+            summary[key] = f'<{type(value).__name__} len={len(value)}>'
+        elif isinstance(value, dict):
+            summary[key] = f'<dict keys={len(value)}>'
+        elif isinstance(value, str) and len(value) > _PARAM_TEXT_LIMIT:
+            summary[key] = value[:_PARAM_TEXT_LIMIT] + '...'
+        elif value is None or isinstance(value, (str, int, float, bool)):
+            summary[key] = value
+        else:
+            summary[key] = repr(value)[:_PARAM_TEXT_LIMIT]
+    return summary
+
+
+def summarize_plan(plan, depth=0):
+    """
+    將 PROFILE 的執行計畫攤平成 list of {'depth', 'operator', 'details', 'rows', 'db_hits'}。
+
+    :return: tuple (operators, 總 db hits)
+    """
+    operators, db_hits = [], 0
+    if not plan:
+        return operators, db_hits
+    args = plan.get('args', {})
+    hits = plan.get('dbHits', args.get('DbHits', 0)) or 0
+    operators.append({
+        'depth': depth,
+        'operator': plan.get('operatorType', '').split('@')[0],
+        'details': args.get('Details', ''),
+        'rows': plan.get('rows', args.get('Rows')),
+        'db_hits': hits,
+    })
+    db_hits += hits
+    for child in plan.get('children', []):
+        child_operators, child_hits = summarize_plan(child, depth + 1)
+        operators.extend(child_operators)
+        db_hits += child_hits
+    return operators, db_hits
+
+
+
+class _StatementStats:
+    def __init__(self, text):
+        self.text = text
+        self.count = 0
+        self.errors = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.rows = 0
+        self.buckets = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        self.profiled = 0
+        self.db_hits = 0
+        self.slow = 0
+
+
+    def add(self, seconds, rows, error):
+        self.count += 1
+        self.errors += error is not None
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        self.rows += rows
+        ms = seconds * 1000
+        self.buckets[next((i for i, bound in enumerate(LATENCY_BUCKETS_MS) if ms <= bound), len(LATENCY_BUCKETS_MS))] += 1
+
+
+    def percentile(self, p):
+        """ 以直方圖估計的百分位數 (所在區間的上界，最後一格以實際最大值代替)。 """
+        target, seen = self.count * p, 0
+        for i, count in enumerate(self.buckets):
+            seen += count
+            if count and seen >= target:
+                return LATENCY_BUCKETS_MS[i] if i < len(LATENCY_BUCKETS_MS) else round(self.max * 1000, 2)
+        return None
+
+
+    def report(self) -> dict:
+        return {
+            'fingerprint': self.text,
+            'count': self.count,
+            'errors': self.errors,
+            'slow': self.slow,
+            'total_ms': round(self.total * 1000, 2),
+            'mean_ms': round(self.total / self.count * 1000, 2) if self.count else None,
+            'p50_ms': self.percentile(0.5),
+            'p95_ms': self.percentile(0.95),
+            'max_ms': round(self.max * 1000, 2),
+            'rows': self.rows,
+            'mean_rows': round(self.rows / self.count, 1) if self.count else None,
+            'profiled': self.profiled,
+            'mean_db_hits': round(self.db_hits / self.profiled) if self.profiled else None,
+            'histogram': dict(zip([f'<={bound}ms' for bound in LATENCY_BUCKETS_MS] + ['>10000ms'], self.buckets)),
+        }
+
+
+
+class QueryProfiler:
+    _default:'QueryProfiler' = None
+    _default_lock = threading.Lock()
+
+
+    def __init__(self, slow_ms=500, slow_log_path=None, profile_slow=True, profile_interval=60,
+                 max_bytes=10 * 1024 * 1024, backup_count=5, max_fingerprints=2000):
+        """
+        :param slow_ms: 超過此延遲 (ms) 的語句寫入慢查詢記錄；None 表示只統計不記錄
+        :param slow_log_path: 慢查詢 JSONL 檔案；None 表示不寫檔
+        :param profile_slow: 是否以 PROFILE 重跑慢的唯讀語句以取得執行計畫
+        :param profile_interval: 同一 fingerprint 兩次 PROFILE 之間至少間隔的秒數
+        :param max_bytes / backup_count: 慢查詢記錄輪替的檔案大小與保留份數
+        :param max_fingerprints: 統計的 fingerprint 上限，超過後新的語句併入 '(other)'
+        """
+        self.slow_ms = slow_ms
+        self.slow_log_path = slow_log_path
+        self.profile_slow = profile_slow
+        self.profile_interval = profile_interval
+        self.max_fingerprints = max_fingerprints
+        self._stats:dict[str, _StatementStats] = {}
+        self._fingerprints:dict[str, tuple[str, str]] = {}      # 原始語句 -> (fingerprint, id)
+        self._last_profiled:dict[str, float] = {}
+        self._lock = threading.Lock()
+        self._slow_log:logging.Logger = None
+        if slow_log_path:
+            # 獨立的 logger，不傳遞到應用程式的 log
+            self._slow_log = logging.getLogger(f'kaqg.slow_queries.{id(self)}')
+            self._slow_log.propagate = False
+            self._slow_log.setLevel(logging.INFO)
+            handler = logging.handlers.RotatingFileHandler(
+                slow_log_path, maxBytes=max_bytes, backupCount=backup_count, encoding='utf-8')
+            handler.setFormatter(logging.Formatter('%(message)s'))
+            self._slow_log.addHandler(handler)
+        self._profile_queue = queue.Queue(maxsize=16)
+        self._profile_worker:threading.Thread = None
+
+
+    @staticmethod
+    def configure(**params) -> 'QueryProfiler':
+        """ 以新參數建立 process 內共用的 profiler，之後建立的 KnowledgeGraph 都會被統計。 """
+        with QueryProfiler._default_lock:
+            previous, QueryProfiler._default = QueryProfiler._default, QueryProfiler(**params)
+        if previous:
+            previous.close()
+        return QueryProfiler._default
+
+
+    @staticmethod
+    def configure_from(profiling:dict, default_dir, process_name=None) -> 'QueryProfiler':
+        """
+        依 [service.kg.profiling] 設定 configure()。慢查詢記錄預設為 <log_dir>/_slow_queries.jsonl，
+        未設定 log_dir 時放在呼叫端自己的目錄 default_dir (KG service 為 datapath，其他 app 為各自的資料目錄)；
+        指定 process_name 時檔名加上 _<process_name>，避免多個 process 輪替同一個檔案。
+        """
+        params = dict(profiling)
+        log_dir = params.pop('log_dir', None) or default_dir
+        path = params.get('slow_log_path') or os.path.join(log_dir, '_slow_queries.jsonl')
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        if process_name:
+            root, ext = os.path.splitext(path)
+            path = f'{root}_{process_name}{ext}'
+        params['slow_log_path'] = path
+        return QueryProfiler.configure(**params)
+
+
+    @staticmethod
+    def default() -> 'QueryProfiler':
+        """ 回傳共用的 profiler；未 configure() 時為 None (不統計)。 """
+        return QueryProfiler._default
+
+
+    @staticmethod
+    def instrument(driver):
+        """ 已 configure() 時回傳包裝後的 driver，否則原樣回傳。 """
+        profiler = QueryProfiler._default
+        return profiler.wrap(driver) if profiler else driver
+
+
+    @staticmethod
+    def unwrap(driver):
+        return driver.driver if isinstance(driver, ProfiledDriver) else driver
+
+
+    def wrap(self, driver) -> 'ProfiledDriver':
+        if isinstance(driver, ProfiledDriver):
+            return driver
+        return ProfiledDriver(driver, self)
+
+
+    def _fingerprint(self, query):
+        cached = self._fingerprints.get(query)
+        if cached is None:
+            text = fingerprint(query)
+            cached = (text, fingerprint_id(text))
+            if len(self._fingerprints) < self.max_fingerprints * 4:
+                self._fingerprints[query] = cached
+        return cached
+
+
+    def record(self, query, params, seconds, rows, error=None, driver=None, database=None):
+        """ 記錄一次語句執行；driver 為未包裝的 driver，供 PROFILE 重跑使用。 """
+        text, key = self._fingerprint(query)
+        slow = self.slow_ms is not None and seconds * 1000 >= self.slow_ms
+        profile = False
+        with self._lock:
+            stats = self._stats.get(key)
+            if stats is None:
+                if len(self._stats) >= self.max_fingerprints:
+                    key, text = 'other', '(other)'
+                    stats = self._stats.get(key)
+                if stats is None:
+                    stats = self._stats[key] = _StatementStats(text)
+            stats.add(seconds, rows, error)
+            if slow:
+                stats.slow += 1
+                now = time.monotonic()
+                if (self.profile_slow and driver is not None and error is None and is_read_only(query)
+                        and now - self._last_profiled.get(key, -self.profile_interval) >= self.profile_interval):
+                    self._last_profiled[key] = now
+                    profile = True
+        if not slow:
+            return
+        entry = {
+            'ts': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'fingerprint_id': key,
+            'fingerprint': text,
+            'query': query,
+            'params': summarize_params(params),
+            'ms': round(seconds * 1000, 2),
+            'rows': rows,
+            'error': repr(error) if error is not None else None,
+        }
+        if profile and self._submit_profile(entry, driver, database, query, params):
+            return
+        self._write_slow(entry)
+
+
+    def _write_slow(self, entry):
+        if self._slow_log:
+            self._slow_log.info(json.dumps(entry, ensure_ascii=False, default=str))
+        else:
+            logger.warning(f"Slow query ({entry['ms']} ms, {entry['rows']} rows): {entry['fingerprint']}")
+
+
+    def _submit_profile(self, entry, driver, database, query, params):
+        """ 交給背景 thread 以 PROFILE 重跑；佇列滿時放棄 (直接記錄不含計畫的項目)。 """
+        with self._lock:
+            if self._profile_worker is None:
+                self._profile_worker = threading.Thread(target=self._run_profiles, name='query-profiler', daemon=True)
+                self._profile_worker.start()
+        try:
+            self._profile_queue.put_nowait((entry, driver, database, query, params))
+            return True
+        except queue.Full:
+            return False
+
+
+    def _run_profiles(self):
+        while True:
+            item = self._profile_queue.get()
+            if item is None:
+                return
+            entry, driver, database, query, params = item
+            try:
+                session_params = {'database': database} if database else {}
+                with driver.session(**session_params) as session:
+                    summary = session.run(f"PROFILE {query}", **(params or {})).consume()
+                operators, db_hits = summarize_plan(summary.profile)
+                entry.update(db_hits=db_hits, plan=operators)
+                with self._lock:
+                    stats = self._stats.get(entry['fingerprint_id'])
+                    if stats:
+                        stats.profiled += 1
+                        stats.db_hits += db_hits
+            except Exception as e:
+                entry['profile_error'] = repr(e)
+            self._write_slow(entry)
+
+
+    def report(self, top=20, sort='total_ms') -> list:
+        """ 依 sort 欄位 (total_ms、p95_ms、max_ms、count、rows、mean_db_hits) 由大到小回傳前 top 個語句的統計。 """
+        with self._lock:
+            reports = [dict(stats.report(), fingerprint_id=key) for key, stats in self._stats.items()]
+        reports.sort(key=lambda report: report.get(sort) or 0, reverse=True)
+        return reports[:top] if top else reports
+
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+            self._last_profiled.clear()
+
+
+    def close(self):
+        """ 等待背景 PROFILE 完成並關閉慢查詢記錄檔。 """
+        if self._profile_worker is not None:
+            self._profile_queue.put(None)
+            self._profile_worker.join()
+            self._profile_worker = None
+        if self._slow_log:
+            for handler in list(self._slow_log.handlers):
+                handler.close()
+                self._slow_log.removeHandler(handler)
+
+
+
+class _ProfiledResult:
+    """ 包裝 neo4j Result，計算讀取的筆數，讀完或 consume 時記錄一次。 """
+    def __init__(self, result, query, params, start, owner):
+        self._result = result
+        self._query = query
+        self._params = params
+        self._start = start
+        self._owner = owner
+        self._rows = 0
+        self._done = False
+
+
+    def _finish(self, error=None):
+        if self._done:
+            return
+        self._done = True
+        self._owner._record(self._query, self._params, time.perf_counter() - self._start, self._rows, error)
+
+
+    def __iter__(self):
+        try:
+            for record in self._result:
+                self._rows += 1
+                yield record
+        except Exception as e:
+            self._finish(e)
+            raise
+        self._finish()
+
+
+    def _read_all(self, method, *args, **kwargs):
+        try:
+            value = getattr(self._result, method)(*args, **kwargs)
+        except Exception as e:
+            self._finish(e)
+            raise
+        if method == 'single':
+            self._rows += value is not None
+        elif method in ('data', 'values', 'value'):
+            self._rows += len(value)
+        self._finish()
+        return value
+
+
+    def single(self, *args, **kwargs):
+        return self._read_all('single', *args, **kwargs)
+
+
+    def data(self, *args, **kwargs):
+        return self._read_all('data', *args, **kwargs)
+
+
+    def values(self, *args, **kwargs):
+        return self._read_all('values', *args, **kwargs)
+
+
+    def value(self, *args, **kwargs):
+        return self._read_all('value', *args, **kwargs)
+
+
+    def consume(self):
+        return self._read_all('consume')
+
+
+    def __getattr__(self, name):
+        return getattr(self._result, name)
+
+
+
+class _ProfiledRunner:
+    """ session 與 transaction 共用：run() 回傳 _ProfiledResult，結束時記錄尚未讀完的結果。 """
+    def __init__(self, target, driver:'ProfiledDriver', database):
+        self._target = target
+        self._driver = driver
+        self._database = database
+        self._pending:list[_ProfiledResult] = []
+
+
+    def run(self, query, parameters=None, **kwargs):
+        params = dict(parameters or {}, **kwargs)
+        start = time.perf_counter()
+        try:
+            result = self._target.run(query, **kwargs) if parameters is None else \
+                self._target.run(query, parameters, **kwargs)
+        except Exception as e:
+            self._record(query, params, time.perf_counter() - start, 0, e)
+            raise
+        wrapped = _ProfiledResult(result, query, params, start, self)
+        self._pending = [pending for pending in self._pending if not pending._done]
+        self._pending.append(wrapped)
+        return wrapped
+
+
+    def _record(self, query, params, seconds, rows, error=None):
+        self._driver.profiler.record(query, params, seconds, rows, error, self._driver.driver, self._database)
+
+
+    def _finish_pending(self):
+        for pending in self._pending:
+            pending._finish()
+        self._pending = []
+
+
+    def __getattr__(self, name):
+        return getattr(self._target, name)
+
+
+
+class _ProfiledSession(_ProfiledRunner):
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+
+    def close(self):
+        try:
+            self._target.close()
+        finally:
+            self._finish_pending()
+
+
+    def _transaction_function(self, execute, fn, args, kwargs):
+        def wrapped(tx, *args, **kwargs):
+            runner = _ProfiledRunner(tx, self._driver, self._database)
+            try:
+                return fn(runner, *args, **kwargs)
+            finally:
+                runner._finish_pending()
+        return execute(wrapped, *args, **kwargs)
+
+
+    def execute_read(self, fn, *args, **kwargs):
+        return self._transaction_function(self._target.execute_read, fn, args, kwargs)
+
+
+    def execute_write(self, fn, *args, **kwargs):
+        return self._transaction_function(self._target.execute_write, fn, args, kwargs)
+
+
+
+class ProfiledDriver:
+    """ 包裝 neo4j Driver；session() 與 execute_query() 的語句都交給 profiler 統計，其餘屬性直接轉給 driver。 """
+    def __init__(self, driver, profiler:QueryProfiler):
+        self.driver = driver
+        self.profiler = profiler
+
+
+    def session(self, **kwargs):
+        return _ProfiledSession(self.driver.session(**kwargs), self, kwargs.get('database'))
+
+
+    def execute_query(self, query, parameters_=None, **kwargs):
+        params = dict(parameters_ or {}, **{key: value for key, value in kwargs.items() if not key.endswith('_')})
+        start = time.perf_counter()
+        try:
+            result = self.driver.execute_query(query, parameters_, **kwargs)
+        except Exception as e:
+            self.profiler.record(query, params, time.perf_counter() - start, 0, e, self.driver, kwargs.get('database_'))
+            raise
+        self.profiler.record(query, params, time.perf_counter() - start, len(result[0]), None,
+                             self.driver, kwargs.get('database_'))
+        return result
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.driver.close()
+        return False
+
+
+    def __getattr__(self, name):
+        return getattr(self.driver, name)
+
+
+
+def read_slow_log(path):
+    """ 讀取慢查詢記錄 (含輪替的 .1 ~ .N 檔案)，由舊到新回傳 list of dict；無法解析的行略過。 """
+    paths = []
+    index = 1
+    while os.path.exists(f'{path}.{index}'):
+        paths.insert(0, f'{path}.{index}')
+        index += 1
+    if os.path.exists(path):
+        paths.append(path)
+    entries = []
+    for log_path in paths:
+        with open(log_path, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entries.append(json.loads(line))
+                except json.JSONDecodeError:
+                    continue
+    return entries
+
+
+def summarize_slow_log(entries, top=20, sort='total_ms'):
+    """
+    依 fingerprint 彙總慢查詢記錄。
+
+    :return: list of {'fingerprint_id', 'fingerprint', 'count', 'total_ms', 'mean_ms', 'p95_ms', 'max_ms',
+        'mean_rows', 'max_db_hits', 'plan' (db hits 最多的一次 PROFILE), 'last_seen'}，依 sort 由大到小排序
+    """
+    groups = defaultdict(list)
+    for entry in entries:
+        groups[entry.get('fingerprint_id')].append(entry)
+
+    summaries = []
+    for key, group in groups.items():
+        latencies = sorted(entry.get('ms', 0) for entry in group)
+        profiled = [entry for entry in group if entry.get('db_hits') is not None]
+        heaviest = max(profiled, key=lambda entry: entry['db_hits']) if profiled else None
+        summaries.append({
+            'fingerprint_id': key,
+            'fingerprint': group[-1].get('fingerprint'),
+            'count': len(group),
+            'total_ms': round(sum(latencies), 2),
+            'mean_ms': round(sum(latencies) / len(latencies), 2),
+            'p95_ms': latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))],
+            'max_ms': latencies[-1],
+            'mean_rows': round(sum(entry.get('rows') or 0 for entry in group) / len(group), 1),
+            'max_db_hits': heaviest['db_hits'] if heaviest else None,
+            'plan': heaviest.get('plan') if heaviest else None,
+            'last_seen': group[-1].get('ts'),
+        })
+    summaries.sort(key=lambda summary: summary.get(sort) or 0, reverse=True)
+    return summaries[:top] if top else summaries
@@ -0,0 +1,272 @@
+"""
+KG 寫入的 write-behind 緩衝。
+
+kg_service 每收到一頁 TRIPLETS_ADD 就寫入一次 Neo4j，而 document、章節與常見 concept 幾乎每頁都會重複，
+大部分 MERGE 都是多餘的。TripletWriteBuffer 先累積多頁 triplets，達到數量或時間門檻 (或文件處理完成)
+時才合併成一個批次寫入，重複的節點與關聯在記憶體中只保留一份。
+
+每頁進入緩衝前先附加到 spill 檔 (JSONL，flush + fsync)，寫入成功後才刪除；
+process 中斷後以 replay() 重送，重送一律以 idempotent 模式寫入，避免重複建立 fact。
+寫入失敗時 (例如 KG 無法連線) 背景 thread 以退避間隔重試：第一次等待 max_delay，之後每次加倍，
+最多 max_retry_delay 秒；退避期間即使有逾時的頁面也不寫入，避免 KG 中斷時不斷重試。
+"""
+import json
+import os
+import threading
+import time
+
+import logging
+logger:logging.Logger = logging.getLogger(os.getenv('LOGGER_NAME'))
+
+
+FLUSHING_SUFFIX = '.flushing'
+
+
+
+class TripletWriteBuffer:
+    def __init__(self, kg_name, write_fn, spill_path, max_triplets=5000, max_delay=2.0, max_retry_delay=60.0):
+        """
+        :param write_fn: write_fn(pages, idempotent) -> dict，pages 為 list of (file_id, page_number, triplets)，
+            回傳值需包含 node_rows 與 relationship_rows (見 KnowledgeGraph.add_pages_batched)
+        :param spill_path: spill 檔路徑，寫入中的批次改名為 <spill_path>.flushing
+        :param max_triplets: 累積的 triplets 達到此數量時立即 flush
+        :param max_delay: 最早進入緩衝的頁面等待超過此秒數時 flush
+        :param max_retry_delay: 連續寫入失敗時重試間隔的上限 (秒)
+        """
+        self.kg_name = kg_name
+        self.write_fn = write_fn
+        self.spill_path = spill_path
+        self.max_triplets = max_triplets
+        self.max_delay = max_delay
+        self.max_retry_delay = max_retry_delay
+
+        self._pending:list = []                 # [(file_id, page_number, triplets)]
+        self._pending_triplets = 0
+        self._oldest = None                     # 最早一頁進入緩衝的時間
+        self._retry:list = []                   # 寫入失敗、等待重送的批次
+        self._retry_delay = 0.0                 # 目前的重試間隔，寫入成功後歸零
+        self._next_retry = 0.0                  # 下次可重試的時間 (time.monotonic)
+        self._lock = threading.Lock()           # 保護 _pending 與 spill 檔
+        self._flush_lock = threading.Lock()     # 同一時間只有一個 flush
+        self._wakeup = threading.Event()
+        self._closed = False
+
+        self.pages_in = 0
+        self.triplets_in = 0
+        self.flushes = 0
+        self.failures = 0
+        self.node_rows = 0
+        self.relationship_rows = 0
+        self.flushed_triplets = 0
+        self.last_latency = 0.0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+
+        os.makedirs(os.path.dirname(os.path.abspath(spill_path)), exist_ok=True)
+        try:
+            self.replay()
+        except Exception as e:
+            logger.warning(f"KG '{kg_name}' failed to replay spilled pages, will retry: {e}")
+        self._thread = threading.Thread(target=self._run, name=f'triplet-buffer-{kg_name}', daemon=True)
+        self._thread.start()
+
+
+    @staticmethod
+    def _read_spill(path):
+        pages = []
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    page = json.loads(line)
+                except json.JSONDecodeError:
+                    # 中斷時最後一行可能只寫了一半，該頁在 fsync 前並未被確認
+                    logger.warning(f"Skipping truncated line in spill file {path}")
+                    continue
+                pages.append((page['file_id'], page['page_number'], page['triplets']))
+        return pages
+
+
+    def replay(self):
+        """
+        重送上次中斷時留下的 spill 檔，回傳重送的頁數。
+        重送失敗時批次保留在 .flushing 檔，由之後的 flush 重試。
+        """
+        flushing_path = self.spill_path + FLUSHING_SUFFIX
+        pages = []
+        for path in (flushing_path, self.spill_path):
+            if os.path.exists(path):
+                pages += TripletWriteBuffer._read_spill(path)
+        if not pages:
+            return 0
+
+        # 合併成一個 .flushing 檔，之後進入的頁面寫入新的 spill 檔
+        with open(flushing_path + '.tmp', 'w', encoding='utf-8') as f:
+            for file_id, page_number, triplets in pages:
+                f.write(json.dumps({'file_id': file_id, 'page_number': page_number, 'triplets': triplets},
+                                   ensure_ascii=False) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(flushing_path + '.tmp', flushing_path)
+        if os.path.exists(self.spill_path):
+            os.remove(self.spill_path)
+
+        logger.info(f"KG '{self.kg_name}' replaying {len(pages)} spilled pages")
+        with self._flush_lock:
+            self._retry = pages
+        self.flush()
+        return len(pages)
+
+
+    def add(self, file_id, page_number, triplets):
+        """ 將一頁 triplets 放入緩衝；回傳前已寫入 spill 檔。 """
+        line = json.dumps({'file_id': file_id, 'page_number': page_number, 'triplets': triplets}, ensure_ascii=False)
+        with self._lock:
+            if self._closed:
+                raise RuntimeError(f"Triplet buffer of KG '{self.kg_name}' is closed")
+            with open(self.spill_path, 'a', encoding='utf-8') as f:
+                f.write(line + '\n')
+                f.flush()
+                os.fsync(f.fileno())
+            self._pending.append((file_id, page_number, triplets))
+            self._pending_triplets += len(triplets)
+            self.pages_in += 1
+            self.triplets_in += len(triplets)
+            if self._oldest is None:
+                self._oldest = time.monotonic()
+            full = self._pending_triplets >= self.max_triplets
+
+        if full and not self._backing_off():
+            try:
+                self.flush()
+            except Exception as e:
+                # 頁面已在 spill 檔與重試批次中，不影響呼叫端
+                logger.warning(f"KG '{self.kg_name}' triplet buffer flush failed, will retry: {e}")
+        else:
+            self._wakeup.set()
+
+
+    def _backing_off(self):
+        return bool(self._retry) and time.monotonic() < self._next_retry
+
+
+    def flush(self):
+        """
+        將緩衝中的頁面 (與先前失敗的批次) 合併寫入；回傳寫入的頁數。
+        直接呼叫時不受重試間隔限制；寫入失敗時加長背景 thread 的重試間隔。
+        """
+        with self._flush_lock:
+            try:
+                written = self._flush()
+            except Exception:
+                self._retry_delay = min(max(self._retry_delay * 2, self.max_delay), self.max_retry_delay)
+                self._next_retry = time.monotonic() + self._retry_delay
+                raise
+            self._retry_delay = 0.0
+            return written
+
+
+    def _flush(self):
+        # 需持有 _flush_lock
+        if self._retry:
+            # 先前失敗的批次可能已部分寫入，或 fact 去重 key 已記錄
+            self._write(self._retry, idempotent=True)
+            self._retry = []
+            os.remove(self.spill_path + FLUSHING_SUFFIX)
+
+        with self._lock:
+            pages, self._pending = self._pending, []
+            self._pending_triplets = 0
+            self._oldest = None
+            if not pages:
+                return 0
+            # 之後進入的頁面寫入新的 spill 檔
+            os.replace(self.spill_path, self.spill_path + FLUSHING_SUFFIX)
+
+        try:
+            self._write(pages, idempotent=False)
+        except Exception:
+            self._retry = pages
+            raise
+        os.remove(self.spill_path + FLUSHING_SUFFIX)
+        return len(pages)
+
+
+    def _write(self, pages, idempotent):
+        start = time.perf_counter()
+        try:
+            result = self.write_fn(pages, idempotent)
+        except Exception:
+            self.failures += 1
+            raise
+        latency = time.perf_counter() - start
+
+        self.flushes += 1
+        self.node_rows += result['node_rows']
+        self.relationship_rows += result['relationship_rows']
+        self.flushed_triplets += sum(len(triplets) for _, _, triplets in pages)
+        self.last_latency = latency
+        self.total_latency += latency
+        self.max_latency = max(self.max_latency, latency)
+        logger.verbose(f"KG '{self.kg_name}' flushed {len(pages)} pages in {latency:.3f}s: {result}")
+
+
+    def _run(self):
+        while not self._closed:
+            with self._lock:
+                oldest = self._oldest
+            if self._retry:
+                # 失敗的批次依退避間隔重試，期間逾時的頁面也一併等待
+                due = self._next_retry
+            elif oldest is not None:
+                due = oldest + self.max_delay
+            else:
+                self._wakeup.wait()
+                self._wakeup.clear()
+                continue
+
+            remaining = due - time.monotonic()
+            if remaining > 0:
+                self._wakeup.wait(remaining)
+                self._wakeup.clear()
+                continue
+
+            try:
+                self.flush()
+            except Exception as e:
+                logger.warning(f"KG '{self.kg_name}' triplet buffer flush failed, "
+                               f"will retry in {self._retry_delay:.1f}s: {e}")
+
+
+    def close(self):
+        """ 寫入剩餘頁面並停止背景 thread；寫入失敗時 spill 檔會保留到下次啟動重送。 """
+        with self._lock:
+            self._closed = True
+        self._wakeup.set()
+        self._thread.join()
+        self.flush()
+
+
+    def stats(self) -> dict:
+        """
+        coalescing_ratio：已寫入的 triplets 原本需要的節點與關聯寫入數 (每個 triplet 兩個節點、一條關聯)，
+        除以合併後實際寫入的列數。
+        """
+        rows = self.node_rows + self.relationship_rows
+        with self._lock:
+            pending_pages, pending_triplets = len(self._pending), self._pending_triplets
+        return {
+            'pages_in': self.pages_in,
+            'triplets_in': self.triplets_in,
+            'pending_pages': pending_pages,
+            'pending_triplets': pending_triplets,
+            'retry_pages': len(self._retry),
+            'retry_delay': self._retry_delay,
+            'flushes': self.flushes,
+            'failures': self.failures,
+            'node_rows': self.node_rows,
+            'relationship_rows': self.relationship_rows,
+            'coalescing_ratio': round(3 * self.flushed_triplets / rows, 2) if rows else None,
+            'flush_latency_last': round(self.last_latency, 4),
+            'flush_latency_mean': round(self.total_latency / self.flushes, 4) if self.flushes else None,
+            'flush_latency_max': round(self.max_latency, 4),
+        }
@@ -0,0 +1,170 @@
+"""
+頁面擷取結果的內容定址快取。
+
+同一份 PDF 重新匯入 (或不同檔案含有相同頁面) 時，每頁仍要多次呼叫 LLM 才能取得相同的結果。
+ExtractionCache 以 hash(正規化的頁面內容, prompt 版本, 模型) 為 key，保存 LLM 擷取出的
+(concept_facts, fact_pairs)；命中時 PdfRetriever 完全不呼叫 LLM，之後的 triplets 組合 (章節、meta) 照常進行，
+所以 TOC 或檔名改變不會使快取失效。
+
+- 頁面內容經 NFKC 正規化並合併空白，只有排版不同的頁面視為相同。
+- prompt 或擷取模式改變時應更新 prompt 版本，舊的結果不再命中，之後依 LRU 淘汰。
+- 以 SQLite 檔案保存，重啟後仍有效，多個 pdf_retriever process 可共用；
+  筆數或總大小超過上限時淘汰最久未使用的結果。筆數與總大小由 trigger 維護在單列的 extraction_meta，
+  每次 put 不必掃描整個表。
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+
+import logging
+logger:logging.Logger = logging.getLogger(os.getenv('LOGGER_NAME'))
+
+
+def normalize_page(page_content:str) -> str:
+    """ NFKC 正規化並合併連續空白。 """
+    return ' '.join(unicodedata.normalize('NFKC', page_content).split())
+
+
+def cache_key(page_content, prompt_version, model):
+    """ 回傳頁面擷取結果的 key (sha256 hex)。 """
+    raw = f"{prompt_version}\x1f{model}\x1f{normalize_page(page_content)}"
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+
+class ExtractionCache:
+    """
+    以 SQLite 檔案保存每頁的 (concept_facts, fact_pairs)。
+    命中時更新 last_used；新增結果後若超過 max_entries 或 max_bytes，依 last_used 淘汰最舊的結果。
+    """
+    _SCHEMA = [
+        """CREATE TABLE IF NOT EXISTS extraction (
+            key TEXT PRIMARY KEY,
+            value TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            last_used REAL NOT NULL
+        ) WITHOUT ROWID""",
+        "CREATE INDEX IF NOT EXISTS extraction_last_used ON extraction (last_used)",
+        """CREATE TABLE IF NOT EXISTS extraction_meta (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            entries INTEGER NOT NULL,
+            bytes INTEGER NOT NULL
+        )""",
+        # 沒有 extraction_meta 的舊檔案，以現有內容初始化一次
+        "INSERT OR IGNORE INTO extraction_meta SELECT 1, count(*), coalesce(sum(size), 0) FROM extraction",
+        """CREATE TRIGGER IF NOT EXISTS extraction_insert AFTER INSERT ON extraction BEGIN
+            UPDATE extraction_meta SET entries = entries + 1, bytes = bytes + new.size WHERE id = 1;
+        END""",
+        """CREATE TRIGGER IF NOT EXISTS extraction_delete AFTER DELETE ON extraction BEGIN
+            UPDATE extraction_meta SET entries = entries - 1, bytes = bytes - old.size WHERE id = 1;
+        END""",
+        """CREATE TRIGGER IF NOT EXISTS extraction_resize AFTER UPDATE OF size ON extraction BEGIN
+            UPDATE extraction_meta SET bytes = bytes + new.size - old.size WHERE id = 1;
+        END""",
+    ]
+
+    def __init__(self, path, max_entries=100_000, max_bytes=512 * 1024 * 1024, timeout=30):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.timeout = timeout
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        conn = self._connection()
+        conn.execute("PRAGMA journal_mode=WAL")
+        # 多個 process 同時建立時，以同一個交易建立表格、初始化 meta 與 trigger
+        conn.execute("BEGIN IMMEDIATE")
+        for statement in ExtractionCache._SCHEMA:
+            conn.execute(statement)
+        conn.commit()
+
+
+    def _connection(self):
+        # sqlite3 連線不可跨 thread 共用，每個 thread 各自開啟
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=self.timeout)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+
+    def get(self, key):
+        """ 回傳 (concept_facts, fact_pairs)；未命中時回傳 None。 """
+        conn = self._connection()
+        with conn:
+            row = conn.execute("SELECT value FROM extraction WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                conn.execute("UPDATE extraction SET last_used = ? WHERE key = ?", (time.time(), key))
+        with self._lock:
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        value = json.loads(row[0])
+        return value['concept_facts'], [tuple(pair) for pair in value['fact_pairs']]
+
+
+    def put(self, key, concept_facts, fact_pairs):
+        value = json.dumps({'concept_facts': concept_facts, 'fact_pairs': fact_pairs}, ensure_ascii=False)
+        size = len(value.encode('utf-8'))
+        conn = self._connection()
+        with conn:
+            # 以 upsert 取代 INSERT OR REPLACE：REPLACE 刪除舊列時不觸發 delete trigger
+            conn.execute("INSERT INTO extraction (key, value, size, last_used) VALUES (?, ?, ?, ?) "
+                         "ON CONFLICT (key) DO UPDATE SET value = excluded.value, size = excluded.size, "
+                         "last_used = excluded.last_used",
+                         (key, value, size, time.time()))
+            evicted = self._evict(conn)
+        if evicted:
+            with self._lock:
+                self.evictions += evicted
+            logger.debug(f"extraction cache evicted: {evicted}")
+
+
+    def _totals(self, conn):
+        return conn.execute("SELECT entries, bytes FROM extraction_meta WHERE id = 1").fetchone()
+
+
+    def _evict(self, conn) -> int:
+        entries, total = self._totals(conn)
+        if entries <= self.max_entries and total <= self.max_bytes:
+            return 0
+        victims = []
+        for key, size in conn.execute("SELECT key, size FROM extraction ORDER BY last_used"):
+            if entries <= self.max_entries and total <= self.max_bytes:
+                break
+            victims.append((key,))
+            entries -= 1
+            total -= size
+        conn.executemany("DELETE FROM extraction WHERE key = ?", victims)
+        return len(victims)
+
+
+    def stats(self) -> dict:
+        entries, total = self._totals(self._connection())
+        with self._lock:
+            return {
+                'entries': entries,
+                'bytes': total,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'disk_bytes': os.path.getsize(self.path) if os.path.exists(self.path) else 0,
+            }
+
+
+    def close(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
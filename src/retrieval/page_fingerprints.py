@@ -0,0 +1,110 @@
+"""
+增量重新匯入：以頁面指紋比對同一份文件的前後版本。
+
+修訂過的教科書原本只能以新的隨機 file_id 整份重新匯入，成本與全書頁數成正比，舊版本的節點也留在 KG 中。
+PdfRetriever 每次匯入後以 FingerprintStore 記錄 (kg_name, document_key) 最新版本的 file_id 與各頁指紋；
+增量匯入時沿用前一版的 file_id，以 diff_pages 比對前後版本的指紋序列：
+- 位置與內容都相同的頁面略過。
+- 內容改變、被移除或位置移動的舊頁面退役 (見 knowsys.page_provenance)。
+- 新增、改變或移動到新位置的頁面重新擷取；移動的頁面內容不變，由 extraction cache 取得結果，不呼叫 LLM。
+指紋為正規化頁面內容的 sha256 (與 extraction cache 相同的正規化)，只有排版不同的頁面視為未改變。
+"""
+import difflib
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+import logging
+logger:logging.Logger = logging.getLogger(os.getenv('LOGGER_NAME'))
+
+from retrieval.extraction_cache import normalize_page
+
+
+def page_fingerprint(page_content:str) -> str:
+    return hashlib.sha256(normalize_page(page_content).encode('utf-8')).hexdigest()
+
+
+def diff_pages(previous, current) -> dict:
+    """
+    比對前後版本的頁面指紋。
+    :param previous: 前一版各頁的指紋；上次未成功寫入的頁面為 None，與任何頁面都不相同
+    :param current: 這一版各頁的指紋
+    :return: {'unchanged', 'moved': 頁數, 'changed': 要重新擷取的新頁碼, 'retired': 要退役的舊頁碼}
+    """
+    matcher = difflib.SequenceMatcher(None, previous, current, autojunk=False)
+    unchanged = moved = 0
+    changed, retired = [], []
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == 'equal':
+            if i1 == j1:
+                unchanged += i2 - i1
+                continue
+            moved += i2 - i1
+        retired.extend(range(i1, i2))
+        changed.extend(range(j1, j2))
+    return {
+        'unchanged': unchanged,
+        'moved': moved,
+        'changed': changed,
+        'retired': retired,
+    }
+
+
+
+class FingerprintStore:
+    """ 以 SQLite 檔案保存各文件最新版本的 file_id 與頁面指紋，多個 pdf_retriever process 可共用。 """
+    def __init__(self, path, timeout=30):
+        self.path = path
+        self.timeout = timeout
+        self._local = threading.local()
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        conn = self._connection()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("""CREATE TABLE IF NOT EXISTS document (
+            kg_name TEXT NOT NULL,
+            document_key TEXT NOT NULL,
+            file_id TEXT NOT NULL,
+            fingerprints TEXT NOT NULL,
+            updated_at REAL NOT NULL,
+            PRIMARY KEY (kg_name, document_key)
+        ) WITHOUT ROWID""")
+        conn.commit()
+
+
+    def _connection(self):
+        # sqlite3 連線不可跨 thread 共用，每個 thread 各自開啟
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=self.timeout)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+
+    def get(self, kg_name, document_key):
+        """ 回傳 {'file_id', 'fingerprints', 'updated_at'}；沒有記錄時回傳 None。 """
+        row = self._connection().execute(
+            "SELECT file_id, fingerprints, updated_at FROM document WHERE kg_name = ? AND document_key = ?",
+            (kg_name, document_key)).fetchone()
+        if row is None:
+            return None
+        return {'file_id': row[0], 'fingerprints': json.loads(row[1]), 'updated_at': row[2]}
+
+
+    def put(self, kg_name, document_key, file_id, fingerprints):
+        conn = self._connection()
+        with conn:
+            conn.execute("INSERT OR REPLACE INTO document (kg_name, document_key, file_id, fingerprints, updated_at) "
+                         "VALUES (?, ?, ?, ?, ?)",
+                         (kg_name, document_key, file_id, json.dumps(fingerprints), time.time()))
+
+
+    def close(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
@@ -0,0 +1,119 @@
+"""
+PdfRetriever 的並行頁面處理。
+
+每頁的 triplets 擷取需要 3~6 次阻塞的 LLM 呼叫 (facts、concepts 與 facts 關聯，後兩者可能遞迴)，
+過去逐頁依序處理，300 頁的書需要數小時，LLM 後端大部分時間閒置。PagePipeline 以 thread pool 同時處理多頁：
+- 同時擷取的頁數上限為 concurrency；已送出但尚未發佈的頁數上限為 max_pending，避免整本書的結果堆在記憶體。
+- 每頁各自重試 (max_attempts)，失敗的頁面略過，不影響其他頁。
+- ordered 時依頁碼順序發佈 (較晚完成的頁面先暫存)，否則完成即發佈；TRIPLETS_ADD 本身帶有 page_number。
+發佈 (publish_page) 一律在呼叫 run() 的 thread 上執行。
+"""
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+import os
+import time
+
+import logging
+logger:logging.Logger = logging.getLogger(os.getenv('LOGGER_NAME'))
+
+
+
+class PagePipeline:
+    def __init__(self, process_page, publish_page, concurrency=4, max_attempts=3, ordered=True, max_pending=None):
+        """
+        :param process_page: fn(page_number, page_content) -> result，在 pool 的 thread 上執行，拋出例外時重試
+        :param publish_page: fn(page_number, result)，依 ordered 的順序在 run() 的 thread 上呼叫
+        :param concurrency: 同時處理的頁數
+        :param max_attempts: 每頁的嘗試次數
+        :param ordered: True 時依頁碼順序發佈
+        :param max_pending: 已送出但尚未發佈的頁數上限，預設為 concurrency 的 2 倍
+        """
+        self.process_page = process_page
+        self.publish_page = publish_page
+        self.concurrency = max(1, concurrency)
+        self.max_attempts = max(1, max_attempts)
+        self.ordered = ordered
+        self.max_pending = max(self.concurrency, max_pending or self.concurrency * 2)
+
+
+    def _process(self, page_number, page_content):
+        """ 回傳 (是否成功, 結果, 耗時秒數)。 """
+        start = time.perf_counter()
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                return True, self.process_page(page_number, page_content), time.perf_counter() - start
+            except Exception as e:
+                logger.warning(f"Error processing page {page_number} (Attempt {attempt}/{self.max_attempts})")
+                logger.exception(e)
+        logger.error(f"Skipping page {page_number} after {self.max_attempts} failed attempts.")
+        return False, None, time.perf_counter() - start
+
+
+    def _publish(self, page_number, ok, result):
+        if not ok:
+            return False
+        try:
+            self.publish_page(page_number, result)
+            return True
+        except Exception as e:
+            logger.error(f"Error publishing page {page_number}")
+            logger.exception(e)
+            return False
+
+
+    def run(self, pages, page_numbers=None) -> dict:
+        """
+        處理所有頁面，全部發佈 (或略過) 後回傳統計資料。
+        :param pages: 依頁碼排列的頁面內容
+        :param page_numbers: 只處理這些頁碼 (增量匯入)，預設為全部頁面
+        """
+        start = time.perf_counter()
+        page_numbers = list(range(len(pages))) if page_numbers is None else sorted(page_numbers)
+        queue = iter((page_number, pages[page_number]) for page_number in page_numbers)
+        pending = {}            # future -> page_number
+        completed = {}          # page_number -> (ok, result)，等待依序發佈
+        next_index = 0          # 下一個依序發佈的頁碼在 page_numbers 中的位置
+        page_seconds = []
+        published = failed = 0
+
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix='page-pipeline') as executor:
+            def submit():
+                while len(pending) + len(completed) < self.max_pending:
+                    page = next(queue, None)
+                    if page is None:
+                        return
+                    pending[executor.submit(self._process, *page)] = page[0]
+
+            submit()
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    ok, result, seconds = future.result()
+                    completed[pending.pop(future)] = (ok, result)
+                    page_seconds.append(seconds)
+
+                if self.ordered:
+                    ready = []
+                    while next_index < len(page_numbers) and page_numbers[next_index] in completed:
+                        ready.append(page_numbers[next_index])
+                        next_index += 1
+                else:
+                    ready = sorted(completed)
+                for page_number in ready:
+                    if self._publish(page_number, *completed.pop(page_number)):
+                        published += 1
+                    else:
+                        failed += 1
+                submit()
+
+        seconds = time.perf_counter() - start
+        stats = {
+            'pages': published + failed,
+            'published': published,
+            'failed': failed,
+            'concurrency': self.concurrency,
+            'seconds': round(seconds, 2),
+            'pages_per_minute': round((published + failed) / seconds * 60, 1) if seconds > 0 else None,
+            'mean_page_seconds': round(sum(page_seconds) / len(page_seconds), 2) if page_seconds else None,
+        }
+        logger.info(f"Page pipeline finished: {stats}")
+        return stats
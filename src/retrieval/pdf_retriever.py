@@ -8,29 +8,59 @@ app_helper.initialize(os.path.splitext(os.path.basename(__file__))[0])
 ###
 
 import ast
+import threading
+import time
 import logging
 logger:logging.Logger = logging.getLogger(os.getenv('LOGGER_NAME'))
 
 from agentflow.core.agent import Agent
 from agentflow.core.parcel import BinaryParcel, Parcel, TextParcel
+from knowsys.bulk_import import spool_page
 from services.file_service import FileService
 from services.kg_service import Topic
 from services.llm_service import LlmService
 from retrieval import part_str
 # import retrieval.extract_tool as et
 from retrieval.extract_tool import FactConceptExtractor, SectionPairer
+from retrieval.extraction_cache import ExtractionCache, cache_key
+from retrieval.page_fingerprints import FingerprintStore, diff_pages, page_fingerprint
+from retrieval.page_pipeline import PagePipeline
 from retrieval.pdf_tool import PdfImport
+from retrieval.structured_extraction import PROMPT_VERSION, ExtractionStats, extract_page
 
 
 
 class PdfRetriever(Agent):
     TOPIC_FILE_UPLOAD = "FileUpload/Pdf/Retrieval"
     TOPIC_RETRIEVED = "Retrieved/Pdf/Retrieval"
+    # 修改 chain 模式的 prompt 時遞增，使 extraction cache 中舊 prompt 的結果不再命中
+    CHAIN_PROMPT_VERSION = 1
 
 
     def __init__(self, config:dict):
         logger.debug(f"config: {config}")
         super().__init__(name='pdf.retrieval.wp', agent_config=config)
+        retrieval_cfg = config.get('retrieval', {})
+        # 同時擷取的頁數；1 為逐頁處理
+        self.page_concurrency = retrieval_cfg.get('page_concurrency', 4)
+        self.page_attempts = retrieval_cfg.get('page_attempts', 3)
+        self.ordered_publish = retrieval_cfg.get('ordered_publish', True)
+        # chain：facts、concepts、關聯依序擷取；structured：一次 JSON schema 請求，只對缺口補問
+        self.extraction_mode = retrieval_cfg.get('extraction_mode', 'chain')
+        self.max_followups = retrieval_cfg.get('max_followups', 1)
+        self._page_local = threading.local()     # 目前頁面的 ExtractionStats (每頁在 pipeline 的 thread 上處理)
+        # 擷取結果快取；空字串停用。llm_model 區分不同模型的結果
+        self.llm_model = config.get('llm_model', '')
+        cache_path = retrieval_cfg.get('extraction_cache', '_cache/extraction.sqlite3')
+        self.extraction_cache = ExtractionCache(
+            cache_path,
+            max_entries=retrieval_cfg.get('cache_max_entries', 100_000),
+            max_bytes=retrieval_cfg.get('cache_max_mb', 512) * 1024 * 1024) if cache_path else None
+        if self.extraction_cache:
+            logger.info(f"Extraction cache: {cache_path}, model: {self.llm_model}")
+        # 各文件最新版本的頁面指紋，供增量匯入比對；空字串停用
+        fingerprint_path = retrieval_cfg.get('fingerprint_store', '_cache/fingerprints.sqlite3')
+        self.fingerprint_store = FingerprintStore(fingerprint_path) if fingerprint_path else None
 
 
     def on_connected(self):
@@ -41,6 +71,11 @@ class PdfRetriever(Agent):
     def _handle_retrieval(self, topic, pcl:BinaryParcel):
         # Upload the file
         kg_name = pcl.content.get('kg_name', 0)
+        # 離線匯入模式：triplets 累積到 bulk_dir，之後以 docker_utility.py import 一次匯入
+        bulk_dir = pcl.content.get('bulk_dir')
+        # 增量模式：只重新擷取與前一版 (同 kg_name 與 document_key) 相比新增或改變的頁面
+        incremental = pcl.content.get('incremental', False)
+        document_key = pcl.content.get('document_key') or pcl.content.get('filename')
         # logger.info(f"topic: {topic}, pcl: {pcl}")
         
         pcl_file:Parcel = self.publish_sync(FileService.TOPIC_FILE_UPLOAD, pcl, timeout=40)
@@ -60,6 +95,34 @@ class PdfRetriever(Agent):
         logger.verbose(f"topic_triplets_add: {topic_triplets_add}")
 
         pages = self.read_pages(file_info['file_path'])
+        fingerprints = [page_fingerprint(page_content) for page_content in pages]
+        # 寫入 KG 的 file_id；增量模式沿用前一版的 file_id
+        file_id = file_info['file_id']
+        page_numbers = None
+        incremental_stats = None
+        if incremental and (bulk_dir or not self.fingerprint_store):
+            logger.warning("Incremental ingestion needs an online KG and a fingerprint store, ingesting all pages.")
+        elif incremental:
+            previous = self.fingerprint_store.get(kg_name, document_key)
+            if previous:
+                file_id = previous['file_id']
+                diff = diff_pages(previous['fingerprints'], fingerprints)
+                page_numbers = diff['changed']
+                incremental_stats = {k: v for k, v in diff.items() if k not in ('changed', 'retired')}
+                incremental_stats.update({'document_key': document_key, 'changed': len(diff['changed']),
+                                          'retired': len(diff['retired'])})
+                if diff['retired']:
+                    # 先撤下舊頁面，之後重新擷取的頁面才不會被去重略過
+                    pcl_retire = TextParcel({
+                        'kg_name': kg_name,
+                        'file_id': file_id,
+                        'page_numbers': diff['retired'],
+                    })
+                    incremental_stats['retirement'] = self.publish_sync(Topic.PAGES_RETIRE.value, pcl_retire,
+                                                                        timeout=120).content
+                logger.info(f"Incremental ingestion of '{document_key}': {incremental_stats}")
+            else:
+                logger.info(f"No previous version of '{document_key}' in KG '{kg_name}', ingesting all pages.")
 
         meta = file_info.get('meta', {})
         meta['filename'] = file_info['filename']
@@ -74,39 +137,58 @@ class PdfRetriever(Agent):
                 file_info['toc'] if 'toc' in file_info else [])]
         logger.debug(f"toc: {toc}")
 
-        def process_page(page_number, page_content, file_info, kg_name, topic_triplets_add):
-            """Process a single page, extracting and publishing triplets."""
+        extraction_stats = ExtractionStats(self.extraction_mode)
+
+        def process_page(page_number, page_content):
+            """Extract the triplets of a single page; runs on the page pipeline's pool."""
             logger.info(f"Page {page_number}: {part_str(page_content, 150)}")
             sections = self.locate_sections(page_number, toc)
             logger.debug(f"sections: {sections}")
-            triplets = self.extract_triplets(page_content, sections, meta)
+            self._page_local.stats = extraction_stats
+            try:
+                triplets = self.extract_triplets(page_content, sections, meta)
+            finally:
+                self._page_local.stats = None
+            extraction_stats.add_page(len(triplets))
             logger.verbose(f"triplets: {triplets[:5]}..")
-            self.publish(topic_triplets_add, {
-                'file_id': file_info['file_id'],
-                'page_number': page_number,
-                'kg_name': kg_name,
-                'triplets': triplets,
-            })
-
-        for page_number, page_content in enumerate(pages):
-            max_attempts = 3
-            attempt = 0
-            # Retry processing the page if an error occurs in max_attempts times.
-            while attempt < max_attempts:
-                try:
-                    process_page(page_number, page_content, file_info, kg_name, topic_triplets_add)
-                    break  # Exit loop if successful
-                except Exception as e:
-                    attempt += 1
-                    logger.warning(f"Error processing page {page_number} (Attempt {attempt}/{max_attempts})")
-                    logger.exception(e)
-                    if attempt == max_attempts:
-                        logger.error(f"Skipping page {page_number} after {max_attempts} failed attempts.")
-                        
+            return triplets
+
+        published_pages = set()
+
+        def publish_page(page_number, triplets):
+            if bulk_dir:
+                spool_page(bulk_dir, file_id, page_number, triplets)
+            else:
+                self.publish(topic_triplets_add, {
+                    'file_id': file_id,
+                    'page_number': page_number,
+                    'kg_name': kg_name,
+                    'triplets': triplets,
+                })
+            published_pages.add(page_number)
+
+        pipeline = PagePipeline(process_page, publish_page, concurrency=self.page_concurrency,
+                                max_attempts=self.page_attempts, ordered=self.ordered_publish)
+        stats = pipeline.run(pages, page_numbers)
+        stats['extraction'] = extraction_stats.to_dict()
+        if self.extraction_cache:
+            stats['extraction_cache'] = self.extraction_cache.stats()
+        if incremental_stats:
+            stats['incremental'] = incremental_stats
+        logger.info(f"File '{file_info['filename']}' retrieved: {stats}")
+
+        if self.fingerprint_store:
+            # 未成功寫入的頁面記為 None，下次增量匯入時重新擷取
+            skipped = set(range(len(pages))).difference(page_numbers) if page_numbers is not None else set()
+            self.fingerprint_store.put(kg_name, document_key, file_id, [
+                fingerprint if page_number in published_pages or page_number in skipped else None
+                for page_number, fingerprint in enumerate(fingerprints)])
+
         self.publish(PdfRetriever.TOPIC_RETRIEVED, {
-            'file_id': file_info['file_id'],
+            'file_id': file_id,
             'filename': file_info['filename'],
             'kg_name': kg_name,
+            'stats': stats,
         })
         
 
@@ -182,6 +264,28 @@ class PdfRetriever(Agent):
         # ]
 
 
+    def _prompt_llm(self, messages, response_format=None) -> str:
+        """ 送出一次 LLM 請求並回傳回覆，呼叫數、時間與 token 用量記入目前頁面的 ExtractionStats。 """
+        params = {
+            'messages': messages,
+        }
+        if response_format:
+            params['response_format'] = response_format
+        pcl = TextParcel(params)
+        logger.verbose(f"pcl: {pcl}")
+
+        start = time.perf_counter()
+        content = self._request_llm(pcl)
+        if stats := getattr(self._page_local, 'stats', None):
+            stats.add_call(time.perf_counter() - start, content.get('usage'))
+        return content['response']
+
+
+    def _request_llm(self, pcl:TextParcel) -> dict:
+        """ 經由 LlmService 送出請求，回傳 {'response', 'usage'}。 """
+        return self.publish_sync(LlmService.TOPIC_LLM_PROMPT, pcl).content
+
+
     def _extract_facts(self, page_content):
         messages = [
         {"role": "system", "content": """You are a helpful assistant that extracts nouns, noun phrases, gerunds (verbs 
@@ -217,14 +321,7 @@ Output: Hattie, hopefuls, stand
         }
         ]
         
-        params = {
-            'messages': messages,
-        }            
-        pcl = TextParcel(params)
-        logger.verbose(f"pcl: {pcl}")
-
-        chat_response = self.publish_sync(LlmService.TOPIC_LLM_PROMPT, pcl)
-        facts_text = chat_response.content['response'].strip()
+        facts_text = self._prompt_llm(messages).strip()
         logger.verbose(f"facts: {facts_text}")
         facts = list(set([fact.strip() for fact in facts_text.split(',') if fact.strip()]))
         # facts = list(set([fact.strip() for fact in facts_text.split(',')]))
@@ -281,12 +378,7 @@ Example output:
             {"role": "system", "content": "You are a helpful assistant."},
             {"role": "user", "content": prompt},
         ]
-        params = {"messages": messages}
-        pcl = TextParcel(params)
-        logger.verbose(f"pcl: {pcl}")
-
-        chat_response = self.publish_sync(LlmService.TOPIC_LLM_PROMPT, pcl)
-        concepts_text = chat_response.content["response"].strip()
+        concepts_text = self._prompt_llm(messages).strip()
         logger.verbose(f"concepts_text: {concepts_text}")
 
         concepts_dict = app_helper.load_json(concepts_text) or {}
@@ -359,15 +451,8 @@ Example output:
             {"role": "user", "content": prompt}
         ]
         
-        params = {
-            'messages': messages,
-        }            
-        pcl = TextParcel(params)
-        logger.verbose(f"pcl: {pcl}")
-
         # Sending the prompt to the LLM service
-        chat_response = self.publish_sync(LlmService.TOPIC_LLM_PROMPT, pcl)
-        relationships_text = chat_response.content['response'].strip()
+        relationships_text = self._prompt_llm(messages).strip()
         logger.verbose(f"relationships_text: {relationships_text}")
 
         fact_pairs_0 = ast.literal_eval(relationships_text.strip())
@@ -480,7 +565,8 @@ Example output:
         return triplets
 
 
-    def extract_triplets(self, page_content, sections, meta) -> list[tuple[dict, dict, dict]]:
+    def _extract_chain(self, page_content):
+        """ chain 模式：依序擷取 facts、concepts 與 facts 關聯，回傳 (concept_facts, fact_pairs)。 """
         factes = self._extract_facts(page_content)
         concept_facts = self._extract_concepts(factes, page_content)
         identified_facts = {fact for facts in concept_facts.values() for fact in facts}
@@ -491,6 +577,40 @@ Example output:
         logger.debug(f"new_concept_facts: {new_concept_facts}")
         
         concept_facts.update(new_concept_facts)
+        return concept_facts, fact_pairs
+
+
+    def _prompt_version(self):
+        if self.extraction_mode == 'structured':
+            # 補問次數會改變結果
+            return f"structured.v{PROMPT_VERSION}.f{self.max_followups}"
+        return f"chain.v{PdfRetriever.CHAIN_PROMPT_VERSION}"
+
+
+    def _extract(self, page_content):
+        """ 擷取一頁的 (concept_facts, fact_pairs)；extraction cache 命中時不呼叫 LLM。 """
+        key = None
+        if self.extraction_cache:
+            key = cache_key(page_content, self._prompt_version(), self.llm_model)
+            cached = self.extraction_cache.get(key)
+            if stats := getattr(self._page_local, 'stats', None):
+                stats.add_cache(cached is not None)
+            if cached is not None:
+                logger.debug(f"extraction cache hit: {key[:12]}")
+                return cached
+
+        if self.extraction_mode == 'structured':
+            concept_facts, fact_pairs = extract_page(page_content, self._prompt_llm, self.max_followups)
+        else:
+            concept_facts, fact_pairs = self._extract_chain(page_content)
+
+        if key:
+            self.extraction_cache.put(key, concept_facts, fact_pairs)
+        return concept_facts, fact_pairs
+
+
+    def extract_triplets(self, page_content, sections, meta) -> list[tuple[dict, dict, dict]]:
+        concept_facts, fact_pairs = self._extract(page_content)
         
         triplets = self._pair_sections(sections, meta)
         triplets.extend(self._pair_concepts_to_section(sections, concept_facts.keys()))
@@ -540,6 +660,9 @@ if __name__ == '__main__':
     os.environ['OPENAI_API_KEY'] = openai_api_key
     logger.info(f"OPENAI_API_KEY: {openai_api_key[:10]}***{openai_api_key[-5:]}")
     
-    agent = PdfRetriever(app_helper.get_agent_config())
+    config = app_helper.get_agent_config()
+    config['retrieval'] = app_helper.config['service'].get('retrieval', {})
+    config['llm_model'] = LlmService.model_name(app_helper.config['service']['llm'])
+    agent = PdfRetriever(config)
     agent.start_process()
     app_helper.wait_agent(agent)
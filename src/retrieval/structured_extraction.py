@@ -0,0 +1,253 @@
+"""
+每頁一次的結構化擷取 (extraction_mode = "structured")。
+
+原本的 chain 模式每頁依序呼叫 LLM 擷取 facts、concepts (對未歸類的 facts 遞迴)、facts 關聯 (對沒有關聯的 facts 遞迴)
+以及新 facts 的 concepts，每次都重送整頁內容。structured 模式以一次 JSON schema 限制輸出的請求
+同時取得 facts、concept -> facts 與 facts 關聯，在本地驗證後只對剩下的缺口 (沒有 concept 的 facts、
+沒有任何關聯的 facts) 再送一次針對性的請求。結果與 chain 模式相同為 (concept_facts, fact_pairs)，
+之後的 triplets 組合不變。
+
+ExtractionStats 累計兩種模式的 LLM 呼叫數、token 用量、時間、triplets 數與 extraction cache 命中數，用於比較。
+"""
+import json
+import os
+import threading
+
+import logging
+logger:logging.Logger = logging.getLogger(os.getenv('LOGGER_NAME'))
+
+
+# 修改 prompt 或 schema 時遞增，使 extraction cache 中舊 prompt 的結果不再命中
+PROMPT_VERSION = 1
+
+_STRING_LIST = {"type": "array", "items": {"type": "string"}}
+
+# OpenAI structured outputs (strict) 不允許任意 key 的 object，concept -> facts 以 list of objects 表示
+EXTRACTION_SCHEMA = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "page_extraction",
+        "strict": True,
+        "schema": {
+            "type": "object",
+            "properties": {
+                "facts": _STRING_LIST,
+                "concepts": {
+                    "type": "array",
+                    "items": {
+                        "type": "object",
+                        "properties": {"concept": {"type": "string"}, "facts": _STRING_LIST},
+                        "required": ["concept", "facts"],
+                        "additionalProperties": False,
+                    },
+                },
+                "relationships": {
+                    "type": "array",
+                    "items": {
+                        "type": "object",
+                        "properties": {
+                            "subject": {"type": "string"},
+                            "relation": {"type": "string"},
+                            "object": {"type": "string"},
+                        },
+                        "required": ["subject", "relation", "object"],
+                        "additionalProperties": False,
+                    },
+                },
+            },
+            "required": ["facts", "concepts", "relationships"],
+            "additionalProperties": False,
+        },
+    },
+}
+
+
+_SYSTEM_PROMPT = """You are a helpful assistant that builds a knowledge graph from an article. From the article:
+1. facts: extract the nouns, noun phrases, gerunds (verbs used as nouns), time, quantities with units, the content inside
+   parentheses (list items separately), proper nouns with their modifiers, and multi-word entities including adjectives.
+   Avoid simple verbs or be verbs.
+2. concepts: group every fact under one or more concepts (hypernyms). Concepts are general terms that group related facts.
+3. relationships: relate the facts to each other (causal, geographical, part-of, etc.) as subject, relation, object,
+   where subject and object are facts.
+Write facts, concepts and relations in the same language as the article. Every fact should belong to a concept and
+appear in at least one relationship."""
+
+
+_FOLLOWUP_PROMPT = """Given the following article:
+{page_content}
+
+Some facts extracted from this article are incomplete.
+Facts without a concept: {ungrouped}
+Facts without any relationship: {isolated}
+
+Return the concepts (hypernyms) of the facts without a concept, and relationships that involve the facts without any
+relationship (the other end may be any fact of the article). Use the same language as the article."""
+
+
+
+def extraction_messages(page_content):
+    return [
+        {"role": "system", "content": _SYSTEM_PROMPT},
+        {"role": "user", "content": f"Article:\n{page_content}"},
+    ]
+
+
+def followup_messages(page_content, gaps):
+    prompt = _FOLLOWUP_PROMPT.format(page_content=page_content,
+                                     ungrouped=json.dumps(gaps['ungrouped'], ensure_ascii=False),
+                                     isolated=json.dumps(gaps['isolated'], ensure_ascii=False))
+    return [
+        {"role": "system", "content": _SYSTEM_PROMPT},
+        {"role": "user", "content": prompt},
+    ]
+
+
+def _text(value):
+    return value.strip() if isinstance(value, str) else ''
+
+
+def parse_extraction(response):
+    """
+    驗證並整理模型的輸出：去除空白與空字串、合併重複的 concept、去除重複的關聯。
+    :param response: 模型回傳的 JSON 字串 (或已解析的 dict)
+    :return: {'facts': [...], 'concept_facts': {concept: [facts]}, 'fact_pairs': [(subject, relation, object)]}
+    :raise ValueError: 不是符合 EXTRACTION_SCHEMA 的 JSON
+    """
+    # 輸出受 JSON schema 限制，不需 app_helper.load_json 的修補；JSONDecodeError 為 ValueError 的子類別
+    data = json.loads(response) if isinstance(response, str) else response
+    if not isinstance(data, dict):
+        raise ValueError(f"Extraction is not a JSON object: {str(response)[:200]}")
+    for key in ('facts', 'concepts', 'relationships'):
+        if not isinstance(data.get(key, []), list):
+            raise ValueError(f"Extraction '{key}' is not a list: {str(response)[:200]}")
+
+    facts = list(dict.fromkeys(fact for fact in map(_text, data.get('facts', [])) if fact))
+    concept_facts = {}
+    for item in data.get('concepts', []):
+        if not isinstance(item, dict):
+            continue
+        concept = _text(item.get('concept'))
+        members = [fact for fact in map(_text, item.get('facts') or []) if fact]
+        if concept and members:
+            grouped = concept_facts.setdefault(concept, [])
+            grouped.extend(fact for fact in members if fact not in grouped)
+    fact_pairs = []
+    for item in data.get('relationships', []):
+        if not isinstance(item, dict):
+            continue
+        pair = (_text(item.get('subject')), _text(item.get('relation')), _text(item.get('object')))
+        if all(pair) and pair not in fact_pairs:
+            fact_pairs.append(pair)
+    return {'facts': facts, 'concept_facts': concept_facts, 'fact_pairs': fact_pairs}
+
+
+def find_gaps(extraction):
+    """
+    找出需要補問的缺口，與 chain 模式遞迴補問的條件相同：
+    - ungrouped：出現在 facts 或關聯中、但不屬於任何 concept 的 facts。
+    - isolated：屬於 concept 但沒有任何關聯的 facts；只有一個時不補問。
+    """
+    grouped = {fact for facts in extraction['concept_facts'].values() for fact in facts}
+    related = {fact for subject, _, obj in extraction['fact_pairs'] for fact in (subject, obj)}
+    mentioned = list(dict.fromkeys(extraction['facts'] + [fact for subject, _, obj in extraction['fact_pairs']
+                                                          for fact in (subject, obj)]))
+    ungrouped = [fact for fact in mentioned if fact not in grouped]
+    isolated = [fact for fact in dict.fromkeys(fact for facts in extraction['concept_facts'].values() for fact in facts)
+                if fact not in related]
+    return {'ungrouped': ungrouped, 'isolated': isolated if len(isolated) > 1 else []}
+
+
+def merge_extraction(extraction, followup):
+    """ 將補問的結果併入 extraction。 """
+    for fact in followup['facts']:
+        if fact not in extraction['facts']:
+            extraction['facts'].append(fact)
+    for concept, facts in followup['concept_facts'].items():
+        grouped = extraction['concept_facts'].setdefault(concept, [])
+        grouped.extend(fact for fact in facts if fact not in grouped)
+    for pair in followup['fact_pairs']:
+        if pair not in extraction['fact_pairs']:
+            extraction['fact_pairs'].append(pair)
+    return extraction
+
+
+def extract_page(page_content, prompt_llm, max_followups=1):
+    """
+    以結構化輸出擷取一頁。
+    :param prompt_llm: fn(messages, response_format) -> 模型回傳的字串
+    :param max_followups: 針對缺口補問的次數上限
+    :return: (concept_facts, fact_pairs)，與 chain 模式相同
+    """
+    extraction = parse_extraction(prompt_llm(extraction_messages(page_content), EXTRACTION_SCHEMA))
+    for _ in range(max_followups):
+        gaps = find_gaps(extraction)
+        if not gaps['ungrouped'] and not gaps['isolated']:
+            break
+        logger.debug(f"extraction gaps: {gaps}")
+        merge_extraction(extraction, parse_extraction(prompt_llm(followup_messages(page_content, gaps), EXTRACTION_SCHEMA)))
+
+    gaps = find_gaps(extraction)
+    if gaps['ungrouped'] or gaps['isolated']:
+        logger.warning(f"extraction gaps remain: {gaps}")
+    return extraction['concept_facts'], extraction['fact_pairs']
+
+
+
+class ExtractionStats:
+    """ 累計擷取的 LLM 呼叫數、token 用量、LLM 時間、triplets 數與快取命中數；各頁在不同 thread 上更新。 """
+    def __init__(self, mode):
+        self.mode = mode
+        self._lock = threading.Lock()
+        self.pages = 0
+        self.triplets = 0
+        self.llm_calls = 0
+        self.llm_seconds = 0.0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+
+    def add_call(self, seconds, usage):
+        with self._lock:
+            self.llm_calls += 1
+            self.llm_seconds += seconds
+            if usage:
+                self.prompt_tokens += usage.get('prompt_tokens') or 0
+                self.completion_tokens += usage.get('completion_tokens') or 0
+
+
+    def add_cache(self, hit):
+        with self._lock:
+            if hit:
+                self.cache_hits += 1
+            else:
+                self.cache_misses += 1
+
+
+    def add_page(self, triplets):
+        with self._lock:
+            self.pages += 1
+            self.triplets += triplets
+
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            pages = self.pages or 1
+            return {
+                'extraction_mode': self.mode,
+                'pages': self.pages,
+                'triplets': self.triplets,
+                'llm_calls': self.llm_calls,
+                'prompt_tokens': self.prompt_tokens,
+                'completion_tokens': self.completion_tokens,
+                'llm_seconds': round(self.llm_seconds, 2),
+                'cache_hits': self.cache_hits,
+                'cache_misses': self.cache_misses,
+                'per_page': {
+                    'triplets': round(self.triplets / pages, 1),
+                    'llm_calls': round(self.llm_calls / pages, 2),
+                    'tokens': round((self.prompt_tokens + self.completion_tokens) / pages, 1),
+                    'llm_seconds': round(self.llm_seconds / pages, 2),
+                },
+            }
@@ -5,8 +5,10 @@ import app_helper
 app_helper.initialize(os.path.splitext(os.path.basename(__file__))[0])
 ###
 
+import contextlib
 from enum import StrEnum, auto
 import os
+import threading
 import time
 
 from agentflow.core.agent import Agent
@@ -15,8 +17,16 @@ from agentflow.core.parcel import TextParcel
 import logging
 logger:logging.Logger = logging.getLogger(os.getenv('LOGGER_NAME'))
 
+from knowsys.concept_cache import ConceptQueryCache, concept_key
+from knowsys.dedupe_store import SqliteDedupeStore, TieredDedupeStore
 from knowsys.docker_management import DockerManager
+from knowsys.driver_registry import DriverRegistry
+from knowsys.graph_snapshot import GraphSnapshot
+from knowsys.kg_dispatcher import READ, WRITE, KGDispatcher
+from knowsys.query_profiler import QueryProfiler
+from knowsys.kg_lifecycle import DockerContainerBackend, KGLifecycleManager
 from knowsys.knowledge_graph import KnowledgeGraph
+from knowsys.triplet_buffer import TripletWriteBuffer
 
 
 
@@ -29,9 +39,17 @@ class Topic(StrEnum):
     CREATE = auto()
     ACCESS_POINT = auto()
     TRIPLETS_ADD = auto()
+    PAGES_RETIRE = auto()
     CONCEPTS_QUERY = auto()
+    CONCEPTS_BATCH_QUERY = auto()
     # FACTS_QUERY = auto()
     SECTIONS_QUERY = auto()
+    METRICS = auto()
+
+
+# 與 PdfRetriever.TOPIC_RETRIEVED 相同；pdf_retriever 匯入本模組，無法反向匯入
+TOPIC_PDF_RETRIEVED = "Retrieved/Pdf/Retrieval"
+SPILL_PREFIX = '_triplets_'
     
     
     
@@ -43,12 +61,49 @@ class KnowledgeGraphService(Agent):
         super().__init__('kg_service.services.kaqg', cfg)
         self.hostname = cfg['kg']['hostname']
         self.datapath = cfg['kg']['datapath']
+        self.write_mode = cfg['kg'].get('write_mode', 'batched')
+        self.dedupe_path = cfg['kg'].get('dedupe_path', os.path.join(self.datapath, '_dedupe.sqlite3'))
+        self.dedupe_cache_size = cfg['kg'].get('dedupe_cache_size', 100_000)
+        self.driver_params = {
+            'max_connection_pool_size': cfg['kg'].get('pool_size', 50),
+            'idle_timeout': cfg['kg'].get('driver_idle_timeout', 300),
+            'health_check_interval': cfg['kg'].get('driver_health_check_interval', 30),
+        }
+        self.port_cache_ttl = cfg['kg'].get('port_cache_ttl', 30)
+        self.memory_profiles = cfg['kg'].get('memory_profiles', True)
+        self.memory_budget_gb = cfg['kg'].get('memory_budget_gb', None)
+        # 依需求啟動 KG 容器，並限制同時運行的數量 / 記憶體
+        self.lifecycle_params = cfg['kg'].get('lifecycle', None)
+        self.lifecycle:KGLifecycleManager = None
+        self.snapshot_reads = cfg['kg'].get('snapshot_reads', False)
+        # CONCEPTS_QUERY 結果快取，寫入 triplets 後清除該 KG 的結果；0 表示不使用
+        concept_cache_size = cfg['kg'].get('concept_cache_size', 1024)
+        self.concept_cache = ConceptQueryCache(concept_cache_size) if concept_cache_size else None
+        self.snapshots:dict[str, GraphSnapshot] = {}
+        # 每個 KG 各自的載入鎖，只有同一個 KG 的請求需等待冷啟動與快照載入
+        self._snapshot_locks:dict[str, threading.Lock] = {}
+        self._snapshots_lock = threading.Lock()
+        self.write_buffer = cfg['kg'].get('write_buffer', False)
+        self.buffer_max_triplets = cfg['kg'].get('buffer_max_triplets', 5000)
+        self.buffer_max_delay = cfg['kg'].get('buffer_max_delay', 2.0)
+        # spill 檔須為檔案而非目錄，DockerManager.list_KGs 會將 datapath 下的目錄視為 KG
+        self.spill_dir = cfg['kg'].get('spill_dir', self.datapath)
+        self.buffers:dict[str, TripletWriteBuffer] = {}
+        self._buffers_lock = threading.Lock()
+        # 請求依 KG 分派到各自的 read / write worker (見 kg_dispatcher)
+        self.dispatcher_params = cfg['kg'].get('dispatcher', {})
+        self.dispatcher:KGDispatcher = None
+        # Cypher 語句的延遲統計與慢查詢記錄 (見 query_profiler)；未設定時不統計
+        self.profiling_params = cfg['kg'].get('profiling', None)
         logger.info(f"Creating Docker container on host '{self.hostname}'\nwith data storage at '{self.datapath}'")    
     
     
     def on_activate(self):
         try:
-            self.docker_manager = DockerManager(self.hostname, self.datapath)
+            # 連接埠快取：啟動時列出一次，之後由 Docker events 更新，events 中斷時以 TTL 重新列出
+            self.docker_manager = DockerManager(self.hostname, self.datapath, self.port_cache_ttl, watch_events=True,
+                                                memory_profiles=self.memory_profiles,
+                                                memory_budget_gb=self.memory_budget_gb)
         except FileNotFoundError as e:
             logger.error(f"Docker 未運行或無法連線: {e}")
             raise RuntimeError(
@@ -59,27 +114,189 @@ class KnowledgeGraphService(Agent):
             raise Exception(f"Failed to create DockerManager: {self.hostname}, {self.datapath}") from e
         self.all_kgs = self.docker_manager.list_KGs()
         logger.info(f"Existing KGs: {self.all_kgs}")
-
-        self.subscribe(Topic.CREATE.value, topic_handler=self.create_knowledge_graph)
-        self.subscribe(Topic.ACCESS_POINT.value, topic_handler=self.get_access_point)
+        if self.lifecycle_params:
+            params = dict(self.lifecycle_params)
+            backend = DockerContainerBackend(self.docker_manager, params.pop('container_memory_gb', 1.5))
+            self.lifecycle = KGLifecycleManager(backend, managed=self.all_kgs, on_started=self._on_KG_started, **params)
+            self.lifecycle.start_reaper()
+            logger.info(f"KG lifecycle: {self.lifecycle_params}, running: {self.lifecycle.stats()['running']}")
+
+        # fact 去重 store：記憶體 LRU + 本機 SQLite，重啟後與多個 process 間仍一致
+        KnowledgeGraph.set_dedupe_store(TieredDedupeStore(
+            SqliteDedupeStore(self.dedupe_path), self.dedupe_cache_size)).close()
+        logger.info(f"Fact dedupe store: {self.dedupe_path}, cache size: {self.dedupe_cache_size}")
+        DriverRegistry.configure(**self.driver_params)
+        logger.info(f"Neo4j driver registry: {self.driver_params}")
+        if self.profiling_params is not None:
+            profiler = QueryProfiler.configure_from(self.profiling_params, self.datapath)
+            logger.info(f"Query profiling: slow queries over {profiler.slow_ms} ms logged to '{profiler.slow_log_path}'")
+        self._migrate_schemas()
+        self.dispatcher = KGDispatcher(**self.dispatcher_params)
+        logger.info(f"KG dispatcher: {self.dispatcher_params}")
+
+        self.subscribe(Topic.CREATE.value, topic_handler=self._dispatched(WRITE, self.create_knowledge_graph))
+        self.subscribe(Topic.ACCESS_POINT.value, topic_handler=self._dispatched(READ, self.get_access_point))
         
-        self.subscribe(Topic.CONCEPTS_QUERY.value, topic_handler=self.query_concepts)
-        # self.subscribe(Topic.FACTS_QUERY.value, topic_handler=self.query_facts)
-        self.subscribe(Topic.SECTIONS_QUERY.value, topic_handler=self.query_sections)
+        self.subscribe(Topic.CONCEPTS_QUERY.value, topic_handler=self._dispatched(READ, self.query_concepts))
+        self.subscribe(Topic.CONCEPTS_BATCH_QUERY.value, topic_handler=self._dispatched(READ, self.query_concepts_batch))
+        # self.subscribe(Topic.FACTS_QUERY.value, topic_handler=self._dispatched(READ, self.query_facts))
+        self.subscribe(Topic.SECTIONS_QUERY.value, topic_handler=self._dispatched(READ, self.query_sections))
+        self.subscribe(Topic.METRICS.value, topic_handler=self.get_metrics)
+        self.subscribe(Topic.PAGES_RETIRE.value, topic_handler=self._dispatched(WRITE, self.handle_pages_retire))
 
         for kg_name in self.all_kgs:
             topic_triplets_add = f'{kg_name}/{Topic.TRIPLETS_ADD.value}'
-            self.subscribe(topic_triplets_add, topic_handler=self.handle_triplets_add)
+            self.subscribe(topic_triplets_add, topic_handler=self._dispatched(WRITE, self.handle_triplets_add))
+
+        if self.write_buffer:
+            logger.info(f"Triplet write buffer: max {self.buffer_max_triplets} triplets, "
+                        f"max delay {self.buffer_max_delay}s, spill dir '{self.spill_dir}'")
+            # 重送上次中斷時留下的 spill 檔
+            for filename in os.listdir(self.spill_dir):
+                if filename.startswith(SPILL_PREFIX):
+                    kg_name = filename[len(SPILL_PREFIX):].split('.jsonl')[0]
+                    if kg_name in self.all_kgs:
+                        self._buffer(kg_name)
+            self.subscribe(TOPIC_PDF_RETRIEVED, topic_handler=self._dispatched(WRITE, self.handle_retrieved))
     
     
+    def on_terminated(self):
+        if self.dispatcher:
+            self.dispatcher.close()
+        with self._buffers_lock:
+            buffers = list(self.buffers.values())
+        for buffer in buffers:
+            try:
+                buffer.close()
+            except Exception as e:
+                logger.warning(f"Failed to flush triplet buffer of KG '{buffer.kg_name}': {e}")
+        if self.lifecycle:
+            self.lifecycle.close()
+        DriverRegistry.default().close_all()
+        if QueryProfiler.default():
+            QueryProfiler.default().close()
+        self.docker_manager.close()
+
+
+    def _migrate_schemas(self):
+        """ 將運行中的既有 KG 升級至最新 schema 版本。 """
+        for kg_name, _, bolt_port in self.docker_manager.list_running_KGs():
+            if kg_name not in self.all_kgs:
+                continue
+            try:
+                with KnowledgeGraph(uri=f"bolt://{self.hostname}:{bolt_port}") as kg:
+                    from_version, to_version = kg.ensure_schema()
+                logger.info(f"KG '{kg_name}' schema version: {from_version} -> {to_version}")
+            except Exception as e:
+                logger.warning(f"Failed to migrate schema of KG '{kg_name}': {e}")
+
+
+    def _on_KG_started(self, kg_name, urls):
+        """ lifecycle 啟動容器後，先升級 schema 再處理請求。 """
+        with KnowledgeGraph(uri=urls[1]) as kg:
+            from_version, to_version = kg.ensure_schema()
+        logger.info(f"KG '{kg_name}' schema version: {from_version} -> {to_version}")
+
+
+    def _dispatched(self, lane, handler):
+        """
+        包裝 topic handler：在 pcl.content['kg_name'] 的 lane 上執行並等待結果，
+        回傳值與例外照常由 agentflow 回覆給 topic_return。
+        """
+        def dispatch(topic:str, pcl:TextParcel):
+            kg_name = pcl.content.get('kg_name') if isinstance(pcl.content, dict) else None
+            with self._borrowed(kg_name):
+                return self.dispatcher.call(kg_name or '', lane, handler, topic, pcl)
+        return dispatch
+
+
+    def _borrowed(self, kg_name):
+        """ 處理請求期間借用 KG，避免容器在執行中被 lifecycle 停止 (見 KGLifecycleManager.borrow)。 """
+        if self.lifecycle and kg_name:
+            return self.lifecycle.borrow(kg_name)
+        return contextlib.nullcontext()
+
+
+    def _verbose(self):
+        # 各元件的 stats() 需取鎖或查詢 SQLite，每頁/每個請求都會呼叫，只在啟用 VERBOSE 時才計算
+        return logger.isEnabledFor(app_helper.LOGGING_LEVEL_VERBOSE)
+
+
+    def _open_KG(self, kg_name):
+        """ 回傳 (http_url, bolt_url)；啟用 lifecycle 時，未運行的 KG 會先啟動。 """
+        if self.lifecycle:
+            return self.lifecycle.open_KG(kg_name)
+        return self.docker_manager.open_KG(kg_name)
+
+
+    def _snapshot_lock(self, kg_name):
+        with self._snapshots_lock:
+            return self._snapshot_locks.setdefault(kg_name, threading.Lock())
+
+
+    def _snapshot(self, kg_name):
+        """ 取得 KG 的記憶體快照，第一次使用時從 Neo4j 載入。 """
+        with self._snapshot_lock(kg_name):
+            snapshot = self.snapshots.get(kg_name)
+            if snapshot is None:
+                _, bolt_url = self._open_KG(kg_name)
+                with KnowledgeGraph(uri=bolt_url) as kg:
+                    snapshot = self.snapshots[kg_name] = GraphSnapshot.load(kg)
+                logger.info(f"KG '{kg_name}' snapshot memory: {snapshot.memory_report()}")
+            return snapshot
+
+
+    def _buffer(self, kg_name):
+        """ 取得 KG 的 write-behind 緩衝，第一次使用時建立 (並重送遺留的 spill 檔)。 """
+        with self._buffers_lock:
+            buffer = self.buffers.get(kg_name)
+            if buffer is None:
+                buffer = self.buffers[kg_name] = TripletWriteBuffer(
+                    kg_name,
+                    lambda pages, idempotent: self._write_pages(kg_name, pages, idempotent),
+                    os.path.join(self.spill_dir, f'{SPILL_PREFIX}{kg_name}.jsonl'),
+                    self.buffer_max_triplets,
+                    self.buffer_max_delay)
+            return buffer
+
+
+    def _write_pages(self, kg_name, pages, idempotent):
+        """ TripletWriteBuffer 的寫入函式：合併寫入多頁 triplets，並更新快照。 """
+        with self._borrowed(kg_name):
+            _, bolt_url = self._open_KG(kg_name)
+            with KnowledgeGraph(uri=bolt_url) as kg:
+                result = kg.add_pages_batched(pages, idempotent)
+                self._on_triplets_written(kg_name, kg, [triplet for _, _, triplets in pages for triplet in triplets])
+        return result
+
+
+    def _on_triplets_written(self, kg_name, kg, triplets):
+        """ triplets 寫入後更新快照，並清除該 KG 的 concept 快取。 """
+        # 等待該 KG 進行中的載入完成，確保快照包含剛寫入的 triplets
+        with self._snapshot_lock(kg_name):
+            snapshot = self.snapshots.get(kg_name)
+        if snapshot:
+            added = snapshot.refresh(kg, triplets)
+            if self._verbose():
+                logger.verbose(f"KG '{kg_name}' snapshot refreshed, {added} relationships added: {snapshot.stats()}")
+        if self.concept_cache:
+            self.concept_cache.invalidate(kg_name)
+
+
     def create_knowledge_graph(self, topic:str, pcl:TextParcel):
         kg_name = pcl.content['kg_name']
         logger.debug(f"Creating KG: {kg_name} ...")
         http_url, bolt_url = self.docker_manager.create_container(kg_name)
         logger.debug(f"KG '{kg_name}' created: {http_url}, {bolt_url}")
+        if self.lifecycle and bolt_url:
+            self.lifecycle.add_managed(kg_name)
+            self.lifecycle.track(kg_name, http_url, bolt_url)
+        if bolt_url:
+            with KnowledgeGraph(uri=bolt_url) as kg:
+                kg.ensure_schema()
 
         topic_triplets_add = f'{kg_name}/{Topic.TRIPLETS_ADD.value}'
-        self.subscribe(topic_triplets_add, topic_handler=self.handle_triplets_add)
+        self.subscribe(topic_triplets_add, topic_handler=self._dispatched(WRITE, self.handle_triplets_add))
 
         return {
             'kg_name': kg_name,
@@ -96,7 +313,7 @@ class KnowledgeGraphService(Agent):
         #     }
         
         kg_name = pcl.content['kg_name']
-        http_url, bolt_url = self.docker_manager.open_KG(kg_name)
+        http_url, bolt_url = self._open_KG(kg_name)
         return {
             'http_url': http_url,
             'bolt_url': bolt_url,
@@ -112,11 +329,99 @@ class KnowledgeGraphService(Agent):
                 # 'triplets': triplets,
         #     }
         kg_name = pcl.content['kg_name']
-        _, bolt_url = self.docker_manager.open_KG(kg_name)
+        if self.write_buffer:
+            buffer = self._buffer(kg_name)
+            buffer.add(pcl.content['file_id'], pcl.content['page_number'], pcl.content['triplets'])
+            if self._verbose():
+                logger.verbose(f"KG '{kg_name}' triplet buffer: {buffer.stats()}")
+            return
+
+        _, bolt_url = self._open_KG(kg_name)
         # _, bolt_url = self.docker_manager.get_urls(kg_name)
         logger.info(f"bolt_url: {bolt_url}")
         with KnowledgeGraph(uri=bolt_url) as kg:
-            kg.add_triplets(pcl.content['file_id'], pcl.content['page_number'], pcl.content['triplets'])
+            if self.write_mode == 'batched':
+                kg.add_triplets_batched(pcl.content['file_id'], pcl.content['page_number'], pcl.content['triplets'])
+            else:
+                kg.add_triplets(pcl.content['file_id'], pcl.content['page_number'], pcl.content['triplets'])
+            self._on_triplets_written(kg_name, kg, pcl.content['triplets'])
+        if self._verbose():
+            logger.verbose(f"dedupe store: {KnowledgeGraph._dedupe_store.stats()}")
+            logger.verbose(f"driver registry: {DriverRegistry.default().stats()}")
+            logger.verbose(f"port registry: {self.docker_manager.port_registry.stats()}")
+            if self.lifecycle:
+                logger.verbose(f"KG lifecycle: {self.lifecycle.stats()}")
+            logger.verbose(f"KG dispatcher: {self.dispatcher.stats().get(kg_name)}")
+
+
+    def handle_pages_retire(self, topic:str, pcl:TextParcel):
+        logger.debug(f"content: {pcl.content}")
+        # pcl.content: {
+                # 'kg_name': kg_name,
+                # 'file_id': file_id,
+                # 'page_numbers': [..],    # 內容改變或被移除的頁面 (增量匯入)
+        #     }
+        kg_name = pcl.content['kg_name']
+        # 先寫入緩衝中的頁面，避免退役後才寫入舊內容
+        with self._buffers_lock:
+            buffer = self.buffers.get(kg_name)
+        if buffer:
+            buffer.flush()
+
+        _, bolt_url = self._open_KG(kg_name)
+        with KnowledgeGraph(uri=bolt_url) as kg:
+            result = kg.retire_pages(pcl.content['file_id'], pcl.content['page_numbers'])
+        # 快照只能增量加入，退役後捨棄，下次讀取時重新載入
+        with self._snapshot_lock(kg_name):
+            self.snapshots.pop(kg_name, None)
+        if self.concept_cache:
+            self.concept_cache.invalidate(kg_name)
+        logger.info(f"KG '{kg_name}' pages of '{pcl.content['file_id']}' retired: {result}")
+        return result
+
+
+    def handle_retrieved(self, topic:str, pcl:TextParcel):
+        logger.debug(f"content: {pcl.content}")
+        # pcl.content: {
+                # 'file_id': file_id,
+                # 'filename': filename,
+                # 'kg_name': kg_name,
+        #     }
+        # 文件處理完成，不等時間門檻直接寫入
+        with self._buffers_lock:
+            buffer = self.buffers.get(pcl.content['kg_name'])
+        if buffer:
+            buffer.flush()
+            logger.info(f"KG '{buffer.kg_name}' triplet buffer flushed: {buffer.stats()}")
+
+
+    def _query_concepts_many(self, kg_name, criteria):
+        """
+        回傳 criteria (list of (document, section)) 依序對應的 concept list；
+        快取中沒有的 criterion 以一次批次查詢 (共用 section 的讀取) 取得。
+        """
+        keys = [concept_key(kg_name, document, section) for document, section in criteria]
+        concepts = [self.concept_cache.get(key) for key in keys] if self.concept_cache else [None] * len(criteria)
+        missing = [i for i, found in enumerate(concepts) if found is None]
+        if not missing:
+            return concepts
+
+        generation = self.concept_cache.generation(kg_name) if self.concept_cache else None
+        pending = [criteria[i] for i in missing]
+        if self.snapshot_reads:
+            found = self._snapshot(kg_name).query_section_concepts_many(pending)
+        else:
+            _, bolt_url = self._open_KG(kg_name)
+            logger.verbose(f"bolt_url: {bolt_url}")
+            with KnowledgeGraph(uri=bolt_url) as kg:
+                # Concepts of the document and of every section in the requested subtree
+                found = kg.query_section_concepts_many(pending)
+
+        for i, result in zip(missing, found):
+            concepts[i] = result
+            if self.concept_cache:
+                self.concept_cache.put(keys[i], result, generation)
+        return concepts
 
 
     def query_concepts(self, topic:str, pcl:TextParcel):
@@ -127,26 +432,47 @@ class KnowledgeGraphService(Agent):
             # 'section': ['section1', 'section1-1'],
         # }
         kg_name = pcl.content['kg_name']
-        _, bolt_url = self.docker_manager.open_KG(kg_name)
-        logger.verbose(f"bolt_url: {bolt_url}")
-        with KnowledgeGraph(uri=bolt_url) as kg:
-            document = kg.query_nodes_by_name(pcl.content['document'], 'document')[0]
-            logger.debug(f"document: {document}")
-            sections = kg.query_subsections(pcl.content['document'], pcl.content['section'])
-            logger.debug(f"sections: {sections}")
-
-            # Use a dictionary to store unique concepts based on their element_id
-            unique_concepts = {concept['element_id']: concept for concept in kg.query_nodes_related_by(document['element_id'], 'include_in', 'concept')}
-            for section in sections:
-                for concept in kg.query_nodes_related_by(section['element_id'], 'include_in', 'concept'):
-                    unique_concepts[concept['element_id']] = concept  # Ensures uniqueness
-
-        concepts = list(unique_concepts.values())
+        concepts = self._query_concepts_many(kg_name, [(pcl.content['document'], pcl.content['section'])])[0]
         logger.debug(f"concepts: {concepts[:10]}..")
+        if self.concept_cache and self._verbose():
+            logger.verbose(f"concept cache: {self.concept_cache.stats()}")
 
         return {'concepts': concepts}
 
 
+    def query_concepts_batch(self, topic:str, pcl:TextParcel):
+        logger.debug(f"content: {pcl.content}")
+        # pcl.content: {
+            # 'kg_name': kg_name,
+            # 'criteria': [
+            #     {'document': 'document name', 'section': ['section1', 'section1-1']},
+            #     ...
+            # ],
+        # }
+        kg_name = pcl.content['kg_name']
+        criteria = [(criterion['document'], criterion.get('section')) for criterion in pcl.content['criteria']]
+        concepts = self._query_concepts_many(kg_name, criteria)
+        if self.concept_cache and self._verbose():
+            logger.verbose(f"{len(criteria)} criteria, concept cache: {self.concept_cache.stats()}")
+
+        return {'results': [
+            {'document': document, 'section': section, 'concepts': result}
+            for (document, section), result in zip(criteria, concepts)
+        ]}
+
+
+    def get_metrics(self, topic:str, pcl:TextParcel):
+        # 各 KG 的佇列深度與服務時間，以及各快取的統計
+        return {
+            'dispatcher': self.dispatcher.stats(),
+            'concept_cache': self.concept_cache.stats() if self.concept_cache else None,
+            'lifecycle': self.lifecycle.stats() if self.lifecycle else None,
+            'driver_registry': DriverRegistry.default().stats(),
+            'port_registry': self.docker_manager.port_registry.stats(),
+            'queries': QueryProfiler.default().report() if QueryProfiler.default() else None,
+        }
+
+
     def query_facts(self, topic:str, pcl:TextParcel):
         logger.debug(f"content: {pcl.content}")
         # pcl.content: {
@@ -154,7 +480,7 @@ class KnowledgeGraphService(Agent):
                 # 'concept': {concept_node},
         #     }
         kg_name = pcl.content['kg_name']
-        _, bolt_url = self.docker_manager.open_KG(kg_name)
+        _, bolt_url = self._open_KG(kg_name)
         logger.verbose(f"bolt_url: {bolt_url}")
         with KnowledgeGraph(uri=bolt_url) as kg:
             concept = pcl.content['concept']
@@ -169,8 +495,10 @@ class KnowledgeGraphService(Agent):
                 # 'section': 'section name',
         #     }
         data = pcl.content
+        if self.snapshot_reads:
+            return {'sections': self._snapshot(data['kg_name']).query_subsections(data['document'], data['section'])}
 
-        _, bolt_url = self.docker_manager.open_KG(data['kg_name'])
+        _, bolt_url = self._open_KG(data['kg_name'])
         logger.verbose(f"bolt_url: {bolt_url}")
         with KnowledgeGraph(uri=bolt_url) as kg:
             return {'sections': kg.query_subsections(data['document'], data['section'])}
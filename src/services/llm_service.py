@@ -73,6 +73,18 @@ class LlmService(Agent):
             llm = ChatLLM(llm_config)
         
         return llm
+
+
+    @staticmethod
+    def model_name(llm_params=None) -> str:
+        """ 回傳 llm_params 選用的模型 (例如 'ChatGpt/gpt-4o-mini')，用於區分不同模型的擷取結果。 """
+        params:dict = LlmService._default_llm_params.copy()
+        if llm_params:
+            params.update(llm_params)
+        llm_name = getattr(params['name'], 'value', params['name'])
+        llm_class = OssGptLLM if llm_name == LlmModel.OssGpt.value else ChatLLM
+        model = params.get(llm_name, {}).get('model', llm_class._default_params['model'])
+        return f"{llm_name}/{model}"
     
 
     def on_activate(self):
@@ -81,16 +93,29 @@ class LlmService(Agent):
         self.subscribe(LlmService.TOPIC_LLM_PROMPT, "str", self.handle_prompt)
 
 
+    @staticmethod
+    def prompt(llm:BaseLLM, params:dict) -> dict:
+        """ 以 llm 回覆一個 TOPIC_LLM_PROMPT 請求 (messages 與選填的 response_format)，回傳 {'response', 'usage'}。 """
+        if params.get('response_format'):
+            # 指定輸出格式 (例如 JSON schema) 的請求
+            request = {'messages': params['messages'], 'response_format': params['response_format']}
+        else:
+            request = params['messages']
+        response, usage = llm.generate_with_usage(request)
+        return {
+            'response': response,
+            'usage': usage,
+        }
+
+
     def handle_prompt(self, topic:str, pcl:TextParcel):
         params = pcl.content
         logger.verbose(f"params: {params}")
 
-        response = self.llm.generate_response(params['messages'])
-        logger.debug(self.M(response))
+        result = LlmService.prompt(self.llm, params)
+        logger.debug(self.M(result['response']))
 
-        return {
-            'response': response,
-        }
+        return result
 
 
 
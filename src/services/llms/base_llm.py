@@ -6,3 +6,11 @@ class BaseLLM(ABC):
     @abstractmethod
     def generate_response(self, params):
         pass
+
+
+    def generate_with_usage(self, params):
+        """
+        與 generate_response 相同，另外回傳 token 用量。
+        :return: (response, usage)；usage 為 {'prompt_tokens', 'completion_tokens'}，模型未提供時為 None
+        """
+        return self.generate_response(params), None
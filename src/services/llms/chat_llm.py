@@ -38,6 +38,11 @@ class ChatLLM(BaseLLM):
 
 
     def generate_response(self, params):
+        response, _ = self.generate_with_usage(params)
+        return response
+
+
+    def generate_with_usage(self, params):
         if isinstance(params, str):
             # prompt text only
             messages = [{"role": "user", "content": params}]
@@ -59,8 +64,10 @@ class ChatLLM(BaseLLM):
             "temperature": params.get('temperature', self.temperature),
             "stream": params.get('streaming', self.streaming),
         }
-        if self.response_format:
-            kwargs['response_format'] = self.response_format
+        # 請求可指定自己的 response_format (例如 JSON schema)，否則使用設定值
+        response_format = params.get('response_format', self.response_format)
+        if response_format:
+            kwargs['response_format'] = response_format
         logger.verbose(f"kwargs: {kwargs}")
 
         response = self.client.chat.completions.create(**kwargs)
@@ -70,10 +77,16 @@ class ChatLLM(BaseLLM):
             for chunk in response:
                 if chunk.choices and chunk.choices[0].delta.content:
                     result += chunk.choices[0].delta.content
-            return result
+            return result, None
         else:
             choice = response.choices[0]
-            return choice.message.content
+            usage = None
+            if response.usage:
+                usage = {
+                    'prompt_tokens': response.usage.prompt_tokens,
+                    'completion_tokens': response.usage.completion_tokens,
+                }
+            return choice.message.content, usage
 
 
 if __name__ == '__main__':
@@ -33,11 +33,17 @@ class OssGptLLM(BaseLLM):
 
 
     def generate_response(self, messages):
+        response, _ = self.generate_with_usage(messages)
+        return response
+
+
+    def generate_with_usage(self, messages):
         kwargs = {
             "model": self.model,
             "temperature": self.temperature,
             "stream": self.streaming,
         }
+        response_format = self.response_format
         
         if isinstance(messages, str):
             # prompt text only
@@ -45,11 +51,19 @@ class OssGptLLM(BaseLLM):
         elif isinstance(messages, list) and isinstance(messages[0], dict):
             # messages list only
             kwargs['messages'] = messages
+        elif isinstance(messages, dict) and 'messages' in messages:
+            # 含 messages 的請求參數，可指定自己的 response_format
+            response_format = messages.get('response_format', response_format)
+            kwargs['messages'] = messages['messages']
         elif isinstance(messages, dict):
             kwargs['messages'] = [messages]
         else:
             raise ValueError("Invalid input.")
 
+        # Ollama 以 format 參數限制輸出的 JSON schema
+        if isinstance(response_format, dict) and response_format.get('type') == 'json_schema':
+            kwargs['format'] = response_format['json_schema']['schema']
+
         # ----------------------------------------------------
         # ⭐ 使用 requests.post 發送請求
         # ----------------------------------------------------
@@ -86,13 +100,19 @@ class OssGptLLM(BaseLLM):
         else: 
             # 非 streaming
             result_json = response.json()
+            usage = None
+            if 'prompt_eval_count' in result_json or 'eval_count' in result_json:
+                usage = {
+                    'prompt_tokens': result_json.get('prompt_eval_count', 0),
+                    'completion_tokens': result_json.get('eval_count', 0),
+                }
             
             if endpoint == "/api/generate":
                 # /api/generate 的回覆內容在 "response" 欄位
-                return result_json.get("response")
+                return result_json.get("response"), usage
             elif endpoint == "/api/chat":
                 # /api/chat 的回覆內容在 ["message"]["content"] 欄位
-                return result_json.get("message", {}).get("content")
+                return result_json.get("message", {}).get("content"), usage
             raise ValueError(f"Unexpected response structure from API. JSON: {result_json}")
 
 if __name__ == '__main__':
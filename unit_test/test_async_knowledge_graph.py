@@ -0,0 +1,175 @@
+import os, sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+import app_helper
+
+import asyncio
+import unittest
+
+from knowsys.async_knowledge_graph import AsyncKnowledgeGraph, FanOutKnowledgeGraph
+from knowsys.knowledge_graph import KnowledgeGraph
+from knowsys.query_profiler import QueryProfiler, fingerprint
+
+
+
+class FakeNode(dict):
+    def __init__(self, eid, label, name):
+        super().__init__(name=name)
+        self.element_id = eid
+        self.labels = [label]
+
+
+
+class FakeAsyncResult:
+    def __init__(self, records):
+        self.records = records
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        for record in self.records:
+            yield record
+
+
+
+class FakeAsyncSession:
+    def __init__(self, driver):
+        self.driver = driver
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        pass
+
+    async def run(self, query, **params):
+        self.driver.queries.append((query, params))
+        self.driver.active += 1
+        self.driver.max_active = max(self.driver.max_active, self.driver.active)
+        await asyncio.sleep(self.driver.delay)
+        self.driver.active -= 1
+        for marker, respond in self.driver.responses.items():
+            if marker in query:
+                return FakeAsyncResult(respond(params))
+        return FakeAsyncResult([])
+
+
+
+class FakeAsyncDriver:
+    """ 模擬 neo4j AsyncDriver：依查詢語句以 responses 中的函式產生 records，並記錄同時執行的查詢數。 """
+    def __init__(self, responses, delay=0.02):
+        self.responses = responses
+        self.delay = delay
+        self.queries = []
+        self.active = 0
+        self.max_active = 0
+        self.closed = False
+
+    def session(self):
+        return FakeAsyncSession(self)
+
+    async def close(self):
+        self.closed = True
+
+
+
+def related_facts(params):
+    eid = params['node_eid']
+    return [{'m': FakeNode(f'{eid}-f{i}', 'fact', f'fact {i} of {eid}')} for i in range(2)]
+
+
+RESPONSES = {
+    'm.name AS subj': lambda params: [{'subj': 'c', 'rel': 'before', 'obj': 'a'}],
+    'RETURN m': related_facts,
+    'startNode(r) = n AS outgoing': lambda params: [
+        {'eid': eid, 'rel': 'related_to', 'outgoing': True, 'm': FakeNode('x', 'fact', 'x')} for eid in params['eids']],
+    'n.name AS subj': lambda params: [{'subj': 'a', 'rel': 'is_a', 'obj': 'b'}],
+}
+
+
+
+class TestAsyncKnowledgeGraph(unittest.TestCase):
+    def make_kg(self, responses=RESPONSES, max_concurrency=8):
+        kg = AsyncKnowledgeGraph(uri="bolt://localhost:1", max_concurrency=max_concurrency)
+        asyncio.run(kg.close())
+        kg.driver = FakeAsyncDriver(responses)
+        return kg
+
+
+    def test_queries_match_sync_surface(self):
+        kg = self.make_kg()
+
+        async def scenario():
+            facts = await kg.query_nodes_related_by('c1', 'is_a', 'fact')
+            triples = await kg.query_all_relationships('a1')
+            neighbors = await kg.query_neighbors_many(['f1', 'f2'], label='fact')
+            return facts, triples, neighbors
+        facts, triples, neighbors = asyncio.run(scenario())
+
+        self.assertEqual(facts[0], {'element_id': 'c1-f0', 'labels': ['fact'], 'name': 'fact 0 of c1'})
+        self.assertEqual(triples, [('a', 'is_a', 'b'), ('c', 'before', 'a')])
+        self.assertEqual(list(neighbors), ['f1', 'f2'])
+        self.assertEqual(neighbors['f1'][0][:2], ('related_to', True))
+        self.assertIn(KnowledgeGraph._nodes_related_by_query('is_a', 'fact'), [query for query, _ in kg.driver.queries])
+
+
+    def test_gather_runs_concurrently(self):
+        kg = self.make_kg(max_concurrency=3)
+        results = asyncio.run(kg.gather(kg.query_nodes_related_by(f'c{i}', 'is_a', 'fact') for i in range(6)))
+
+        self.assertEqual([facts[0]['element_id'] for facts in results], [f'c{i}-f0' for i in range(6)])
+        self.assertEqual(kg.driver.max_active, 3)       # 受 max_concurrency 限制
+
+
+    def test_queries_recorded_by_profiler(self):
+        kg = self.make_kg()
+        profiler = QueryProfiler.configure(slow_ms=None)
+        try:
+            asyncio.run(kg.query_all_relationships('a1'))
+            report = {entry['fingerprint']: entry for entry in profiler.report()}
+        finally:
+            QueryProfiler._default = None
+            profiler.close()
+
+        entry = report[fingerprint(KnowledgeGraph._OUTGOING_RELATIONSHIPS_QUERY)]
+        self.assertEqual((entry['count'], entry['rows']), (1, 1))
+        self.assertIn(fingerprint(KnowledgeGraph._INCOMING_RELATIONSHIPS_QUERY), report)
+
+
+    def test_empty_inputs_skip_queries(self):
+        kg = self.make_kg()
+        self.assertEqual(asyncio.run(kg.query_neighbors_many([])), {})
+        self.assertEqual(asyncio.run(kg.query_section_concepts_many([])), [])
+        self.assertEqual(kg.driver.queries, [])
+
+
+
+class TestFanOutKnowledgeGraph(unittest.TestCase):
+    def test_sync_facade(self):
+        with FanOutKnowledgeGraph(uri="bolt://localhost:1", shared=False) as kg:
+            fake = FakeAsyncDriver(RESPONSES)
+            real, kg.client.driver = kg.client.driver, fake
+            fact_lists = kg.gather([('query_nodes_related_by', f'c{i}', 'is_a', 'fact') for i in range(4)])
+            facts = kg.query_nodes_related_by('c9', 'is_a', 'fact')
+            kg.client.driver = real
+
+        self.assertEqual([facts[1]['element_id'] for facts in fact_lists], [f'c{i}-f1' for i in range(4)])
+        self.assertEqual(facts[0]['name'], 'fact 0 of c9')
+        self.assertEqual(fake.max_active, 4)
+        self.assertIsNone(kg.client)
+
+
+    def test_shared_client_reused(self):
+        try:
+            with FanOutKnowledgeGraph(uri="bolt://localhost:2") as a, FanOutKnowledgeGraph(uri="bolt://localhost:2") as b:
+                self.assertIs(a.client, b.client)
+                client = a.client
+            self.assertIsNotNone(client.driver)      # 共用的 client 不隨 facade 關閉
+        finally:
+            FanOutKnowledgeGraph.close_all()
+        self.assertIsNone(client.driver)
+
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,88 @@
+import os, sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+import app_helper
+
+import csv
+import tempfile
+import unittest
+
+from knowsys import bulk_import
+from knowsys.bulk_import import BulkImportWriter, spool_page
+from knowsys.fact_identity import fact_key
+
+
+
+class TestBulkImportWriter(unittest.TestCase):
+    def setUp(self):
+        self.document = {'type': 'document', 'name': 'Doc', 'meta': {'title': 'Doc'}}
+        self.section = {'type': 'structure', 'name': 'Ch1'}
+        self.page1 = [
+            (self.section, {'name': 'part_of'}, self.document),
+            ({'type': 'concept', 'name': '季節'}, {'name': 'include_in'}, self.section),
+            ({'type': 'fact', 'name': '冬天', 'aliases': ['winter']}, {'name': 'is_a'}, {'type': 'concept', 'name': '季節'}),
+            ({'type': 'fact', 'name': '冬天'}, {'name': 'is_a'}, {'type': 'concept', 'name': '季節', 'aliases': ['season']}),
+        ]
+        self.page2 = [
+            ({'type': 'fact', 'name': '冬天'}, {'name': 'before'}, {'type': 'fact', 'name': '春天'}),
+        ]
+
+
+    def test_dedupe_like_online_writes(self):
+        writer = BulkImportWriter()
+        writer.add_triplets('f1', 1, self.page1)
+        writer.add_triplets('f1', 2, self.page2)
+        stats = writer.stats()
+
+        # 冬天 在兩頁各一個 fact 節點，其餘節點以 (label, name) 合併
+        self.assertEqual(stats['facts'], 3)
+        self.assertEqual(stats['nodes'], 6)
+        # part_of, include_in, 冬天(p1) is_a, 冬天(p1 & p2) before 春天(p2)
+        self.assertEqual(stats['relationships'], 5)
+
+        concept = writer._properties[writer._nodes_by_key[('concept', '季節')][0]]
+        self.assertEqual(concept['aliases'], ['season'])
+        fact = writer._properties[writer._facts[('fact', fact_key('f1', 1, '冬天'))]]
+        self.assertEqual(fact['aliases'], ['winter'])
+
+
+    def test_relationships_only_link_existing_nodes(self):
+        writer = BulkImportWriter()
+        writer.add_triplets('f1', 1, [({'type': 'fact', 'name': 'A'}, {'name': 'r'}, {'type': 'fact', 'name': 'B'})])
+        writer.add_triplets('f1', 2, [({'type': 'fact', 'name': 'A'}, {'name': 's'}, {'type': 'concept', 'name': 'C'})])
+        # 第二頁的 A 不會補上第一頁的 r 關聯
+        self.assertEqual(writer.stats()['relationships'], 3)
+
+
+    def test_write_csv_and_spool(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            spool_page(tmp, 'f1', 1, self.page1)
+            spool_page(tmp, 'f1', 2, self.page2)
+            writer = BulkImportWriter()
+            writer.add_spool(tmp)
+            stats = writer.write(os.path.join(tmp, 'csv'))
+
+            with open(os.path.join(tmp, 'csv', bulk_import.NODE_HEADER), encoding='utf-8') as f:
+                self.assertEqual(next(csv.reader(f))[:3], [':ID', ':LABEL', 'name'])
+            with open(os.path.join(tmp, 'csv', bulk_import.NODE_DATA), encoding='utf-8') as f:
+                rows = list(csv.reader(f))
+            with open(os.path.join(tmp, 'csv', bulk_import.RELATIONSHIP_DATA), encoding='utf-8') as f:
+                relationships = list(csv.reader(f))
+
+        self.assertEqual(stats['pages'], 2)
+        self.assertEqual(len(rows), stats['nodes'])
+        self.assertEqual(len(relationships), stats['relationships'])
+        document = next(row for row in rows if row[1] == 'document')
+        self.assertEqual(document[6], '{"title": "Doc"}')
+        self.assertIn('season', [row[5] for row in rows])
+
+
+    def test_import_args_reference_written_files(self):
+        args = bulk_import.neo4j_admin_import_args('/import')
+        self.assertEqual(args[:4], ['neo4j-admin', 'database', 'import', 'full'])
+        self.assertIn(f"--nodes=/import/{bulk_import.NODE_HEADER},/import/{bulk_import.NODE_DATA}", args)
+        self.assertEqual(args[-1], 'neo4j')
+
+
+
+if __name__ == '__main__':
+    unittest.main()
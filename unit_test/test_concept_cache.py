@@ -0,0 +1,66 @@
+import os, sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+import app_helper
+
+import unittest
+
+from knowsys.concept_cache import ConceptQueryCache, concept_key
+
+
+
+class TestConceptQueryCache(unittest.TestCase):
+    def test_key_normalizes_section_path(self):
+        self.assertEqual(concept_key('kg', 'doc', '第一章'), concept_key('kg', 'doc', ['第一章']))
+        self.assertEqual(concept_key('kg', 'doc', None), concept_key('kg', 'doc', []))
+        self.assertNotEqual(concept_key('kg', 'doc', ['第一章']), concept_key('kg2', 'doc', ['第一章']))
+
+
+    def test_hit_and_miss(self):
+        cache = ConceptQueryCache()
+        key = concept_key('kg', 'doc', ['第一章'])
+        self.assertIsNone(cache.get(key))
+        cache.put(key, [{'name': '冬天'}], cache.generation('kg'))
+        self.assertEqual(cache.get(key), [{'name': '冬天'}])
+
+        stats = cache.stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['hit_ratio']), (1, 1, 0.5))
+
+
+    def test_lru_eviction(self):
+        cache = ConceptQueryCache(max_entries=2)
+        keys = [concept_key('kg', 'doc', [f'第{i}章']) for i in range(3)]
+        cache.put(keys[0], [], 0)
+        cache.put(keys[1], [], 0)
+        cache.get(keys[0])
+        cache.put(keys[2], [], 0)
+
+        self.assertIsNotNone(cache.get(keys[0]))
+        self.assertIsNone(cache.get(keys[1]))
+        self.assertEqual(cache.stats()['entries'], 2)
+
+
+    def test_invalidate_only_affects_kg(self):
+        cache = ConceptQueryCache()
+        cache.put(concept_key('kg1', 'doc', None), [], 0)
+        cache.put(concept_key('kg2', 'doc', None), [], 0)
+        cache.invalidate('kg1')
+
+        self.assertIsNone(cache.get(concept_key('kg1', 'doc', None)))
+        self.assertIsNotNone(cache.get(concept_key('kg2', 'doc', None)))
+        self.assertEqual(cache.generation('kg1'), 1)
+
+
+    def test_put_after_invalidate_is_dropped(self):
+        cache = ConceptQueryCache()
+        key = concept_key('kg', 'doc', None)
+        generation = cache.generation('kg')     # 查詢開始
+        cache.invalidate('kg')                  # 查詢期間寫入 triplets
+        cache.put(key, [{'name': '舊結果'}], generation)
+
+        self.assertIsNone(cache.get(key))
+        self.assertEqual(cache.stats()['stale_puts'], 1)
+
+
+
+if __name__ == '__main__':
+    unittest.main()
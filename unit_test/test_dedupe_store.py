@@ -0,0 +1,136 @@
+import os, sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+
+import multiprocessing
+import sqlite3
+import tempfile
+import threading
+import unittest
+
+from knowsys.dedupe_store import LruDedupeStore, SqliteDedupeStore, TieredDedupeStore, dedupe_key
+
+
+def _add_keys(path, keys, queue):
+    store = SqliteDedupeStore(path)
+    store.add_many(keys)
+    queue.put(store.inserts)
+    store.close()
+
+
+
+class TestDedupeStore(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.temp_dir.name, 'dedupe.sqlite3')
+
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+
+    def test_key_separates_fields(self):
+        self.assertNotEqual(dedupe_key('f1', 1, 'fact', 'a'), dedupe_key('f1', 11, 'fact', 'a'))
+        self.assertNotEqual(dedupe_key('f1', 1, 'fact', 'a'), dedupe_key('f1', 2, 'fact', 'a'))
+        self.assertEqual(dedupe_key('f1', 1, 'fact', 'a'), dedupe_key('f1', 1, 'fact', 'a'))
+
+
+    def test_lru_is_bounded(self):
+        store = LruDedupeStore(capacity=10)
+        for i in range(100):
+            self.assertFalse(store.contains(f"k{i}"))
+            store.add_many([f"k{i}"])
+        self.assertTrue(store.contains("k99"))
+        self.assertFalse(store.contains("k0"))
+        stats = store.stats()
+        self.assertEqual(stats['entries'], 10)
+        self.assertEqual(stats['evictions'], 90)
+        self.assertGreater(stats['memory_bytes'], 0)
+
+
+    def test_sqlite_survives_restart(self):
+        store = SqliteDedupeStore(self.path)
+        store.add_many(['k1'])
+        store.close()
+
+        store = SqliteDedupeStore(self.path)
+        self.assertTrue(store.contains('k1'))
+        self.assertFalse(store.contains('k2'))
+        store.add_many(['k1', 'k2'])
+        self.assertEqual(store.stats()['entries'], 2)
+        self.assertEqual(store.inserts, 1)
+        store.close()
+
+
+    def test_tiered_answers_from_backing_after_eviction(self):
+        store = TieredDedupeStore(SqliteDedupeStore(self.path), capacity=2)
+        store.add_many(['a', 'b', 'c'])
+        self.assertTrue(store.contains('a'))
+        self.assertEqual(store.stats()['cache']['entries'], 2)
+        store.close()
+
+
+    def test_discard(self):
+        store = TieredDedupeStore(SqliteDedupeStore(self.path), capacity=10)
+        store.add_many(['a', 'b'])
+        store.discard(['a', 'x'])
+        self.assertFalse(store.contains('a'))
+        self.assertTrue(store.contains('b'))
+        store.close()
+
+
+    def test_tiered_sees_discard_from_other_process(self):
+        # 兩個 TieredDedupeStore 共用同一個 SQLite 檔，模擬兩個 kg_service process
+        store, other = (TieredDedupeStore(SqliteDedupeStore(self.path), capacity=10) for _ in range(2))
+        store.add_many(['a', 'b'])
+        self.assertTrue(other.contains('a'))
+        self.assertEqual(other.stats()['cache']['entries'], 1)
+
+        store.discard(['a'])
+        self.assertFalse(other.contains('a'))
+        self.assertTrue(other.contains('b'))
+        self.assertEqual(other.stats()['invalidations'], 1)
+        store.close()
+        other.close()
+
+
+    def test_contains_does_not_add(self):
+        for store in (LruDedupeStore(), SqliteDedupeStore(self.path),
+                      TieredDedupeStore(SqliteDedupeStore(self.path), capacity=10)):
+            self.assertFalse(store.contains('a'))
+            self.assertFalse(store.contains('a'))
+            store.add_many(['a', 'b', 'a'])
+            self.assertTrue(store.contains('a'))
+            self.assertTrue(store.contains('b'))
+            store.discard(['a', 'b'])
+            store.close()
+
+
+    def test_close_closes_connections_of_all_threads(self):
+        store = SqliteDedupeStore(self.path)
+        workers = [threading.Thread(target=store.add_many, args=([f"k{i}"],)) for i in range(3)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        connections = list(store._connections)
+        self.assertEqual(len(connections), 4)       # 建立資料表的連線 + 3 個 thread
+        store.close()
+        for conn in connections:
+            with self.assertRaises(sqlite3.ProgrammingError):
+                conn.execute("SELECT 1")
+
+
+    def test_shared_across_processes(self):
+        keys = [f"k{i}" for i in range(200)]
+        queue = multiprocessing.Queue()
+        processes = [multiprocessing.Process(target=_add_keys, args=(self.path, keys, queue)) for _ in range(3)]
+        for p in processes:
+            p.start()
+        for p in processes:
+            p.join()
+        self.assertEqual(sum(queue.get() for _ in processes), len(keys))
+
+
+
+if __name__ == '__main__':
+    unittest.main()
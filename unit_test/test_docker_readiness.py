@@ -0,0 +1,156 @@
+import os, sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+import app_helper
+
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+import docker
+
+from knowsys import docker_management
+from knowsys.docker_management import DockerManager
+from knowsys.memory_profile import MIN_PROFILE
+
+
+class EmptyClient:
+    """ 沒有任何容器的 docker client。 """
+    def __init__(self):
+        self.containers = self
+
+    def list(self, all=False):
+        return []
+
+
+
+class SlowStartClient:
+    """ containers.run 需要一段時間才回傳，之後容器才出現在 containers.list() 的 docker client。 """
+    def __init__(self):
+        self.containers = self
+        self.started = []
+
+    def get(self, name):
+        raise docker.errors.NotFound(name)
+
+    def list(self, all=False):
+        return list(self.started)
+
+    def run(self, name, environment, **kwargs):
+        time.sleep(0.05)
+        container = mock.Mock()
+        container.name = name
+        container.attrs = {'Config': {'Env': [f'{key}={value}' for key, value in environment.items()]}}
+        self.started.append(container)
+        return container
+
+
+
+class FlakyDriver:
+    """ 前 failures 次連線失敗的 neo4j driver。 """
+    attempts = 0
+    failures = 0
+
+    def __init__(self, uri, **kwargs):
+        FlakyDriver.attempts += 1
+
+    def __enter__(self):
+        if FlakyDriver.attempts <= FlakyDriver.failures:
+            raise ConnectionError('bolt not ready')
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def session(self):
+        return mock.MagicMock()
+
+
+
+class TestReadiness(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.docker_manager = DockerManager(base_volume_dir=self.tmp.name, client=EmptyClient())
+
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+
+    def test_bolt_probe_backs_off(self):
+        FlakyDriver.attempts, FlakyDriver.failures = 0, 3
+        with mock.patch.object(docker_management.GraphDatabase, 'driver', FlakyDriver):
+            elapsed = self.docker_manager.wait_for_bolt(7687, timeout=5, initial_delay=0.01)
+        self.assertEqual(FlakyDriver.attempts, 4)
+        # 0.01 + 0.02 + 0.04
+        self.assertGreaterEqual(elapsed, 0.07)
+        self.assertLess(elapsed, 1)
+
+
+    def test_bolt_probe_timeout(self):
+        FlakyDriver.attempts, FlakyDriver.failures = 0, 1000
+        with mock.patch.object(docker_management.GraphDatabase, 'driver', FlakyDriver):
+            self.assertIsNone(self.docker_manager.wait_for_bolt(7687, timeout=0.1, initial_delay=0.01))
+
+
+    def test_not_ready_raises(self):
+        self.docker_manager.wait_for_bolt = mock.Mock(return_value=None)
+        with self.assertRaises(TimeoutError):
+            self.docker_manager._wait_ready('kg1', '7687')
+        self.docker_manager.wait_for_bolt.assert_called_once_with(7687, timeout=docker_management.READY_TIMEOUT)
+
+
+    def test_ensure_running_in_parallel(self):
+        active, peak = 0, 0
+        lock = threading.Lock()
+
+        def create_container(kg_name):
+            nonlocal active, peak
+            with lock:
+                active += 1
+                peak = max(peak, active)
+            time.sleep(0.05)
+            with lock:
+                active -= 1
+            if kg_name == 'broken':
+                raise RuntimeError('port conflict')
+            if kg_name == 'slow':
+                raise TimeoutError(f"KG '{kg_name}' not ready after 180s")
+            return f'http://localhost:{kg_name}', f'bolt://localhost:{kg_name}'
+
+        self.docker_manager.create_container = create_container
+        # create_container 已等待就緒，ensure_running 不再探測
+        self.docker_manager.wait_for_bolt = mock.Mock(side_effect=AssertionError('probed again'))
+        results = self.docker_manager.ensure_running(['kg1', 'kg2', 'kg3', 'broken', 'slow'], parallelism=2)
+
+        self.assertEqual(peak, 2)
+        self.assertEqual(list(results), ['kg1', 'kg2', 'kg3', 'broken', 'slow'])
+        self.assertEqual(results['kg1']['bolt_url'], 'bolt://localhost:kg1')
+        self.assertIsNone(results['kg1']['error'])
+        self.assertGreaterEqual(results['kg1']['seconds'], 0.05)
+        self.assertEqual(results['broken']['error'], 'port conflict')
+        self.assertEqual(results['slow']['error'], 'not ready after 180s')
+        self.assertIsNone(results['slow']['bolt_url'])
+        self.docker_manager.wait_for_bolt.assert_not_called()
+
+
+
+    def test_parallel_starts_share_memory_budget(self):
+        client = SlowStartClient()
+        # 預算只夠一個最小設定的容器
+        manager = DockerManager(base_volume_dir=self.tmp.name, client=client,
+                                memory_budget_gb=MIN_PROFILE.total_mb * 1.5 / 1024)
+        manager._wait_ready = mock.Mock()
+        results = manager.ensure_running(['kg1', 'kg2'], parallelism=2)
+
+        self.assertEqual(len(client.started), 1)
+        errors = [results[container.name]['error'] for container in client.started] + [
+            result['error'] for name, result in results.items() if name != client.started[0].name]
+        self.assertIsNone(errors[0])
+        self.assertTrue(errors[1].startswith('Memory budget exhausted'))
+
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,85 @@
+import os, sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+
+import unittest
+
+from knowsys.driver_registry import DriverRegistry
+
+
+
+class FakeDriver:
+    def __init__(self, uri):
+        self.uri = uri
+        self.healthy = True
+        self.closed = False
+
+    def verify_connectivity(self):
+        if not self.healthy:
+            raise ConnectionError("unreachable")
+
+    def close(self):
+        self.closed = True
+
+
+
+class FakeDriverRegistry(DriverRegistry):
+    def _create_driver(self, uri, auth):
+        self.created += 1
+        return FakeDriver(uri)
+
+
+
+class TestDriverRegistry(unittest.TestCase):
+    def test_driver_is_shared_per_uri(self):
+        registry = FakeDriverRegistry()
+        d1 = registry.acquire("bolt://localhost:7687")
+        d2 = registry.acquire("bolt://localhost:7687")
+        d3 = registry.acquire("bolt://localhost:7688")
+        self.assertIs(d1, d2)
+        self.assertIsNot(d1, d3)
+        self.assertEqual(registry.created, 2)
+        self.assertEqual(registry.stats()['drivers']["bolt://localhost:7687"]['borrowers'], 2)
+
+
+    def test_idle_driver_is_evicted(self):
+        registry = FakeDriverRegistry(idle_timeout=-1)
+        driver = registry.acquire("bolt://localhost:7687")
+        self.assertEqual(registry.evict_idle(), 0)     # 仍被借用
+        registry.release(driver)
+        self.assertEqual(registry.evict_idle(), 1)
+        self.assertTrue(driver.closed)
+
+
+    def test_unhealthy_driver_is_replaced(self):
+        registry = FakeDriverRegistry(health_check_interval=-1)
+        driver = registry.acquire("bolt://localhost:7687")
+        driver.healthy = False
+        replacement = registry.acquire("bolt://localhost:7687")
+        self.assertIsNot(driver, replacement)
+        self.assertEqual(registry.health_failures, 1)
+        self.assertFalse(driver.closed)     # 仍有借用者
+        registry.release(driver)
+        self.assertTrue(driver.closed)
+
+
+    def test_health_check_outside_lock(self):
+        registry = FakeDriverRegistry(health_check_interval=-1)
+        driver = registry.acquire("bolt://localhost:7687")
+        lock_free = []
+
+        def verify_connectivity():
+            # 檢查期間其他 thread 仍可借用與歸還 driver
+            acquired = registry._lock.acquire(blocking=False)
+            if acquired:
+                registry._lock.release()
+            lock_free.append(acquired)
+
+        driver.verify_connectivity = verify_connectivity
+        registry.release(driver)
+        self.assertIs(registry.acquire("bolt://localhost:7687"), driver)
+        self.assertEqual(lock_free, [True])
+
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,96 @@
+import os, sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+import app_helper
+
+import unittest
+
+from knowsys.entity_index import (NgramEntityIndex, best_matches, classify_match, fulltext_query,
+                                  lucene_escape, preferred_matches, rank_matches, similarity)
+from knowsys.graph_snapshot import GraphSnapshot
+
+
+def node(eid, name, labels=('fact',), aliases=None):
+    return {'element_id': eid, 'labels': list(labels), 'name': name, 'aliases': aliases or []}
+
+
+
+class TestEntityIndex(unittest.TestCase):
+    def test_lucene_escape(self):
+        self.assertEqual(lucene_escape('C++ (語言): a/b'), r'C\+\+ \(語言\)\: a\/b')
+        self.assertEqual(fulltext_query('Photo-Synthesis'), r'"photo\-synthesis"^3 OR (photo\-synthesis)')
+        self.assertEqual(fulltext_query('water cycle'), '"water cycle"^3 OR (water~1 AND cycle~1)')
+
+
+    def test_classify_match(self):
+        self.assertEqual(classify_match('Ｗｉｎｔｅｒ ', 'winter', []), ('name', 1.0))
+        self.assertEqual(classify_match('cold season', '冬天', ['Cold  Season']), ('alias', 1.0))
+        match, score = classify_match('光合作用', '光合作用的過程', [])
+        self.assertEqual(match, 'fuzzy')
+        self.assertAlmostEqual(score, similarity('光合作用', '光合作用的過程'))
+
+
+    def test_rank_prefers_name_then_alias_then_label_order(self):
+        nodes = [node('c1', '冬季', ['concept'], ['冬天']), node('f2', '冬天的', ['fact']),
+                 node('f1', '冬天', ['fact']), node('c2', '冬天', ['concept']), node('f1', '冬天', ['fact'])]
+        ranked = rank_matches('冬天', nodes, ('fact', 'concept'))
+
+        self.assertEqual([(m['node']['element_id'], m['match']) for m in ranked],
+                         [('f1', 'name'), ('c2', 'name'), ('c1', 'alias'), ('f2', 'fuzzy')])
+        self.assertEqual([m['node']['element_id'] for m in best_matches(ranked)], ['f1', 'c2'])
+        self.assertEqual(rank_matches('冬天', nodes, ('fact',), limit=1)[0]['node']['element_id'], 'f1')
+
+
+    def test_fuzzy_below_min_score_dropped(self):
+        self.assertEqual(rank_matches('光合作用', [node('f1', '呼吸作用')], ('fact',), min_score=0.6), [])
+        fuzzy = rank_matches('光合作用', [node('f1', '光合作用原理'), node('f2', '光合')], ('fact',))
+        self.assertEqual(best_matches(fuzzy), fuzzy[:1])
+        self.assertEqual(fuzzy[0]['node']['element_id'], 'f1')
+
+
+    def test_preferred_matches_match_name_lookup(self):
+        """ 與原本的名稱查詢 (先查 fact，查無時不限 label) 相同：同名 fact 分佈在 7 頁時全部保留，不混入同名 concept。 """
+        db = '4:0f3c2a9e-1b2d-4c5e-8f70-123456789abc:'
+        nodes = [(f'{db}{page}', ['fact'], {'name': '冬天', 'file_id': 'f1', 'page_number': page}) for page in range(7)]
+        nodes += [(f'{db}50', ['concept'], {'name': '冬天', 'file_id': 'f1'}),
+                  (f'{db}51', ['concept'], {'name': '季節', 'file_id': 'f1'}),
+                  (f'{db}60', ['fact'], {'name': '寒流', 'file_id': 'f1', 'page_number': 1})]
+        relationships = [(f'{db}{page}', 'is_a', f'{db}51') for page in range(7)]
+        relationships += [(f'{db}{page}', f'rel{page}', f'{db}60') for page in range(7)]
+        relationships += [(f'{db}50', 'include_in', f'{db}51')]
+        snapshot = GraphSnapshot()
+        snapshot.reset(nodes, relationships)
+        labels = ('fact', 'concept', 'structure', 'document')
+
+        def clauses(eids):
+            relationships = snapshot.query_all_relationships_many(eids)
+            return {clause for eid in eids for clause in relationships[eid]}
+
+        for name in ('季節', '冬天'):
+            expected = snapshot.query_nodes_by_names([name], label='fact')[name] or \
+                snapshot.query_nodes_by_names([name])[name]
+            matches = snapshot.resolve_entities([name], labels=labels, limit=None)[name]
+            resolved = [entry['node'] for entry in preferred_matches(matches, labels)]
+            self.assertEqual(sorted(n['element_id'] for n in resolved), sorted(n['element_id'] for n in expected))
+            self.assertEqual(clauses([n['element_id'] for n in resolved]), clauses([n['element_id'] for n in expected]))
+        self.assertEqual(len(resolved), 7)
+        self.assertEqual(len(clauses([n['element_id'] for n in resolved])), 8)     # 7 個關聯 + 1 個 is_a
+
+        # 預設的 limit 會截斷同名的 fact
+        self.assertEqual(len(snapshot.resolve_entities(['冬天'], labels=labels)['冬天']), 5)
+
+
+    def test_ngram_candidates(self):
+        index = NgramEntityIndex()
+        index.add(1, ['光合作用', 'photosynthesis'])
+        index.add(2, ['呼吸作用'])
+        index.add(3, ['Photo Synthesis'])
+
+        self.assertEqual(index.candidates('光合作用')[0], 1)
+        self.assertNotIn(2, index.candidates('光合作用', min_score=0.8))
+        self.assertEqual(set(index.candidates('PHOTOSYNTHESIS')[:2]), {1, 3})
+        self.assertEqual(index.candidates('颱風'), [])
+
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,115 @@
+import os, sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+import app_helper
+
+import sqlite3
+import tempfile
+import threading
+import time
+import unittest
+
+from retrieval.extraction_cache import ExtractionCache, cache_key
+
+
+CONCEPT_FACTS = {'城市': ['台北', '台北101'], '地理': ['台灣']}
+FACT_PAIRS = [('台北', '位於', '台灣'), ('台北101', '位於', '台北')]
+
+
+
+class TestExtractionCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, 'cache', 'extraction.sqlite3')
+
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+
+    def test_key(self):
+        key = cache_key('台北是 台灣的首都。\n', 'chain.v1', 'ChatGpt/gpt-4o-mini')
+        # 只有空白或全形/半形不同的頁面視為相同
+        self.assertEqual(key, cache_key(' 台北是\t台灣的首都。', 'chain.v1', 'ChatGpt/gpt-4o-mini'))
+        self.assertEqual(cache_key('ＡＢＣ 1', 'chain.v1', 'm'), cache_key('ABC 1', 'chain.v1', 'm'))
+        self.assertNotEqual(key, cache_key('台北是台灣的首都。', 'chain.v1', 'ChatGpt/gpt-4o-mini'))
+        self.assertNotEqual(key, cache_key('台北是 台灣的首都。', 'chain.v2', 'ChatGpt/gpt-4o-mini'))
+        self.assertNotEqual(key, cache_key('台北是 台灣的首都。', 'chain.v1', 'OssGpt/gpt-oss:20b'))
+
+
+    def test_hit_miss_and_persistence(self):
+        cache = ExtractionCache(self.path)
+        self.assertIsNone(cache.get('k'))
+        cache.put('k', CONCEPT_FACTS, FACT_PAIRS)
+        self.assertEqual(cache.get('k'), (CONCEPT_FACTS, FACT_PAIRS))
+        self.assertEqual((cache.stats()['hits'], cache.stats()['misses'], cache.stats()['entries']), (1, 1, 1))
+        cache.close()
+
+        cache = ExtractionCache(self.path)
+        self.assertEqual(cache.get('k'), (CONCEPT_FACTS, FACT_PAIRS))
+        cache.close()
+
+
+    def test_evicts_least_recently_used(self):
+        cache = ExtractionCache(self.path, max_entries=3)
+        for key in 'abc':
+            cache.put(key, CONCEPT_FACTS, FACT_PAIRS)
+            time.sleep(0.01)
+        cache.get('a')
+        cache.put('d', CONCEPT_FACTS, FACT_PAIRS)
+
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual([key for key in 'acd' if cache.get(key)], ['a', 'c', 'd'])
+        self.assertEqual(cache.stats()['evictions'], 1)
+        cache.close()
+
+
+    def test_bounded_by_bytes(self):
+        cache = ExtractionCache(self.path, max_bytes=1000)
+        for i in range(20):
+            cache.put(str(i), {'concept': [f'fact {i}'] * 5}, [])
+        stats = cache.stats()
+        self.assertLessEqual(stats['bytes'], 1000)
+        self.assertIsNotNone(cache.get('19'))
+        self.assertIsNone(cache.get('0'))
+        cache.close()
+
+
+    def test_totals_tracked_without_scanning(self):
+        cache = ExtractionCache(self.path, max_entries=3)
+        for key in 'abcd':
+            cache.put(key, CONCEPT_FACTS, FACT_PAIRS)
+        cache.put('d', {'concept': ['fact']}, [])     # 取代既有結果
+        conn = cache._connection()
+        self.assertEqual(cache._totals(conn),
+                         conn.execute("SELECT count(*), sum(size) FROM extraction").fetchone())
+        self.assertEqual(cache.stats()['entries'], 3)
+        cache.close()
+
+        # 沒有 extraction_meta 的舊檔案以現有內容初始化
+        conn = sqlite3.connect(self.path)
+        conn.execute("DROP TABLE extraction_meta")
+        conn.commit()
+        conn.close()
+        cache = ExtractionCache(self.path)
+        self.assertEqual(cache.stats()['entries'], 3)
+        cache.close()
+
+
+    def test_threads(self):
+        cache = ExtractionCache(self.path)
+
+        def work(i):
+            cache.put(str(i), CONCEPT_FACTS, FACT_PAIRS)
+            cache.get(str(i))
+
+        threads = [threading.Thread(target=work, args=(i,)) for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual((cache.stats()['entries'], cache.stats()['hits']), (8, 8))
+
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,94 @@
+import os, sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+import app_helper
+
+import unittest
+
+from knowsys import fact_identity
+from knowsys.fact_identity import fact_key, normalize_fact_name, plan_fact_collapse
+
+
+
+def fact(eid, name, page_number=1, aliases=None, key=None):
+    return {'eid': eid, 'file_id': 'f1', 'page_number': page_number, 'name': name, 'aliases': aliases, 'fact_key': key}
+
+
+
+class TestFactKey(unittest.TestCase):
+    def test_normalization(self):
+        self.assertEqual(normalize_fact_name('  Ｗｉｎｔｅｒ\n Season '), 'winter season')
+        self.assertEqual(fact_key('f1', 1, '冬天'), fact_key('f1', 1, ' 冬天 '))
+        self.assertNotEqual(fact_key('f1', 1, '冬天'), fact_key('f1', 2, '冬天'))
+        self.assertNotEqual(fact_key('f1', 1, '冬天'), fact_key('f2', 1, '冬天'))
+
+
+
+class TestCollapsePlan(unittest.TestCase):
+    def test_duplicates_merged_into_keyed_node(self):
+        key = fact_key('f1', 1, '冬天')
+        plan = plan_fact_collapse([
+            fact('e1', '冬天', aliases=['winter']),
+            fact('e2', '冬天 ', aliases=['cold', 'winter']),
+            fact('e3', '冬天', key=key),
+            fact('e4', '冬天', page_number=2),
+        ])
+
+        self.assertEqual(plan[0], {'keep': 'e3', 'duplicates': ['e1', 'e2'], 'fact_key': key,
+                                   'aliases': ['winter', 'cold']})
+        self.assertEqual(plan[1], {'keep': 'e4', 'duplicates': [], 'fact_key': fact_key('f1', 2, '冬天'),
+                                   'aliases': []})
+
+
+    def test_keyed_unique_facts_skipped(self):
+        self.assertEqual(plan_fact_collapse([fact('e1', '冬天', key=fact_key('f1', 1, '冬天'))]), [])
+
+
+
+class RecordingTx:
+    class Result(list):
+        class Summary:
+            class Counters:
+                relationships_created = 1
+            counters = Counters()
+
+        def consume(self):
+            return self.Summary()
+
+    def __init__(self, types):
+        self.types = types
+        self.statements = []
+
+    def run(self, query, **params):
+        self.statements.append((query, params))
+        if 'type(r)' in query:
+            return self.Result({'type': t} for t in self.types)
+        return self.Result()
+
+
+
+class TestCollapseTx(unittest.TestCase):
+    def test_relationships_moved_before_delete(self):
+        plan = [{'keep': 'e3', 'duplicates': ['e1'], 'fact_key': 'k', 'aliases': []}]
+        tx = RecordingTx(['is_a', 'before'])
+        moved = fact_identity._collapse_tx(tx, plan)
+
+        queries = [query for query, _ in tx.statements]
+        self.assertEqual(moved, 4)      # 兩種關聯 x 出 / 入
+        self.assertTrue(any('MERGE (keep)-[m:`is_a`]->(o)' in query for query in queries))
+        self.assertTrue(any('MERGE (keep)<-[m:`before`]-(o)' in query for query in queries))
+        # 產生關聯的頁面併入保留的關聯
+        self.assertTrue(all('m.sources' in query for query in queries if 'MERGE (keep)' in query))
+        self.assertIn('DETACH DELETE', queries[-2])
+        self.assertIn('SET n.fact_key', queries[-1])
+        self.assertEqual(tx.statements[1][1]['groups'][0]['members'], ['e3', 'e1'])
+
+
+    def test_keys_only(self):
+        tx = RecordingTx([])
+        self.assertEqual(fact_identity._collapse_tx(tx, [{'keep': 'e1', 'duplicates': [], 'fact_key': 'k', 'aliases': []}]), 0)
+        self.assertEqual(len(tx.statements), 1)
+
+
+
+if __name__ == '__main__':
+    unittest.main()
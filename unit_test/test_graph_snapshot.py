@@ -0,0 +1,233 @@
+import os, sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+import app_helper
+
+import tempfile
+import unittest
+
+from knowsys.graph_snapshot import GraphSnapshot
+
+
+DB = '4:0f3c2a9e-1b2d-4c5e-8f70-123456789abc:'
+
+
+def eid(n):
+    return f"{DB}{n}"
+
+
+
+class TestGraphSnapshot(unittest.TestCase):
+    def setUp(self):
+        nodes = [
+            (eid(0), ['document'], {'name': 'Doc', 'file_id': 'f1', 'metadata': '{"title": "Doc"}'}),
+            (eid(1), ['structure'], {'name': 'Ch1', 'file_id': 'f1'}),
+            (eid(2), ['structure'], {'name': 'Ch1.1', 'file_id': 'f1'}),
+            (eid(3), ['structure'], {'name': 'Ch1.0', 'file_id': 'f1'}),
+            (eid(4), ['structure'], {'name': 'Ch2', 'file_id': 'f1'}),
+            (eid(10), ['concept'], {'name': '季節', 'file_id': 'f1', 'aliases': ['season']}),
+            (eid(11), ['concept'], {'name': '天氣', 'file_id': 'f1', 'aliases': []}),
+            (eid(12), ['concept'], {'name': '文件', 'file_id': 'f1', 'aliases': []}),
+            (eid(20), ['fact'], {'name': '冬天', 'file_id': 'f1', 'page_number': 1, 'aliases': []}),
+            (eid(21), ['fact'], {'name': '春天', 'file_id': 'f1', 'page_number': 1, 'aliases': []}),
+            (eid(22), ['fact'], {'name': '冬天', 'file_id': 'f1', 'page_number': 2, 'aliases': []}),
+            (eid(99), ['_KaqgSchema'], {'version': 1}),
+        ]
+        relationships = [
+            (eid(1), 'part_of', eid(0)),
+            (eid(4), 'part_of', eid(0)),
+            (eid(2), 'part_of', eid(1)),
+            (eid(3), 'part_of', eid(1)),
+            (eid(10), 'include_in', eid(2)),
+            (eid(11), 'include_in', eid(4)),
+            (eid(12), 'include_in', eid(0)),
+            (eid(20), 'is_a', eid(10)),
+            (eid(21), 'is_a', eid(10)),
+            (eid(22), 'is_a', eid(10)),
+            (eid(20), 'before', eid(21)),
+        ]
+        self.snapshot = GraphSnapshot()
+        self.snapshot.reset(nodes, relationships)
+
+
+    def names(self, nodes):
+        return [n['name'] for n in nodes]
+
+
+    def test_serialized_like_knowledge_graph(self):
+        node = self.snapshot.query_nodes_by_name('季節', 'concept')[0]
+        self.assertEqual(node, {'element_id': eid(10), 'labels': ['concept'],
+                                'name': '季節', 'file_id': 'f1', 'aliases': ['season']})
+        fact = self.snapshot.query_nodes_by_name('冬天')
+        self.assertEqual([f['page_number'] for f in fact], [1, 2])
+        self.assertEqual(self.snapshot.query_nodes_by_name('季節', 'fact'), [])
+        self.assertEqual(self.snapshot.node_count, 11)
+
+
+    def test_neighbors(self):
+        facts = self.snapshot.query_nodes_related_by(eid(10), 'is_a', 'fact')
+        self.assertEqual(sorted(f['element_id'] for f in facts), [eid(20), eid(21), eid(22)])
+        self.assertEqual(self.names(self.snapshot.query_nodes_relate_to(eid(20))), ['季節', '春天'])
+        self.assertEqual(self.snapshot.query_nodes_relate_to(eid(20), 'unknown'), [])
+        self.assertEqual(self.snapshot.query_nodes_related_by(f"{DB}12345"), [])
+
+
+    def test_all_relationships(self):
+        self.assertEqual(sorted(self.snapshot.query_all_relationships(eid(21))),
+                         [('冬天', 'before', '春天'), ('春天', 'is_a', '季節')])
+
+
+    def test_batched_reads(self):
+        nodes = self.snapshot.query_nodes_by_names(['冬天', '夏天'], 'fact')
+        self.assertEqual([len(nodes['冬天']), len(nodes['夏天'])], [2, 0])
+        self.assertEqual(self.snapshot.query_all_relationships_many([eid(21)])[eid(21)],
+                         self.snapshot.query_all_relationships(eid(21)))
+        neighbors = self.snapshot.query_neighbors_many([eid(21)], label='fact')[eid(21)]
+        self.assertEqual([(rel, outgoing, node['name']) for rel, outgoing, node in neighbors],
+                         [('before', False, '冬天')])
+
+
+    def test_subsections(self):
+        # 前序，同層依關聯載入的順序 (Ch1.1 的 part_of 先於 Ch1.0)，不依名稱排序
+        self.assertEqual(self.names(self.snapshot.query_subsections('Doc', ['Ch1'])), ['Ch1', 'Ch1.1', 'Ch1.0'])
+        self.assertEqual(self.names(self.snapshot.query_subsections('Doc', 'Ch2')), ['Ch2'])
+        self.assertEqual(self.names(self.snapshot.query_subsections('Doc')), ['Ch1', 'Ch1.1', 'Ch1.0', 'Ch2'])
+        self.assertEqual(self.names(self.snapshot.query_subsections('Doc', ['missing'])),
+                         ['Ch1', 'Ch1.1', 'Ch1.0', 'Ch2'])
+
+
+    def test_section_concepts(self):
+        self.assertEqual(sorted(self.names(self.snapshot.query_section_concepts('Doc', ['Ch1']))), sorted(['文件', '季節']))
+        self.assertEqual(sorted(self.names(self.snapshot.query_section_concepts('Doc'))), sorted(['天氣', '文件', '季節']))
+
+
+    def test_section_concepts_many(self):
+        criteria = [('Doc', ['Ch1']), ('Doc', None), ('Doc', ['Ch1'])]
+        results = self.snapshot.query_section_concepts_many(criteria)
+        self.assertEqual([sorted(self.names(concepts)) for concepts in results],
+                         [sorted(self.names(self.snapshot.query_section_concepts(*criterion))) for criterion in criteria])
+
+
+    def test_resolve_entities(self):
+        results = self.snapshot.resolve_entities(['冬天', 'Season', '冬天天', '颱風'])
+
+        self.assertEqual([(m['node']['element_id'], m['match']) for m in results['冬天']],
+                         [(eid(20), 'name'), (eid(22), 'name')])
+        self.assertEqual([(m['node']['name'], m['match']) for m in results['Season']], [('季節', 'alias')])
+        self.assertEqual(results['冬天天'][0]['match'], 'fuzzy')
+        self.assertEqual(results['冬天天'][0]['node']['name'], '冬天')
+        self.assertEqual(results['颱風'], [])
+
+
+    def test_resolve_entities_sees_new_nodes(self):
+        self.snapshot.resolve_entities(['冬天'])
+        self.snapshot.apply_delta([(eid(30), ['fact'], {'name': '夏天', 'aliases': ['summer']})], [])
+        self.assertEqual(self.snapshot.resolve_entities(['summer'])['summer'][0]['node']['element_id'], eid(30))
+
+
+    def test_apply_delta(self):
+        added = self.snapshot.apply_delta(
+            [(eid(30), ['fact'], {'name': '夏天', 'file_id': 'f1', 'page_number': 3, 'aliases': []}),
+             (eid(10), ['concept'], {'name': '季節', 'file_id': 'f1', 'aliases': ['season', 'seasons']})],
+            [(eid(30), 'is_a', eid(10)), (eid(20), 'is_a', eid(10))])
+        self.assertEqual(added, 1)
+        facts = self.snapshot.query_nodes_related_by(eid(10), 'is_a')
+        self.assertIn(eid(30), [f['element_id'] for f in facts])
+        self.assertEqual(self.snapshot.query_nodes_by_name('夏天')[0]['element_id'], eid(30))
+        self.assertEqual(self.snapshot.query_nodes_by_name('季節')[0]['aliases'], ['season', 'seasons'])
+        self.assertEqual(self.snapshot.edge_count, 12)
+
+
+    def test_apply_delta_updates_relationship_properties(self):
+        self.snapshot.apply_delta([], [(eid(20), 'is_a', eid(10), {'sources': ['f1:1', 'f1:5']}),
+                                       (eid(31), 'is_a', eid(10), {'sources': ['f1:3']})])
+        self.snapshot.apply_delta([(eid(31), ['fact'], {'name': '秋天'})],
+                                  [(eid(31), 'is_a', eid(10), {'sources': ['f1:3']}), (eid(31), 'is_a', eid(10))])
+        src, types, dst, extras = self.snapshot._edges()
+        rel_extras = self.snapshot._rel_extras.strings
+        properties = {(int(s), int(o)): rel_extras[e] for s, o, e in zip(src, dst, extras) if e >= 0}
+        index = self.snapshot._node_index
+        self.assertEqual(properties, {(index(eid(20)), index(eid(10))): '{"sources": ["f1:1", "f1:5"]}',
+                                      (index(eid(31)), index(eid(10))): '{"sources": ["f1:3"]}'})
+        self.snapshot.compact()
+        self.assertEqual(sorted(self.snapshot._rel_extras.strings[e] for e in self.snapshot._out_extras if e >= 0),
+                         ['{"sources": ["f1:1", "f1:5"]}', '{"sources": ["f1:3"]}'])
+
+
+    def test_ids_beyond_int16(self):
+        count = 40_000
+        nodes = [(eid(i), [f'L{i}'], {'name': f'n{i}'}) for i in range(count)]
+        relationships = [(eid(i), f'r{i}', eid(i + 1)) for i in range(count - 1)]
+        snapshot = GraphSnapshot()
+        snapshot.reset(nodes, relationships)
+        snapshot.apply_delta([(eid(count), [f'L{count}'], {'name': f'n{count}'})], [(eid(0), f'r{count}', eid(count))])
+
+        self.assertEqual(snapshot.query_nodes_by_name(f'n{count - 1}')[0]['labels'], [f'L{count - 1}'])
+        self.assertEqual(snapshot.query_nodes_by_name(f'n{count}')[0]['labels'], [f'L{count}'])
+        self.assertEqual(self.names(snapshot.query_nodes_relate_to(eid(count - 2), f'r{count - 2}')), [f'n{count - 1}'])
+        snapshot.compact()
+        self.assertEqual(self.names(snapshot.query_nodes_relate_to(eid(0), f'r{count}')), [f'n{count}'])
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'kg.kgsnap')
+            snapshot.save(path)
+            opened = GraphSnapshot.open(path)
+            self.assertEqual(opened.query_nodes_by_name(f'n{count - 1}')[0]['labels'], [f'L{count - 1}'])
+            self.assertEqual(self.names(opened.query_nodes_related_by(eid(count - 1), f'r{count - 2}')),
+                             [f'n{count - 2}'])
+
+
+    def test_compact_keeps_results(self):
+        before = self.snapshot.query_nodes_related_by(eid(10), 'is_a')
+        self.snapshot.apply_delta([(eid(31), ['fact'], {'name': '秋天', 'file_id': 'f1', 'page_number': 3})],
+                                  [(eid(31), 'is_a', eid(10))])
+        self.snapshot.compact()
+        self.assertEqual(self.snapshot.stats()['overlay_edges'], 0)
+        after = self.snapshot.query_nodes_related_by(eid(10), 'is_a')
+        self.assertEqual(sorted(n['element_id'] for n in after),
+                         sorted([n['element_id'] for n in before] + [eid(31)]))
+        self.assertEqual(self.snapshot.query_nodes_by_name('秋天')[0]['element_id'], eid(31))
+
+
+    def test_refresh_groups_triplets(self):
+        class FakeSession:
+            def __init__(self):
+                self.queries = []
+
+            def __enter__(self):
+                return self
+
+            def __exit__(self, *args):
+                pass
+
+            def run(self, query, rows):
+                self.queries.append((query, rows))
+                return [{'s_eid': eid(40), 's_labels': ['fact'], 's_props': {'name': row['subject_name']},
+                         'o_eid': eid(10), 'o_labels': ['concept'], 'o_props': {'name': '季節'},
+                         'r_props': {'sources': ['f1:4']}}
+                        for row in rows]
+
+        class FakeKG:
+            def __init__(self):
+                self.fake_session = FakeSession()
+
+            def session(self):
+                return self.fake_session
+
+        kg = FakeKG()
+        triplets = [({'type': 'fact', 'name': '立春'}, {'name': 'is_a'}, {'type': 'concept', 'name': '季節'})] * 2
+        self.assertEqual(self.snapshot.refresh(kg, triplets), 1)
+        self.assertEqual(len(kg.fake_session.queries), 1)
+        self.assertEqual(len(kg.fake_session.queries[0][1]), 1)
+        self.assertIn('立春', self.names(self.snapshot.query_nodes_related_by(eid(10), 'is_a', 'fact')))
+
+
+    def test_memory_report(self):
+        report = self.snapshot.memory_report()
+        self.assertEqual(report['edges'], 11)
+        self.assertEqual(report['total_bytes'], sum(report['bytes'].values()))
+        self.assertGreater(report['mb_per_million_edges'], 0)
+
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,134 @@
+import os, sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+import app_helper
+
+import csv
+import tempfile
+import unittest
+
+from knowsys import bulk_import
+from knowsys.graph_snapshot import GraphSnapshot
+from knowsys.kg_archive import SnapshotArchive, write_import_csv
+
+
+DB = '4:0f3c2a9e-1b2d-4c5e-8f70-123456789abc:'
+
+
+def eid(n):
+    return f"{DB}{n}"
+
+
+NODES = [
+    (eid(0), ['document'], {'name': 'Doc', 'file_id': 'f1', 'metadata': '{"title": "Doc"}'}),
+    (eid(1), ['structure'], {'name': 'Ch1', 'file_id': 'f1'}),
+    (eid(10), ['concept'], {'name': '季節', 'file_id': 'f1', 'aliases': ['season', 'a;b']}),
+    (eid(20), ['fact'], {'name': '冬天', 'file_id': 'f1', 'page_number': 1, 'aliases': [], 'fact_key': 'k20'}),
+    (eid(21), ['fact'], {'name': '春天', 'file_id': 'f1', 'page_number': 1, 'aliases': [], 'fact_key': 'k21'}),
+    (eid(99), ['_KaqgSchema'], {'version': 1}),
+]
+RELATIONSHIPS = [
+    (eid(1), 'part_of', eid(0)),
+    (eid(10), 'include_in', eid(1)),
+    (eid(20), 'is_a', eid(10), {'sources': ['f1:1']}),
+    (eid(21), 'is_a', eid(10), {'sources': ['f1:1', 'f1:2']}),
+    (eid(20), 'before', eid(21), {}),
+]
+
+
+
+class TestKGArchive(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, 'kg.kgsnap')
+        self.snapshot = GraphSnapshot()
+        self.snapshot.reset(NODES, RELATIONSHIPS)
+
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+
+    def test_round_trip(self):
+        self.snapshot.apply_delta([(eid(22), ['fact'], {'name': '夏天', 'file_id': 'f2', 'page_number': 3})],
+                                  [(eid(22), 'is_a', eid(10), {'sources': ['f2:3']})])   # overlay 關聯一併保存
+        stats = self.snapshot.save(self.path, source='kg')
+        opened = GraphSnapshot.open(self.path)
+
+        self.assertEqual((stats['nodes'], stats['edges']), (6, 6))
+        self.assertEqual((opened.node_count, opened.edge_count), (6, 6))
+        for name in ('Doc', '季節', '冬天', '夏天'):
+            self.assertEqual(opened.query_nodes_by_name(name), self.snapshot.query_nodes_by_name(name))
+        self.assertEqual(sorted(f['name'] for f in opened.query_nodes_related_by(eid(10), 'is_a', 'fact')),
+                         ['冬天', '夏天', '春天'])
+        self.assertEqual(opened.query_all_relationships(eid(21)), self.snapshot.query_all_relationships(eid(21)))
+        self.assertEqual(opened.query_section_concepts('Doc', 'Ch1'), self.snapshot.query_section_concepts('Doc', 'Ch1'))
+        with SnapshotArchive(self.path) as archive:
+            self.assertEqual(sorted(archive.strings('rel_extras')),
+                             ['{"sources": ["f1:1", "f1:2"]}', '{"sources": ["f1:1"]}', '{"sources": ["f2:3"]}'])
+
+
+    def test_layout_by_label_and_type(self):
+        self.snapshot.save(self.path)
+        with SnapshotArchive(self.path) as archive:
+            labelsets = {tuple(r['name']): (r['start'], r['count']) for r in archive.header['labelsets']}
+            types = {r['name']: (r['start'], r['count']) for r in archive.header['types']}
+            node_labels = archive.array('nodes.labels').tolist()
+            src = archive.array('edges.src').tolist()
+
+        self.assertEqual(node_labels, sorted(node_labels))
+        self.assertEqual(labelsets[('fact',)][1], 2)
+        self.assertEqual(types['is_a'][1], 2)
+        lo, count = types['is_a']
+        self.assertEqual(src[lo:lo + count], sorted(src[lo:lo + count]))
+
+
+    def test_opened_snapshot_accepts_delta(self):
+        self.snapshot.save(self.path)
+        opened = GraphSnapshot.open(self.path)
+        opened.apply_delta([(eid(20), ['fact'], {'name': '冬天', 'file_id': 'f9', 'page_number': 1})], [])
+        self.assertEqual(opened.query_nodes_by_name('冬天')[0]['file_id'], 'f9')
+        self.assertEqual(GraphSnapshot.open(self.path).query_nodes_by_name('冬天')[0]['file_id'], 'f1')
+
+
+    def test_import_csv(self):
+        self.snapshot.save(self.path)
+        csv_dir = os.path.join(self.tmp.name, 'csv')
+        stats = write_import_csv(self.path, csv_dir)
+
+        def read(filename):
+            with open(os.path.join(csv_dir, filename), encoding='utf-8', newline='') as f:
+                return list(csv.reader(f))
+
+        header = read(bulk_import.NODE_HEADER)[0]
+        nodes = {row[header.index('name')]: dict(zip(header, row)) for row in read(bulk_import.NODE_DATA)}
+        self.assertEqual((stats['nodes'], stats['relationships']), (5, 5))
+        self.assertIn('page_number:long', header)
+        self.assertEqual(header[0], ':ID')
+        self.assertEqual(nodes['季節']['aliases:string[]'], f'season{bulk_import.ARRAY_DELIMITER}a;b')
+        self.assertEqual(nodes['冬天']['aliases:string[]'], '')
+        self.assertEqual(nodes['冬天']['fact_key'], 'k20')
+        relationships = {(row[0], row[2], row[1]): row[3] for row in read(bulk_import.RELATIONSHIP_DATA)}
+        self.assertIn((nodes['冬天'][':ID'], 'before', nodes['春天'][':ID']), relationships)
+        # r.sources 隨封存檔還原，頁面退役仍可移除關聯
+        self.assertEqual(read(bulk_import.RELATIONSHIP_HEADER)[0], [':START_ID', ':END_ID', ':TYPE', 'sources:string[]'])
+        self.assertEqual(relationships[(nodes['春天'][':ID'], 'is_a', nodes['季節'][':ID'])],
+                         f'f1:1{bulk_import.ARRAY_DELIMITER}f1:2')
+        self.assertEqual(relationships[(nodes['冬天'][':ID'], 'before', nodes['春天'][':ID'])], '')
+
+
+    def test_rejects_other_files(self):
+        with open(self.path, 'wb') as f:
+            f.write(b'not an archive' * 10)
+        with self.assertRaises(ValueError):
+            SnapshotArchive(self.path)
+
+        self.snapshot.save(self.path)
+        with open(self.path, 'r+b') as f:
+            f.truncate(200)
+        with self.assertRaises(ValueError):
+            GraphSnapshot.open(self.path)
+
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,100 @@
+import os, sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+import app_helper
+
+import threading
+import unittest
+
+from knowsys.kg_dispatcher import READ, WRITE, KGDispatcher
+
+
+
+class TestKGDispatcher(unittest.TestCase):
+    def setUp(self):
+        self.release = threading.Event()
+
+
+    def tearDown(self):
+        self.release.set()
+
+
+    def blocked_write(self, started):
+        started.set()
+        self.release.wait(5)
+        return 'written'
+
+
+    def test_read_not_blocked_by_write(self):
+        dispatcher = KGDispatcher()
+        started = threading.Event()
+        write = dispatcher.submit('kgA', WRITE, self.blocked_write, started)
+        self.assertTrue(started.wait(1))
+
+        self.assertEqual(dispatcher.call('kgB', READ, lambda: 'concepts'), 'concepts')
+        self.assertEqual(dispatcher.call('kgA', READ, lambda: 'concepts'), 'concepts')
+        self.assertFalse(write.done())
+
+        self.release.set()
+        self.assertEqual(write.result(1), 'written')
+        dispatcher.close()
+
+
+    def test_writes_to_same_kg_are_serialized(self):
+        dispatcher = KGDispatcher(write_workers=1)
+        active, peak = [0], [0]
+        lock = threading.Lock()
+
+        def write():
+            with lock:
+                active[0] += 1
+                peak[0] = max(peak[0], active[0])
+            threading.Event().wait(0.01)
+            with lock:
+                active[0] -= 1
+
+        futures = [dispatcher.submit('kg', WRITE, write) for _ in range(5)]
+        for future in futures:
+            future.result(1)
+        self.assertEqual(peak[0], 1)
+        dispatcher.close()
+
+
+    def test_full_queue_rejects_after_timeout(self):
+        dispatcher = KGDispatcher(write_workers=1, queue_size=1, queue_timeout=0.05)
+        started = threading.Event()
+        dispatcher.submit('kg', WRITE, self.blocked_write, started)
+        self.assertTrue(started.wait(1))
+        dispatcher.submit('kg', WRITE, lambda: None)       # 佔滿佇列
+
+        with self.assertRaises(TimeoutError):
+            dispatcher.submit('kg', WRITE, lambda: None)
+        stats = dispatcher.stats()['kg'][WRITE]
+        self.assertEqual((stats['active'], stats['queue_depth'], stats['rejected']), (1, 1, 1))
+
+        self.release.set()
+        dispatcher.close()
+        self.assertEqual(dispatcher.stats()['kg'][WRITE]['completed'], 2)
+
+
+    def test_exception_propagates_and_is_counted(self):
+        dispatcher = KGDispatcher()
+
+        def fail():
+            raise ValueError("KG 'kg' does not exist")
+
+        with self.assertRaises(ValueError):
+            dispatcher.call('kg', READ, fail)
+        stats = dispatcher.stats()['kg'][READ]
+        self.assertEqual((stats['failed'], stats['completed']), (1, 0))
+        self.assertIsNotNone(stats['service']['p95_ms'])
+        dispatcher.close()
+
+
+    def test_unknown_lane(self):
+        with self.assertRaises(ValueError):
+            KGDispatcher().submit('kg', 'admin', lambda: None)
+
+
+
+if __name__ == '__main__':
+    unittest.main()
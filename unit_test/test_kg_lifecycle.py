@@ -0,0 +1,162 @@
+import os, sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+import app_helper
+
+import threading
+import time
+import unittest
+
+from knowsys.kg_lifecycle import GB, ContainerBackend, KGLifecycleManager
+
+
+
+class FakeBackend(ContainerBackend):
+    def __init__(self, running=(), start_delay=0.0, fail=()):
+        self.containers = {name: self._urls(name) for name in running}
+        self.start_delay = start_delay
+        self.fail = set(fail)
+        self.starts = []
+        self.stops = []
+        self.log = []                   # 依序記錄 ('start' | 'stop', name)
+        self.stop_gate = None           # 設定時 stop() 等待此 event
+
+    @staticmethod
+    def _urls(name):
+        return f'http://{name}', f'bolt://{name}'
+
+    def start(self, name):
+        self.starts.append(name)
+        self.log.append(('start', name))
+        time.sleep(self.start_delay)
+        if name in self.fail:
+            raise RuntimeError(f'{name} failed')
+        self.containers[name] = self._urls(name)
+        return self.containers[name]
+
+    def stop(self, name):
+        self.stops.append(name)
+        if self.stop_gate:
+            self.stop_gate.wait()
+        self.containers.pop(name, None)
+        self.log.append(('stop', name))
+
+    def running(self):
+        return dict(self.containers)
+
+    def memory_bytes(self, name):
+        return GB
+
+
+
+class TestKGLifecycleManager(unittest.TestCase):
+    def test_hit_and_miss(self):
+        backend = FakeBackend(running=['kg1'])
+        manager = KGLifecycleManager(backend, max_running=2)
+        self.assertEqual(manager.open_KG('kg1'), ('http://kg1', 'bolt://kg1'))
+        self.assertEqual(manager.open_KG('kg2'), ('http://kg2', 'bolt://kg2'))
+        self.assertEqual(backend.starts, ['kg2'])
+
+        stats = manager.stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['cold_starts']), (1, 1, 1))
+
+
+    def test_lru_eviction(self):
+        backend = FakeBackend()
+        manager = KGLifecycleManager(backend, max_running=2)
+        manager.open_KG('kg1')
+        manager.open_KG('kg2')
+        manager.open_KG('kg1')
+        manager.open_KG('kg3')
+        self.assertEqual(backend.stops, ['kg2'])
+        self.assertEqual(sorted(manager.stats()['running']), ['kg1', 'kg3'])
+
+
+    def test_borrowed_container_not_evicted(self):
+        backend = FakeBackend()
+        manager = KGLifecycleManager(backend, max_running=2, idle_ttl=0)
+        with manager.borrow('kg1'):
+            manager.open_KG('kg1')
+            manager.open_KG('kg2')
+            manager.open_KG('kg3')      # kg1 最久未使用但仍在處理請求，改停止 kg2
+            self.assertEqual(backend.stops, ['kg2'])
+            self.assertEqual(manager.stats()['borrowed'], {'kg1': 1})
+            self.assertEqual(manager.reap_idle(), ['kg3'])
+
+        self.assertEqual(manager.stats()['borrowed'], {})
+        time.sleep(0.01)
+        self.assertEqual(manager.reap_idle(), ['kg1'])
+
+
+    def test_restart_waits_for_stop(self):
+        backend = FakeBackend()
+        manager = KGLifecycleManager(backend, max_running=1)
+        manager.open_KG('kg1')
+        backend.stop_gate = threading.Event()
+        evicting = threading.Thread(target=manager.open_KG, args=('kg2',))
+        evicting.start()
+        while not backend.stops:
+            time.sleep(0.001)
+        self.assertEqual(manager.stats()['stopping'], ['kg1'])
+
+        reopening = threading.Thread(target=manager.open_KG, args=('kg1',))
+        reopening.start()
+        time.sleep(0.05)
+        self.assertEqual(backend.starts.count('kg1'), 1)       # kg1 停止中，尚未重新啟動
+        backend.stop_gate.set()
+        evicting.join()
+        reopening.join()
+
+        self.assertEqual(backend.log[:2], [('start', 'kg1'), ('stop', 'kg1')])
+        self.assertCountEqual(backend.log[2:], [('start', 'kg2'), ('start', 'kg1')])
+        self.assertIn('kg1', backend.containers)
+        self.assertEqual(manager.stats()['stopping'], [])
+
+
+    def test_memory_budget(self):
+        backend = FakeBackend()
+        manager = KGLifecycleManager(backend, max_running=10, max_memory_gb=2.5)
+        for name in ('kg1', 'kg2', 'kg3'):
+            manager.open_KG(name)
+        self.assertEqual(backend.stops, ['kg1'])
+        self.assertEqual(manager.stats()['memory_gb'], 2)
+
+
+    def test_requests_wait_for_warming_container(self):
+        backend = FakeBackend(start_delay=0.1)
+        manager = KGLifecycleManager(backend)
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(manager.open_KG('kg1'))) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(backend.starts, ['kg1'])
+        self.assertEqual(len(results), 5)
+        self.assertEqual(manager.stats()['queued'], 4)
+
+
+    def test_failed_start_is_retried(self):
+        backend = FakeBackend(fail=['kg1'])
+        manager = KGLifecycleManager(backend)
+        with self.assertRaises(RuntimeError):
+            manager.open_KG('kg1')
+        backend.fail.clear()
+        self.assertEqual(manager.open_KG('kg1'), ('http://kg1', 'bolt://kg1'))
+        self.assertEqual(manager.stats()['failures'], 1)
+
+
+    def test_idle_reaping_and_unmanaged_containers(self):
+        backend = FakeBackend(running=['kg1', 'other'])
+        manager = KGLifecycleManager(backend, idle_ttl=0.05, managed=['kg1', 'kg2'])
+        manager.open_KG('kg2')
+        time.sleep(0.06)
+        manager.open_KG('kg2')
+        self.assertEqual(manager.reap_idle(), ['kg1'])
+        self.assertEqual(backend.stops, ['kg1'])
+        self.assertIn('other', backend.containers)
+
+
+
+if __name__ == '__main__':
+    unittest.main()
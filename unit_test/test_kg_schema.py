@@ -0,0 +1,86 @@
+import os, sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+import app_helper
+
+import unittest
+
+from neo4j.exceptions import Neo4jError
+
+from knowsys import kg_schema
+
+
+
+class FakeResult:
+    def __init__(self, record=None, plan=None):
+        self.record = record
+        self.plan = plan
+
+    def single(self):
+        return self.record
+
+    def consume(self):
+        return self
+
+
+
+class FakeSession:
+    """ 模擬 neo4j Session，記錄執行的語句並可指定失敗的語句。 """
+    def __init__(self, version=0, failing=(), plan=None):
+        self.version = version
+        self.failing = failing
+        self.plan = plan
+        self.statements = []
+
+    def run(self, query, **params):
+        self.statements.append(query)
+        if any(f in query for f in self.failing):
+            # 與 Neo4j 相同：既有重複資料造成的建立失敗屬於 DatabaseError
+            raise Neo4jError._hydrate_neo4j(
+                code='Neo.DatabaseError.Schema.ConstraintCreationFailed',
+                message='Unable to create Constraint: both nodes have label `concept` and property `name`'
+            )
+        if query.startswith("MATCH (s:`_KaqgSchema`)"):
+            return FakeResult({'version': self.version})
+        if query.startswith("MERGE (s:`_KaqgSchema`"):
+            self.version = params['version']
+        return FakeResult(plan=self.plan)
+
+
+
+class TestKGSchema(unittest.TestCase):
+    def test_migrate_from_empty(self):
+        session = FakeSession()
+        self.assertEqual(kg_schema.ensure_schema(session), (0, kg_schema.SCHEMA_VERSION))
+        self.assertEqual(session.version, kg_schema.SCHEMA_VERSION)
+        self.assertTrue(any('FULLTEXT' in q for q in session.statements))
+
+
+    def test_up_to_date_is_noop(self):
+        session = FakeSession(version=kg_schema.SCHEMA_VERSION)
+        kg_schema.ensure_schema(session)
+        self.assertEqual(len(session.statements), 1)
+
+
+    def test_constraint_fallback_to_index(self):
+        session = FakeSession(failing=('concept_name_unique',))
+        kg_schema.ensure_schema(session)
+        self.assertIn("CREATE INDEX concept_name IF NOT EXISTS FOR (n:concept) ON (n.name)", session.statements)
+
+
+    def test_index_usage_report(self):
+        plan = {
+            'operatorType': 'ProduceResults@neo4j',
+            'args': {},
+            'children': [
+                {'operatorType': 'NodeIndexSeek@neo4j', 'args': {'Details': 'RANGE INDEX n:fact(name)'}, 'children': []},
+                {'operatorType': 'AllNodesScan@neo4j', 'args': {'Details': 'n'}, 'children': []},
+            ],
+        }
+        report = kg_schema.index_usage_report(FakeSession(plan=plan), {'q': ("MATCH (n) RETURN n", {})})
+        self.assertEqual(report['q']['indexes'], ['RANGE INDEX n:fact(name)'])
+        self.assertEqual(report['q']['scans'], ['AllNodesScan: n'])
+
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,349 @@
+import os, sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+import app_helper
+
+import unittest
+
+from knowsys.dedupe_store import LruDedupeStore
+from knowsys.fact_identity import fact_key
+from knowsys.knowledge_graph import KnowledgeGraph
+
+
+
+class TestBatchedWritePlan(unittest.TestCase):
+    def setUp(self):
+        KnowledgeGraph.set_dedupe_store(LruDedupeStore())
+        self.document = {'type': 'document', 'name': 'Doc', 'meta': {'title': 'Doc'}}
+        self.section = {'type': 'structure', 'name': 'Ch1'}
+        self.triplets = [
+            (self.section, {'name': 'part_of'}, self.document),
+            ({'type': 'concept', 'name': '季節'}, {'name': 'include_in'}, self.section),
+            ({'type': 'fact', 'name': '冬天'}, {'name': 'is_a'}, {'type': 'concept', 'name': '季節'}),
+            ({'type': 'fact', 'name': '春天'}, {'name': 'is_a'}, {'type': 'concept', 'name': '季節', 'aliases': ['season']}),
+            ({'type': 'fact', 'name': '冬天'}, {'name': 'before'}, {'type': 'fact', 'name': '春天'}),
+        ]
+
+
+    def test_groups_by_labels_and_predicate(self):
+        nodes, relationships = KnowledgeGraph._plan_batched_writes('f1', 1, self.triplets)
+
+        self.assertEqual(
+            set(relationships.keys()),
+            {('structure', 'part_of', 'document'),
+             ('concept', 'include_in', 'structure'),
+             ('fact', 'is_a', 'concept'),
+             ('fact', 'before', 'fact')})
+        self.assertEqual(len(relationships[('fact', 'is_a', 'concept')]), 2)
+        self.assertEqual(set(nodes.keys()),
+                         {('structure', 'structure'), ('document', 'document'),
+                          ('concept', 'concept'), ('fact', 'fact')})
+
+
+    def test_facts_created_once_per_page(self):
+        nodes, _ = KnowledgeGraph._plan_batched_writes('f1', 1, self.triplets)
+        self.assertEqual([row['name'] for row in nodes[('fact', 'fact')].values()], ['冬天', '春天'])
+        KnowledgeGraph._record_written_facts(nodes)
+
+        nodes, relationships = KnowledgeGraph._plan_batched_writes('f1', 1, self.triplets)
+        self.assertNotIn(('fact', 'fact'), nodes)
+        self.assertIn(('fact', 'before', 'fact'), relationships)
+
+        nodes, _ = KnowledgeGraph._plan_batched_writes('f1', 2, self.triplets)
+        self.assertEqual(len(nodes[('fact', 'fact')]), 2)
+
+
+    def test_facts_recorded_after_commit(self):
+        class FailingSession:
+            def __enter__(self):
+                return self
+
+            def __exit__(self, *args):
+                pass
+
+            def execute_write(self, fn, **kwargs):
+                raise RuntimeError("transaction failed")
+
+        kg = KnowledgeGraph.__new__(KnowledgeGraph)
+        kg.driver = type('Driver', (), {'session': lambda self: FailingSession()})()
+        with self.assertRaises(RuntimeError):
+            kg.add_pages_batched([('f1', 1, self.triplets)])
+
+        # 交易失敗時不記錄去重 key，重新匯入仍會寫入這些 fact
+        nodes, _ = KnowledgeGraph._plan_batched_writes('f1', 1, self.triplets)
+        self.assertEqual(len(nodes[('fact', 'fact')]), 2)
+
+
+    def test_last_occurrence_wins(self):
+        nodes, _ = KnowledgeGraph._plan_batched_writes('f1', 1, self.triplets)
+        self.assertEqual(nodes[('concept', 'concept')]['季節']['aliases'], ['season'])
+
+
+    def test_one_statement_per_group(self):
+        class RecordingTx:
+            def __init__(self):
+                self.statements = []
+
+            def run(self, query, **params):
+                self.statements.append((query, params))
+
+        nodes, relationships = KnowledgeGraph._plan_batched_writes('f1', 1, self.triplets)
+        tx = RecordingTx()
+        KnowledgeGraph._write_batched_tx(tx, nodes, relationships)
+
+        self.assertEqual(len(tx.statements), len(nodes) + len(relationships))
+        self.assertTrue(all('UNWIND $rows' in query for query, _ in tx.statements))
+
+
+    def test_pages_coalesce_into_one_plan(self):
+        nodes, relationships = KnowledgeGraph._plan_batched_writes('f1', 1, self.triplets)
+        KnowledgeGraph._plan_batched_writes('f1', 2, self.triplets, nodes, relationships)
+
+        # 各頁的 fact 各一份，其他節點與關聯只寫入一次
+        self.assertEqual(len(nodes[('fact', 'fact')]), 4)
+        self.assertEqual(len(nodes[('concept', 'concept')]), 1)
+        self.assertEqual(len(relationships[('fact', 'is_a', 'concept')]), 2)
+        self.assertEqual(nodes[('fact', 'fact')][fact_key('f1', 2, '冬天')]['page_number'], 2)
+
+
+    def test_idempotent_merges_recorded_facts(self):
+        nodes, _ = KnowledgeGraph._plan_batched_writes('f1', 1, self.triplets)
+        KnowledgeGraph._record_written_facts(nodes)
+        nodes, _ = KnowledgeGraph._plan_batched_writes('f1', 1, self.triplets, idempotent=True)
+
+        self.assertEqual(len(nodes[('fact', 'fact')]), 2)
+
+
+    def test_facts_keyed_by_normalized_name(self):
+        triplets = [({'type': 'fact', 'name': name}, {'name': 'is_a'}, {'type': 'concept', 'name': '季節'})
+                    for name in ('Winter', ' winter ', 'Ｗｉｎｔｅｒ')]
+        nodes, _ = KnowledgeGraph._plan_batched_writes('f1', 1, triplets)
+
+        self.assertEqual(list(nodes[('fact', 'fact')]), [fact_key('f1', 1, 'Winter')])
+        self.assertEqual(nodes[('fact', 'fact')][fact_key('f1', 1, 'winter')]['name'], 'Winter')
+        self.assertNotEqual(fact_key('f1', 1, 'Winter'), fact_key('f1', 2, 'Winter'))
+
+
+    def test_relationship_sources(self):
+        nodes, relationships = KnowledgeGraph._plan_batched_writes('f1', 1, self.triplets)
+        KnowledgeGraph._plan_batched_writes('f1', 2, self.triplets[:2], nodes, relationships)
+
+        self.assertEqual(relationships[('structure', 'part_of', 'document')][('Ch1', 'Doc')]['sources'], ['f1/1', 'f1/2'])
+        self.assertEqual(relationships[('fact', 'before', 'fact')][('冬天', '春天')]['sources'], ['f1/1'])
+        self.assertIn('r.sources', KnowledgeGraph._BATCH_RELATIONSHIP_WRITE)
+
+
+    def test_hot_queries_are_executed_statements(self):
+        queries = [query for query, _ in KnowledgeGraph._hot_queries().values()]
+        self.assertIn(KnowledgeGraph._BATCH_NODE_WRITES['fact'].format(label='fact'), queries)
+        self.assertIn(KnowledgeGraph._SECTION_SUBTREES_QUERY, queries)
+        self.assertIn(KnowledgeGraph._DOCUMENT_SUBTREES_QUERY, queries)
+        self.assertFalse([query for query in queries if '$subject_name' in query or '$section}' in query])
+
+
+    def test_fact_write_merges_on_key(self):
+        self.assertIn('MERGE (n:`{label}` {{fact_key: row.fact_key}})', KnowledgeGraph._BATCH_NODE_WRITES['fact'])
+        self.assertNotIn('CREATE (', KnowledgeGraph._BATCH_NODE_WRITES['fact'])
+
+
+
+class FakeDriver:
+    """ 模擬 neo4j Driver：依查詢語句回傳預先定義的 records。 """
+    def __init__(self, responses):
+        self.responses = responses
+        self.queries = []
+
+    def session(self):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def run(self, query, **params):
+        self.queries.append((query, params))
+        for marker, records in self.responses.items():
+            if marker in query:
+                return records
+        return []
+
+
+
+class TestRetirePages(unittest.TestCase):
+    class RecordingTx:
+        def __init__(self):
+            self.statements = []
+
+        def run(self, query, **params):
+            self.statements.append((query, params))
+            if 'collect(DISTINCT c.name)' in query:
+                return [{'name': '冬天', 'page_number': 1, 'concepts': ['季節']},
+                        {'name': 'Ｗｉｎｔｅｒ', 'page_number': 2, 'concepts': ['季節']}]
+            return self
+
+        def single(self):
+            return {'deleted': 1}
+
+
+    class Driver:
+        def __init__(self, tx):
+            self.tx = tx
+
+        def session(self):
+            return self
+
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *args):
+            pass
+
+        def execute_write(self, fn, *args):
+            return fn(self.tx, *args)
+
+
+    def test_retire_pages(self):
+        store = LruDedupeStore()
+        KnowledgeGraph.set_dedupe_store(store)
+        triplets = [({'type': 'fact', 'name': name}, {'name': 'is_a'}, {'type': 'concept', 'name': '季節'})
+                    for name in ('冬天', 'winter')]
+        for page_number, page_triplets in ((1, triplets[:1]), (2, triplets[1:]), (3, triplets[:1])):
+            nodes, _ = KnowledgeGraph._plan_batched_writes('f1', page_number, page_triplets)
+            KnowledgeGraph._record_written_facts(nodes)
+
+        tx = self.RecordingTx()
+        kg = KnowledgeGraph.__new__(KnowledgeGraph)
+        kg.driver = self.Driver(tx)
+        result = kg.retire_pages('f1', [1, 2])
+
+        self.assertEqual(result, {'pages': 2, 'facts': 1, 'relationships': 4, 'nodes': 2})
+        params = {query.split('(n:`')[1].split('`')[0]: p for query, p in tx.statements if 'r.sources' in query}
+        self.assertEqual(params['fact']['names'], ['冬天', 'Ｗｉｎｔｅｒ'])
+        self.assertEqual(params['concept']['names'], ['季節'])
+        self.assertEqual(params['structure']['sources'], ['f1/1', 'f1/2'])
+        # 退役頁面的 fact 可再次寫入，其他頁面仍去重
+        nodes, _ = KnowledgeGraph._plan_batched_writes('f1', 1, triplets[:1])
+        self.assertEqual(len(nodes[('fact', 'fact')]), 1)
+        nodes, _ = KnowledgeGraph._plan_batched_writes('f1', 2, triplets[1:])
+        self.assertEqual(len(nodes[('fact', 'fact')]), 1)
+        nodes, _ = KnowledgeGraph._plan_batched_writes('f1', 3, triplets[:1])
+        self.assertNotIn(('fact', 'fact'), nodes)
+
+
+
+class TestBatchedReads(unittest.TestCase):
+    def make_kg(self, responses):
+        kg = KnowledgeGraph.__new__(KnowledgeGraph)
+        kg.driver = FakeDriver(responses)
+        return kg
+
+
+    def test_nodes_by_names_grouped_by_input(self):
+        class Node(dict):
+            element_id = 'e1'
+            labels = ['fact']
+
+        kg = self.make_kg({'UNWIND $names': [{'name': '冬天', 'n': Node(name='冬天')}]})
+        nodes = kg.query_nodes_by_names(['冬天', '夏天', '冬天'], label='fact')
+
+        self.assertEqual(list(nodes), ['冬天', '夏天'])
+        self.assertEqual(nodes['冬天'], [{'element_id': 'e1', 'labels': ['fact'], 'name': '冬天'}])
+        self.assertEqual(nodes['夏天'], [])
+        self.assertEqual(len(kg.driver.queries), 1)
+        self.assertEqual(kg.driver.queries[0][1]['names'], ['冬天', '夏天'])
+
+
+    def test_all_relationships_many_outgoing_first(self):
+        kg = self.make_kg({
+            'MATCH (n)-[r]->(m)': [{'eid': 'e1', 'subj': '冬天', 'rel': 'before', 'obj': '春天'}],
+            'MATCH (m)-[r]->(n)': [{'eid': 'e1', 'subj': '秋天', 'rel': 'before', 'obj': '冬天'},
+                                   {'eid': 'e2', 'subj': '冬天', 'rel': 'before', 'obj': '春天'}],
+        })
+        relationships = kg.query_all_relationships_many(['e1', 'e2', 'e3'])
+
+        self.assertEqual(relationships['e1'], [('冬天', 'before', '春天'), ('秋天', 'before', '冬天')])
+        self.assertEqual(relationships['e2'], [('冬天', 'before', '春天')])
+        self.assertEqual(relationships['e3'], [])
+        self.assertEqual(len(kg.driver.queries), 2)
+
+
+    def test_section_concepts_many_shares_queries(self):
+        def node(eid, label, name):
+            class Node(dict):
+                element_id = eid
+                labels = [label]
+            return Node(name=name)
+
+        kg = self.make_kg({
+            'size($sections)': [{'tree': 0, 'path': ['s1'], 'sub': node('s1', 'structure', '第一章')}],
+            'top:structure': [{'tree': 0, 'path': ['s2'], 'sub': node('s2', 'structure', '第二章')}],
+            'UNWIND $documents': [{'document': '課本', 'c': node('c0', 'concept', '季節')}],
+            'UNWIND $section_eids': [{'eid': 's1', 'c': node('c1', 'concept', '冬天')},
+                                     {'eid': 's2', 'c': node('c2', 'concept', '夏天')}],
+        })
+        results = kg.query_section_concepts_many([('課本', ['第一章']), ('課本', None), ('課本', ['第一章'])])
+
+        self.assertEqual([[c['element_id'] for c in concepts] for concepts in results],
+                         [['c0', 'c1'], ['c0', 'c2'], ['c0', 'c1']])
+        self.assertEqual(len(kg.driver.queries), 4)     # 兩個不重複 criterion + document + section
+        self.assertEqual(kg.driver.queries[-1][1]['section_eids'], ['s1', 's2'])
+
+
+    def test_subsections_in_traversal_order(self):
+        def record(tree, *path):
+            class Node(dict):
+                element_id = path[-1]
+                labels = ['structure']
+            return {'tree': tree, 'path': list(path), 'sub': Node(name=path[-1])}
+
+        # 子節點可能先於父節點回傳；同層保持回傳順序而非名稱順序
+        kg = self.make_kg({
+            'size($sections)': [record(1, 'Chapter 3'), record(0, 'Chapter 1', 'Chapter 2', 'Section 2.1'),
+                                record(0, 'Chapter 1'), record(0, 'Chapter 1', 'Chapter 2'),
+                                record(0, 'Chapter 1', 'Chapter 10')],
+            'top:structure': [record(0, 'Chapter 2'), record(0, 'Chapter 10'), record(0, 'Chapter 2', 'Section 2.1')],
+        })
+
+        self.assertEqual([s['name'] for s in kg.query_subsections('課本', ['Chapter 1', 'Chapter 3'])],
+                         ['Chapter 1', 'Chapter 2', 'Section 2.1', 'Chapter 10', 'Chapter 3'])
+        self.assertEqual([s['name'] for s in kg.query_subsections('課本')],
+                         ['Chapter 2', 'Section 2.1', 'Chapter 10'])
+        self.assertNotIn('ORDER BY', KnowledgeGraph._SECTION_SUBTREES_QUERY + KnowledgeGraph._DOCUMENT_SUBTREES_QUERY)
+
+
+    def test_resolve_entities_fulltext_only_for_misses(self):
+        class Node(dict):
+            def __init__(self, eid, label, **props):
+                super().__init__(**props)
+                self.element_id = eid
+                self.labels = [label]
+
+        kg = self.make_kg({
+            'UNWIND $names': [{'name': '冬天', 'n': Node('f1', 'fact', name='冬天')}],
+            'db.index.fulltext.queryNodes': [
+                {'surface': 'Season', 'node': Node('c1', 'concept', name='季節', aliases=['season'])},
+                {'surface': 'Season', 'node': Node('c2', 'concept', name='颱風', aliases=[])}],
+        })
+        results = kg.resolve_entities(['冬天', 'Season', '冬天'], labels=('fact', 'concept', 'structure'))
+
+        self.assertEqual(list(results), ['冬天', 'Season'])
+        self.assertEqual([(m['node']['element_id'], m['match']) for m in results['冬天']], [('f1', 'name')])
+        self.assertEqual([(m['node']['element_id'], m['match']) for m in results['Season']], [('c1', 'alias')])
+        exact_query, fulltext = kg.driver.queries
+        self.assertIn('MATCH (n:`structure` {name: name})', exact_query[0])
+        self.assertEqual([q['surface'] for q in fulltext[1]['queries']], ['Season'])
+        self.assertEqual(fulltext[1]['labels'], ['fact', 'concept'])
+
+
+    def test_empty_input_skips_query(self):
+        kg = self.make_kg({})
+        self.assertEqual(kg.query_nodes_by_names([]), {})
+        self.assertEqual(kg.query_all_relationships_many([]), {})
+        self.assertEqual(kg.query_neighbors_many([]), {})
+        self.assertEqual(kg.driver.queries, [])
+
+
+
+if __name__ == '__main__':
+    unittest.main()
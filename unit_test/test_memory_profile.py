@@ -0,0 +1,58 @@
+import os, sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+import app_helper
+
+import tempfile
+import unittest
+
+from knowsys.memory_profile import (MB, MIN_PROFILE, MemoryProfile, MemoryProfileStore, size_profile,
+                                    store_size_bytes)
+
+
+
+class TestMemoryProfile(unittest.TestCase):
+    def test_small_graph_gets_minimum(self):
+        self.assertEqual(size_profile(10 * MB, nodes=2_000, relationships=5_000), MemoryProfile(320, 64, 160))
+        self.assertEqual(size_profile(0), MIN_PROFILE)
+
+
+    def test_large_graph_scales(self):
+        profile = size_profile(2048 * MB, nodes=2_000_000, relationships=8_000_000)
+        self.assertEqual(profile.pagecache_mb, 2496)     # 2048 x 1.2, rounded up to 64 MB
+        self.assertEqual(profile.heap_mb, 2176)      # 256 + 10M x 200 B
+        self.assertEqual(profile.transaction_mb, 1088)
+
+
+    def test_environment_round_trip(self):
+        profile = MemoryProfile(512, 1024, 256)
+        env = [f'{key}={value}' for key, value in profile.to_environment().items()] + ['NEO4J_AUTH=none']
+        self.assertEqual(MemoryProfile.from_environment(env), profile)
+        self.assertIsNone(MemoryProfile.from_environment(['NEO4J_AUTH=none']))
+
+
+    def test_scaled_to_budget(self):
+        profile = MemoryProfile(1024, 4096, 512)
+        self.assertEqual(profile.scaled_to(8192), profile)
+        self.assertEqual(profile.scaled_to(2048), MemoryProfile(1024, 1024, 512))
+        self.assertEqual(profile.scaled_to(600), MemoryProfile(536, 64, 268))
+
+
+    def test_store_size_and_records(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            os.makedirs(os.path.join(tmp, 'kg', 'databases', 'neo4j'))
+            with open(os.path.join(tmp, 'kg', 'databases', 'neo4j', 'neostore'), 'wb') as f:
+                f.write(b'\0' * 1000)
+            self.assertEqual(store_size_bytes(os.path.join(tmp, 'kg')), 1000)
+
+            store = MemoryProfileStore(os.path.join(tmp, '_memory_profiles.json'))
+            store.update('kg', nodes=10)
+            store.update('kg', relationships=20)
+            self.assertEqual(MemoryProfileStore(store.path).get('kg'), {'nodes': 10, 'relationships': 20})
+            store.remove('kg')
+            self.assertEqual(store.get('kg'), {})
+            self.assertEqual(sorted(os.listdir(tmp)), ['_memory_profiles.json', 'kg'])     # 暫存檔已取代原檔
+
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,55 @@
+import os, sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+import app_helper
+
+import tempfile
+import unittest
+
+from retrieval.page_fingerprints import FingerprintStore, diff_pages, page_fingerprint
+
+
+
+class TestPageFingerprints(unittest.TestCase):
+    def test_fingerprint_ignores_layout(self):
+        self.assertEqual(page_fingerprint('台北是\n台灣的  首都。'), page_fingerprint(' 台北是 台灣的 首都。'))
+        self.assertNotEqual(page_fingerprint('台北是台灣的首都。'), page_fingerprint('台中是台灣的城市。'))
+
+
+    def test_diff_changed_page(self):
+        diff = diff_pages(['a', 'b', 'c', 'd'], ['a', 'B', 'c', 'd'])
+        self.assertEqual(diff, {'unchanged': 3, 'moved': 0, 'changed': [1], 'retired': [1]})
+
+
+    def test_diff_added_and_removed_pages(self):
+        diff = diff_pages(['a', 'b', 'c', 'd'], ['a', 'b', 'c', 'd', 'e'])
+        self.assertEqual((diff['changed'], diff['retired']), ([4], []))
+
+        diff = diff_pages(['a', 'b', 'c', 'd'], ['a', 'b', 'c'])
+        self.assertEqual((diff['changed'], diff['retired']), ([], [3]))
+
+        # 插入一頁後，之後的頁面內容不變但頁碼改變
+        diff = diff_pages(['a', 'b', 'c', 'd'], ['a', 'x', 'b', 'c', 'd'])
+        self.assertEqual(diff, {'unchanged': 1, 'moved': 3, 'changed': [1, 2, 3, 4], 'retired': [1, 2, 3]})
+
+
+    def test_diff_retries_unwritten_pages(self):
+        diff = diff_pages(['a', None, 'c'], ['a', 'b', 'c'])
+        self.assertEqual((diff['changed'], diff['retired']), ([1], [1]))
+
+
+    def test_store(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            store = FingerprintStore(os.path.join(tmp, 'cache', 'fingerprints.sqlite3'))
+            self.assertIsNone(store.get('kg', 'book.pdf'))
+            store.put('kg', 'book.pdf', 'f1', ['a', None])
+            store.put('kg', 'book.pdf', 'f1', ['a', 'b'])
+            store.put('other', 'book.pdf', 'f2', ['c'])
+            previous = store.get('kg', 'book.pdf')
+            self.assertEqual((previous['file_id'], previous['fingerprints']), ('f1', ['a', 'b']))
+            self.assertEqual(store.get('other', 'book.pdf')['file_id'], 'f2')
+            store.close()
+
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,97 @@
+import os, sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+import app_helper
+
+import threading
+import time
+import unittest
+
+from retrieval.page_pipeline import PagePipeline
+
+
+
+class Pages:
+    """ 模擬每頁的擷取：delays 指定各頁耗時，failures 指定各頁先失敗的次數。 """
+    def __init__(self, delays=None, failures=None):
+        self.delays = delays or {}
+        self.failures = dict(failures or {})
+        self.attempts = {}
+        self.active = 0
+        self.max_active = 0
+        self.lock = threading.Lock()
+        self.published = []
+
+
+    def process(self, page_number, page_content):
+        with self.lock:
+            self.attempts[page_number] = self.attempts.get(page_number, 0) + 1
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        try:
+            time.sleep(self.delays.get(page_number, 0.01))
+            if self.failures.get(page_number, 0) > 0:
+                self.failures[page_number] -= 1
+                raise RuntimeError(f"page {page_number} failed")
+            return [page_content]
+        finally:
+            with self.lock:
+                self.active -= 1
+
+
+    def publish(self, page_number, triplets):
+        self.published.append((page_number, triplets))
+
+
+
+class TestPagePipeline(unittest.TestCase):
+    def test_ordered_publish(self):
+        pages = Pages(delays={0: 0.2})
+        stats = PagePipeline(pages.process, pages.publish, concurrency=4).run([f'p{i}' for i in range(8)])
+
+        self.assertEqual(pages.published, [(i, [f'p{i}']) for i in range(8)])
+        self.assertEqual((stats['published'], stats['failed']), (8, 0))
+        self.assertEqual(pages.max_active, 4)
+
+
+    def test_slow_page_does_not_stall_unordered(self):
+        pages = Pages(delays={0: 0.3})
+        PagePipeline(pages.process, pages.publish, concurrency=2, ordered=False, max_pending=10).run(['p'] * 6)
+
+        self.assertEqual(pages.published[-1][0], 0)
+        self.assertEqual(sorted(page_number for page_number, _ in pages.published), list(range(6)))
+
+
+    def test_retries_and_skips(self):
+        pages = Pages(failures={1: 1, 2: 5})
+        stats = PagePipeline(pages.process, pages.publish, concurrency=3, max_attempts=3).run(['p'] * 4)
+
+        self.assertEqual([page_number for page_number, _ in pages.published], [0, 1, 3])
+        self.assertEqual((pages.attempts[1], pages.attempts[2]), (2, 3))
+        self.assertEqual((stats['pages'], stats['failed']), (4, 1))
+
+
+    def test_pending_pages_bounded(self):
+        pages = Pages(delays={0: 0.2})
+        submitted = []
+
+        def process(page_number, page_content):
+            submitted.append((page_number, len(pages.published)))
+            return pages.process(page_number, page_content)
+
+        PagePipeline(process, pages.publish, concurrency=2, max_pending=3).run(['p'] * 6)
+        # 第 0 頁發佈前最多只送出 max_pending 頁
+        self.assertEqual([page_number for page_number, published in submitted if published == 0], [0, 1, 2])
+        self.assertEqual(len(pages.published), 6)
+
+
+    def test_selected_pages(self):
+        pages = Pages(delays={5: 0.2})
+        stats = PagePipeline(pages.process, pages.publish, concurrency=3).run([f'p{i}' for i in range(8)], [7, 2, 5])
+
+        self.assertEqual(pages.published, [(2, ['p2']), (5, ['p5']), (7, ['p7'])])
+        self.assertEqual(stats['pages'], 3)
+
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,71 @@
+import os, sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+import app_helper
+
+import tempfile
+import threading
+import unittest
+
+from knowsys.port_allocator import PortAllocator
+
+
+
+class TestPortAllocator(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, '_ports.json')
+
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+
+    def test_reservation_is_stable_across_restarts(self):
+        self.assertEqual(PortAllocator(self.path).reserve('kg1'), (7474, 7687))
+        self.assertEqual(PortAllocator(self.path).reserve('kg2'), (7475, 7688))
+        # 新的 allocator (例如重啟後) 讀回相同預約
+        self.assertEqual(PortAllocator(self.path).reserve('kg1'), (7474, 7687))
+        self.assertEqual(PortAllocator(self.path).reservations(), {'kg1': (7474, 7687), 'kg2': (7475, 7688)})
+
+
+    def test_skips_used_and_probed_ports(self):
+        probed = []
+
+        def probe(port):
+            probed.append(port)
+            return port == 7476
+
+        allocator = PortAllocator(self.path)
+        self.assertEqual(allocator.reserve('kg1', used_ports={7474, 7475, 7687}, probe=probe), (7477, 7688))
+        # 只探測不在容器列表中的候選端口
+        self.assertEqual(probed, [7476, 7477, 7688])
+
+
+    def test_release(self):
+        allocator = PortAllocator(self.path)
+        allocator.reserve('kg1')
+        allocator.release('kg1')
+        self.assertEqual(allocator.reserve('kg2'), (7474, 7687))
+
+
+    def test_concurrent_reservations_are_unique(self):
+        results = {}
+
+        def reserve(kg_name):
+            # 各自建立 allocator，如同多個 DockerManager
+            results[kg_name] = PortAllocator(self.path).reserve(kg_name)
+
+        threads = [threading.Thread(target=reserve, args=(f'kg{i}',)) for i in range(20)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        ports = [port for pair in results.values() for port in pair]
+        self.assertEqual(len(ports), len(set(ports)))
+        self.assertEqual(len(PortAllocator(self.path).reservations()), 20)
+
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,111 @@
+import os, sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+import app_helper
+
+import queue
+import time
+import unittest
+
+from knowsys.port_registry import PortRegistry
+
+
+class FakeContainer:
+    def __init__(self, name, http_port, bolt_port):
+        self.name = name
+        self.id = f'id-{name}'
+        self.attrs = {'NetworkSettings': {'Ports': {
+            '7474/tcp': [{'HostPort': http_port}],
+            '7687/tcp': [{'HostPort': bolt_port}],
+        }}}
+
+
+
+class FakeEvents:
+    """ 模擬 docker events stream：iterate 直到 close()。 """
+    def __init__(self):
+        self.queue = queue.Queue()
+
+    def __iter__(self):
+        while (event := self.queue.get()) is not None:
+            yield event
+
+    def close(self):
+        self.queue.put(None)
+
+
+
+class FakeClient:
+    def __init__(self, containers):
+        self.running = {c.name: c for c in containers}
+        self.stream = FakeEvents()
+        self.containers = self
+
+    def list(self):
+        return list(self.running.values())
+
+    def get(self, container_id):
+        return next(c for c in self.running.values() if container_id in (c.id, c.name))
+
+    def events(self, decode, filters):
+        return self.stream
+
+
+
+class TestPortRegistry(unittest.TestCase):
+    def setUp(self):
+        self.client = FakeClient([FakeContainer('kg1', '7474', '7687')])
+
+
+    def test_lookups_are_cached(self):
+        registry = PortRegistry(self.client, ttl=60)
+        for _ in range(100):
+            self.assertEqual(registry.get('kg1'), ('7474', '7687'))
+        stats = registry.stats()
+        self.assertEqual(stats['api_calls'], 1)
+        self.assertEqual(stats['hits'], 100)
+        self.assertEqual(stats['api_calls_per_minute'], 1)
+
+
+    def test_ttl_and_miss_refresh(self):
+        registry = PortRegistry(self.client, ttl=0.05, miss_refresh_interval=0.05)
+        registry.get('kg1')
+        self.client.running['kg2'] = FakeContainer('kg2', '7475', '7688')
+        # 剛建立的容器在 miss_refresh_interval 內不重新列出
+        self.assertEqual(registry.get('kg2'), (None, None))
+        time.sleep(0.06)
+        self.assertEqual(registry.get('kg2'), ('7475', '7688'))
+        self.assertEqual(registry.refreshes, 2)
+
+
+    def test_events_keep_registry_fresh(self):
+        registry = PortRegistry(self.client, ttl=0, watch_events=True)
+        deadline = time.monotonic() + 2
+        while not registry.watching and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertTrue(registry.watching)
+
+        self.client.running['kg2'] = FakeContainer('kg2', '7475', '7688')
+        self.client.stream.queue.put({'Action': 'start', 'Actor': {'ID': 'id-kg2', 'Attributes': {'name': 'kg2'}}})
+        self.client.stream.queue.put({'Action': 'die', 'Actor': {'ID': 'id-kg1', 'Attributes': {'name': 'kg1'}}})
+        while registry.events < 2 and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+        # 連上 events 時不受 TTL 影響，不再列出容器
+        self.assertEqual(registry.running(), [('kg2', '7475', '7688')])
+        self.assertEqual(registry.get('kg1'), (None, None))
+        self.assertEqual(registry.refreshes, 1)
+        registry.close()
+        self.assertFalse(registry._thread.is_alive())
+
+
+    def test_invalidate(self):
+        registry = PortRegistry(self.client, ttl=60)
+        registry.get('kg1')
+        del self.client.running['kg1']
+        registry.invalidate('kg1')
+        self.assertEqual(registry.running(), [])
+
+
+
+if __name__ == '__main__':
+    unittest.main()
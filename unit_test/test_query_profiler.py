@@ -0,0 +1,206 @@
+import os, sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+import app_helper
+
+import tempfile
+import unittest
+
+from knowsys.knowledge_graph import KnowledgeGraph
+from knowsys.query_profiler import (QueryProfiler, ProfiledDriver, fingerprint, is_read_only,
+                                    read_slow_log, summarize_params, summarize_plan, summarize_slow_log)
+
+
+PLAN = {
+    'operatorType': 'ProduceResults@neo4j', 'dbHits': 0, 'rows': 2, 'args': {'Details': 'n'},
+    'children': [{'operatorType': 'NodeIndexSeek@neo4j', 'dbHits': 5, 'rows': 2,
+                  'args': {'Details': 'RANGE INDEX n:fact(name)'}, 'children': []}],
+}
+
+
+
+class FakeSummary:
+    def __init__(self, profile=None):
+        self.profile = profile
+
+
+
+class FakeResult:
+    def __init__(self, records):
+        self.records = records
+
+    def __iter__(self):
+        return iter(self.records)
+
+    def single(self):
+        return self.records[0] if self.records else None
+
+    def consume(self):
+        return FakeSummary(PLAN)
+
+
+
+class FakeSession:
+    def __init__(self, driver):
+        self.driver = driver
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        pass
+
+    def run(self, query, **params):
+        self.driver.queries.append((query, params))
+        return FakeResult([{'n': i} for i in range(self.driver.rows)])
+
+    def execute_read(self, fn, *args, **kwargs):
+        return fn(self, *args, **kwargs)
+
+    execute_write = execute_read
+
+
+
+class FakeDriver:
+    def __init__(self, rows=2):
+        self.rows = rows
+        self.queries = []
+        self.closed = False
+
+    def session(self, **kwargs):
+        return FakeSession(self)
+
+    def close(self):
+        self.closed = True
+
+
+
+class TestFingerprint(unittest.TestCase):
+    def test_literals_and_whitespace(self):
+        a = fingerprint("MATCH (n {name: '冬天'})-[r*2..2]-(m)\n  WHERE n.x > 3 RETURN m LIMIT 10")
+        b = fingerprint("MATCH (n {name: \"夏天\"})-[r*3..3]-(m) WHERE n.x > 42 RETURN m LIMIT 5 // comment")
+        self.assertEqual(a, b)
+        self.assertEqual(a, "MATCH (n {name: ?})-[r*?..?]-(m) WHERE n.x > ? RETURN m LIMIT ?")
+
+
+    def test_parameters_and_names_kept(self):
+        self.assertEqual(fingerprint("MATCH (n:fact2 {name: $name1}) WHERE n.id IN [1, 2, 3] RETURN n"),
+                         "MATCH (n:fact2 {name: $name1}) WHERE n.id IN [?] RETURN n")
+
+
+    def test_read_only(self):
+        self.assertTrue(is_read_only("MATCH (n) WHERE n.name = 'CREATE' RETURN n"))
+        self.assertFalse(is_read_only("UNWIND $rows AS row MERGE (n:fact {fact_key: row.fact_key})"))
+        self.assertFalse(is_read_only("MATCH (n) SET n.x = 1"))
+        self.assertFalse(is_read_only("EXPLAIN MATCH (n) RETURN n"))
+
+
+    def test_summaries(self):
+        operators, db_hits = summarize_plan(PLAN)
+        self.assertEqual(db_hits, 5)
+        self.assertEqual([(o['depth'], o['operator']) for o in operators], [(0, 'ProduceResults'), (1, 'NodeIndexSeek')])
+        self.assertEqual(summarize_params({'rows': [1, 2], 'name': 'x', 'n': 1}),
+                         {'rows': '<list len=2>', 'name': 'x', 'n': 1})
+
+
+
+class TestQueryProfiler(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, '_slow_queries.jsonl')
+
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+
+    def test_session_statements_recorded(self):
+        profiler = QueryProfiler(slow_ms=None)
+        driver = profiler.wrap(FakeDriver(rows=3))
+        with driver.session() as session:
+            rows = list(session.run("MATCH (n {name: 'a'}) RETURN n"))
+            session.run("MATCH (n {name: $name}) RETURN n", name='b').single()
+            session.run("MATCH (n {name: 'c'}) RETURN n")          # 未讀取，session 結束時記錄
+        session.execute_write(lambda tx: tx.run("MERGE (n:fact {name: $name})", name='d'))
+
+        report = {entry['fingerprint']: entry for entry in profiler.report()}
+        self.assertEqual(len(rows), 3)
+        self.assertEqual(report["MATCH (n {name: ?}) RETURN n"]['count'], 2)
+        self.assertEqual(report["MATCH (n {name: ?}) RETURN n"]['rows'], 3)
+        self.assertEqual(report["MATCH (n {name: $name}) RETURN n"]['rows'], 1)
+        self.assertEqual(report["MERGE (n:fact {name: $name})"]['count'], 1)
+        self.assertEqual(sum(report["MERGE (n:fact {name: $name})"]['histogram'].values()), 1)
+
+
+    def test_slow_read_profiled_into_log(self):
+        profiler = QueryProfiler(slow_ms=0, slow_log_path=self.path, profile_interval=60)
+        raw = FakeDriver()
+        driver = profiler.wrap(raw)
+        with driver.session() as session:
+            for _ in range(3):
+                list(session.run("MATCH (n:fact {name: $name}) RETURN n", name='冬天', rows=[1, 2]))
+            session.run("UNWIND $rows AS row CREATE (n:fact {name: row.name})", rows=[{'name': 'x'}]).consume()
+        profiler.close()
+
+        entries = read_slow_log(self.path)
+        self.assertEqual(len(entries), 4)
+        profiled = [entry for entry in entries if 'plan' in entry]
+        self.assertEqual(len(profiled), 1)      # 同一 fingerprint 在 profile_interval 內只 PROFILE 一次
+        self.assertEqual(profiled[0]['db_hits'], 5)
+        self.assertEqual(profiled[0]['params'], {'name': '冬天', 'rows': '<list len=2>'})
+        # 寫入語句不以 PROFILE 重跑
+        self.assertEqual([query for query, _ in raw.queries if query.startswith('PROFILE')],
+                         ["PROFILE MATCH (n:fact {name: $name}) RETURN n"])
+
+        summaries = summarize_slow_log(entries, sort='count')
+        self.assertEqual(summaries[0]['count'], 3)
+        self.assertEqual(summaries[0]['max_db_hits'], 5)
+        self.assertIsNone(summaries[1]['max_db_hits'])
+
+
+    def test_slow_log_rotation_read_back(self):
+        profiler = QueryProfiler(slow_ms=0, slow_log_path=self.path, profile_slow=False, max_bytes=300, backup_count=3)
+        driver = profiler.wrap(FakeDriver())
+        with driver.session() as session:
+            for i in range(6):
+                session.run(f"MATCH (n) WHERE n.id = {i} RETURN n").consume()
+        profiler.close()
+
+        self.assertTrue(os.path.exists(self.path + '.1'))
+        entries = read_slow_log(self.path)
+        self.assertTrue(entries[-1]['query'].endswith('n.id = 5 RETURN n'))
+        self.assertEqual(len({entry['fingerprint_id'] for entry in entries}), 1)
+
+
+    def test_configure_from_log_dir(self):
+        root = os.path.dirname(self.path)
+        try:
+            profiler = QueryProfiler.configure_from({'slow_ms': 100}, os.path.join(root, 'datapath'))
+            self.assertEqual(profiler.slow_log_path, os.path.join(root, 'datapath', '_slow_queries.jsonl'))
+            profiler = QueryProfiler.configure_from({'log_dir': os.path.join(root, 'logs')},
+                                                    os.path.join(root, 'generation'), process_name='scq')
+            self.assertEqual(profiler.slow_log_path, os.path.join(root, 'logs', '_slow_queries_scq.jsonl'))
+            self.assertTrue(os.path.isdir(os.path.join(root, 'logs')))
+        finally:
+            QueryProfiler.default().close()
+            QueryProfiler._default = None
+
+
+    def test_knowledge_graph_instrumented(self):
+        profiler = QueryProfiler.configure(slow_ms=None)
+        try:
+            kg = KnowledgeGraph(uri="bolt://localhost:1", shared=False)
+            self.assertIsInstance(kg.driver, ProfiledDriver)
+            self.assertIs(QueryProfiler.unwrap(kg.driver), kg.driver.driver)
+            kg.close()
+        finally:
+            profiler.close()
+            QueryProfiler._default = None
+        self.assertIs(QueryProfiler.instrument(FakeDriver()).__class__, FakeDriver)
+
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,100 @@
+import os, sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+import app_helper
+
+import json
+import unittest
+
+from retrieval.structured_extraction import (EXTRACTION_SCHEMA, ExtractionStats, extract_page, find_gaps,
+                                             parse_extraction)
+
+
+def response(facts, concepts, relationships):
+    return json.dumps({
+        'facts': facts,
+        'concepts': [{'concept': concept, 'facts': members} for concept, members in concepts.items()],
+        'relationships': [{'subject': s, 'relation': r, 'object': o} for s, r, o in relationships],
+    }, ensure_ascii=False)
+
+
+FIRST = response(
+    [' 台北 ', '台灣', '台北101', '颱風', ''],
+    {'城市': ['台北', '台北101'], '地理': ['台灣'], '': ['颱風']},
+    [('台北', '位於', '台灣'), ('台北101', '位於', '台北'), ('台北', '位於', '台灣'), ('台灣', '', '颱風')])
+FOLLOWUP = response(
+    [],
+    {'天氣': ['颱風']},
+    [('颱風', '侵襲', '台灣')])
+
+
+
+class FakeLlm:
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.requests = []
+
+
+    def __call__(self, messages, response_format):
+        self.requests.append((messages, response_format))
+        return self.responses.pop(0)
+
+
+
+class TestStructuredExtraction(unittest.TestCase):
+    def test_parse_validates_and_cleans(self):
+        extraction = parse_extraction(FIRST)
+        self.assertEqual(extraction['facts'], ['台北', '台灣', '台北101', '颱風'])
+        self.assertEqual(extraction['concept_facts'], {'城市': ['台北', '台北101'], '地理': ['台灣']})
+        self.assertEqual(extraction['fact_pairs'], [('台北', '位於', '台灣'), ('台北101', '位於', '台北')])
+
+        with self.assertRaises(ValueError):
+            parse_extraction('not json at all')
+        with self.assertRaises(ValueError):
+            parse_extraction('{"facts": "a, b", "concepts": [], "relationships": []}')
+
+
+    def test_gaps(self):
+        gaps = find_gaps(parse_extraction(FIRST))
+        self.assertEqual(gaps, {'ungrouped': ['颱風'], 'isolated': []})
+
+        extraction = parse_extraction(response(['a', 'b', 'c'], {'x': ['a', 'b', 'c']}, [('a', 'r', 'd')]))
+        self.assertEqual(find_gaps(extraction), {'ungrouped': ['d'], 'isolated': ['b', 'c']})
+
+
+    def test_single_request_when_complete(self):
+        llm = FakeLlm([response(['a', 'b'], {'x': ['a', 'b']}, [('a', 'r', 'b')])])
+        concept_facts, fact_pairs = extract_page('page', llm)
+
+        self.assertEqual(len(llm.requests), 1)
+        self.assertIs(llm.requests[0][1], EXTRACTION_SCHEMA)
+        self.assertEqual((concept_facts, fact_pairs), ({'x': ['a', 'b']}, [('a', 'r', 'b')]))
+
+
+    def test_followup_only_for_gaps(self):
+        llm = FakeLlm([FIRST, FOLLOWUP])
+        concept_facts, fact_pairs = extract_page('台北是台灣的首都。', llm, max_followups=3)
+
+        self.assertEqual(len(llm.requests), 2)          # 補問後已無缺口
+        self.assertIn('["颱風"]', llm.requests[1][0][1]['content'])
+        self.assertEqual(concept_facts['天氣'], ['颱風'])
+        self.assertIn(('颱風', '侵襲', '台灣'), fact_pairs)
+
+        llm = FakeLlm([FIRST])
+        extract_page('台北是台灣的首都。', llm, max_followups=0)
+        self.assertEqual(len(llm.requests), 1)
+
+
+    def test_stats(self):
+        stats = ExtractionStats('structured')
+        stats.add_call(1.5, {'prompt_tokens': 900, 'completion_tokens': 300})
+        stats.add_call(0.5, None)
+        stats.add_page(20)
+        stats.add_page(10)
+        report = stats.to_dict()
+        self.assertEqual((report['llm_calls'], report['prompt_tokens'], report['triplets']), (2, 900, 30))
+        self.assertEqual(report['per_page'], {'triplets': 15.0, 'llm_calls': 1.0, 'tokens': 600.0, 'llm_seconds': 1.0})
+
+
+
+if __name__ == '__main__':
+    unittest.main()
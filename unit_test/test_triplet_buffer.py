@@ -0,0 +1,137 @@
+import os, sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+import app_helper
+
+import json
+import tempfile
+import unittest
+
+from knowsys.triplet_buffer import FLUSHING_SUFFIX, TripletWriteBuffer
+
+
+def page_triplets(page_number):
+    section = {'type': 'structure', 'name': 'Ch1'}
+    return [
+        (section, {'name': 'part_of'}, {'type': 'document', 'name': 'Doc'}),
+        ({'type': 'fact', 'name': f'fact-{page_number}'}, {'name': 'is_a'}, {'type': 'concept', 'name': '季節'}),
+    ]
+
+
+
+class RecordingWriter:
+    """ 記錄每次寫入的頁面；fail 次數內拋出例外。 """
+    def __init__(self, fail=0):
+        self.calls = []
+        self.fail = fail
+
+    def __call__(self, pages, idempotent):
+        if self.fail:
+            self.fail -= 1
+            raise ConnectionError('neo4j unavailable')
+        self.calls.append(([page_number for _, page_number, _ in pages], idempotent))
+        return {'node_rows': 3 + len(pages), 'relationship_rows': 1 + len(pages)}
+
+
+
+class TestTripletWriteBuffer(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.spill_path = os.path.join(self.tmp.name, '_triplets_test.jsonl')
+
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+
+    def test_flush_on_size_threshold(self):
+        writer = RecordingWriter()
+        buffer = TripletWriteBuffer('test', writer, self.spill_path, max_triplets=4, max_delay=60)
+        buffer.add('f1', 1, page_triplets(1))
+        self.assertEqual(writer.calls, [])
+        self.assertTrue(os.path.exists(self.spill_path))
+
+        buffer.add('f1', 2, page_triplets(2))
+        self.assertEqual(writer.calls, [([1, 2], False)])
+        self.assertFalse(os.path.exists(self.spill_path))
+        self.assertFalse(os.path.exists(self.spill_path + FLUSHING_SUFFIX))
+
+        stats = buffer.stats()
+        self.assertEqual(stats['pages_in'], 2)
+        self.assertEqual(stats['flushes'], 1)
+        self.assertEqual(stats['coalescing_ratio'], 1.5)    # 4 triplets x 3 / 8 rows
+        buffer.close()
+
+
+    def test_flush_on_delay(self):
+        writer = RecordingWriter()
+        buffer = TripletWriteBuffer('test', writer, self.spill_path, max_triplets=1000, max_delay=0.05)
+        buffer.add('f1', 1, page_triplets(1))
+        buffer._thread.join(0.5)
+        self.assertEqual(writer.calls, [([1], False)])
+        buffer.close()
+
+
+    def test_failed_flush_is_retried_idempotently(self):
+        writer = RecordingWriter(fail=1)
+        buffer = TripletWriteBuffer('test', writer, self.spill_path, max_triplets=1000, max_delay=60)
+        buffer.add('f1', 1, page_triplets(1))
+        with self.assertRaises(ConnectionError):
+            buffer.flush()
+        self.assertTrue(os.path.exists(self.spill_path + FLUSHING_SUFFIX))
+
+        buffer.add('f1', 2, page_triplets(2))
+        buffer.flush()
+        self.assertEqual(writer.calls, [([1], True), ([2], False)])
+        self.assertEqual(buffer.stats()['failures'], 1)
+        buffer.close()
+
+
+    def test_failed_retry_backs_off_while_pages_are_pending(self):
+        writer = RecordingWriter(fail=1000)
+        buffer = TripletWriteBuffer('test', writer, self.spill_path, max_triplets=1000, max_delay=0.05)
+        buffer.add('f1', 1, page_triplets(1))
+        with self.assertRaises(ConnectionError):
+            buffer.flush()
+
+        # 新頁面逾時後背景 thread 仍須依退避間隔 (0.05, 0.1, 0.2 ...) 重試，而非不斷重試
+        buffer.add('f1', 2, page_triplets(2))
+        buffer._thread.join(0.4)
+        stats = buffer.stats()
+        self.assertLessEqual(stats['failures'], 5)
+        self.assertGreaterEqual(stats['retry_delay'], 0.1)
+        self.assertEqual(stats['pending_pages'], 1)
+
+        writer.fail = 0
+        buffer.close()
+        self.assertEqual(writer.calls, [([1], True), ([2], False)])
+        self.assertEqual(buffer.stats()['retry_delay'], 0.0)
+
+
+    def test_replay_spill_after_crash(self):
+        with open(self.spill_path + FLUSHING_SUFFIX, 'w', encoding='utf-8') as f:
+            f.write(json.dumps({'file_id': 'f1', 'page_number': 1, 'triplets': page_triplets(1)}) + '\n')
+        with open(self.spill_path, 'w', encoding='utf-8') as f:
+            f.write(json.dumps({'file_id': 'f1', 'page_number': 2, 'triplets': page_triplets(2)}) + '\n')
+            f.write('{"file_id": "f1", "page_nu')     # 中斷時寫了一半的行
+
+        writer = RecordingWriter()
+        buffer = TripletWriteBuffer('test', writer, self.spill_path, max_triplets=1000, max_delay=60)
+        self.assertEqual(writer.calls, [([1, 2], True)])
+        self.assertFalse(os.path.exists(self.spill_path))
+        self.assertFalse(os.path.exists(self.spill_path + FLUSHING_SUFFIX))
+        buffer.close()
+
+
+    def test_close_flushes_pending_pages(self):
+        writer = RecordingWriter()
+        buffer = TripletWriteBuffer('test', writer, self.spill_path, max_triplets=1000, max_delay=60)
+        buffer.add('f1', 1, page_triplets(1))
+        buffer.close()
+        self.assertEqual(writer.calls, [([1], False)])
+        with self.assertRaises(RuntimeError):
+            buffer.add('f1', 2, page_triplets(2))
+
+
+
+if __name__ == '__main__':
+    unittest.main()